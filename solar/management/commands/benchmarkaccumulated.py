@@ -0,0 +1,91 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.core.management.base import BaseCommand
+from solar.solardata import SolarData
+import numpy as np
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the accumulated area calculations against day, month and year sized data sets.'
+
+    # Number of samples in each period, based on a sample every 20 seconds.
+    period_samples = {
+        'day': 4320,
+        'month': 4320 * 31,
+        'year': 4320 * 366,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat",
+            "-r",
+            type=int,
+            help="The number of times to run each calculation. The fastest run is reported.",
+            required=False,
+            default=3,
+        )
+
+    @staticmethod
+    def time_function(function, repeat: int) -> tuple:
+        """
+        Run a function a number of times and return the fastest time and the result.
+
+        :param function: The function to time.
+        :param repeat: The number of times to run the function.
+        :return: The fastest run time and the function result.
+        """
+
+        fastest = None
+        result = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            run_time = time.perf_counter() - start
+            if (fastest is None) or (run_time < fastest):
+                fastest = run_time
+
+        return fastest, result
+
+    def handle(self, repeat: int, *args, **kwargs):
+        random_generator = np.random.default_rng(42)
+
+        for period, samples in Command.period_samples.items():
+            # Build a synthetic data set, with some jitter in the sample times.
+            time_array = 1631858701 + np.cumsum(random_generator.integers(19, 22, samples)).astype(np.float64)
+            magnitude_array = np.round(random_generator.uniform(0, 5000, samples), 3)
+            data_table = [
+                {'time_stamp': int(time_stamp), 'inverter_ac_power': float(magnitude)}
+                for time_stamp, magnitude in zip(time_array, magnitude_array)
+            ]
+
+            loop_time, loop_result = Command.time_function(
+                lambda: SolarData.get_accumulated_area(data_table, 'inverter_ac_power', 'time_stamp'), repeat)
+            array_time, array_result = Command.time_function(
+                lambda: SolarData.get_accumulated_area_array(time_array, magnitude_array), repeat)
+
+            self.stdout.write(self.style.SUCCESS(
+                '{0}: {1} samples, loop {2:.4f} seconds, vectorised {3:.4f} seconds, {4:.1f}x faster, results match: {5}'
+                .format(period, samples, loop_time, array_time, loop_time / array_time, loop_result == array_result)))
@@ -0,0 +1,61 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.core.management.base import BaseCommand
+from solar.models import SolarData as SolarDataModel
+from solar.solardata import SolarData
+import time
+import tqdm
+
+
+class Command(BaseCommand):
+    help = 'Build the daily solar rollups from the stored inverter data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--year",
+            "-y",
+            type=int,
+            help="Only build the rollups for this year.",
+            required=False,
+            default=None,
+        )
+
+    def handle(self, year: int, *args, **kwargs):
+        start = time.time()
+        self.stdout.write('Gathering days to build rollups for...')
+
+        day_objects = SolarDataModel.objects.values('time_year', 'time_month', 'time_day')
+        if year is not None:
+            day_objects = day_objects.filter(time_year=year)
+        day_list = list(day_objects.distinct().order_by('time_year', 'time_month', 'time_day'))
+
+        self.stdout.write(self.style.SUCCESS('Building rollups for {0} days...'.format(len(day_list))))
+        with tqdm.tqdm(total=len(day_list)) as pbar:
+            for day in day_list:
+                SolarData.rollup_day({'year': day['time_year'], 'month': day['time_month'], 'day': day['time_day']})
+                pbar.update(1)
+
+        total_time = (time.time() - start)
+        self.stdout.write(self.style.SUCCESS('Rollups built in {0:.1f} seconds.'.format(total_time)))
@@ -0,0 +1,192 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from solar.models import SolarData as SolarDataModel
+from solar.solardata import SolarData
+from system.ingest import IngestBuffer
+from system.workers import WorkerPool
+from concurrent.futures import ThreadPoolExecutor
+import math
+import requests
+import signal
+import threading
+import time
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class Command(BaseCommand):
+    help = 'Poll the inverter for the latest data at a fixed interval, until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            "-i",
+            type=float,
+            help="The number of seconds between polls. Defaults to the SOLAR_POLL_INTERVAL setting, or 20 seconds.",
+            required=False,
+            default=None,
+        )
+        parser.add_argument(
+            "--count",
+            "-c",
+            type=int,
+            help="Stop after this many polls. By default polling continues until the command is stopped.",
+            required=False,
+            default=0,
+        )
+        parser.add_argument(
+            "--report",
+            "-r",
+            type=int,
+            help="Report the time budget used every this many polls.",
+            required=False,
+            default=180,
+        )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stop_event = threading.Event()
+        self.stats = {}
+
+    def stop(self, signum, frame):
+        """
+        Signal handler to stop polling after the current poll.
+        """
+
+        self.stop_event.set()
+
+    def reset_stats(self):
+        """
+        Reset the poll statistics for the next report.
+        """
+
+        self.stats = {'polls': 0, 'failed': 0, 'skipped': 0, 'total': 0.0, 'max': 0.0}
+
+    def report(self, interval: float):
+        """
+        Report how much of the time budget the polls since the last report used.
+
+        :param interval: The number of seconds between polls.
+        """
+
+        if self.stats['polls'] == 0:
+            return
+
+        average = self.stats['total'] / self.stats['polls']
+        message = '{0} polls, {1} failed, {2} skipped: average {3:.3f} seconds ({4:.1f}% of budget), ' \
+                  'max {5:.3f} seconds ({6:.1f}% of budget)'.format(
+                      self.stats['polls'], self.stats['failed'], self.stats['skipped'],
+                      average, average / interval * 100, self.stats['max'], self.stats['max'] / interval * 100)
+        worker_stats = WorkerPool.get_stats()
+        message += '; worker queue depth {0}, max {1}, {2} coalesced, {3} dropped'.format(
+            worker_stats['queue_depth'], worker_stats['max_queue_depth'],
+            worker_stats['coalesced'], worker_stats['dropped'])
+        logger.info('Inverter poller: {0}'.format(message))
+        self.stdout.write(self.style.SUCCESS(message))
+        self.reset_stats()
+
+    def poll(self, session: requests.Session, executor: ThreadPoolExecutor) -> bool:
+        """
+        Query the inverter and store the data, waiting until the caches and payload are updated.
+
+        :param session: The HTTP session to query the inverter with.
+        :param executor: The executor to query the inverter in.
+        :return: True if the data was stored.
+        """
+
+        # The database connection is kept open between polls, unless it has gone away.
+        if (connection.connection is not None) and not connection.is_usable():
+            connection.close()
+
+        try:
+            store_result = SolarData.store(session=session, executor=executor)
+        except (requests.RequestException, KeyError, ValueError) as error:
+            logger.error('Inverter poller: failed to get data from the inverter: {0}'.format(error))
+            return False
+
+        store_result['thread'].join()
+        store_result['payload_thread'].join()
+
+        return True
+
+    def handle(self, interval: float, count: int, report: int, *args, **kwargs):
+        if interval is None:
+            interval = getattr(settings, 'SOLAR_POLL_INTERVAL', 20)
+
+        previous_handlers = {
+            signum: signal.signal(signum, self.stop) for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        self.reset_stats()
+        self.stdout.write('Polling the inverter every {0} seconds...'.format(interval))
+
+        # The session keeps the connection to the inverter open between polls,
+        # and the executor lets the grid and inverter data be requested at the same time.
+        with requests.Session() as session, ThreadPoolExecutor(max_workers=2) as executor:
+            # Polls are scheduled from a fixed start time, so the time each poll takes doesn't add up.
+            start = time.monotonic()
+            slot = 0
+            polls = 0
+            while not self.stop_event.is_set():
+                self.stop_event.wait(max(0.0, start + (slot * interval) - time.monotonic()))
+                if self.stop_event.is_set():
+                    break
+
+                poll_start = time.monotonic()
+                stored = self.poll(session, executor)
+                used = time.monotonic() - poll_start
+
+                polls += 1
+                self.stats['polls'] += 1
+                self.stats['failed'] += 0 if stored else 1
+                self.stats['total'] += used
+                self.stats['max'] = max(self.stats['max'], used)
+                if kwargs.get('verbosity', 1) > 1:
+                    self.stdout.write('Poll {0}: {1:.3f} seconds ({2:.1f}% of budget)'.format(
+                        polls, used, used / interval * 100))
+
+                # If a poll overran its budget, skip the slots that have already passed.
+                next_slot = max(slot + 1, math.ceil((time.monotonic() - start) / interval))
+                self.stats['skipped'] += next_slot - slot - 1
+                slot = next_slot
+
+                if (count > 0) and (polls >= count):
+                    break
+                if (report > 0) and (self.stats['polls'] >= report):
+                    self.report(interval)
+
+        self.report(interval)
+
+        # The workers may still be writing the rollups and tiers for the last samples.
+        WorkerPool.wait()
+        IngestBuffer.flush(SolarDataModel)
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS('Stopped polling the inverter.'))
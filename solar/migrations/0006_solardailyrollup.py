@@ -0,0 +1,38 @@
+# Generated by Django 3.2.4 on 2026-10-17 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('solar', '0005_solardata_solar_solar_time_st_7db798_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolarDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inverter_ac_power', models.FloatField()),
+                ('power_consumption', models.FloatField()),
+                ('first_time_stamp', models.IntegerField()),
+                ('first_inverter_ac_power', models.FloatField()),
+                ('first_power_consumption', models.FloatField()),
+                ('last_time_stamp', models.IntegerField()),
+                ('last_inverter_ac_power', models.FloatField()),
+                ('last_power_consumption', models.FloatField()),
+                ('time_year', models.IntegerField()),
+                ('time_month', models.IntegerField()),
+                ('time_day', models.IntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='solardailyrollup',
+            index=models.Index(fields=['first_time_stamp'], name='solar_solar_first_t_da72a9_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='solardailyrollup',
+            constraint=models.UniqueConstraint(fields=('time_year', 'time_month', 'time_day'), name='solar_daily_rollup_day'),
+        ),
+    ]
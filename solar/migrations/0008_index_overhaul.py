@@ -0,0 +1,94 @@
+# Generated by Django 3.2.4 on 2026-10-17 23:30
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('solar', '0007_solartrendtier'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='solardata',
+            name='solar_solar_time_st_2d1034_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='solardata',
+            name='solar_solar_time_st_5b4087_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='solardata',
+            name='solar_solar_time_st_02738e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='solardata',
+            name='solar_solar_time_st_9726e2_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='solardata',
+            name='solar_solar_time_st_a98a8f_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='solardata',
+            name='solar_solar_time_st_67af82_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='solardata',
+            name='solar_solar_time_st_a9da6e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='solardata',
+            name='solar_solar_time_st_736c35_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='solardata',
+            name='solar_solar_time_st_aa8eb5_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='solardata',
+            name='solar_solar_time_st_ce7bad_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='solardata',
+            name='solar_solar_time_st_535139_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='solardata',
+            name='solar_solar_time_st_9ee5cf_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='solardata',
+            name='solar_solar_time_st_7db798_idx',
+        ),
+        migrations.AlterField(
+            model_name='solardata',
+            name='time_day',
+            field=models.IntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='solardata',
+            name='time_month',
+            field=models.IntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='solardata',
+            name='time_stamp',
+            field=models.IntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='solardata',
+            name='time_year',
+            field=models.IntegerField(),
+        ),
+        migrations.AddIndex(
+            model_name='solardata',
+            index=django.contrib.postgres.indexes.BrinIndex(autosummarize=True, fields=['time_stamp'], name='solar_data_time_stamp_brin', pages_per_range=32),
+        ),
+        migrations.AddIndex(
+            model_name='solardata',
+            index=models.Index(fields=['time_year', 'time_month', 'time_day', 'time_stamp'], name='solar_data_calendar_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.4 on 2026-10-18 00:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('solar', '0008_index_overhaul'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='solartrendtier',
+            name='last_time_stamp',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -48,25 +48,64 @@ class SolarData(PostgresPartitionedModel):
     inverter_dc_current = models.FloatField()  # IDC
     inverter_dc_voltage = models.FloatField()  # UDC
     power_consumption = models.FloatField()
-    time_stamp = models.IntegerField(db_index=True)
-    time_year = models.IntegerField(db_index=True)
-    time_month = models.IntegerField(db_index=True)
-    time_day = models.IntegerField(db_index=True)
+    time_stamp = models.IntegerField()
+    time_year = models.IntegerField()
+    time_month = models.IntegerField()
+    time_day = models.IntegerField()
 
 
     class Meta:
         indexes = [
-            models.Index(fields=['time_stamp', 'grid_power_usage_real']),
-            models.Index(fields=['time_stamp', 'grid_power_factor']),
-            models.Index(fields=['time_stamp', 'grid_power_apparent']),
-            models.Index(fields=['time_stamp', 'grid_power_reactive']),
-            models.Index(fields=['time_stamp', 'grid_ac_voltage']),
-            models.Index(fields=['time_stamp', 'grid_ac_current']),
-            models.Index(fields=['time_stamp', 'inverter_ac_frequency']),
-            models.Index(fields=['time_stamp', 'inverter_ac_current']),
-            models.Index(fields=['time_stamp', 'inverter_ac_voltage']),
-            models.Index(fields=['time_stamp', 'inverter_ac_power']),
-            models.Index(fields=['time_stamp', 'inverter_dc_current']),
-            models.Index(fields=['time_stamp', 'inverter_dc_voltage']),
-            models.Index(fields=['time_stamp', 'power_consumption']),
-        ]
\ No newline at end of file
+            # Time stamp ranges, and the first and last samples. Samples are appended in time order,
+            # so inserts only ever touch the right hand edge of the index.
+            models.Index(fields=['time_stamp'], name='solar_data_time_stamp_idx'),
+            # Day, month and year lookups, ordered by time stamp within the period.
+            models.Index(fields=['time_year', 'time_month', 'time_day', 'time_stamp'], name='solar_data_calendar_idx'),
+        ]
+
+class SolarDailyRollup(models.Model):
+    """
+    This model stores the accumulated solar data for each day.
+    The first and last samples of the day are also stored, so days can be
+    joined together when calculating week, month and year totals.
+    """
+
+    inverter_ac_power = models.FloatField()  # Accumulated for the day.
+    power_consumption = models.FloatField()  # Accumulated for the day.
+    first_time_stamp = models.IntegerField()
+    first_inverter_ac_power = models.FloatField()
+    first_power_consumption = models.FloatField()
+    last_time_stamp = models.IntegerField()
+    last_inverter_ac_power = models.FloatField()
+    last_power_consumption = models.FloatField()
+    time_year = models.IntegerField()
+    time_month = models.IntegerField()
+    time_day = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['time_year', 'time_month', 'time_day'], name='solar_daily_rollup_day'),
+        ]
+        indexes = [
+            models.Index(fields=['first_time_stamp']),
+        ]
+
+class SolarTrendTier(models.Model):
+    """
+    This model stores the solar inverter data aggregated into time buckets at several resolutions.
+    See system.tiers.TrendTiers.
+    """
+
+    resolution = models.IntegerField()  # Bucket size in seconds.
+    metric = models.CharField(max_length=50)
+    bucket_start = models.IntegerField()
+    sum_value = models.FloatField()
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    sample_count = models.IntegerField()
+    last_time_stamp = models.IntegerField(default=0)  # Time stamp of the newest sample in the bucket.
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['resolution', 'metric', 'bucket_start'], name='solar_trend_tier_bucket'),
+        ]
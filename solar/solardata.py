@@ -24,14 +24,23 @@
 
 import requests
 from django.conf import settings
-from datetime import datetime, timedelta
+from datetime import datetime
 from solar.models import SolarData as SolarDataModel
-from django.db.models import Max, Min
+from solar.models import SolarTrendTier as SolarTrendTierModel
+from solar.models import SolarDailyRollup as SolarDailyRollupModel
+from django.db.models import Max, Q
 from weather.weatherdata import WeatherData
 from system.conversion import UnitConversion
-from django.core.cache import cache
-import threading
-from django.db import connection
+from system.cache import DataCache
+from system.history import HistoryCache
+from system.payload import DashboardPayload
+from system.ingest import IngestBuffer
+from system.period import TimePeriod
+from system.tiers import TrendTiers
+from system.workers import WorkerPool
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection, transaction
+import numpy as np
 
 import logging
 
@@ -56,6 +65,21 @@ class SolarData:
         'power_consumption',
     ]
 
+    # Periods to keep running accumulators for.
+    live_periods = [
+        'day',
+        'week',
+        'month',
+    ]
+
+    # Number of seconds accumulated values are cached for, for each period.
+    accumulated_timeouts = {
+        'year': 3600,
+        'month': 3600,
+        'week': 1800,
+        'day': 600,
+    }
+
     # Metrics to get trend data for.
     solar_trends = [
         'grid_power_usage_real',
@@ -72,35 +96,52 @@ class SolarData:
         :return time_obj: The date object
         """
 
-        # Split out timestamp to date components.
-        date_object = datetime.fromtimestamp(timestamp)
-
-        start = date_object - timedelta(days=(date_object.weekday() + 1) % 7)
-        end = start + timedelta(days=6)
-
-        time_obj = {
-            'year': date_object.year,
-            'month': date_object.month,
-            'week': date_object.isocalendar()[1],
-            'day': date_object.day,
-            'week_start_day': start.day,
-            'week_end_day': end.day
-        }
+        # Split out timestamp to date components, in the TIME_ZONE setting.
+        return TimePeriod.get_time_obj(timestamp)
+
+    @staticmethod
+    def get_api_timeout() -> float:
+        """
+        Get the number of seconds to wait for the inverter to respond.
+
+        :return: The timeout from the SOLAR_API_TIMEOUT setting, defaults to 10 seconds.
+        """
+
+        return getattr(settings, 'SOLAR_API_TIMEOUT', 10)
+
+    @staticmethod
+    def get_raw_data(session: requests.Session = None, executor: ThreadPoolExecutor = None) -> tuple:
+        """
+        Query the Fronius inverter for both the grid and inverter data.
+        If an executor is given the two requests are made at the same time.
+
+        :param session: The HTTP session to use, so the connection to the inverter can be kept alive.
+        :param executor: The executor to make the requests in.
+        :return: The grid data and the inverter data.
+        """
+
+        if executor is None:
+            return SolarData.get_grid_data(session), SolarData.get_inverter_data(session)
 
-        return time_obj
+        grid_future = executor.submit(SolarData.get_grid_data, session)
+        inverter_future = executor.submit(SolarData.get_inverter_data, session)
+
+        return grid_future.result(), inverter_future.result()
 
     @staticmethod
-    def get_grid_data() -> dict:
+    def get_grid_data(session: requests.Session = None) -> dict:
         """
         Query the Fronius inverter for grid power data.
 
+        :param session: The HTTP session to use, so the connection to the inverter can be kept alive.
         :return grid_data: The grid data received from the inverter.
         """
 
+        http = requests if session is None else session
         inverter_domain = getattr(settings, 'SOLAR_API')
         inverter_uri = 'http://{0}/solar_api/v1/GetMeterRealtimeData.cgi'.format(inverter_domain)
         query_params = {'Scope': 'System'}
-        request_response = requests.get(inverter_uri, params=query_params)
+        request_response = http.get(inverter_uri, params=query_params, timeout=SolarData.get_api_timeout())
         grid_data_raw = request_response.json()['Body']['Data']['0']
 
         # Just grab the data we want.
@@ -116,17 +157,19 @@ class SolarData:
         return grid_data
 
     @staticmethod
-    def get_inverter_data() -> dict:
+    def get_inverter_data(session: requests.Session = None) -> dict:
         """
         Query the Fronius inverter for inverter and solar power data.
 
+        :param session: The HTTP session to use, so the connection to the inverter can be kept alive.
         :return inverter_data: The solar data received from the inverter.
         """
 
+        http = requests if session is None else session
         inverter_domain = getattr(settings, 'SOLAR_API')
         inverter_uri = 'http://{0}/solar_api/v1/GetInverterRealtimeData.cgi'.format(inverter_domain)
         query_params = {'Scope': 'Device', 'DeviceId': '1', 'DataCollection': 'CommonInverterData'}
-        request_response = requests.get(inverter_uri, params=query_params)
+        request_response = http.get(inverter_uri, params=query_params, timeout=SolarData.get_api_timeout())
         inverter_data_raw = request_response.json()['Body']['Data']
 
         # Just grab the data we want.
@@ -176,7 +219,7 @@ class SolarData:
         """
 
         cache_key = '{0}_latest'.format(metric)
-        cache_val = cache.get(cache_key)
+        cache_val = DataCache.get(cache_key)
 
         return {cache_key: cache_val}
 
@@ -192,10 +235,45 @@ class SolarData:
         """
 
         cache_key = '{0}_latest'.format(metric)
-        cache.set(cache_key, value, 3600)
+        DataCache.set(cache_key, value, 3600)
 
         return {cache_key: value}
 
+    @staticmethod
+    def get_latest_many(metrics: list) -> dict:
+        """
+        Get the latest received values for several metrics in one cache operation.
+
+        :param metrics: The metrics to get the latest for, e.g. ['inverter_ac_power', 'power_consumption']
+        :return: The latest values, keyed by cache key.
+        """
+
+        cache_keys = ['{0}_latest'.format(metric) for metric in metrics]
+        cache_values = DataCache.get_many(cache_keys)
+
+        return {cache_key: cache_values.get(cache_key) for cache_key in cache_keys}
+
+    @staticmethod
+    def set_latest_many(values: dict, time_stamp: int = None) -> dict:
+        """
+        Set the latest values for several metrics in one cache operation.
+        If the time stamp of the sample is given, the values are only set if they are newer
+        than the cached values, so a delayed update can't replace newer values.
+        The values are only "set" in the cache and not updated in the database.
+
+        :param values: The latest values, keyed by metric.
+        :param time_stamp: The time stamp of the sample the values come from.
+        :return: The latest values, keyed by cache key, or an empty dict if newer values are cached.
+        """
+
+        latest_values = {'{0}_latest'.format(metric): value for metric, value in values.items()}
+        if time_stamp is None:
+            DataCache.set_many(latest_values, 3600)
+        elif not DataCache.set_many_versioned(latest_values, 'latest_solar_time_stamp', time_stamp, 3600):
+            return {}
+
+        return latest_values
+
     @staticmethod
     def get_accumulated_area(data_table: list, magnitude_field: str, time_field: str) -> float:
         """
@@ -231,12 +309,276 @@ class SolarData:
 
         return accumulated_area
 
+    @staticmethod
+    def get_accumulated_area_array(time_array, magnitude_array) -> float:
+        """
+        Vectorised version of get_accumulated_area.
+        Takes arrays of time and magnitude values, ordered by time,
+        and returns the accumulated area under the curve per hour.
+
+        The rectangle and triangle for each pair of samples are calculated
+        in a single pass. They are then added together with a cumulative sum,
+        as this adds the values in the same order as the loop in get_accumulated_area
+        and so gives exactly the same result.
+
+        :param time_array: NumPy array of the time data.
+        :param magnitude_array: NumPy array of the magnitude data.
+        :return accumulated_area: The accumulated area per hour.
+        """
+
+        if time_array.size < 2:
+            return 0
+
+        time_period = np.diff(time_array) / 3600
+
+        area_parts = np.empty(time_period.size * 2)
+        area_parts[0::2] = magnitude_array[1:] * time_period
+        area_parts[1::2] = (magnitude_array[1:] - magnitude_array[:-1]) * time_period * 0.5
+
+        return float(np.cumsum(area_parts)[-1])
+
+    @staticmethod
+    def get_queryset_area(queryset, metric: str) -> float:
+        """
+        Get the accumulated area for a metric from a filtered queryset.
+        When the database is PostgreSQL the area is calculated in the database,
+        otherwise (e.g. SQLite) the rows are fetched and the area is calculated in Python.
+        Calculating in the database can be disabled with the SOLAR_ACCUMULATION_BACKEND setting.
+
+        :param queryset: The filtered SolarData queryset to get the area for.
+        :param metric: The metric to get the accumulated area for, e.g. inverter_ac_power
+        :return: The accumulated area per hour.
+        """
+
+        accumulation_backend = getattr(settings, 'SOLAR_ACCUMULATION_BACKEND', 'database')
+
+        if (accumulation_backend == 'database') and (connection.vendor == 'postgresql'):
+            return SolarData.get_queryset_area_database(queryset, metric)
+
+        return SolarData.get_queryset_area_array(queryset, metric)
+
+    @staticmethod
+    def get_queryset_area_database(queryset, metric: str) -> float:
+        """
+        Get the accumulated area for a metric from a filtered queryset,
+        calculating the area in the database. Each row is paired with the previous
+        row using LAG(), and the areas of the pairs are summed.
+        Only the final area is returned from the database.
+        PostgreSQL only.
+
+        :param queryset: The filtered SolarData queryset to get the area for.
+        :param metric: The metric to get the accumulated area for, e.g. inverter_ac_power
+        :return: The accumulated area per hour.
+        """
+
+        data_sql, data_params = queryset.values_list('time_stamp', metric).order_by().query.sql_with_params()
+
+        # Same "rectangle" plus "triangle" for each pair of rows as get_accumulated_area.
+        # The time period is converted to hours. The first row has no previous row, so is ignored by SUM().
+        area_sql = """
+            SELECT SUM((magnitude * time_period) + ((magnitude - previous_magnitude) * time_period * 0.5))
+            FROM (
+                SELECT magnitude,
+                    LAG(magnitude) OVER (ORDER BY time_stamp) AS previous_magnitude,
+                    (time_stamp - LAG(time_stamp) OVER (ORDER BY time_stamp)) / 3600.0 AS time_period
+                FROM ({0}) AS accum_data (time_stamp, magnitude)
+            ) AS accum_pairs
+        """.format(data_sql)
+
+        with connection.cursor() as cursor:
+            cursor.execute(area_sql, data_params)
+            accumulated_area = cursor.fetchone()[0]
+
+        if accumulated_area is None:
+            accumulated_area = 0
+
+        return accumulated_area
+
+    @staticmethod
+    def get_queryset_area_array(queryset, metric: str) -> float:
+        """
+        Get the accumulated area for a metric from a filtered queryset.
+        The time and metric values are read straight into NumPy arrays,
+        without building a dict for each row.
+
+        :param queryset: The filtered SolarData queryset to get the area for.
+        :param metric: The metric to get the accumulated area for, e.g. inverter_ac_power
+        :return: The accumulated area per hour.
+        """
+
+        data_rows = queryset.values_list('time_stamp', metric).order_by('time_stamp')
+        data_array = np.fromiter(
+            data_rows.iterator(chunk_size=10000),
+            dtype=[('time_stamp', np.float64), ('magnitude', np.float64)])
+
+        return SolarData.get_accumulated_area_array(data_array['time_stamp'], data_array['magnitude'])
+
+    @staticmethod
+    def get_period_area(metric: str, period_range: tuple) -> float:
+        """
+        Get the accumulated area for a metric for the period matching the filter.
+        The daily rollups are used for the days in the period that have them, and the area
+        for the rest of the period is calculated from the raw data. If there are no rollups
+        for the period the area is calculated from the raw data.
+
+        The raw samples that are not in a rollup are put in time order with the first and last
+        samples of each rollup. The area between all these samples is calculated, and for each rollup
+        the area between its first and last sample is replaced with the area of the day.
+        This gives the same result as calculating the area from all the raw data for the period.
+
+        :param metric: The metric to get the accumulated area for, e.g. inverter_ac_power
+        :param period_range: The start and end (exclusive) timestamps of the period, see TimePeriod.get_range().
+        :return: The accumulated area per hour.
+        """
+
+        start, end = period_range
+        rollup_rows = []
+        if metric in SolarData.accumulated_metrics:
+            rollup_rows = list(SolarDailyRollupModel.objects
+                               .filter(first_time_stamp__gte=start, first_time_stamp__lt=end)
+                               .order_by('first_time_stamp')
+                               .values_list('first_time_stamp', 'first_{0}'.format(metric),
+                                            'last_time_stamp', 'last_{0}'.format(metric), metric))
+
+        # No rollups for this period, get the area from the raw data.
+        accum_objects = SolarDataModel.objects.filter(time_stamp__gte=start, time_stamp__lt=end)
+        if len(rollup_rows) == 0:
+            return SolarData.get_queryset_area(accum_objects, metric)
+
+        # The raw samples before, between and after the rollups. Days without a rollup, and samples
+        # stored after a rollup was last updated, are in these gaps.
+        gap_filter = Q(time_stamp__lt=rollup_rows[0][0])
+        for previous_row, next_row in zip(rollup_rows, rollup_rows[1:]):
+            gap_filter |= Q(time_stamp__gt=previous_row[2], time_stamp__lt=next_row[0])
+        gap_filter |= Q(time_stamp__gt=rollup_rows[-1][2])
+
+        gap_rows = accum_objects.filter(gap_filter).values_list('time_stamp', metric)
+        gap_array = np.fromiter(
+            gap_rows.iterator(chunk_size=10000),
+            dtype=[('time_stamp', np.float64), ('magnitude', np.float64)])
+        rollup_array = np.array(rollup_rows, dtype=np.float64)
+
+        time_array = np.concatenate((gap_array['time_stamp'], rollup_array[:, 0], rollup_array[:, 2]))
+        magnitude_array = np.concatenate((gap_array['magnitude'], rollup_array[:, 1], rollup_array[:, 3]))
+        order = np.argsort(time_array, kind='stable')
+        accumulated_area = SolarData.get_accumulated_area_array(time_array[order], magnitude_array[order])
+
+        # Swap the area between the first and last sample of each rollup for the area of the day.
+        rollup_periods = (rollup_array[:, 2] - rollup_array[:, 0]) / 3600
+        rollup_lines = (rollup_array[:, 3] * rollup_periods) \
+            + ((rollup_array[:, 3] - rollup_array[:, 1]) * rollup_periods * 0.5)
+
+        return accumulated_area - float(np.sum(rollup_lines)) + float(np.sum(rollup_array[:, 4]))
+
+    @staticmethod
+    def rollup_day(time_obj: dict):
+        """
+        Create or update the daily rollup for a day from the raw data.
+        Stored history payloads that include the day are invalidated.
+
+        :param time_obj: The object that contains the time data.
+        :return: The rollup record, or None if there is no data for the day.
+        """
+
+        day_filter = {'time_year': time_obj['year'], 'time_month': time_obj['month'], 'time_day': time_obj['day']}
+        # Samples still in the ingest buffer would be missed.
+        IngestBuffer.flush(SolarDataModel)
+        day_objects = SolarDataModel.objects.filter(**TimePeriod.get_filter('day', time_obj))
+
+        # The day is being rebuilt, so any stored history that includes it may be out of date.
+        HistoryCache.invalidate_day('solar', time_obj)
+        first_row = day_objects.order_by('time_stamp').values('time_stamp', *SolarData.accumulated_metrics).first()
+        last_row = day_objects.order_by('-time_stamp').values('time_stamp', *SolarData.accumulated_metrics).first()
+
+        if first_row is None:
+            SolarDailyRollupModel.objects.filter(**day_filter).delete()
+            return None
+
+        rollup_data = {
+            'first_time_stamp': first_row['time_stamp'],
+            'last_time_stamp': last_row['time_stamp'],
+        }
+        for metric in SolarData.accumulated_metrics:
+            rollup_data[metric] = SolarData.get_queryset_area(day_objects, metric)
+            rollup_data['first_{0}'.format(metric)] = first_row[metric]
+            rollup_data['last_{0}'.format(metric)] = last_row[metric]
+
+        rollup_record, created = SolarDailyRollupModel.objects.update_or_create(defaults=rollup_data, **day_filter)
+
+        return rollup_record
+
+    @staticmethod
+    def update_rollup(store_data: dict):
+        """
+        Update the daily rollup with a newly stored sample.
+        The area between the last sample of the rollup and the new sample is added to the rollup.
+        If there is no rollup for the day yet, or the sample is older than the last sample
+        in the rollup, the day is rebuilt from the raw data instead.
+
+        :param store_data: The data for the sample that was stored.
+        :return: The rollup record.
+        """
+
+        day_filter = {
+            'time_year': store_data['time_year'],
+            'time_month': store_data['time_month'],
+            'time_day': store_data['time_day']
+        }
+        time_stamp = int(store_data['time_stamp'])
+
+        with transaction.atomic():
+            rollup_record = SolarDailyRollupModel.objects.select_for_update().filter(**day_filter).first()
+
+            if (rollup_record is None) or (time_stamp < rollup_record.last_time_stamp):
+                return SolarData.rollup_day({
+                    'year': store_data['time_year'],
+                    'month': store_data['time_month'],
+                    'day': store_data['time_day']
+                })
+
+            for metric in SolarData.accumulated_metrics:
+                last_metric = 'last_{0}'.format(metric)
+                previous_sample = {'time_stamp': rollup_record.last_time_stamp, metric: getattr(rollup_record, last_metric)}
+                current_sample = {'time_stamp': time_stamp, metric: store_data[metric]}
+                sample_area = SolarData.get_accumulated_area([previous_sample, current_sample], metric, 'time_stamp')
+
+                setattr(rollup_record, metric, getattr(rollup_record, metric) + sample_area)
+                setattr(rollup_record, last_metric, store_data[metric])
+
+            rollup_record.last_time_stamp = time_stamp
+            rollup_record.save()
+
+        return rollup_record
+
+    @staticmethod
+    def get_accumulated_cache_key(metric: str, period: str, time_obj: dict) -> str:
+        """
+        Get the cache key for an accumulated value.
+
+        :param metric: The metric the value is for, e.g. inverter_ac_power
+        :param period: The period the value relates to. i.e. 'year', 'month', 'week', 'day'.
+        :param time_obj: The object that contains the time data.
+        :return: The cache key.
+        """
+
+        if period == 'week':
+            return '_'.join(('accum', metric, str(time_obj['week_year']), 'week', str(time_obj['week'])))
+
+        key_parts = ['accum', metric, str(time_obj['year'])]
+        if period in ('month', 'day'):
+            key_parts.append(str(time_obj['month']))
+        if period == 'day':
+            key_parts.append(str(time_obj['day']))
+
+        return '_'.join(key_parts)
+
     @staticmethod
     def get_accumulated(metric: str, period: str, time_obj: dict, usecache: bool = True) -> float:
         """
         Get the accumulated value for a metric for the given period (day, month, week, or year).
         By accumulated we mean the area under the curve. For example the total power generated for a day.
-        If the value is not cached it is calculated and then the value is set in the cache
+        If the value is not cached, or has expired, it is calculated and then the value is set in the cache.
+        Only one caller calculates an expired value, the others get the expired value until it is replaced.
 
         :param metric: The metric to get the daily value for, e.g. uv_index
         :param period: The period the maximum relates to. i.e. 'year', 'month', 'day'.
@@ -245,80 +587,198 @@ class SolarData:
         :return: The accumulated value.
         """
 
-        accum_value = 0
-
-        # Get value from cache.
-        # If cache is empty or invalid get value from the database. Then store in cache.
-        if period == 'year':
-            cache_key = '_'.join(('accum', metric, str(time_obj['year'])))
-            cache_val = cache.get(cache_key)
-            if (cache_val is None) or (usecache is False):
-                accum_objects = SolarDataModel.objects\
-                    .filter(time_year=time_obj['year']) \
-                    .values('time_stamp', metric) \
-                    .order_by('time_stamp')
-                accum_value = SolarData.get_accumulated_area(accum_objects, metric, 'time_stamp')
-                cache.set(cache_key, accum_value, 3600)
-            else:
-                accum_value = cache_val
-        elif period == 'month':
-            cache_key = '_'.join(('accum', metric, str(time_obj['year']), str(time_obj['month'])))
-            cache_val = cache.get(cache_key)
-            if (cache_val is None) or (usecache is False):
-                accum_objects = SolarDataModel.objects \
-                    .filter(time_year=time_obj['year'], time_month=time_obj['month']) \
-                    .values('time_stamp', metric)\
-                    .order_by('time_stamp')
-                accum_value = SolarData.get_accumulated_area(accum_objects, metric, 'time_stamp')
-                cache.set(cache_key, accum_value, 3600)
+        if period not in SolarData.accumulated_timeouts:
+            return 0
+
+        return DataCache.get_or_compute(
+            SolarData.get_accumulated_cache_key(metric, period, time_obj),
+            lambda: SolarData.get_period_area(metric, TimePeriod.get_range(period, time_obj)),
+            SolarData.accumulated_timeouts[period],
+            refresh=(usecache is False))
+
+    @staticmethod
+    def get_accumulated_live(metric: str, period: str, time_obj: dict) -> float:
+        """
+        Get the accumulated value for a metric for the current period (day, week or month),
+        from the running accumulator that is updated as each new sample is stored.
+        If there is no running accumulator for the period, the value is got using get_accumulated.
+
+        :param metric: The metric to get the accumulated value for, e.g. inverter_ac_power
+        :param period: The period the value relates to. i.e. 'month', 'week', 'day'.
+        :param time_obj: The object that contains the time data.
+        :return: The accumulated value.
+        """
+
+        cache_key = '_'.join(('accum_live', metric, period))
+        accumulator = DataCache.get(cache_key)
+
+        if (accumulator is None) or (accumulator['period_key'] != SolarData.get_live_period_key(period, time_obj)):
+            return SolarData.get_accumulated(metric, period, time_obj)
+
+        return accumulator['area']
+
+    @staticmethod
+    def get_accumulated_live_many(time_obj: dict) -> dict:
+        """
+        Get the accumulated values for all accumulated metrics for the current day, week and month.
+        All the running accumulators are got from the cache in one operation. Any accumulators that
+        are missing, or are for a different period, are got using get_accumulated.
+
+        :param time_obj: The object that contains the time data.
+        :return: The accumulated values, keyed by metric and then period.
+        """
+
+        accumulator_keys = {}
+        for metric in SolarData.accumulated_metrics:
+            for period in SolarData.live_periods:
+                accumulator_keys['_'.join(('accum_live', metric, period))] = (metric, period)
+
+        accumulators = DataCache.get_many(list(accumulator_keys.keys()))
+
+        accumulated_values = {metric: {} for metric in SolarData.accumulated_metrics}
+        for cache_key, (metric, period) in accumulator_keys.items():
+            accumulator = accumulators.get(cache_key)
+
+            if (accumulator is None) or (accumulator['period_key'] != SolarData.get_live_period_key(period, time_obj)):
+                accumulated_values[metric][period] = SolarData.get_accumulated(metric, period, time_obj)
             else:
-                accum_value = cache_val
+                accumulated_values[metric][period] = accumulator['area']
+
+        return accumulated_values
+
+    @staticmethod
+    def get_live_period_key(period: str, time_obj: dict) -> str:
+        """
+        Get the key that identifies the period a running accumulator is for.
+        When the key changes the period has rolled over, e.g. a new day has started.
+
+        :param period: The period the key relates to. i.e. 'month', 'week', 'day'.
+        :param time_obj: The object that contains the time data.
+        :return: The period key.
+        """
+
+        period_key = ''
+
+        if period == 'month':
+            period_key = '_'.join((str(time_obj['year']), str(time_obj['month'])))
         elif period == 'week':
-            cache_key = '_'.join(('accum', metric, str(time_obj['year']), 'week', str(time_obj['week'])))
-            cache_val = cache.get(cache_key)
-            if (cache_val is None) or (usecache is False):
-                accum_objects = SolarDataModel.objects \
-                    .filter(time_year=time_obj['year'], time_month=time_obj['month'],
-                            time_day__gte=time_obj['week_start_day'], time_day__lte=time_obj['week_end_day']) \
-                    .values('time_stamp', metric) \
-                    .order_by('time_stamp')
-                accum_value = SolarData.get_accumulated_area(accum_objects, metric, 'time_stamp')
-                cache.set(cache_key, accum_value, 1800)
-            else:
-                accum_value = cache_val
+            period_key = '_'.join((str(time_obj['week_year']), 'week', str(time_obj['week'])))
         elif period == 'day':
-            cache_key = '_'.join(('accum', metric, str(time_obj['year']), str(time_obj['month']), str(time_obj['day'])))
-            cache_val = cache.get(cache_key)
-            if (cache_val is None) or (usecache is False):
-                accum_objects = SolarDataModel.objects \
-                    .filter(time_year=time_obj['year'], time_month=time_obj['month'], time_day=time_obj['day']) \
-                    .values('time_stamp', metric) \
-                    .order_by('time_stamp')
-                accum_value = SolarData.get_accumulated_area(accum_objects, metric, 'time_stamp')
-                cache.set(cache_key, accum_value, 600)
-            else:
-                accum_value = cache_val
+            period_key = '_'.join((str(time_obj['year']), str(time_obj['month']), str(time_obj['day'])))
+
+        return period_key
+
+    @staticmethod
+    def set_accumulated_live(metric: str, period: str, time_stamp: int, value: float) -> float:
+        """
+        Add a new sample to the running accumulator for a metric and period.
+        The accumulator stores the previous sample and the area so far,
+        so each new sample only needs the area between it and the previous sample.
+        The value is only "set" in the cache and not updated in the database.
+
+        If the accumulator is missing, or the period has rolled over, the accumulator
+        is rebuilt from the database.
+
+        :param metric: The metric to update the accumulator for, e.g. inverter_ac_power
+        :param period: The period the accumulator relates to. i.e. 'month', 'week', 'day'.
+        :param time_stamp: The time of the new sample.
+        :param value: The value of the new sample.
+        :return: The accumulated value.
+        """
+
+        cache_key = '_'.join(('accum_live', metric, period))
+        accumulator = SolarData.add_accumulator_sample(DataCache.get(cache_key), metric, period, time_stamp, value)
+        DataCache.set(cache_key, accumulator, 3600)
+
+        return accumulator['area']
+
+    @staticmethod
+    def set_accumulated_live_many(store_data) -> dict:
+        """
+        Add a new sample to the running accumulators for all accumulated metrics and periods.
+        The accumulators are got from the cache in one operation and set in one operation.
+        The values are only "set" in the cache and not updated in the database.
+
+        :param store_data: The data for the new sample, or a list of samples oldest first.
+        :return: The accumulated values, keyed by cache key.
+        """
+
+        samples = store_data if isinstance(store_data, list) else [store_data]
+        accumulator_keys = {}
+        for metric in SolarData.accumulated_metrics:
+            for period in SolarData.live_periods:
+                accumulator_keys['_'.join(('accum_live', metric, period))] = (metric, period)
+
+        accumulators = DataCache.get_many(list(accumulator_keys.keys()))
+
+        for sample in samples:
+            for cache_key, (metric, period) in accumulator_keys.items():
+                accumulators[cache_key] = SolarData.add_accumulator_sample(
+                    accumulators.get(cache_key), metric, period, int(sample['time_stamp']), sample[metric])
+
+        DataCache.set_many(accumulators, 3600)
 
-        return accum_value
+        return {cache_key: accumulator['area'] for cache_key, accumulator in accumulators.items()}
 
     @staticmethod
-    def store(timestamp: int = 0) -> dict:
+    def add_accumulator_sample(accumulator, metric: str, period: str, time_stamp: int, value: float) -> dict:
+        """
+        Add a new sample to a running accumulator.
+        If the accumulator is missing, or the period has rolled over, the accumulator
+        is rebuilt from the database.
+
+        :param accumulator: The running accumulator, or None if there isn't one.
+        :param metric: The metric the accumulator is for, e.g. inverter_ac_power
+        :param period: The period the accumulator relates to. i.e. 'month', 'week', 'day'.
+        :param time_stamp: The time of the new sample.
+        :param value: The value of the new sample.
+        :return: The updated accumulator.
+        """
+
+        time_obj = SolarData.get_date_obj(time_stamp)
+        period_key = SolarData.get_live_period_key(period, time_obj)
+
+        if (accumulator is None) or (accumulator['period_key'] != period_key):
+            # Rebuild the accumulator from the database. The new sample may or may not be stored yet,
+            # so the area is only calculated up to the last stored sample.
+            accumulator = {'period_key': period_key, 'time_stamp': time_stamp, 'value': value, 'area': 0}
+            IngestBuffer.flush(SolarDataModel)
+            period_objects = SolarDataModel.objects.filter(**TimePeriod.get_filter(period, time_obj))
+            last_row = period_objects.order_by('-time_stamp').values('time_stamp', metric).first()
+            if last_row is not None:
+                accumulator['time_stamp'] = last_row['time_stamp']
+                accumulator['value'] = last_row[metric]
+                accumulator['area'] = SolarData.get_queryset_area(
+                    period_objects.filter(time_stamp__lte=last_row['time_stamp']), metric)
+
+        if time_stamp > accumulator['time_stamp']:
+            previous_sample = {'time_stamp': accumulator['time_stamp'], metric: accumulator['value']}
+            current_sample = {'time_stamp': time_stamp, metric: value}
+            accumulator['area'] += SolarData.get_accumulated_area([previous_sample, current_sample], metric, 'time_stamp')
+            accumulator['time_stamp'] = time_stamp
+            accumulator['value'] = value
+
+        return accumulator
+
+    @staticmethod
+    def store(timestamp: int = 0, session: requests.Session = None, executor: ThreadPoolExecutor = None) -> dict:
         """
         Store received weather station data into database.
 
         :param timestamp: Time data was received.
-        :return: ID of inserted row.
+        :param session: The HTTP session to query the inverter with, see get_raw_data().
+        :param executor: The executor to query the inverter in, see get_raw_data().
+        :return: ID of inserted row, or None if the sample was buffered.
         """
 
         # If timestamp is not provided default to now.
         if timestamp == 0:
             timestamp = datetime.now().timestamp()
 
-        date_object = datetime.fromtimestamp(timestamp)
+        date_object = TimePeriod.get_time_obj(timestamp)
 
         # Get the raw data.
-        grid_data = SolarData.get_grid_data()
-        inverter_data = SolarData.get_inverter_data()
+        grid_data, inverter_data = SolarData.get_raw_data(session, executor)
 
         # Do some calculations.
         power_consumption = SolarData.get_inst_power_consumption(
@@ -340,86 +800,129 @@ class SolarData:
             'inverter_dc_voltage': inverter_data['inverter_dc_voltage'],
             'power_consumption': power_consumption,
             'time_stamp': timestamp,
-            'time_year': date_object.year,
-            'time_month': date_object.month,
-            'time_day': date_object.day
+            'time_year': date_object['year'],
+            'time_month': date_object['month'],
+            'time_day': date_object['day']
         }
 
-        # Update latest, max and min values.
-        timestamp = datetime.now().timestamp()
-        date_object = datetime.fromtimestamp(timestamp)
-        time_obj = {
-            'year': date_object.year,
-            'month': date_object.month,
-            'day': date_object.day
-        }
+        # Update latest and accumulated values in the worker pool so we don't have to wait for a response.
+        cache_task = WorkerPool.submit('cache_solar', SolarData.thread_set, store_data)
+
+        # Store data in the database, or the ingest buffer if it is enabled.
+        data_record_id = IngestBuffer.add(SolarDataModel, store_data)
 
-        # Update caches in a thread so we don't have to wait for a response.
-        x = threading.Thread(target=SolarData.thread_set, args=(store_data, time_obj))
-        x.start()
+        # Add the new data to the daily rollup and trend tiers in the worker pool.
+        derive_task = WorkerPool.submit_write('derive_solar', SolarData.thread_derive, store_data)
 
-        # Store data in the database.
-        data_record = SolarDataModel(**store_data)
-        data_record.save()
+        # Rebuild the dashboard payload once the caches have been updated.
+        payload_task = DashboardPayload.rebuild('solar', cache_task)
 
         # Return ID of inserted row.
         return {
-            'datarecord': data_record.id,
-            'thread': x
+            'datarecord': data_record_id,
+            'thread': cache_task,
+            'derive_thread': derive_task,
+            'payload_thread': payload_task
         }
 
     @staticmethod
-    def thread_set(store_data: dict, time_obj: dict):
+    def thread_set(samples: list):
         """
-        Method called in a thread to update cache values.
+        Method called in a worker to update cache values.
+        Samples queued while the worker was busy are coalesced: the latest values are set
+        from the last sample, and every sample is added to the accumulators in one update.
 
-        :param store_data:
-        :param time_obj:
+        :param samples: The stored data for each new sample, oldest first.
         :return:
         """
-        for metric, value in store_data.items():
+        values = {}
+        for metric, value in samples[-1].items():
             if (type(value) is int) or (type(value) is float):
-                # SolarData.set_max(metric, 'day', value, time_obj)
-                # SolarData.set_min(metric, 'day', value, time_obj)
-                SolarData.set_latest(metric, value)
-        connection.close()
+                values[metric] = value
+        SolarData.set_latest_many(values, samples[-1]['time_stamp'])
+
+        # Add the new samples to the running accumulators.
+        SolarData.set_accumulated_live_many(samples)
+
+    @staticmethod
+    def thread_derive(samples: list):
+        """
+        Method called in a worker to add newly stored samples to the daily rollup and trend tiers.
+
+        :param samples: The stored data for each new sample, oldest first.
+        :return:
+        """
+
+        for store_data in samples:
+            SolarData.update_rollup(store_data)
+            SolarData.update_tiers(store_data)
 
     @staticmethod
-    def get_trend(metric: str, period: str, time_obj: dict) -> list:
+    def get_trend_range(metrics: list, start: int, end: int, max_points: int) -> dict:
+        """
+        Get the trend data for several metrics for a time range, down sampled to a maximum number of points.
+
+        :param metrics: The metrics to get the trend for, metrics that are not in the allowed list are skipped.
+        :param start: The start of the time range.
+        :param end: The end of the time range (exclusive).
+        :param max_points: The maximum number of points for each metric.
+        :return: The resolution used (0 for raw data) and the trend data for each metric.
+        """
+
+        metrics = [metric for metric in metrics if metric in SolarData.solar_metrics]
+        trend_range = TrendTiers.get_range(SolarDataModel, SolarTrendTierModel, metrics, start, end, max_points)
+
+        for metric, trend_list in trend_range['trends'].items():
+            trend_range['trends'][metric] = UnitConversion.downsample(trend_list, max_points)
+
+        return trend_range
+
+    @staticmethod
+    def update_tiers(store_data: dict):
+        """
+        Add a newly stored sample to the trend tiers.
+
+        :param store_data: The data for the sample that was stored.
+        :return:
+        """
+
+        TrendTiers.update(SolarTrendTierModel, SolarData.solar_metrics, store_data)
+
+    @staticmethod
+    def refresh_tiers(start: int, end: int):
+        """
+        Rebuild the trend tiers from the raw data for a time range.
+
+        :param start: The start of the time range.
+        :param end: The end of the time range (exclusive).
+        :return:
+        """
+
+        TrendTiers.refresh(SolarDataModel, SolarTrendTierModel, SolarData.solar_metrics, start, end)
+
+    @staticmethod
+    def get_trend(metric: str, period: str, time_obj: dict, max_points: int = None) -> list:
         """
         Get the metric trend data for a given time period.
+        Short periods such as a day are got from the raw data, so the peaks are kept when the trend is
+        down sampled. Longer periods are got from the trend tier that best matches the period and maximum
+        number of points, see TrendTiers.get_range().
 
         :param metric: The metric to get the trend for, e.g. indoor_temp
         :param period: The period the trend relates to. i.e. 'year', 'month', 'day'.
         :param time_obj: The object that contains the time data.
+        :param max_points: The maximum number of points the trend will be down sampled to,
+        defaults to the TREND_MAX_POINTS setting.
         :return: The trend data.
         """
 
-        trend_year = time_obj['year']
-        trend_month = time_obj['month']
-        trend_day = time_obj['day']
-
-        trend_data = {}
-
-        # TODO: decide if this needs to be cached.
-        if period == 'year':
-            SolarDataModel.name
-            trend_data = SolarDataModel.objects.values_list('time_stamp', metric) \
-                .filter(time_year=trend_year) \
-                .order_by('time_stamp') \
-                .all()
-        elif period == 'month':
-            trend_data = SolarDataModel.objects.values_list('time_stamp', metric) \
-                .filter(time_year=trend_year, time_month=trend_month) \
-                .order_by('time_stamp') \
-                .all()
-        elif period == 'day':
-            trend_data = SolarDataModel.objects.values_list('time_stamp', metric) \
-                .filter(time_year=trend_year, time_month=trend_month, time_day=trend_day) \
-                .order_by('time_stamp') \
-                .all()
+        if max_points is None:
+            max_points = getattr(settings, 'TREND_MAX_POINTS', 250)
+
+        start, end = TimePeriod.get_range(period, time_obj)
+        trend_range = TrendTiers.get_range(SolarDataModel, SolarTrendTierModel, [metric], start, end, max_points)
 
-        return list(trend_data)
+        return trend_range['trends'][metric]
 
     @staticmethod
     def get_data(timestamp: int = 0) -> dict:
@@ -442,35 +945,30 @@ class SolarData:
         date_object = SolarData.get_date_obj(timestamp)
 
         result_data = {}
+        latest = SolarData.get_latest_many(SolarData.solar_metrics)
+        accumulated = SolarData.get_accumulated_live_many(date_object)
 
         for metric in SolarData.solar_metrics:
             result_data[metric] = {}
-            result_data[metric]['latest'] = SolarData.get_latest(metric).get('{0}_latest'.format(metric))
+            result_data[metric]['latest'] = latest.get('{0}_latest'.format(metric))
 
             if metric in SolarData.accumulated_metrics:
-                result_data[metric]['day'] = SolarData.get_accumulated(metric, 'day', date_object)
-                result_data[metric]['week'] = SolarData.get_accumulated(metric, 'week', date_object)
-                result_data[metric]['month'] = SolarData.get_accumulated(metric, 'month', date_object)
+                result_data[metric]['day'] = accumulated[metric]['day']
+                result_data[metric]['week'] = accumulated[metric]['week']
+                result_data[metric]['month'] = accumulated[metric]['month']
 
             # Get the trend data.
             if metric in SolarData.solar_trends:
-                # We use slicing here to do some quick and dirty down sampling.
-                # Down sampling is based on number of elements (told you it was dirty).
+                # Down sample the trend to a fixed maximum number of points, keeping the peaks and troughs.
                 trend_list = SolarData.get_trend(metric, 'day', date_object)
-                list_size = len(trend_list)
-
-                if list_size <= 250:
-                    result_data[metric]['daily_trend'] = trend_list
-                elif (list_size > 250) or (list_size < 100):
-                    result_data[metric]['daily_trend'] = UnitConversion.downsample_data(trend_list, 50)
-                else:
-                    result_data[metric]['daily_trend'] = UnitConversion.downsample_data(trend_list, 100)
+                result_data[metric]['daily_trend'] = UnitConversion.downsample(trend_list)
 
         # Get some solar related data from the weather station.
         result_data['solar_radiation'] = {}
         result_data['uv_index'] = {}
-        result_data['solar_radiation']['latest'] = WeatherData.get_latest('solar_radiation').get('{0}_latest'.format('solar_radiation'))
-        result_data['uv_index']['latest'] = WeatherData.get_latest('uv_index').get('{0}_latest'.format('uv_index'))
+        weather_latest = WeatherData.get_latest_many(['solar_radiation', 'uv_index'])
+        result_data['solar_radiation']['latest'] = weather_latest.get('solar_radiation_latest')
+        result_data['uv_index']['latest'] = weather_latest.get('uv_index_latest')
 
         return result_data
 
@@ -486,26 +984,28 @@ class SolarData:
 
         # Cache max and min values. Min can be cached for ages.
         max_cache_key = 'select_date_max'
-        max_cache_val = cache.get(max_cache_key)
+        max_cache_val = DataCache.get(max_cache_key)
 
         min_cache_key = 'select_date_min'
-        min_cache_val = cache.get(min_cache_key)
+        min_cache_val = DataCache.get(min_cache_key)
 
         if max_cache_val is None:
-            max_value = SolarDataModel.objects.aggregate(Max('time_stamp'))
-            maximum = datetime.fromtimestamp(max_value['time_stamp__max']).strftime("%Y-%m-%d")
-            cache.set(max_cache_key, maximum, 600)
+            max_value = SolarDataModel.objects.order_by('-time_stamp') \
+                .values_list('time_stamp', flat=True).first()
+            maximum = TimePeriod.get_date(max_value).strftime("%Y-%m-%d")
+            DataCache.set(max_cache_key, maximum, 600)
         else:
             maximum = max_cache_val
 
         if min_cache_val is None:
-            min_value = SolarDataModel.objects.aggregate(Min('time_stamp'))
-            minimum = datetime.fromtimestamp(min_value['time_stamp__min']).strftime("%Y-%m-%d")                       
-            cache.set(min_cache_key, minimum, 86400)
+            min_value = SolarDataModel.objects.order_by('time_stamp') \
+                .values_list('time_stamp', flat=True).first()
+            minimum = TimePeriod.get_date(min_value).strftime("%Y-%m-%d")
+            DataCache.set(min_cache_key, minimum, 86400)
         else:
             minimum = min_cache_val
 
-        today = datetime.now().strftime("%Y-%m-%d")
+        today = TimePeriod.get_date(datetime.now().timestamp()).strftime("%Y-%m-%d")
 
         context = {
             'minimum': minimum,
@@ -519,6 +1019,8 @@ class SolarData:
     def get_max(metric: str, period: str, time_obj: dict, usecache: bool = True):
         """
         Get the maximum value for a given time period.
+        If the value is not cached, or has expired, it is got from the database and then set in the cache.
+        Only one caller gets an expired value from the database, the others get the expired value meanwhile.
 
         :param metric: The metric to get the maximum for, e.g. uv_index
         :param period: The period the maximum relates to. i.e. 'year', 'month', 'day'.
@@ -527,49 +1029,27 @@ class SolarData:
         :return: The found maximum value.
         """
 
-        max_year = time_obj['year']
-        max_month = time_obj['month']
-        max_day = time_obj['day']
+        if period not in TimePeriod.extreme_periods.values():
+            return {}
 
-        max_value = {}
         metric_max = '{0}__max'.format(metric)
 
-        # Get value from cache.
-        # If cache is empty or invalid get value from the database. Then store in cache.
-        if period == 'year':
-            cache_key = '_'.join(('max', metric, str(max_year)))
-            cache_val = cache.get(cache_key)
-            if (cache_val is None) or (usecache is False):
-                max_value = SolarDataModel.objects \
-                    .filter(time_year=max_year) \
-                    .aggregate(Max(metric))
-                if max_value[metric_max] is None:
-                    max_value = {metric_max: 0}
-            else:
-                max_value = {metric_max: cache_val}
-        elif period == 'month':
-            cache_key = '_'.join(('max', metric, str(max_year), str(max_month)))
-            cache_val = cache.get(cache_key)
-            if (cache_val is None) or (usecache is False):
-                max_value = SolarDataModel.objects \
-                    .filter(time_year=max_year, time_month=max_month) \
-                    .aggregate(Max(metric))
-                if max_value[metric_max] is None:
-                    max_value = {metric_max: 0}
-            else:
-                max_value = {metric_max: cache_val}
-        elif period == 'day':
-            cache_key = '_'.join(('max', metric, str(max_year), str(max_month), str(max_day)))
-            cache_val = cache.get(cache_key)
-            if (cache_val is None) or (usecache is False):
-                max_value = SolarDataModel.objects \
-                    .filter(time_year=max_year, time_month=max_month, time_day=max_day) \
-                    .aggregate(Max(metric))
-                if max_value[metric_max] is None:
-                    max_value = {metric_max: 0}
-            else:
-                max_value = {metric_max: cache_val}
-        return max_value
+        def get_db_value():
+            return SolarDataModel.objects \
+                .filter(**TimePeriod.get_filter(period, time_obj)) \
+                .aggregate(Max(metric))[metric_max]
+
+        if usecache is False:
+            max_value = get_db_value()
+        else:
+            cache_key = TimePeriod.get_extreme_cache_key('max', metric, period, time_obj)
+            max_value = DataCache.get_or_compute(cache_key, get_db_value, 3600, 'max')
+
+        # No data for the period is treated as zero, and is not cached.
+        if max_value is None:
+            max_value = 0
+
+        return {metric_max: max_value}
 
     @staticmethod
     def get_history(timestamp: int) -> dict:
@@ -597,16 +1077,8 @@ class SolarData:
 
             # Get the trend data.
             if metric in SolarData.solar_trends:
-                # We use slicing here to do some quick and dirty down sampling.
-                # Down sampling is based on number of elements (told you it was dirty).
+                # Down sample the trend to a fixed maximum number of points, keeping the peaks and troughs.
                 trend_list = SolarData.get_trend(metric, 'day', date_object)
-                list_size = len(trend_list)
-
-                if list_size <= 250:
-                    result_data[metric]['daily_trend'] = trend_list
-                elif (list_size > 250) or (list_size < 100):
-                    result_data[metric]['daily_trend'] = UnitConversion.downsample_data(trend_list, 50)
-                else:
-                    result_data[metric]['daily_trend'] = UnitConversion.downsample_data(trend_list, 100)
+                result_data[metric]['daily_trend'] = UnitConversion.downsample(trend_list)
 
         return result_data
@@ -22,6 +22,7 @@
 # @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
 # ==============================================================================
 
+from django.core.management import call_command
 from django.test import TestCase
 import solar.test.test_data as test_data
 import requests_mock
@@ -29,8 +30,15 @@ from solar.solardata import SolarData
 from django.conf import settings
 import json
 from solar.models import SolarData as SolarDataModel
+from solar.models import SolarDailyRollup as SolarDailyRollupModel
 from django.core.cache import cache
+from system.cache import DataCache
+from system.period import TimePeriod
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+import numpy as np
+import requests
 
 import logging
 
@@ -138,11 +146,60 @@ class SolarDataUnitTestCase(TestCase):
         solar_data = SolarData()
         store_result = solar_data.store()
         store_result['thread'].join()
+        store_result['payload_thread'].join()
 
         data_record = SolarDataModel.objects.get(id=store_result['datarecord'])
 
         self.assertEqual(data_record.inverter_ac_frequency, 49.99)
 
+    @requests_mock.Mocker()
+    def test_get_raw_data(self, m):
+        """
+        Test getting the grid and inverter data at the same time over one session.
+        """
+
+        inverter_domain = getattr(settings, 'SOLAR_API')
+        inverter_uri = 'http://{0}/solar_api/v1/GetMeterRealtimeData.cgi?Scope=System'.format(inverter_domain)
+        m.get(inverter_uri, text=json.dumps(test_data.test_grid_data))
+
+        inverter_uri = 'http://{0}/solar_api/v1/GetInverterRealtimeData.cgi?Scope=Device&DeviceId=1&DataCollection=CommonInverterData'.format(inverter_domain)
+        m.get(inverter_uri, text=json.dumps(test_data.test_inverter_data))
+
+        with requests.Session() as session, ThreadPoolExecutor(max_workers=2) as executor:
+            grid_data, inverter_data = SolarData.get_raw_data(session, executor)
+
+        self.assertEqual(m.call_count, 2)
+        self.assertEqual(grid_data, SolarData.get_grid_data())
+        self.assertEqual(inverter_data['inverter_ac_frequency'], 49.99)
+
+    @requests_mock.Mocker()
+    def test_pollinverter(self, m):
+        """
+        Test polling the inverter at a fixed interval.
+        """
+
+        inverter_domain = getattr(settings, 'SOLAR_API')
+        inverter_uri = 'http://{0}/solar_api/v1/GetMeterRealtimeData.cgi?Scope=System'.format(inverter_domain)
+        m.get(inverter_uri, text=json.dumps(test_data.test_grid_data))
+
+        inverter_uri = 'http://{0}/solar_api/v1/GetInverterRealtimeData.cgi?Scope=Device&DeviceId=1&DataCollection=CommonInverterData'.format(inverter_domain)
+        m.get(inverter_uri, text=json.dumps(test_data.test_inverter_data))
+
+        record_count = SolarDataModel.objects.count()
+        out = StringIO()
+        call_command('pollinverter', interval=0.2, count=3, stdout=out)
+
+        self.assertEqual(SolarDataModel.objects.count(), record_count + 3)
+        self.assertIn('3 polls, 0 failed', out.getvalue())
+
+        # A failed poll is reported and polling carries on.
+        m.get(inverter_uri, status_code=500, text='')
+        out = StringIO()
+        call_command('pollinverter', interval=0.2, count=2, stdout=out)
+
+        self.assertEqual(SolarDataModel.objects.count(), record_count + 3)
+        self.assertIn('2 polls, 2 failed', out.getvalue())
+
     def test_set_latest(self):
         """
         Test setting the latest value.
@@ -227,6 +284,42 @@ class SolarDataUnitTestCase(TestCase):
         accum_area = solar_data.get_accumulated_area(data_set, 'inverter_ac_power', 'time_stamp')
         self.assertEqual(accum_area, 79.44027777777778)
 
+    def test_get_accumulated_area_array(self):
+        """
+        Test getting the accumulated data from arrays.
+        Result should match the non vectorised method.
+        """
+
+        time_array = np.array([
+            1631858701, 1631858721, 1631858741, 1631858761, 1631858781, 1631858801,
+            1631858821, 1631858841, 1631858861, 1631858882, 1631858902], dtype=np.float64)
+        magnitude_array = np.array([
+            1308.0, 1323.0, 1653.0, 2249.0, 1968.0, 1263.0,
+            1206.0, 1173.0, 1155.0, 1155.0, 1167.0], dtype=np.float64)
+
+        solar_data = SolarData()
+
+        # Test.
+        accum_area = solar_data.get_accumulated_area_array(time_array, magnitude_array)
+        self.assertEqual(accum_area, 79.44027777777778)
+
+        # Less than two samples has no area.
+        accum_area = solar_data.get_accumulated_area_array(time_array[:1], magnitude_array[:1])
+        self.assertEqual(accum_area, 0)
+
+    def add_october_samples(self):
+        """
+        Add copies of the fixture samples with October calendar columns on the days in those columns.
+        The fixture samples have time stamps on the 17th of September. The copies keep their spacing
+        and are either side of midnight, so two are on the 17th of October and one on the 18th.
+        """
+
+        midnight = TimePeriod.get_range('day', {'year': 2021, 'month': 10, 'day': 18})[0]
+        for sample in SolarDataModel.objects.filter(time_year=2021, time_month=10).values():
+            sample.pop('id')
+            sample['time_stamp'] = midnight + sample['time_stamp'] - 1631859300
+            SolarDataModel.objects.create(**sample)
+
     def test_get_accumulated(self):
         """
         Test getting accumulated data.
@@ -240,6 +333,7 @@ class SolarDataUnitTestCase(TestCase):
             'year': 2021,
             'month': 10,
             'week': 38,
+            'week_year': 2021,
             'day': 17,
             'week_start_day': 17,
             'week_end_day': 23,
@@ -249,7 +343,10 @@ class SolarDataUnitTestCase(TestCase):
 
         # Test year.
         accum_val = solar_data.get_accumulated(metric, 'year', time_obj)
-        self.assertEqual(accum_val, 4020.651527777777)
+        self.assertAlmostEqual(accum_val, 4020.651527777777)
+
+        # Periods are found from the time stamps, so the month, week and day need samples in October.
+        self.add_october_samples()
 
         # Test month.
         accum_val = solar_data.get_accumulated(metric, 'month', time_obj)
@@ -263,6 +360,203 @@ class SolarDataUnitTestCase(TestCase):
         accum_val = solar_data.get_accumulated(metric, 'day', time_obj)
         self.assertEqual(accum_val, 14.258333333333335)
 
+        # The September day has every fixture sample.
+        accum_val = solar_data.get_accumulated(metric, 'day', {'year': 2021, 'month': 9, 'day': 17})
+        self.assertAlmostEqual(accum_val, 4020.651527777777)
+
+    def test_get_queryset_area(self):
+        """
+        Test the database and Python accumulated area calculations give the same result.
+        """
+
+        solar_data = SolarData()
+
+        for time_filter in ({'time_year': 2021}, {'time_year': 2021, 'time_month': 10, 'time_day': 17}):
+            queryset = SolarDataModel.objects.filter(**time_filter)
+            database_area = solar_data.get_queryset_area_database(queryset, 'inverter_ac_power')
+            array_area = solar_data.get_queryset_area_array(queryset, 'inverter_ac_power')
+
+            self.assertAlmostEqual(database_area, array_area)
+
+        # No data means no area.
+        queryset = SolarDataModel.objects.filter(time_year=2000)
+        self.assertEqual(solar_data.get_queryset_area_database(queryset, 'inverter_ac_power'), 0)
+        self.assertEqual(solar_data.get_queryset_area_array(queryset, 'inverter_ac_power'), 0)
+
+    def test_get_accumulated_rollup(self):
+        """
+        Test getting accumulated data from the daily rollups.
+        """
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+
+        metric = 'inverter_ac_power'
+        time_obj = {
+            'year': 2021,
+            'month': 10,
+            'week': 38,
+            'week_year': 2021,
+            'day': 17,
+            'week_start_day': 17,
+            'week_end_day': 23,
+        }
+
+        solar_data = SolarData()
+
+        for day in SolarDataModel.objects.values('time_year', 'time_month', 'time_day').distinct():
+            solar_data.rollup_day({'year': day['time_year'], 'month': day['time_month'], 'day': day['time_day']})
+
+        # The days are found from the time stamps, so the October calendar days have no samples.
+        self.assertEqual(SolarDailyRollupModel.objects.count(), 2)
+
+        # Results should match the results from the raw data.
+        accum_val = solar_data.get_accumulated(metric, 'year', time_obj, False)
+        self.assertAlmostEqual(accum_val, 4020.651527777777)
+
+        # Add samples to the October days, and roll them up.
+        self.add_october_samples()
+        for day in (17, 18):
+            solar_data.rollup_day({'year': 2021, 'month': 10, 'day': day})
+        self.assertEqual(SolarDailyRollupModel.objects.count(), 4)
+
+        accum_val = solar_data.get_accumulated(metric, 'month', time_obj, False)
+        self.assertEqual(accum_val, 19.875)
+
+        accum_val = solar_data.get_accumulated(metric, 'week', time_obj, False)
+        self.assertEqual(accum_val, 19.875)
+
+        accum_val = solar_data.get_accumulated(metric, 'day', time_obj, False)
+        self.assertEqual(accum_val, 14.258333333333335)
+
+        # The year spans rollups for several days and the gaps between them.
+        year_objects = SolarDataModel.objects.filter(**TimePeriod.get_filter('year', time_obj))
+        accum_val = solar_data.get_accumulated(metric, 'year', time_obj, False)
+        self.assertAlmostEqual(accum_val, solar_data.get_queryset_area(year_objects, metric))
+        self.assertGreater(accum_val, 4020.651527777777)
+
+    def test_get_accumulated_partial_rollup(self):
+        """
+        Test getting accumulated data when only some days have a rollup.
+        """
+
+        metric = 'inverter_ac_power'
+        time_obj = {'year': 2021, 'month': 9, 'week': 37, 'week_year': 2021, 'day': 17}
+
+        solar_data = SolarData()
+
+        # A sample on a day earlier in the month.
+        sample = SolarDataModel.objects.filter(time_stamp=1631855161).values().first()
+        sample.pop('id')
+        sample.update({'time_stamp': 1631250000, 'time_day': 10})
+        SolarDataModel.objects.create(**sample)
+
+        raw_values = {period: solar_data.get_accumulated(metric, period, time_obj, False)
+                      for period in ('year', 'month', 'week', 'day')}
+
+        # Only the last day has a rollup, and it is missing the last sample of the day.
+        last_record = SolarDataModel.objects.filter(**TimePeriod.get_filter('day', time_obj)).latest('time_stamp')
+        last_record.delete()
+        solar_data.rollup_day(time_obj)
+        last_record.save()
+        self.assertEqual(SolarDailyRollupModel.objects.count(), 1)
+
+        # The days without a rollup, and the sample missing from the rollup, come from the raw data.
+        for period, raw_value in raw_values.items():
+            self.assertAlmostEqual(solar_data.get_accumulated(metric, period, time_obj, False), raw_value)
+
+    def test_update_rollup(self):
+        """
+        Test adding a new sample to the daily rollup.
+        """
+
+        solar_data = SolarData()
+        time_obj = {'year': 2021, 'month': 9, 'day': 17}
+        day_val = solar_data.get_accumulated('inverter_ac_power', 'day', time_obj, False)
+
+        # Remove the last sample of the day and build the rollup without it.
+        last_record = SolarDataModel.objects.filter(**TimePeriod.get_filter('day', time_obj)).latest('time_stamp')
+        last_record.delete()
+        solar_data.rollup_day(time_obj)
+
+        # Adding the sample back should give the same result as the full day.
+        last_record.save()
+        store_data = SolarDataModel.objects.filter(id=last_record.id).values().first()
+
+        # The sample is stored with the calendar columns of its time stamp.
+        store_data.update({'time_year': 2021, 'time_month': 9, 'time_day': 17})
+        rollup_record = solar_data.update_rollup(store_data)
+
+        self.assertAlmostEqual(rollup_record.inverter_ac_power, day_val)
+        self.assertEqual(rollup_record.last_time_stamp, last_record.time_stamp)
+        self.assertEqual(SolarDailyRollupModel.objects.count(), 1)
+
+    def test_set_accumulated_live(self):
+        """
+        Test updating the running accumulator with new samples.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+
+        metric = 'inverter_ac_power'
+        solar_data = SolarData()
+
+        time_obj = {'year': 2021, 'month': 9, 'day': 17}
+        last_record = SolarDataModel.objects.filter(**TimePeriod.get_filter('day', time_obj)).latest('time_stamp')
+        time_obj = solar_data.get_date_obj(last_record.time_stamp)
+        day_val = solar_data.get_accumulated(metric, 'day', time_obj, False)
+
+        # Remove the last sample of the day, the accumulator will be built without it.
+        last_record.delete()
+
+        accum_val = solar_data.set_accumulated_live(metric, 'day', last_record.time_stamp, last_record.inverter_ac_power)
+        self.assertAlmostEqual(accum_val, day_val)
+
+        # The same sample should not be added twice.
+        accum_val = solar_data.set_accumulated_live(metric, 'day', last_record.time_stamp, last_record.inverter_ac_power)
+        self.assertAlmostEqual(accum_val, day_val)
+
+        accum_val = solar_data.get_accumulated_live(metric, 'day', time_obj)
+        self.assertAlmostEqual(accum_val, day_val)
+
+        # A sample from a later day should start a new day.
+        next_record = SolarDataModel.objects.filter(time_year=2022, time_month=10, time_day=18).latest('time_stamp')
+        accum_val = solar_data.set_accumulated_live(metric, 'day', next_record.time_stamp, next_record.inverter_ac_power)
+        self.assertEqual(accum_val, 0)
+
+    def test_set_accumulated_live_many(self):
+        """
+        Test updating all the running accumulators with a new sample.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+
+        solar_data = SolarData()
+
+        last_record = SolarDataModel.objects.filter(time_year=2021, time_month=9, time_day=17).latest('time_stamp')
+        time_obj = solar_data.get_date_obj(last_record.time_stamp)
+        day_val = solar_data.get_accumulated('power_consumption', 'day', time_obj, False)
+        store_data = SolarDataModel.objects.filter(id=last_record.id).values().first()
+
+        # Remove the last sample of the day, the accumulators will be built without it.
+        last_record.delete()
+
+        DataCache.reset_operations()
+        accum_vals = solar_data.set_accumulated_live_many(store_data)
+        self.assertEqual(len(accum_vals), 6)
+        self.assertAlmostEqual(accum_vals['accum_live_power_consumption_day'], day_val)
+        self.assertEqual(DataCache.get_operations(), {'operations': 2, 'keys': 12})
+
+        # The accumulated values should all be got in one operation.
+        DataCache.reset_operations()
+        accum_vals = solar_data.get_accumulated_live_many(time_obj)
+        self.assertAlmostEqual(accum_vals['power_consumption']['day'], day_val)
+        self.assertEqual(DataCache.get_operations(), {'operations': 1, 'keys': 6})
+
     def test_get_trend(self):
         """
         Test getting the trend data.
@@ -282,8 +576,9 @@ class SolarDataUnitTestCase(TestCase):
         solar_data = SolarData()
         result_data = solar_data.get_trend('grid_power_usage_real', 'day', time_obj)
 
+        # The last three samples are on this day by their time stamps, whatever their calendar columns say.
         self.assertEqual(result_data[0][0], 1631855161)
-        self.assertEqual(result_data[-1][0], 1631859241)
+        self.assertEqual(result_data[-1][0], 1631859301)
 
     def test_get_date_range(self):
         """
@@ -45,6 +45,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'system.middleware.CacheOperationsMiddleware',
+    'system.middleware.WorkerPoolMiddleware',
     #'django_cprofile_middleware.middleware.ProfilerMiddleware',
 ]
 
@@ -167,12 +169,40 @@ LOGGING = {
     }
 }
 
-CACHES = {
-    'default': {
+# Cache profiles. Set CACHE_PROFILE in the private settings to pick one, or set CACHES to override them.
+# Run the benchmarkcache command to compare the profiles on a host, see the README.
+#   file: One file per key. Works everywhere, but every operation is a file system call.
+#   locmem: Process memory. Only for a single process, the ingest commands and web server don't share it.
+#   shm: A memory mapped file shared by every process on the host. Recommended for a single host.
+#   redis: A Redis server, needs the django-redis package. For more than one host.
+CACHE_PROFILES = {
+    'file': {
         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
         'LOCATION': '/tmp/django_cache',
-    }
+    },
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'solarweather',
+    },
+    'shm': {
+        'BACKEND': 'system.shmcache.SharedMemoryCache',
+        'LOCATION': '/dev/shm/solarweather_cache',
+        'OPTIONS': {
+            'SIZE': 64 * 1024 * 1024,
+            'SLOTS': 16384,
+        },
+    },
+    'redis': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
 }
+CACHE_PROFILE = 'file'
 
 # Private settings
 from .settings_local import *
+
+if 'CACHES' not in globals():
+    CACHES = {
+        'default': CACHE_PROFILES[CACHE_PROFILE],
+    }
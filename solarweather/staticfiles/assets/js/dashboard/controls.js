@@ -1,2 +1,185 @@
+
+// ==============================================================================
+//
+// This file is part of ActiveAudit.
+//
+// ActiveAudit is free software: you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation, either version 3 of the License, or
+// (at your option) any later version.
+//
+// ActiveAudit is distributed  WITHOUT ANY WARRANTY:
+// without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+// See the GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with this software.  If not, see <http://www.gnu.org/licenses/>.
+// ==============================================================================
+
+// ==============================================================================
+//
+// @author Matthew Porritt
+// @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
 // @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
-"use strict";let counterid,callback,refreshPeriod=60;const refreshAction=e=>{e.preventDefault();const t=e.target;if(null!==t.closest("button")&&"refresh-dashboard"===t.closest("button").id)callback();else if("a"===t.tagName.toLowerCase()){refreshPeriod=t.dataset.period;const e=document.getElementById("period-container");e.getElementsByClassName("dropdown-toggle")[0].textContent=t.innerHTML;const r=e.getElementsByClassName("active");for(let e=0;e<r.length;e++)r[e].classList.remove("active");t.classList.add("active")}refreshCounter(!0)},refreshCounter=(e=!0)=>{const t=document.getElementById("refresh-progress");!0===e&&(clearInterval(counterid),counterid=null,t.setAttribute("style","width: 100%"),t.setAttribute("aria-valuenow","100")),counterid||(counterid=setInterval((()=>{const e=t.getAttribute("aria-valuenow"),r=100/refreshPeriod;e-r>0?(t.setAttribute("style","width: "+(e-r)+"%"),t.setAttribute("aria-valuenow",String(e-r))):(clearInterval(counterid),counterid=null,t.setAttribute("style","width: 100%"),t.setAttribute("aria-valuenow","100"),callback(),refreshCounter())}),1e3))};export const setup=e=>{callback=e;document.getElementById("period-container").addEventListener("click",refreshAction),refreshCounter()};
\ No newline at end of file
+// ==============================================================================
+
+'use strict';
+
+let refreshPeriod = 60;
+let counterid;
+let callback;
+let waitUrl = null;
+let waitCallback;
+let waiting = false;
+
+/**
+ * Handle processing of refresh and period button actions.
+ *
+ * @param {Event} event The triggered event for the element.
+ */
+const refreshAction = (event) => {
+    event.preventDefault();
+    const element = event.target;
+
+    if (element.closest('button') !== null && element.closest('button').id === 'refresh-dashboard') {
+        callback();
+    } else if (element.tagName.toLowerCase() === 'a') {
+        refreshPeriod = element.dataset.period;
+
+        const refreshElement = document.getElementById('period-container');
+        const actionButton = refreshElement.getElementsByClassName('dropdown-toggle')[0];
+        actionButton.textContent = element.innerHTML;
+
+        const activeoptions = refreshElement.getElementsByClassName('active');
+
+        // Fix active classes.
+        for (let i = 0; i < activeoptions.length; i++) {
+            activeoptions[i].classList.remove('active');
+        }
+        element.classList.add('active');
+    }
+
+    // The counter is not needed while the server is sending updates.
+    if (waiting) {
+        return;
+    }
+
+    refreshCounter(true);
+};
+
+/**
+ * Function for refreshing the counter.
+ *
+ * @param {boolean} reset Reset the current count process.
+ */
+const refreshCounter = (reset = true) => {
+    const progressElement = document.getElementById('refresh-progress');
+
+    // Reset the current count process.
+    if (reset === true) {
+        clearInterval(counterid);
+        counterid = null;
+        progressElement.setAttribute('style', 'width: 100%');
+        progressElement.setAttribute('aria-valuenow', '100');
+    }
+
+    // Exit early if there is already a counter running.
+    if (counterid) {
+        return;
+    }
+
+    counterid = setInterval(() => {
+        const progressWidthAria = progressElement.getAttribute('aria-valuenow');
+        const progressStep = 100 / refreshPeriod;
+
+        if ((progressWidthAria - progressStep) > 0) {
+            progressElement.setAttribute('style', 'width: ' + (progressWidthAria - progressStep) + '%');
+            progressElement.setAttribute('aria-valuenow', String(progressWidthAria - progressStep));
+        } else {
+            clearInterval(counterid);
+            counterid = null;
+            progressElement.setAttribute('style', 'width: 100%');
+            progressElement.setAttribute('aria-valuenow', '100');
+            callback();
+            refreshCounter();
+
+            // Try waiting for updates again.
+            if (waitUrl !== null && !waiting) {
+                wait();
+            }
+        }
+    }, (1000));
+};
+
+/**
+ * Stop the refresh counter while the server is sending updates.
+ */
+const pauseCounter = () => {
+    const progressElement = document.getElementById('refresh-progress');
+
+    clearInterval(counterid);
+    counterid = null;
+    progressElement.setAttribute('style', 'width: 100%');
+    progressElement.setAttribute('aria-valuenow', '100');
+};
+
+/**
+ * Wait for the server to send the next update for a dashboard.
+ * The server holds the request until the dashboard data changes, so updates arrive as soon as they are
+ * stored and the refresh counter is paused. If the server is too busy or the request fails, the dashboard
+ * is refreshed by the counter, and waiting is tried again the next time the counter reaches zero.
+ *
+ * @param {string|null} etag The ETag of the data the dashboard has.
+ */
+const wait = (etag = null) => {
+    waiting = true;
+
+    fetch(waitUrl, {cache: 'no-store', headers: etag === null ? {} : {'If-None-Match': etag}})
+        .then((response) => {
+            if (response.status === 304) {
+                // Nothing changed while we were waiting.
+                pauseCounter();
+                wait(etag);
+            } else if (response.ok) {
+                pauseCounter();
+                return response.json().then((data) => {
+                    waitCallback(data);
+                    wait(response.headers.get('ETag'));
+                });
+            } else {
+                throw new Error(response.statusText);
+            }
+        })
+        .catch(() => {
+            waiting = false;
+            callback();
+            refreshCounter(false);
+        });
+};
+
+/**
+ * External entry point to set up the refresh counter.
+ * If a wait url is given the dashboard waits for the server to send updates,
+ * and the refresh counter is only used as a fallback.
+ * The first wait returns the current data straight away.
+ *
+ * @param {function} callbackfunc The function to call when the counter reaches zero..
+ * @param {string} waiturl The url to wait for updates on.
+ * @param {function} waitcallback The function to call with the data of each update.
+ */
+export const setup = (callbackfunc, waiturl = null, waitcallback = null) => {
+    callback = callbackfunc;
+    waitUrl = waiturl;
+    waitCallback = waitcallback;
+
+    // Event handling for refresh and period buttons.
+    const refreshElement = document.getElementById('period-container');
+    refreshElement.addEventListener('click', refreshAction);
+
+    // Start the refresh counter.
+    refreshCounter();
+
+    if (waitUrl !== null) {
+        wait();
+    }
+};
@@ -1,2 +1,386 @@
+// ==============================================================================
+//
+// This file is part of SolarWeather.
+//
+// SolarWeather is free software: you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation, either version 3 of the License, or
+// (at your option) any later version.
+//
+// SolarWeather is distributed  WITHOUT ANY WARRANTY:
+// without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+// See the GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with this software.  If not, see <http://www.gnu.org/licenses/>.
+// ==============================================================================
+
+// ==============================================================================
+//
+// @author Matthew Porritt
+// @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
 // @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
-"use strict";import{setup}from"./controls.js";const weatherCharts={indoorTemp:{id:"indoor-temp-chart",chartObj:null,dataLabel:"indoor_temp",type:"line",invert:!1},outdoorTemp:{id:"outdoor-temp-chart",chartObj:null,dataLabel:"outdoor_temp",type:"line",invert:!1}};class WeatherChartConfig{constructor(e){this.config={type:e,data:{labels:[],datasets:[{backgroundColor:"#c68200",borderColor:"#FF8C00",data:[]}]},options:{responsive:!0,maintainAspectRatio:!1,plugins:{legend:{display:!1}},scales:{x:{grid:{color:"rgb(255, 255, 255, 0.5)"},ticks:{color:"rgb(255, 255, 255)"}},y:{grid:{color:"rgb(255, 255, 255, 0.5)"},ticks:{color:"rgb(255, 255, 255)"}}}}}}}let Chart;const windDegrees=["N","NE","E","SE","S","SW","W","NW"],updateGraphs=(e,t)=>{weatherCharts[e].chartObj.data.labels=t.labels,weatherCharts[e].chartObj.data.datasets[0].data=t.values,weatherCharts[e].chartObj.update()},formatDate=e=>{const t=[];return new Promise(((r,o)=>{e.labels.forEach((e=>{const r=new Date(1e3*e),o=r.getHours()+":"+("0"+r.getMinutes()).substr(-2);t.push(o)})),r({labels:t,values:e.values})}))},formatTrend=(e,t)=>{const r=[],o=[];return new Promise(((a,n)=>{e.forEach((e=>{r.push(e[0]),!0===t?o.push(-1*e[1]):o.push(e[1])})),a({labels:r,values:o})}))},updateDashboard=e=>{const t=document.getElementById("dashboard-indoor-temp-card"),r=t.querySelector(".loading-spinner"),o=t.querySelector(".overlay"),a=t.querySelectorAll(".blur"),n=document.getElementById("dashboard-outdoor-temp-card"),d=n.querySelector(".loading-spinner"),l=n.querySelector(".overlay"),i=n.querySelectorAll(".blur"),s=document.getElementById("dashboard-humidity-card"),m=s.querySelector(".loading-spinner"),u=s.querySelector(".overlay"),y=s.querySelectorAll(".blur"),c=document.getElementById("dashboard-rain-card"),p=c.querySelector(".loading-spinner"),h=c.querySelector(".overlay"),b=c.querySelectorAll(".blur"),g=document.getElementById("dashboard-pressure-card"),_=g.querySelector(".loading-spinner"),w=g.querySelector(".overlay"),E=g.querySelectorAll(".blur"),F=document.getElementById("dashboard-wind-card"),I=F.querySelector(".loading-spinner"),L=F.querySelector(".overlay"),x=F.querySelectorAll(".blur"),B=document.getElementById("indoor-temp-now"),N=document.getElementById("indoor-temp-now-feels-like"),T=document.getElementById("indoor-temp-day-min"),f=document.getElementById("indoor-temp-day-max"),H=document.getElementById("outdoor-temp-now"),M=document.getElementById("outdoor-temp-now-feels-like"),C=document.getElementById("outdoor-temp-day-min"),S=document.getElementById("outdoor-temp-day-max"),v=document.getElementById("indoor-humidity-now"),q=document.getElementById("indoor-humidity-day-min"),D=document.getElementById("indoor-humidity-day-max"),j=document.getElementById("outdoor-humidity-now"),O=document.getElementById("outdoor-humidity-day-min"),k=document.getElementById("outdoor-humidity-day-max"),A=document.getElementById("rain-day"),W=document.getElementById("rain-rate"),P=document.getElementById("rain-week"),G=document.getElementById("rain-month"),R=document.getElementById("pressure-now"),z=document.getElementById("pressure-day-min"),J=document.getElementById("pressure-day-max"),K=document.getElementById("wind-now"),Q=document.getElementById("wind-dir"),U=document.getElementById("wind-day-min"),V=document.getElementById("wind-day-max"),X=document.getElementById("wind-gust"),Y=e.indoor_temp.latest?e.indoor_temp.latest:0,Z=e.indoor_feels_temp.latest?e.indoor_feels_temp.latest:0,$=e.outdoor_temp.latest?e.outdoor_temp.latest:0,ee=e.outdoor_feels_temp.latest?e.outdoor_feels_temp.latest:0,te=e.indoor_humidity.latest?e.indoor_humidity.latest:0,re=e.outdoor_humidity.latest?e.outdoor_humidity.latest:0,oe=(new Date).getHours()+1,ae=e.daily_rain.latest/oe,ne=Number.parseInt(e.wind_direction.latest/45+.5),de=windDegrees[ne]?windDegrees[ne]:"N";B.innerHTML=Number.parseFloat(Y).toFixed(1),N.innerHTML=Number.parseFloat(Z).toFixed(1),T.innerHTML=Number.parseFloat(e.indoor_temp.daily_min).toFixed(1),f.innerHTML=Number.parseFloat(e.indoor_temp.daily_max).toFixed(1),H.innerHTML=Number.parseFloat($).toFixed(1),M.innerHTML=Number.parseFloat(ee).toFixed(1),C.innerHTML=Number.parseFloat(e.outdoor_temp.daily_min).toFixed(1),S.innerHTML=Number.parseFloat(e.outdoor_temp.daily_max).toFixed(1),v.innerHTML=Number.parseInt(te),q.innerHTML=Number.parseInt(e.indoor_humidity.daily_min),D.innerHTML=Number.parseInt(e.indoor_humidity.daily_max),j.innerHTML=Number.parseInt(re),O.innerHTML=Number.parseInt(e.outdoor_humidity.daily_min),k.innerHTML=Number.parseInt(e.outdoor_humidity.daily_max),A.innerHTML=Number.parseFloat(e.daily_rain.latest).toFixed(1),W.innerHTML=Number.parseFloat(ae).toFixed(1),P.innerHTML=Number.parseFloat(e.weekly_rain.latest).toFixed(1),G.innerHTML=Number.parseFloat(e.monthly_rain.latest).toFixed(1),R.innerHTML=Number.parseFloat(e.pressure.latest).toFixed(2),z.innerHTML=Number.parseFloat(e.pressure.daily_min).toFixed(2),J.innerHTML=Number.parseFloat(e.pressure.daily_max).toFixed(2),K.innerHTML=Number.parseFloat(e.wind_speed.latest).toFixed(1),Q.innerHTML=de,U.innerHTML=Number.parseFloat(e.wind_speed.daily_min).toFixed(1),V.innerHTML=Number.parseFloat(e.wind_speed.daily_max).toFixed(1),X.innerHTML=Number.parseFloat(e.wind_gust.latest).toFixed(1);for(const t in weatherCharts)if({}.hasOwnProperty.call(weatherCharts,t)){const r=weatherCharts[t].dataLabel;formatTrend(e[r].daily_trend,weatherCharts[t].invert).then(formatDate).then((e=>{updateGraphs(t,e)}))}r.style.display="none",o.style.display="none",a.forEach((e=>{e.classList.remove("blur")})),d.style.display="none",l.style.display="none",i.forEach((e=>{e.classList.remove("blur")})),m.style.display="none",u.style.display="none",y.forEach((e=>{e.classList.remove("blur")})),p.style.display="none",h.style.display="none",b.forEach((e=>{e.classList.remove("blur")})),_.style.display="none",w.style.display="none",E.forEach((e=>{e.classList.remove("blur")})),I.style.display="none",L.style.display="none",x.forEach((e=>{e.classList.remove("blur")}))},getData=()=>{fetch("/dataajax/?dashboard=weather").then((e=>e.json())).then((e=>updateDashboard(e)))};export const init=e=>{Chart=e;for(const e in weatherCharts)if({}.hasOwnProperty.call(weatherCharts,e)){const t=new WeatherChartConfig(weatherCharts[e].type);weatherCharts[e].chartObj=new Chart(document.getElementById(weatherCharts[e].id),t.config)}setup(getData),getData()};
\ No newline at end of file
+// ==============================================================================
+
+'use strict';
+
+import {setup} from './controls.js';
+
+/**
+ * @param {Object} weatherCharts The charts to make.
+ */
+const weatherCharts = {
+    'indoorTemp': {'id': 'indoor-temp-chart', 'chartObj': null, 'dataLabel': 'indoor_temp', 'type': 'line', 'invert': false},
+    'outdoorTemp': {'id': 'outdoor-temp-chart', 'chartObj': null, 'dataLabel': 'outdoor_temp', 'type': 'line', 'invert': false},
+};
+
+/**
+ * This class allows setting up the configuration object
+ * that is used in charts.
+ *
+ * @class WeatherChartConfig
+ */
+class WeatherChartConfig {
+    /**
+     * Constructor method for the class.
+     *
+     * @param {String} chartType The type of chart. Bar, line, etc.
+     */
+    constructor(chartType) {
+        this.config = {
+            type: chartType,
+            data: {
+                labels: [],
+                datasets: [{
+                    backgroundColor: '#c68200',
+                    borderColor: '#FF8C00',
+                    data: [],
+                }],
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                plugins: {
+                    legend: {
+                        display: false,
+                    },
+                },
+                scales: {
+                    x: {
+                        grid: {
+                            color: 'rgb(255, 255, 255, 0.5)',
+                        },
+                        ticks: {
+                            color: 'rgb(255, 255, 255)',
+                        },
+                    },
+                    y: {
+                        grid: {
+                            color: 'rgb(255, 255, 255, 0.5)',
+                        },
+                        ticks: {
+                            color: 'rgb(255, 255, 255)',
+                        },
+                    },
+                },
+            },
+        };
+    }
+}
+
+/**
+ * @param {Object} Chart The chart object factory.
+ */
+let Chart;
+
+const windDegrees = [
+    'N',
+    'NE',
+    'E',
+    'SE',
+    'S',
+    'SW',
+    'W',
+    'NW',
+];
+
+/**
+ * Update the graphs.
+ *
+ * @param {String} chartName The chart to update.
+ * @param {Object} updateData The data to update the charts with.
+ */
+const updateGraphs = (chartName, updateData) => {
+    weatherCharts[chartName].chartObj.data.labels = updateData.labels;
+    weatherCharts[chartName].chartObj.data.datasets[0].data = updateData.values;
+    weatherCharts[chartName].chartObj.update();
+};
+
+/**
+ * Format the timestamps given in the trend data into readable times.
+ *
+ *  @param {Object} data The data to update the charts with.
+ *  @return {Promise} The data processed.
+ */
+const formatDate = (data) => {
+    const labelDates = [];
+    return new Promise((resolve, reject) => {
+        data.labels.forEach((label) =>{
+            const dateObj = new Date(label * 1000);
+            const hours = dateObj.getHours();
+            const minutes = '0' + dateObj.getMinutes();
+            const strftimetime = hours + ':' + minutes.substr(-2); // Will display time in 10:30 format.
+            labelDates.push(strftimetime);
+        });
+        resolve({'labels': labelDates, 'values': data.values});
+    });
+};
+
+/**
+ * Format the trend data ready for the charts.
+ * The data can be a list of time and value pairs, or columns of time deltas and values.
+ *
+ * @param {Object} data The data to update the charts with.
+ * @param {Boolean} invert True if data values should be inverted.
+ * @return {Promise} The data processed.
+ */
+const formatTrend = (data, invert) => {
+    const labels = [];
+    const values = [];
+    return new Promise((resolve, reject) => {
+        if (Array.isArray(data)) {
+            data.forEach((datapair) =>{
+                labels.push(datapair[0]);
+                if (invert === true) {
+                    values.push(datapair[1] * -1);
+                } else {
+                    values.push(datapair[1]);
+                }
+            });
+        } else {
+            // Columnar data, the first timestamp then the time since the previous point.
+            let timestamp = data.t0;
+            data.v.forEach((value, index) =>{
+                if (index > 0) {
+                    timestamp += data.dt[index - 1];
+                }
+                labels.push(timestamp);
+                if (invert === true) {
+                    values.push(value * -1);
+                } else {
+                    values.push(value);
+                }
+            });
+        }
+        resolve({'labels': labels, 'values': values});
+    });
+};
+
+/**
+ * Update the dashboard
+ *
+ * @param {Object} data The raw data to use to update dashboard.
+ */
+const updateDashboard = (data) => {
+    // Parent card elements.
+    const indoorTempCard = document.getElementById('dashboard-indoor-temp-card');
+    const indoorTempSpinner = indoorTempCard.querySelector('.loading-spinner');
+    const indoorTempOverlay = indoorTempCard.querySelector('.overlay');
+    const indoorTempBlur = indoorTempCard.querySelectorAll('.blur');
+
+    const outdoorTempCard = document.getElementById('dashboard-outdoor-temp-card');
+    const outdoorTempSpinner = outdoorTempCard.querySelector('.loading-spinner');
+    const outdoorTempOverlay = outdoorTempCard.querySelector('.overlay');
+    const outdoorTempBlur = outdoorTempCard.querySelectorAll('.blur');
+
+    const humidityCard = document.getElementById('dashboard-humidity-card');
+    const humiditySpinner = humidityCard.querySelector('.loading-spinner');
+    const humidityOverlay = humidityCard.querySelector('.overlay');
+    const humidityBlur = humidityCard.querySelectorAll('.blur');
+
+    const rainCard = document.getElementById('dashboard-rain-card');
+    const rainSpinner = rainCard.querySelector('.loading-spinner');
+    const rainOverlay = rainCard.querySelector('.overlay');
+    const rainBlur = rainCard.querySelectorAll('.blur');
+
+    const pressureCard = document.getElementById('dashboard-pressure-card');
+    const pressureSpinner = pressureCard.querySelector('.loading-spinner');
+    const pressureOverlay = pressureCard.querySelector('.overlay');
+    const pressureBlur = pressureCard.querySelectorAll('.blur');
+
+    const windCard = document.getElementById('dashboard-wind-card');
+    const windSpinner = windCard.querySelector('.loading-spinner');
+    const windOverlay = windCard.querySelector('.overlay');
+    const windBlur = windCard.querySelectorAll('.blur');
+
+    // Individual elements that we will set.
+    const indoorTempNow = document.getElementById('indoor-temp-now');
+    const indoorTempNowFeelsLike = document.getElementById('indoor-temp-now-feels-like');
+    const indoorTempDayMin = document.getElementById('indoor-temp-day-min');
+    const indoorTempDayMax = document.getElementById('indoor-temp-day-max');
+
+    const outdoorTempNow = document.getElementById('outdoor-temp-now');
+    const outdoorTempNowFeelsLike = document.getElementById('outdoor-temp-now-feels-like');
+    const outdoorTempDayMin = document.getElementById('outdoor-temp-day-min');
+    const outdoorTempDayMax = document.getElementById('outdoor-temp-day-max');
+
+    const indoorHumidityNow = document.getElementById('indoor-humidity-now');
+    const indoorHumidityDayMin = document.getElementById('indoor-humidity-day-min');
+    const indoorHumidityDayMax = document.getElementById('indoor-humidity-day-max');
+    const outdoorHumidityNow = document.getElementById('outdoor-humidity-now');
+    const outdoorHumidityDayMin = document.getElementById('outdoor-humidity-day-min');
+    const outdoorHumidityDayMax = document.getElementById('outdoor-humidity-day-max');
+
+    const rainDay = document.getElementById('rain-day');
+    const rainRate = document.getElementById('rain-rate');
+    const rainWeek = document.getElementById('rain-week');
+    const rainMonth = document.getElementById('rain-month');
+
+    const pressureNow = document.getElementById('pressure-now');
+    const pressureDayMin = document.getElementById('pressure-day-min');
+    const pressureDayMax = document.getElementById('pressure-day-max');
+
+    const windNow = document.getElementById('wind-now');
+    const windDir = document.getElementById('wind-dir');
+    const windDayMin = document.getElementById('wind-day-min');
+    const windDayMax = document.getElementById('wind-day-max');
+    const windGust = document.getElementById('wind-gust');
+
+    // Handle some potential null conditions.
+    const indoorTempNowVal = data.indoor_temp.latest ? data.indoor_temp.latest : 0;
+    const indoorTempNowFeelsLikeVal = data.indoor_feels_temp.latest? data.indoor_feels_temp.latest : 0;
+
+    const outdoorTempNowVal = data.outdoor_temp.latest ? data.outdoor_temp.latest : 0;
+    const outdoorTempNowFeelsLikeVal = data.outdoor_feels_temp.latest ? data.outdoor_feels_temp.latest : 0;
+
+    const indoorHumidityNowVal = data.indoor_humidity.latest ? data.indoor_humidity.latest : 0;
+    const outdoorHumidityNowVal = data.outdoor_humidity.latest ? data.outdoor_humidity.latest : 0;
+
+    // Calculations.
+    const nowDate = new Date();
+    const nowHours = nowDate.getHours() + 1;
+    const rainRateVal = data.daily_rain.latest / nowHours;
+
+    const winDirVal = Number.parseInt((data.wind_direction.latest/45)+.5);
+    const windDirStr = windDegrees[winDirVal] ? windDegrees[winDirVal] : 'N';
+
+    // Set the values.
+    indoorTempNow.innerHTML = Number.parseFloat(indoorTempNowVal).toFixed(1);
+    indoorTempNowFeelsLike.innerHTML = Number.parseFloat(indoorTempNowFeelsLikeVal).toFixed(1);
+    indoorTempDayMin.innerHTML = Number.parseFloat(data.indoor_temp.daily_min).toFixed(1);
+    indoorTempDayMax.innerHTML = Number.parseFloat(data.indoor_temp.daily_max).toFixed(1);
+
+    outdoorTempNow.innerHTML = Number.parseFloat(outdoorTempNowVal).toFixed(1);
+    outdoorTempNowFeelsLike.innerHTML = Number.parseFloat(outdoorTempNowFeelsLikeVal).toFixed(1);
+    outdoorTempDayMin.innerHTML = Number.parseFloat(data.outdoor_temp.daily_min).toFixed(1);
+    outdoorTempDayMax.innerHTML = Number.parseFloat(data.outdoor_temp.daily_max).toFixed(1);
+
+    indoorHumidityNow.innerHTML = Number.parseInt(indoorHumidityNowVal);
+    indoorHumidityDayMin.innerHTML = Number.parseInt(data.indoor_humidity.daily_min);
+    indoorHumidityDayMax.innerHTML = Number.parseInt(data.indoor_humidity.daily_max);
+
+    outdoorHumidityNow.innerHTML = Number.parseInt(outdoorHumidityNowVal);
+    outdoorHumidityDayMin.innerHTML = Number.parseInt(data.outdoor_humidity.daily_min);
+    outdoorHumidityDayMax.innerHTML = Number.parseInt(data.outdoor_humidity.daily_max);
+
+    rainDay.innerHTML = Number.parseFloat(data.daily_rain.latest).toFixed(1);
+    rainRate.innerHTML = Number.parseFloat(rainRateVal).toFixed(1);
+    rainWeek.innerHTML = Number.parseFloat(data.weekly_rain.latest).toFixed(1);
+    rainMonth.innerHTML = Number.parseFloat(data.monthly_rain.latest).toFixed(1);
+
+    pressureNow.innerHTML = Number.parseFloat(data.pressure.latest).toFixed(2);
+    pressureDayMin.innerHTML = Number.parseFloat(data.pressure.daily_min).toFixed(2);
+    pressureDayMax.innerHTML = Number.parseFloat(data.pressure.daily_max).toFixed(2);
+
+    windNow.innerHTML = Number.parseFloat(data.wind_speed.latest).toFixed(1);
+    windDir.innerHTML = windDirStr;
+    windDayMin.innerHTML = Number.parseFloat(data.wind_speed.daily_min).toFixed(1);
+    windDayMax.innerHTML = Number.parseFloat(data.wind_speed.daily_max).toFixed(1);
+    windGust.innerHTML = Number.parseFloat(data.wind_gust.latest).toFixed(1);
+
+    // Update the charts.
+    for (const chartName in weatherCharts) {
+        if ({}.hasOwnProperty.call(weatherCharts, chartName)) {
+            const trendName = weatherCharts[chartName].dataLabel;
+            formatTrend(data[trendName].daily_trend, weatherCharts[chartName].invert)
+                .then(formatDate)
+                .then((trendData) => {
+                    updateGraphs(chartName, trendData);
+                });
+        }
+    }
+
+    // Remove the blur effect etc.
+    indoorTempSpinner.style.display = 'none';
+    indoorTempOverlay.style.display = 'none';
+    indoorTempBlur.forEach((BlurredItem) =>{
+        BlurredItem.classList.remove('blur');
+    });
+
+    outdoorTempSpinner.style.display = 'none';
+    outdoorTempOverlay.style.display = 'none';
+    outdoorTempBlur.forEach((BlurredItem) =>{
+        BlurredItem.classList.remove('blur');
+    });
+
+    humiditySpinner.style.display = 'none';
+    humidityOverlay.style.display = 'none';
+    humidityBlur.forEach((BlurredItem) =>{
+        BlurredItem.classList.remove('blur');
+    });
+
+    rainSpinner.style.display = 'none';
+    rainOverlay.style.display = 'none';
+    rainBlur.forEach((BlurredItem) =>{
+        BlurredItem.classList.remove('blur');
+    });
+
+    pressureSpinner.style.display = 'none';
+    pressureOverlay.style.display = 'none';
+    pressureBlur.forEach((BlurredItem) =>{
+        BlurredItem.classList.remove('blur');
+    });
+
+    windSpinner.style.display = 'none';
+    windOverlay.style.display = 'none';
+    windBlur.forEach((BlurredItem) =>{
+        BlurredItem.classList.remove('blur');
+    });
+};
+
+/**
+ * Get raw dashboard data.
+ *
+ * @method getData
+ */
+const getData = () => {
+    fetch('/dataajax/?dashboard=weather&format=columns')
+        .then((response) => response.json())
+        .then((data) => updateDashboard(data));
+};
+
+/**
+ * Script entry point.
+ *
+ * @method init
+ * @param {Object} chart The chart object.
+ *
+ */
+export const init = (chart) => {
+    Chart = chart;
+
+    // Setup the initial charts.
+    for (const chartName in weatherCharts) {
+        if ({}.hasOwnProperty.call(weatherCharts, chartName)) {
+            const chartConfigObj = new WeatherChartConfig(weatherCharts[chartName].type);
+            weatherCharts[chartName].chartObj = new Chart(
+                document.getElementById(weatherCharts[chartName].id),
+                chartConfigObj.config
+            );
+        }
+    }
+
+    // Setup auto retrieving of data, waiting for the server gets the initial data to kick things off.
+    setup(getData, '/datawait/?dashboard=weather&format=columns', updateDashboard);
+};
+
@@ -1,2 +1,371 @@
+// ==============================================================================
+//
+// This file is part of SolarWeather.
+//
+// SolarWeather is free software: you can redistribute it and/or modify
+// it under the terms of the GNU General Public License as published by
+// the Free Software Foundation, either version 3 of the License, or
+// (at your option) any later version.
+//
+// SolarWeather is distributed  WITHOUT ANY WARRANTY:
+// without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+// See the GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with this software.  If not, see <http://www.gnu.org/licenses/>.
+// ==============================================================================
+
+// ==============================================================================
+//
+// @author Matthew Porritt
+// @copyright  2022 onwards Matthew Porritt (mattp@catalyst-au.net)
 // @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
-"use strict";const solarCharts={energyBalance:{id:"energy-balance-chart",chartObj:null,dataLabel:"grid_power_usage_real",type:"bar",invert:!0,suggestedMinVal:-5e3,suggestedMaxVal:5e3},generation:{id:"solar-generation-chart",chartObj:null,dataLabel:"inverter_ac_power",type:"line",invert:!1,suggestedMinVal:0,suggestedMaxVal:5e3}};class SolarChartConfig{constructor(e,a,t){this.config={type:e,data:{labels:[],datasets:[{backgroundColor:"#c68200",borderColor:"#FF8C00",data:[]}]},options:{responsive:!0,maintainAspectRatio:!1,plugins:{legend:{display:!1}},scales:{x:{grid:{color:"rgb(255, 255, 255, 0.5)"},ticks:{color:"rgb(255, 255, 255)"}},y:{grid:{color:"rgb(255, 255, 255, 0.5)"},ticks:{color:"rgb(255, 255, 255)"},suggestedMin:-5e3,suggestedMax:5e3}}}},void 0!==a&&(this.config.options.scales.y.suggestedMin=a),void 0!==t&&(this.config.options.scales.y.suggestedMax=t)}}let Chart;const updateGraphs=(e,a)=>{solarCharts[e].chartObj.data.labels=a.labels,solarCharts[e].chartObj.data.datasets[0].data=a.values,solarCharts[e].chartObj.update()},formatDate=e=>{const a=[];return new Promise(((t,r)=>{e.labels.forEach((e=>{const t=new Date(1e3*e),r=t.getHours()+":"+("0"+t.getMinutes()).substr(-2);a.push(r)})),t({labels:a,values:e.values})}))},formatTrend=(e,a)=>{const t=[],r=[];return new Promise(((o,n)=>{e.forEach((e=>{t.push(e[0]),!0===a?r.push(-1*e[1]):r.push(e[1])})),o({labels:t,values:r})}))},updateDashboard=e=>{const a=document.getElementById("dashboard-peak-usage-card"),t=a.querySelector(".loading-spinner"),r=a.querySelector(".overlay"),o=a.querySelectorAll(".blur"),n=document.getElementById("dashboard-daily-power-card"),s=n.querySelector(".loading-spinner"),l=n.querySelector(".overlay"),d=n.querySelectorAll(".blur"),i=document.getElementById("dashboard-energy-balance-card"),c=i.querySelector(".loading-spinner"),u=i.querySelector(".overlay"),g=i.querySelectorAll(".blur"),p=document.getElementById("dashboard-solar-generation-card"),m=p.querySelector(".loading-spinner"),y=p.querySelector(".overlay"),h=p.querySelectorAll(".blur"),b=document.getElementById("peak-usage-now"),_=document.getElementById("peak-usage-from-solar"),w=document.getElementById("peak-usage-from-grid"),v=document.getElementById("generated-day"),C=document.getElementById("generated-week"),x=document.getElementById("generated-month"),E=document.getElementById("used-day"),f=document.getElementById("used-week"),F=document.getElementById("used-month"),M=document.getElementById("energy-balance-surplus"),L=document.getElementById("solar-generation-total"),B=e.power_consumption.daily_max?e.power_consumption.daily_max:0,I=e.inverter_ac_power.daily_max?e.inverter_ac_power.daily_max:0,S=e.grid_power_usage_real.daily_max?e.grid_power_usage_real.daily_max:0,k=e.inverter_ac_power.day?e.inverter_ac_power.day:0,T=e.inverter_ac_power.week?e.inverter_ac_power.week:0,q=e.inverter_ac_power.month?e.inverter_ac_power.month:0,H=e.power_consumption.day?e.power_consumption.day:0,N=e.power_consumption.week?e.power_consumption.week:0,j=e.power_consumption.month?e.power_consumption.month:0,D=Number.parseFloat(B)/1e3,O=Number.parseFloat(I)/1e3,A=Number.parseFloat(S)/1e3,V=Number.parseFloat(k)/1e3,P=Number.parseFloat(T)/1e3,G=Number.parseFloat(q)/1e3,R=Number.parseFloat(H)/1e3,z=Number.parseFloat(N)/1e3,J=Number.parseFloat(j)/1e3,K=V-R;b.innerHTML=D.toFixed(3),_.innerHTML=O.toFixed(3),w.innerHTML=A.toFixed(3),v.innerHTML=V.toFixed(3),C.innerHTML=P.toFixed(1),x.innerHTML=G.toFixed(1),E.innerHTML=R.toFixed(3),f.innerHTML=z.toFixed(1),F.innerHTML=J.toFixed(1),M.innerHTML=K.toFixed(3),L.innerHTML=V.toFixed(3);for(const a in solarCharts)if({}.hasOwnProperty.call(solarCharts,a)){const t=solarCharts[a].dataLabel;formatTrend(e[t].daily_trend,solarCharts[a].invert).then(formatDate).then((e=>{updateGraphs(a,e)}))}t.style.display="none",r.style.display="none",o.forEach((e=>{e.classList.remove("blur")})),s.style.display="none",l.style.display="none",d.forEach((e=>{e.classList.remove("blur")})),c.style.display="none",u.style.display="none",g.forEach((e=>{e.classList.remove("blur")})),m.style.display="none",y.style.display="none",h.forEach((e=>{e.classList.remove("blur")}))},getData=e=>{fetch("/dataajax/?dashboard=solar&history=1&timestamp="+e).then((e=>e.json())).then((e=>updateDashboard(e)))},dateChange=e=>{const a=e.target.valueAsNumber/1e3;getData(a)};export const init=e=>{Chart=e;for(const e in solarCharts)if({}.hasOwnProperty.call(solarCharts,e)){const a=new SolarChartConfig(solarCharts[e].type,solarCharts[e].suggestedMinVal,solarCharts[e].suggestedMaxVal);solarCharts[e].chartObj=new Chart(document.getElementById(solarCharts[e].id),a.config)}const a=document.getElementById("history-date");a.addEventListener("change",dateChange);const t=a.valueAsNumber/1e3;getData(t)};
\ No newline at end of file
+// ==============================================================================
+
+'use strict';
+
+/**
+ * @param {Object} weatherCharts The charts to make.
+ */
+const solarCharts = {
+    'energyBalance': {
+        'id': 'energy-balance-chart',
+        'chartObj': null,
+        'dataLabel': 'grid_power_usage_real',
+        'type': 'bar',
+        'invert': true,
+        'suggestedMinVal': -5000,
+        'suggestedMaxVal': 5000,
+    },
+    'generation': {
+        'id': 'solar-generation-chart',
+        'chartObj': null,
+        'dataLabel': 'inverter_ac_power',
+        'type': 'line',
+        'invert': false,
+        'suggestedMinVal': 0,
+        'suggestedMaxVal': 5000,
+    },
+};
+
+/**
+ * This class allows setting up the configuration object
+ * that is used in charts.
+ *
+ * @class SolarChartConfig
+ */
+class SolarChartConfig {
+    /**
+     * Constructor method for the class.
+     *
+     * @param {String} chartType The type of chart. Bar, line, etc.
+     * @param {Int} suggestedMinVal The suggested min value for the y scale.
+     * @param {Int} suggestedMaxVal The suggested max value for the y scale.
+     */
+    constructor(chartType, suggestedMinVal, suggestedMaxVal) {
+        this.config = {
+            type: chartType,
+            data: {
+                labels: [],
+                datasets: [{
+                    backgroundColor: '#c68200',
+                    borderColor: '#FF8C00',
+                    data: [],
+                }],
+            },
+            options: {
+                responsive: true,
+                maintainAspectRatio: false,
+                plugins: {
+                    legend: {
+                        display: false,
+                    },
+                },
+                scales: {
+                    x: {
+                        grid: {
+                            color: 'rgb(255, 255, 255, 0.5)',
+                        },
+                        ticks: {
+                            color: 'rgb(255, 255, 255)',
+                        },
+                    },
+                    y: {
+                        grid: {
+                            color: 'rgb(255, 255, 255, 0.5)',
+                        },
+                        ticks: {
+                            color: 'rgb(255, 255, 255)',
+                        },
+                        suggestedMin: -5000,
+                        suggestedMax: 5000,
+                    },
+                },
+            },
+        };
+
+        if (typeof suggestedMinVal !== 'undefined') {
+            this.config.options.scales.y.suggestedMin = suggestedMinVal;
+        }
+
+        if (typeof suggestedMaxVal !== 'undefined') {
+            this.config.options.scales.y.suggestedMax = suggestedMaxVal;
+        }
+    }
+}
+
+/**
+ * @param {Object} Chart The chart object factory.
+ */
+let Chart;
+
+/**
+ * Update the graphs.
+ *
+ * @param {String} chartName The chart to update.
+ * @param {Object} updateData The data to update the charts with.
+ */
+const updateGraphs = (chartName, updateData) => {
+    solarCharts[chartName].chartObj.data.labels = updateData.labels;
+    solarCharts[chartName].chartObj.data.datasets[0].data = updateData.values;
+    solarCharts[chartName].chartObj.update();
+};
+
+/**
+ * Format the timestamps given in the trend data into readable times.
+ *
+ *  @param {Object} data The data to update the charts with.
+ *  @return {Promise} The data processed.
+ */
+const formatDate = (data) => {
+    const labelDates = [];
+    return new Promise((resolve, reject) => {
+        data.labels.forEach((label) =>{
+            const dateObj = new Date(label * 1000);
+            const hours = dateObj.getHours();
+            const minutes = '0' + dateObj.getMinutes();
+            const strftimetime = hours + ':' + minutes.substr(-2); // Will display time in 10:30 format.
+            labelDates.push(strftimetime);
+        });
+        resolve({'labels': labelDates, 'values': data.values});
+    });
+};
+
+/**
+ * Format the trend data ready for the charts.
+ * The data can be a list of time and value pairs, or columns of time deltas and values.
+ *
+ * @param {Object} data The data to update the charts with.
+ * @param {Boolean} invert True if data values should be inverted.
+ * @return {Promise} The data processed.
+ */
+const formatTrend = (data, invert) => {
+    const labels = [];
+    const values = [];
+
+    return new Promise((resolve, reject) => {
+        if (Array.isArray(data)) {
+            data.forEach((datapair) =>{
+                labels.push(datapair[0]);
+                if (invert === true) {
+                    values.push(datapair[1] * -1);
+                } else {
+                    values.push(datapair[1]);
+                }
+            });
+        } else {
+            // Columnar data, the first timestamp then the time since the previous point.
+            let timestamp = data.t0;
+            data.v.forEach((value, index) =>{
+                if (index > 0) {
+                    timestamp += data.dt[index - 1];
+                }
+                labels.push(timestamp);
+                if (invert === true) {
+                    values.push(value * -1);
+                } else {
+                    values.push(value);
+                }
+            });
+        }
+        resolve({'labels': labels, 'values': values});
+    });
+};
+
+/**
+ * Update the dashboard
+ *
+ * @param {Object} data The raw data to use to update dashboard.
+ */
+const updateDashboard = (data) => {
+    // Parent card elements.
+    const peakUsageCard = document.getElementById('dashboard-peak-usage-card');
+    const peakUsageSpinner = peakUsageCard.querySelector('.loading-spinner');
+    const peakUsageOverlay = peakUsageCard.querySelector('.overlay');
+    const peakUsageBlur = peakUsageCard.querySelectorAll('.blur');
+
+    const dailyPowerCard = document.getElementById('dashboard-daily-power-card');
+    const dailyPowerSpinner = dailyPowerCard.querySelector('.loading-spinner');
+    const dailyPowerOverlay = dailyPowerCard.querySelector('.overlay');
+    const dailyPowerBlur = dailyPowerCard.querySelectorAll('.blur');
+
+    const energyBalanceCard = document.getElementById('dashboard-energy-balance-card');
+    const energyBalanceSpinner = energyBalanceCard.querySelector('.loading-spinner');
+    const energyBalanceOverlay = energyBalanceCard.querySelector('.overlay');
+    const energyBalanceBlur = energyBalanceCard.querySelectorAll('.blur');
+
+    const solarGenerationCard = document.getElementById('dashboard-solar-generation-card');
+    const solarGenerationSpinner = solarGenerationCard.querySelector('.loading-spinner');
+    const solarGenerationOverlay = solarGenerationCard.querySelector('.overlay');
+    const solarGenerationBlur = solarGenerationCard.querySelectorAll('.blur');
+
+    // Individual elements that we will set.
+    const peakUsageNow = document.getElementById('peak-usage-now');
+    const peakUsageFromSolar = document.getElementById('peak-usage-from-solar');
+    const peakUsageFromGrid = document.getElementById('peak-usage-from-grid');
+
+    const generatedDay = document.getElementById('generated-day');
+    const generatedWeek = document.getElementById('generated-week');
+    const generatedMonth = document.getElementById('generated-month');
+    const usedDay = document.getElementById('used-day');
+    const usedWeek = document.getElementById('used-week');
+    const usedMonth = document.getElementById('used-month');
+
+    const energyBalanceSurplus = document.getElementById('energy-balance-surplus');
+
+    const solarGenerationTotal = document.getElementById('solar-generation-total');
+
+    // Handle some potential null conditions.
+    const peakUsageNowVal = data.power_consumption.daily_max ? data.power_consumption.daily_max : 0;
+    const peakUsageFromSolarVal = data.inverter_ac_power.daily_max? data.inverter_ac_power.daily_max : 0;
+    const peakUsageFromGridVal = data.grid_power_usage_real.daily_max? data.grid_power_usage_real.daily_max : 0;
+
+    const generatedDayVal = data.inverter_ac_power.day ? data.inverter_ac_power.day : 0;
+    const generatedWeekVal = data.inverter_ac_power.week ? data.inverter_ac_power.week : 0;
+    const generatedMonthVal = data.inverter_ac_power.month ? data.inverter_ac_power.month : 0;
+    const usedDayVal = data.power_consumption.day ? data.power_consumption.day : 0;
+    const usedWeekVal = data.power_consumption.week ? data.power_consumption.week : 0;
+    const usedMonthVal = data.power_consumption.month ? data.power_consumption.month : 0;
+
+    // Calculations.
+    const peakUsageNowValFloat = Number.parseFloat(peakUsageNowVal) / 1000;
+    const peakUsageFromSolarValFloat = Number.parseFloat(peakUsageFromSolarVal) / 1000;
+    const peakUsageFromGridValFloat = Number.parseFloat(peakUsageFromGridVal) / 1000;
+
+    const generatedDayValFloat = Number.parseFloat(generatedDayVal) / 1000;
+    const generatedWeekValFloat = Number.parseFloat(generatedWeekVal) / 1000;
+    const generatedMonthValFloat = Number.parseFloat(generatedMonthVal) / 1000;
+    const usedDayValFloat = Number.parseFloat(usedDayVal) / 1000;
+    const usedWeekValFloat = Number.parseFloat(usedWeekVal) / 1000;
+    const usedMonthValFloat = Number.parseFloat(usedMonthVal) / 1000;
+
+    const energyBalanceSurplusVal = generatedDayValFloat - usedDayValFloat;
+
+    // Set the values.
+    peakUsageNow.innerHTML = peakUsageNowValFloat.toFixed(3);
+    peakUsageFromSolar.innerHTML = peakUsageFromSolarValFloat.toFixed(3);
+    peakUsageFromGrid.innerHTML = peakUsageFromGridValFloat.toFixed(3);
+
+    generatedDay.innerHTML = generatedDayValFloat.toFixed(3);
+    generatedWeek.innerHTML = generatedWeekValFloat.toFixed(1);
+    generatedMonth.innerHTML = generatedMonthValFloat.toFixed(1);
+    usedDay.innerHTML = usedDayValFloat.toFixed(3);
+    usedWeek.innerHTML = usedWeekValFloat.toFixed(1);
+    usedMonth.innerHTML = usedMonthValFloat.toFixed(1);
+
+    energyBalanceSurplus.innerHTML = energyBalanceSurplusVal.toFixed(3);
+
+    solarGenerationTotal.innerHTML = generatedDayValFloat.toFixed(3);
+
+    // Update the charts.
+    for (const chartName in solarCharts) {
+        if ({}.hasOwnProperty.call(solarCharts, chartName)) {
+            const trendName = solarCharts[chartName].dataLabel;
+            formatTrend(data[trendName].daily_trend, solarCharts[chartName].invert)
+                .then(formatDate)
+                .then((trendData) => {
+                    updateGraphs(chartName, trendData);
+                });
+        }
+    }
+
+    // Remove the blur effect etc.
+    peakUsageSpinner.style.display = 'none';
+    peakUsageOverlay.style.display = 'none';
+    peakUsageBlur.forEach((BlurredItem) =>{
+        BlurredItem.classList.remove('blur');
+    });
+
+    dailyPowerSpinner.style.display = 'none';
+    dailyPowerOverlay.style.display = 'none';
+    dailyPowerBlur.forEach((BlurredItem) =>{
+        BlurredItem.classList.remove('blur');
+    });
+
+    energyBalanceSpinner.style.display = 'none';
+    energyBalanceOverlay.style.display = 'none';
+    energyBalanceBlur.forEach((BlurredItem) =>{
+        BlurredItem.classList.remove('blur');
+    });
+
+    solarGenerationSpinner.style.display = 'none';
+    solarGenerationOverlay.style.display = 'none';
+    solarGenerationBlur.forEach((BlurredItem) =>{
+        BlurredItem.classList.remove('blur');
+    });
+};
+
+/**
+ * Get raw dashboard data.
+ *
+ * @method getData
+ * @param {int} timestamp The timestamp to get the data for.
+ */
+const getData = (timestamp) => {
+    const urlString = '/dataajax/?dashboard=solar&history=1&format=columns&timestamp=' + timestamp;
+    fetch(urlString)
+        .then((response) => response.json())
+        .then((data) => updateDashboard(data));
+};
+
+/**
+ * Process the date change event.
+ *
+ * @method dateChange
+ * @param {event} event The date change event.
+ */
+const dateChange = (event) => {
+    const timestamp = (event.target.valueAsNumber) / 1000;
+    getData(timestamp);
+};
+
+/**
+ * Script entry point.
+ *
+ * @method init
+ * @param {Object} chart The chart object.
+ */
+export const init = (chart) => {
+    Chart = chart;
+
+    // Set up the initial charts.
+    for (const chartName in solarCharts) {
+        if ({}.hasOwnProperty.call(solarCharts, chartName)) {
+            const chartConfigObj = new SolarChartConfig(
+                solarCharts[chartName].type, solarCharts[chartName].suggestedMinVal, solarCharts[chartName].suggestedMaxVal);
+            solarCharts[chartName].chartObj = new Chart(
+                document.getElementById(solarCharts[chartName].id),
+                chartConfigObj.config
+            );
+        }
+    }
+
+    // Set up the event listener.
+    const dateSelector = document.getElementById('history-date');
+    dateSelector.addEventListener('change', dateChange);
+
+    // Initial set kick off.
+    const timestamp = (dateSelector.valueAsNumber) / 1000;
+    getData(timestamp);
+};
+
@@ -28,6 +28,9 @@
 let refreshPeriod = 60;
 let counterid;
 let callback;
+let waitUrl = null;
+let waitCallback;
+let waiting = false;
 
 /**
  * Handle processing of refresh and period button actions.
@@ -56,6 +59,11 @@ const refreshAction = (event) => {
         element.classList.add('active');
     }
 
+    // The counter is not needed while the server is sending updates.
+    if (waiting) {
+        return;
+    }
+
     refreshCounter(true);
 };
 
@@ -94,17 +102,75 @@ const refreshCounter = (reset = true) => {
             progressElement.setAttribute('aria-valuenow', '100');
             callback();
             refreshCounter();
+
+            // Try waiting for updates again.
+            if (waitUrl !== null && !waiting) {
+                wait();
+            }
         }
     }, (1000));
 };
 
+/**
+ * Stop the refresh counter while the server is sending updates.
+ */
+const pauseCounter = () => {
+    const progressElement = document.getElementById('refresh-progress');
+
+    clearInterval(counterid);
+    counterid = null;
+    progressElement.setAttribute('style', 'width: 100%');
+    progressElement.setAttribute('aria-valuenow', '100');
+};
+
+/**
+ * Wait for the server to send the next update for a dashboard.
+ * The server holds the request until the dashboard data changes, so updates arrive as soon as they are
+ * stored and the refresh counter is paused. If the server is too busy or the request fails, the dashboard
+ * is refreshed by the counter, and waiting is tried again the next time the counter reaches zero.
+ *
+ * @param {string|null} etag The ETag of the data the dashboard has.
+ */
+const wait = (etag = null) => {
+    waiting = true;
+
+    fetch(waitUrl, {cache: 'no-store', headers: etag === null ? {} : {'If-None-Match': etag}})
+        .then((response) => {
+            if (response.status === 304) {
+                // Nothing changed while we were waiting.
+                pauseCounter();
+                wait(etag);
+            } else if (response.ok) {
+                pauseCounter();
+                return response.json().then((data) => {
+                    waitCallback(data);
+                    wait(response.headers.get('ETag'));
+                });
+            } else {
+                throw new Error(response.statusText);
+            }
+        })
+        .catch(() => {
+            waiting = false;
+            callback();
+            refreshCounter(false);
+        });
+};
+
 /**
  * External entry point to set up the refresh counter.
+ * If a wait url is given the dashboard waits for the server to send updates,
+ * and the refresh counter is only used as a fallback.
+ * The first wait returns the current data straight away.
  *
  * @param {function} callbackfunc The function to call when the counter reaches zero..
+ * @param {string} waiturl The url to wait for updates on.
+ * @param {function} waitcallback The function to call with the data of each update.
  */
-export const setup = (callbackfunc) => {
+export const setup = (callbackfunc, waiturl = null, waitcallback = null) => {
     callback = callbackfunc;
+    waitUrl = waiturl;
+    waitCallback = waitcallback;
 
     // Event handling for refresh and period buttons.
     const refreshElement = document.getElementById('period-container');
@@ -112,4 +178,8 @@ export const setup = (callbackfunc) => {
 
     // Start the refresh counter.
     refreshCounter();
+
+    if (waitUrl !== null) {
+        wait();
+    }
 };
@@ -138,6 +138,7 @@ const formatDate = (data) => {
 
 /**
  * Format the trend data ready for the charts.
+ * The data can be a list of time and value pairs, or columns of time deltas and values.
  *
  * @param {Object} data The data to update the charts with.
  * @param {Boolean} invert True if data values should be inverted.
@@ -147,14 +148,30 @@ const formatTrend = (data, invert) => {
     const labels = [];
     const values = [];
     return new Promise((resolve, reject) => {
-        data.forEach((datapair) =>{
-            labels.push(datapair[0]);
-            if (invert === true) {
-                values.push(datapair[1] * -1);
-            } else {
-                values.push(datapair[1]);
-            }
-        });
+        if (Array.isArray(data)) {
+            data.forEach((datapair) =>{
+                labels.push(datapair[0]);
+                if (invert === true) {
+                    values.push(datapair[1] * -1);
+                } else {
+                    values.push(datapair[1]);
+                }
+            });
+        } else {
+            // Columnar data, the first timestamp then the time since the previous point.
+            let timestamp = data.t0;
+            data.v.forEach((value, index) =>{
+                if (index > 0) {
+                    timestamp += data.dt[index - 1];
+                }
+                labels.push(timestamp);
+                if (invert === true) {
+                    values.push(value * -1);
+                } else {
+                    values.push(value);
+                }
+            });
+        }
         resolve({'labels': labels, 'values': values});
     });
 };
@@ -337,7 +354,7 @@ const updateDashboard = (data) => {
  * @method getData
  */
 const getData = () => {
-    fetch('/dataajax/?dashboard=weather')
+    fetch('/dataajax/?dashboard=weather&format=columns')
         .then((response) => response.json())
         .then((data) => updateDashboard(data));
 };
@@ -363,10 +380,7 @@ export const init = (chart) => {
         }
     }
 
-    // Setup auto retrieving of data.
-    setup(getData);
-
-    // Get initial data to kick things off.
-    getData();
+    // Setup auto retrieving of data, waiting for the server gets the initial data to kick things off.
+    setup(getData, '/datawait/?dashboard=weather&format=columns', updateDashboard);
 };
 
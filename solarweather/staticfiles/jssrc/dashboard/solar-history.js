@@ -153,6 +153,7 @@ const formatDate = (data) => {
 
 /**
  * Format the trend data ready for the charts.
+ * The data can be a list of time and value pairs, or columns of time deltas and values.
  *
  * @param {Object} data The data to update the charts with.
  * @param {Boolean} invert True if data values should be inverted.
@@ -163,14 +164,30 @@ const formatTrend = (data, invert) => {
     const values = [];
 
     return new Promise((resolve, reject) => {
-        data.forEach((datapair) =>{
-            labels.push(datapair[0]);
-            if (invert === true) {
-                values.push(datapair[1] * -1);
-            } else {
-                values.push(datapair[1]);
-            }
-        });
+        if (Array.isArray(data)) {
+            data.forEach((datapair) =>{
+                labels.push(datapair[0]);
+                if (invert === true) {
+                    values.push(datapair[1] * -1);
+                } else {
+                    values.push(datapair[1]);
+                }
+            });
+        } else {
+            // Columnar data, the first timestamp then the time since the previous point.
+            let timestamp = data.t0;
+            data.v.forEach((value, index) =>{
+                if (index > 0) {
+                    timestamp += data.dt[index - 1];
+                }
+                labels.push(timestamp);
+                if (invert === true) {
+                    values.push(value * -1);
+                } else {
+                    values.push(value);
+                }
+            });
+        }
         resolve({'labels': labels, 'values': values});
     });
 };
@@ -305,7 +322,7 @@ const updateDashboard = (data) => {
  * @param {int} timestamp The timestamp to get the data for.
  */
 const getData = (timestamp) => {
-    const urlString = '/dataajax/?dashboard=solar&history=1&timestamp=' + timestamp;
+    const urlString = '/dataajax/?dashboard=solar&history=1&format=columns&timestamp=' + timestamp;
     fetch(urlString)
         .then((response) => response.json())
         .then((data) => updateDashboard(data));
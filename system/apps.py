@@ -26,4 +26,5 @@ from django.apps import AppConfig
 
 
 class SystemConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
     name = 'system'
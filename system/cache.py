@@ -0,0 +1,731 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import cache
+import collections
+import contextlib
+import fcntl
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class DataCache:
+    """
+    Wrapper around the Django cache used by the weather and solar data classes.
+    The number of cache operations, and the number of keys they use,
+    are counted for each thread, or each request under ASGI, so they can be reported for each request.
+
+    Extremes and latest values are updated with compare-and-set operations, so updates made at the
+    same time can't overwrite a higher maximum with a lower one, or a newer value with an older one.
+    With a Redis cache backend each operation is a Lua script run in one round trip.
+    The shared memory cache does the read, compare and write with its segment locked between processes.
+    Other backends do them under a lock file, so they are atomic between the processes on a host,
+    e.g. the web server workers and the ingest commands, but not between hosts.
+
+    Values can also be kept in a small in-process cache (L1) in front of the Django cache, so repeated reads
+    in the same process don't cross the process boundary. L1 values are kept for a few seconds, and all of them
+    are dropped when the ingest generation changes, which happens each time a new sample has been processed.
+    The L1 cache is enabled by setting DATA_CACHE_LOCAL_SIZE to the maximum number of values to keep.
+
+    Values that are expensive to compute, like accumulated and extreme values, are got with get_or_compute.
+    These are kept for a while after they expire and served stale while one caller recomputes them,
+    and may be recomputed a little before they expire, so they don't all expire at once.
+    """
+
+    # Operation counts for the current thread. Under ASGI the counts made by sync code
+    # run with sync_to_async are added to the counts of the async code that awaits it.
+    counter = Local()
+
+    # Lock used for the compare-and-set operations when the backend can't run them atomically.
+    # It is held within the process, and the lock file is locked between processes.
+    lock = threading.Lock()
+
+    # The lock file opened by this process, as the path, the process ID and the file descriptor.
+    # A forked process opens the file again, as a file lock is shared by every process using the same open file.
+    lock_file = {'path': None, 'pid': None, 'fd': None}
+
+    # Registered Lua scripts, keyed by name.
+    scripts = {}
+
+    # L1 values, least recently used first, as (value, expiry time) tuples keyed by cache key.
+    local_values = collections.OrderedDict()
+    local_lock = threading.Lock()
+
+    # The ingest generation the L1 values belong to, and when it was last checked.
+    local_generation = {'value': None, 'checked': 0.0}
+
+    # L1 hits, misses and invalidations since the process started.
+    local_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    # Cache key of the ingest generation counter.
+    generation_key = 'ingest_generation'
+
+    # Number of seconds between checks for a value that another caller is computing.
+    rebuild_poll = 0.05
+
+    # Lua script to update extremes. KEYS are the cache key and value key of each extreme.
+    # ARGV is the timeout, then the mode, value and encoded value of each extreme.
+    # The value key holds the plain number, as the cached value is encoded by the backend.
+    # Returns the positions of the extremes that were updated.
+    extremes_script = """
+        local updated = {}
+        for position = 1, #KEYS / 2 do
+            local cache_key = KEYS[(position * 2) - 1]
+            local value_key = KEYS[position * 2]
+            local mode = ARGV[(position * 3) - 1]
+            local value = tonumber(ARGV[position * 3])
+            local exists = redis.call('EXISTS', cache_key) == 1
+            local current = nil
+            if exists then
+                current = tonumber(redis.call('GET', value_key))
+            end
+
+            if (mode == 'set') or ((mode == 'fill') and not exists) or ((current ~= nil) and
+                    (((mode == 'max') and (value > current)) or ((mode == 'min') and (value < current)))) then
+                redis.call('SET', cache_key, ARGV[(position * 3) + 1], 'EX', ARGV[1])
+                redis.call('SET', value_key, ARGV[position * 3], 'EX', ARGV[1])
+                table.insert(updated, position)
+            end
+        end
+        return updated
+    """
+
+    # Lua script to set values if they are newer. KEYS are the version value key, the version key,
+    # then the cache key of each value. ARGV is the timeout, the version, then the encoded version and encoded values.
+    # As with the extremes, the version value key holds the plain number. Returns 1 if the values were set.
+    versioned_script = """
+        local current = tonumber(redis.call('GET', KEYS[1]))
+        local version = tonumber(ARGV[2])
+        if (current ~= nil) and (current >= version) then
+            return 0
+        end
+
+        redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[1])
+        for position = 2, #KEYS do
+            redis.call('SET', KEYS[position], ARGV[position + 1], 'EX', ARGV[1])
+        end
+        return 1
+    """
+
+    @staticmethod
+    def reset_operations():
+        """
+        Reset the operation counts for the current thread.
+
+        :return:
+        """
+
+        DataCache.counter.operations = 0
+        DataCache.counter.keys = 0
+        DataCache.counter.local_hits = 0
+        DataCache.counter.local_misses = 0
+
+    @staticmethod
+    def get_operations() -> dict:
+        """
+        Get the operation counts for the current thread.
+
+        :return: The number of cache operations and keys.
+        """
+
+        return {
+            'operations': getattr(DataCache.counter, 'operations', 0),
+            'keys': getattr(DataCache.counter, 'keys', 0),
+        }
+
+    @staticmethod
+    def get_local_operations() -> dict:
+        """
+        Get the L1 hits and misses for the current thread.
+
+        :return: The number of keys found and not found in the L1 cache.
+        """
+
+        return {
+            'hits': getattr(DataCache.counter, 'local_hits', 0),
+            'misses': getattr(DataCache.counter, 'local_misses', 0),
+        }
+
+    @staticmethod
+    def count_operation(keys: int = 1):
+        """
+        Add a cache operation to the counts for the current thread.
+
+        :param keys: The number of keys used by the operation.
+        :return:
+        """
+
+        DataCache.counter.operations = getattr(DataCache.counter, 'operations', 0) + 1
+        DataCache.counter.keys = getattr(DataCache.counter, 'keys', 0) + keys
+
+    @staticmethod
+    def get_local_size() -> int:
+        """
+        Get the maximum number of values in the L1 cache.
+
+        :return: The DATA_CACHE_LOCAL_SIZE setting, defaults to 0 which disables the L1 cache.
+        """
+
+        return int(getattr(settings, 'DATA_CACHE_LOCAL_SIZE', 0))
+
+    @staticmethod
+    def check_generation():
+        """
+        Drop the L1 values if the ingest generation has changed since they were cached.
+        The generation is got from the Django cache at most every DATA_CACHE_GENERATION_INTERVAL
+        seconds, defaults to 0.25 seconds.
+
+        :return:
+        """
+
+        now = time.monotonic()
+        if (now - DataCache.local_generation['checked']) < getattr(settings, 'DATA_CACHE_GENERATION_INTERVAL', 0.25):
+            return
+
+        DataCache.count_operation()
+        generation = cache.get(DataCache.generation_key)
+        with DataCache.local_lock:
+            DataCache.local_generation['checked'] = now
+            if generation != DataCache.local_generation['value']:
+                DataCache.local_generation['value'] = generation
+                if DataCache.local_values:
+                    DataCache.local_values.clear()
+                    DataCache.local_stats['invalidations'] += 1
+
+    @staticmethod
+    def get_local(keys: list) -> dict:
+        """
+        Get values from the L1 cache.
+
+        :param keys: The cache keys.
+        :return: The values found, keyed by cache key.
+        """
+
+        DataCache.check_generation()
+
+        now = time.monotonic()
+        values = {}
+        with DataCache.local_lock:
+            for key in keys:
+                local_value = DataCache.local_values.get(key)
+                if (local_value is not None) and (local_value[1] > now):
+                    DataCache.local_values.move_to_end(key)
+                    values[key] = local_value[0]
+
+            DataCache.local_stats['hits'] += len(values)
+            DataCache.local_stats['misses'] += len(keys) - len(values)
+
+        DataCache.counter.local_hits = getattr(DataCache.counter, 'local_hits', 0) + len(values)
+        DataCache.counter.local_misses = getattr(DataCache.counter, 'local_misses', 0) + len(keys) - len(values)
+
+        return values
+
+    @staticmethod
+    def set_local(data: dict):
+        """
+        Set values in the L1 cache, for DATA_CACHE_LOCAL_TTL seconds, defaults to 2 seconds.
+        The least recently used values are removed when the L1 cache is full.
+
+        :param data: The values to cache, keyed by cache key.
+        :return:
+        """
+
+        size = DataCache.get_local_size()
+        if size <= 0:
+            return
+
+        expiry = time.monotonic() + getattr(settings, 'DATA_CACHE_LOCAL_TTL', 2)
+        with DataCache.local_lock:
+            for key, value in data.items():
+                DataCache.local_values[key] = (value, expiry)
+                DataCache.local_values.move_to_end(key)
+
+            while len(DataCache.local_values) > size:
+                DataCache.local_values.popitem(last=False)
+
+    @staticmethod
+    def forget_local(keys: list):
+        """
+        Remove values from the L1 cache.
+
+        :param keys: The cache keys.
+        :return:
+        """
+
+        with DataCache.local_lock:
+            for key in keys:
+                DataCache.local_values.pop(key, None)
+
+    @staticmethod
+    def clear_local():
+        """
+        Remove every value from the L1 cache and reset its statistics.
+
+        :return:
+        """
+
+        with DataCache.local_lock:
+            DataCache.local_values.clear()
+            DataCache.local_generation.update({'value': None, 'checked': 0.0})
+            DataCache.local_stats.update({'hits': 0, 'misses': 0, 'invalidations': 0})
+
+    @staticmethod
+    def get_local_stats() -> dict:
+        """
+        Get the L1 statistics since the process started.
+
+        :return: The number of hits, misses and invalidations, the hit rate and the number of cached values.
+        """
+
+        with DataCache.local_lock:
+            stats = dict(DataCache.local_stats)
+            stats['size'] = len(DataCache.local_values)
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] / lookups) if lookups > 0 else 0.0
+
+        return stats
+
+    @staticmethod
+    def bump_generation():
+        """
+        Start a new ingest generation, so every process drops its L1 values.
+        Called once the caches have been updated for a new sample.
+
+        :return:
+        """
+
+        DataCache.count_operation()
+        try:
+            cache.incr(DataCache.generation_key)
+        except ValueError:
+            # The counter is not cached yet.
+            cache.set(DataCache.generation_key, 1, None)
+
+    @staticmethod
+    def get(key: str, default=None):
+        """
+        Get a value from the cache.
+
+        :param key: The cache key.
+        :param default: The value to return if the key is not cached.
+        :return: The cached value.
+        """
+
+        if DataCache.get_local_size() > 0:
+            local_values = DataCache.get_local([key])
+            if key in local_values:
+                return local_values[key]
+
+        DataCache.count_operation()
+        value = cache.get(key)
+        if value is None:
+            return default
+
+        DataCache.set_local({key: value})
+
+        return value
+
+    @staticmethod
+    def get_many(keys: list) -> dict:
+        """
+        Get several values from the cache in one operation.
+        Keys that are not cached are not included in the result.
+
+        :param keys: The cache keys.
+        :return: The cached values, keyed by cache key.
+        """
+
+        values = {}
+        if DataCache.get_local_size() > 0:
+            values = DataCache.get_local(keys)
+            if len(values) == len(keys):
+                return values
+            keys = [key for key in keys if key not in values]
+
+        DataCache.count_operation(len(keys))
+        cache_values = cache.get_many(keys)
+        DataCache.set_local(cache_values)
+        values.update(cache_values)
+
+        return values
+
+    @staticmethod
+    def set(key: str, value, timeout: int):
+        """
+        Set a value in the cache.
+
+        :param key: The cache key.
+        :param value: The value to cache.
+        :param timeout: The number of seconds to cache the value for.
+        :return:
+        """
+
+        DataCache.count_operation()
+        cache.set(key, value, timeout)
+        DataCache.set_local({key: value})
+
+    @staticmethod
+    def set_many(data: dict, timeout: int):
+        """
+        Set several values in the cache in one operation.
+
+        :param data: The values to cache, keyed by cache key.
+        :param timeout: The number of seconds to cache the values for.
+        :return:
+        """
+
+        if not data:
+            return
+
+        DataCache.count_operation(len(data))
+        cache.set_many(data, timeout)
+        DataCache.set_local(data)
+
+    @staticmethod
+    def get_redis():
+        """
+        Get the Redis client and value encoder of the cache backend, if it is a Redis backend.
+        Both the Django Redis backend and django-redis are supported.
+
+        :return: The client and encoder, or None if the backend is not Redis.
+        """
+
+        backend = getattr(cache, '_cache', None)
+        if hasattr(backend, 'get_client') and hasattr(backend, '_serializer'):
+            # Django Redis backend.
+            return backend.get_client(write=True), backend._serializer.dumps
+
+        client = getattr(cache, 'client', None)
+        if hasattr(client, 'get_client') and hasattr(client, 'encode'):
+            # django-redis backend.
+            return client.get_client(write=True), client.encode
+
+        return None
+
+    @staticmethod
+    def run_script(name: str, client, keys: list, args: list):
+        """
+        Run a Lua script on a Redis client. The script is only sent to Redis the first time it is run,
+        after that it is run by its hash.
+
+        :param name: The name of the script, e.g. extremes
+        :param client: The Redis client.
+        :param keys: The keys the script uses.
+        :param args: The arguments of the script.
+        :return: The result of the script.
+        """
+
+        if name not in DataCache.scripts:
+            DataCache.scripts[name] = client.register_script(getattr(DataCache, '{0}_script'.format(name)))
+
+        return DataCache.scripts[name](keys=keys, args=args, client=client)
+
+    @staticmethod
+    def get_lock_path() -> str:
+        """
+        Get the path of the lock file held while values are compared and set.
+
+        :return: The DATA_CACHE_LOCK_FILE setting, defaults to a file in the directory of a file based cache,
+        or in the temporary directory for other backends.
+        """
+
+        lock_path = getattr(settings, 'DATA_CACHE_LOCK_FILE', None)
+        if lock_path is None:
+            lock_path = os.path.join(getattr(cache, '_dir', None) or tempfile.gettempdir(), 'solarweather_cache.lock')
+
+        return lock_path
+
+    @staticmethod
+    @contextlib.contextmanager
+    def locked():
+        """
+        Lock the cache for a read, compare and write, for backends that can't do them atomically.
+        The lock is held within the process, and on the lock file between processes.
+
+        :return:
+        """
+
+        with DataCache.lock:
+            lock_path = DataCache.get_lock_path()
+            if (DataCache.lock_file['path'] != lock_path) or (DataCache.lock_file['pid'] != os.getpid()):
+                os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+                DataCache.lock_file.update({
+                    'path': lock_path,
+                    'pid': os.getpid(),
+                    'fd': os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600),
+                })
+
+            fcntl.flock(DataCache.lock_file['fd'], fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(DataCache.lock_file['fd'], fcntl.LOCK_UN)
+
+    @staticmethod
+    def compare_and_set(keys: list, compare, timeout: int) -> dict:
+        """
+        Read several values and set the values a function returns, in one operation that is atomic
+        between the processes on the host. The shared memory cache does this with its segment locked,
+        other backends under the lock file, see locked().
+
+        :param keys: The cache keys to read.
+        :param compare: Function called with the cached values, keyed by cache key (keys that are not cached
+        are left out), returning the values to set, keyed by cache key.
+        :param timeout: The number of seconds to cache the values for.
+        :return: The values that were set, keyed by cache key.
+        """
+
+        compare_and_set_many = getattr(cache, 'compare_and_set_many', None)
+        if compare_and_set_many is not None:
+            return compare_and_set_many(keys, compare, timeout)
+
+        with DataCache.locked():
+            updated_values = compare(cache.get_many(keys))
+            cache.set_many(updated_values, timeout)
+
+        return updated_values
+
+    @staticmethod
+    def update_extremes(extremes: dict, timeout: int) -> dict:
+        """
+        Update several extremes in the cache in one atomic operation.
+        Each extreme is updated with a mode:
+            max: Set the value if it is greater than the cached value.
+            min: Set the value if it is less than the cached value.
+            fill: Set the value if there is no cached value.
+            set: Set the value, e.g. when it has been recomputed from the database.
+        Extremes that are not cached are only set by fill and set, as the value to compare with is unknown.
+
+        :param extremes: The mode and value of each extreme, keyed by cache key.
+        :param timeout: The number of seconds to cache the values for.
+        :return: The values that were updated, keyed by cache key.
+        """
+
+        if not extremes:
+            return {}
+
+        # Other processes may have changed the extremes, so the L1 values are not updated.
+        DataCache.forget_local(list(extremes.keys()))
+        DataCache.count_operation(len(extremes))
+
+        redis = DataCache.get_redis()
+        if redis is not None:
+            client, encode = redis
+            keys = []
+            args = [int(timeout)]
+            for cache_key, (mode, value) in extremes.items():
+                keys.extend([cache.make_key(cache_key), cache.make_key('{0}_value'.format(cache_key))])
+                args.extend([mode, repr(float(value)), encode(value)])
+
+            cache_keys = list(extremes.keys())
+            positions = DataCache.run_script('extremes', client, keys, args)
+
+            return {cache_keys[position - 1]: extremes[cache_keys[position - 1]][1] for position in positions}
+
+        def compare(cache_values: dict) -> dict:
+            updated_values = {}
+            for cache_key, (mode, value) in extremes.items():
+                current = cache_values.get(cache_key)
+                if (mode == 'set') or ((mode == 'fill') and (current is None)) or ((current is not None) and (
+                        ((mode == 'max') and (value > current)) or ((mode == 'min') and (value < current)))):
+                    updated_values[cache_key] = value
+
+            return updated_values
+
+        return DataCache.compare_and_set(list(extremes.keys()), compare, timeout)
+
+    @staticmethod
+    def set_many_versioned(data: dict, version_key: str, version, timeout: int) -> bool:
+        """
+        Set several values in the cache in one atomic operation, if they are newer than the values
+        already cached. The version of the cached values is kept in its own key.
+
+        :param data: The values to cache, keyed by cache key.
+        :param version_key: The cache key of the version.
+        :param version: The version of the values, e.g. the time stamp of the sample they come from.
+        :param timeout: The number of seconds to cache the values for.
+        :return: True if the values were set.
+        """
+
+        DataCache.forget_local(list(data.keys()) + [version_key])
+        DataCache.count_operation(len(data) + 1)
+
+        redis = DataCache.get_redis()
+        if redis is not None:
+            client, encode = redis
+            keys = [cache.make_key('{0}_value'.format(version_key)), cache.make_key(version_key)]
+            keys.extend(cache.make_key(cache_key) for cache_key in data.keys())
+            args = [int(timeout), repr(float(version)), encode(version)] + [encode(value) for value in data.values()]
+
+            return DataCache.run_script('versioned', client, keys, args) == 1
+
+        def compare(cache_values: dict) -> dict:
+            current = cache_values.get(version_key)
+            if (current is not None) and (current >= version):
+                return {}
+
+            return dict(data, **{version_key: version})
+
+        return len(DataCache.compare_and_set([version_key], compare, timeout)) > 0
+
+    @staticmethod
+    def is_expiring(refresh: dict) -> bool:
+        """
+        Check if a computed value should be recomputed.
+        Values are recomputed early with a probability that rises as they get closer to expiring,
+        and the longer they took to compute the earlier this starts. This is the "XFetch" algorithm,
+        scaled by DATA_CACHE_EARLY_EXPIRY_BETA, defaults to 1. A beta of 0 turns off early expiry.
+
+        :param refresh: The expiry time and compute time of the value.
+        :return: True if the value should be recomputed.
+        """
+
+        beta = getattr(settings, 'DATA_CACHE_EARLY_EXPIRY_BETA', 1.0)
+        early = refresh['delta'] * beta * -math.log(1.0 - random.random())
+
+        return (time.time() + early) >= refresh['expires']
+
+    @staticmethod
+    def acquire_rebuild(key: str) -> bool:
+        """
+        Try to become the caller that computes a value. The rebuild lock expires after
+        DATA_CACHE_REBUILD_TIMEOUT seconds, defaults to 30, in case the caller never finishes.
+
+        :param key: The cache key of the value.
+        :return: True if the lock was acquired.
+        """
+
+        lock_key = '{0}_rebuild'.format(key)
+        timeout = getattr(settings, 'DATA_CACHE_REBUILD_TIMEOUT', 30)
+
+        DataCache.count_operation()
+        if DataCache.get_redis() is not None:
+            return cache.add(lock_key, 1, timeout)
+
+        # Only some backends add atomically, so the lock is also held between processes.
+        with DataCache.locked():
+            return cache.add(lock_key, 1, timeout)
+
+    @staticmethod
+    def rebuild(key: str, compute, timeout: int, mode: str, locked: bool):
+        """
+        Compute a value, store it in the cache with its expiry time and release the rebuild lock.
+
+        :param key: The cache key of the value.
+        :param compute: The function that computes the value.
+        :param timeout: The number of seconds until the value should be recomputed.
+        :param mode: How the value is stored, see get_or_compute.
+        :param locked: Whether this caller holds the rebuild lock. Only a lock this caller holds is released.
+        :return: The computed value.
+        """
+
+        start = time.monotonic()
+        try:
+            value = compute()
+            if value is None:
+                return None
+
+            refresh = {'expires': time.time() + timeout, 'delta': time.monotonic() - start}
+            cache_timeout = timeout + getattr(settings, 'DATA_CACHE_STALE_TTL', 600)
+
+            if mode == 'set':
+                DataCache.set_many({key: value, '{0}_refresh'.format(key): refresh}, cache_timeout)
+            else:
+                # The computed extreme comes from the database, so it replaces the cached one even if that is
+                # further out, e.g. from a sample that was removed. With Redis the plain number that the samples
+                # stored from now on are compared with is replaced as well. A sample stored while the value was
+                # computed may be missed until the value is next recomputed.
+                DataCache.update_extremes({key: ('set', value)}, cache_timeout)
+                DataCache.set('{0}_refresh'.format(key), refresh, cache_timeout)
+        finally:
+            if locked:
+                DataCache.count_operation()
+                cache.delete('{0}_rebuild'.format(key))
+
+        return value
+
+    @staticmethod
+    def get_or_compute(key: str, compute, timeout: int, mode: str = 'set', refresh: bool = False):
+        """
+        Get a value from the cache, computing it if it isn't cached or has expired.
+        Only one caller computes a value at a time. While it does, the other callers get the expired value,
+        which is kept for DATA_CACHE_STALE_TTL seconds after it expires, defaults to 600 seconds.
+        If there is no value at all the other callers wait for it, for up to DATA_CACHE_REBUILD_TIMEOUT seconds.
+        Values are stored with a mode:
+            set: Replace the cached value.
+            max, min: Replace the cached extreme, which is then moved by the samples stored after it, see update_extremes.
+        The computed value replaces the cached one in every mode, as it comes from the stored data.
+        Extremes moved by update_extremes are used until they are recomputed.
+
+        :param key: The cache key of the value.
+        :param compute: The function that computes the value. If it returns None nothing is cached.
+        :param timeout: The number of seconds until the value should be recomputed.
+        :param mode: How the value is stored. i.e. 'set', 'max', 'min'.
+        :param refresh: Compute the value even if it is cached.
+        :return: The value.
+        """
+
+        refresh_key = '{0}_refresh'.format(key)
+        if refresh:
+            # The value is computed even if another caller is computing it, but their lock is left alone.
+            locked = DataCache.acquire_rebuild(key)
+            return DataCache.rebuild(key, compute, timeout, mode, locked)
+
+        cache_values = DataCache.get_many([key, refresh_key])
+        value = cache_values.get(key)
+        if value is not None:
+            if (refresh_key not in cache_values) or not DataCache.is_expiring(cache_values[refresh_key]):
+                return value
+
+            # Serve the stale value unless this caller gets to recompute it.
+            if not DataCache.acquire_rebuild(key):
+                return value
+
+            return DataCache.rebuild(key, compute, timeout, mode, True)
+
+        # Nothing to serve, so wait for the caller already computing the value.
+        deadline = time.monotonic() + getattr(settings, 'DATA_CACHE_REBUILD_TIMEOUT', 30)
+        locked = DataCache.acquire_rebuild(key)
+        while not locked:
+            time.sleep(DataCache.rebuild_poll)
+            value = DataCache.get(key)
+            if value is not None:
+                return value
+            if time.monotonic() > deadline:
+                break
+            locked = DataCache.acquire_rebuild(key)
+
+        return DataCache.rebuild(key, compute, timeout, mode, locked)
@@ -22,6 +22,10 @@
 # @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
 # ==============================================================================
 
+from django.conf import settings
+import itertools
+import numpy as np
+
 import logging
 
 # Get an instance of a logger
@@ -142,4 +146,160 @@ class UnitConversion:
             avg_tuple = (avg_time, avg_count)
             downsampled_list.append(avg_tuple)
 
-        return downsampled_list
\ No newline at end of file
+        return downsampled_list
+
+    @staticmethod
+    def downsample(data_table: list, max_points: int = None, mode: str = None) -> list:
+        """
+        Down sample a list of time and magnitude pairs to at most the given number of points.
+        Data that already has no more than the given number of points is returned unchanged.
+
+        Data is provided in a list of tuples, in the format (timestamp, value)
+
+        :param data_table: The table containing the raw data pairs.
+        :param max_points: The maximum number of points to return, defaults to the TREND_MAX_POINTS setting.
+        :param mode: The down sampling mode, 'lttb' or 'minmax', defaults to the TREND_DOWNSAMPLE_MODE setting.
+        :return: The down sampled list.
+        """
+
+        if max_points is None:
+            max_points = getattr(settings, 'TREND_MAX_POINTS', 250)
+        if mode is None:
+            mode = getattr(settings, 'TREND_DOWNSAMPLE_MODE', 'lttb')
+
+        if len(data_table) <= max_points:
+            return list(data_table)
+
+        if mode == 'minmax':
+            return UnitConversion.downsample_minmax(data_table, max_points)
+
+        return UnitConversion.downsample_lttb(data_table, max_points)
+
+    @staticmethod
+    def get_bucket_edges(samples: int, buckets: int):
+        """
+        Split the samples between the first and last sample into buckets of (nearly) equal size.
+
+        :param samples: The total number of samples.
+        :param buckets: The number of buckets.
+        :return: The index of the first sample in each bucket, and the index after the last bucket.
+        """
+
+        return np.linspace(1, samples - 1, buckets + 1).astype(np.int64)
+
+    @staticmethod
+    def get_arrays(data_table: list) -> tuple:
+        """
+        Get the times and values from a list of time and magnitude pairs as arrays.
+
+        :param data_table: The table containing the raw data pairs.
+        :return: The time array and the magnitude array.
+        """
+
+        data_array = np.fromiter(
+            itertools.chain.from_iterable(data_table), dtype=np.float64, count=len(data_table) * 2).reshape(-1, 2)
+
+        return data_array[:, 0], data_array[:, 1]
+
+    @staticmethod
+    def get_pairs(time_array, magnitude_array, selected) -> list:
+        """
+        Get the selected samples as a list of time and magnitude pairs.
+
+        :param time_array: The sample times.
+        :param magnitude_array: The sample values.
+        :param selected: The indexes of the samples to get.
+        :return: The list of pairs.
+        """
+
+        return list(zip(time_array[selected].astype(np.int64).tolist(), magnitude_array[selected].tolist()))
+
+    @staticmethod
+    def downsample_lttb(data_table: list, threshold: int) -> list:
+        """
+        Down sample a list of time and magnitude pairs using the
+        Largest-Triangle-Three-Buckets algorithm.
+        The first and last points are kept, and the points in between are split into buckets.
+        From each bucket the point that forms the largest triangle with the point selected from the
+        previous bucket and the average of the next bucket is kept, so peaks and troughs are preserved.
+
+        :param data_table: The table containing the raw data pairs.
+        :param threshold: The number of points to return.
+        :return: The down sampled list.
+        """
+
+        samples = len(data_table)
+        if (threshold >= samples) or (threshold < 3):
+            return list(data_table)
+
+        time_array, magnitude_array = UnitConversion.get_arrays(data_table)
+
+        buckets = threshold - 2
+        edges = UnitConversion.get_bucket_edges(samples, buckets)
+
+        # The average of each bucket, calculated for all buckets at once from the cumulative sums.
+        time_sums = np.concatenate(([0], np.cumsum(time_array)))
+        magnitude_sums = np.concatenate(([0], np.cumsum(magnitude_array)))
+        bucket_sizes = np.diff(edges)
+        time_averages = (time_sums[edges[1:]] - time_sums[edges[:-1]]) / bucket_sizes
+        magnitude_averages = (magnitude_sums[edges[1:]] - magnitude_sums[edges[:-1]]) / bucket_sizes
+
+        # The "next bucket" for the last bucket is the last point.
+        next_times = np.append(time_averages[1:], time_array[-1])
+        next_magnitudes = np.append(magnitude_averages[1:], magnitude_array[-1])
+
+        selected = np.empty(threshold, dtype=np.int64)
+        selected[0] = 0
+        selected[-1] = samples - 1
+
+        # Each bucket depends on the point selected from the previous bucket,
+        # so buckets are processed in turn, with the points in each bucket processed at once.
+        previous = 0
+        for bucket in range(buckets):
+            start = edges[bucket]
+            end = edges[bucket + 1]
+            areas = np.abs(
+                (time_array[previous] - next_times[bucket]) * (magnitude_array[start:end] - magnitude_array[previous])
+                - (time_array[previous] - time_array[start:end]) * (next_magnitudes[bucket] - magnitude_array[previous]))
+            previous = start + int(np.argmax(areas))
+            selected[bucket + 1] = previous
+
+        return UnitConversion.get_pairs(time_array, magnitude_array, selected)
+
+    @staticmethod
+    def downsample_minmax(data_table: list, threshold: int) -> list:
+        """
+        Down sample a list of time and magnitude pairs by keeping the minimum and maximum point of each bucket.
+        The first and last points are kept, and the points in between are split into buckets.
+        The points are returned in time order, so no more than the threshold number of points are returned.
+
+        :param data_table: The table containing the raw data pairs.
+        :param threshold: The maximum number of points to return.
+        :return: The down sampled list.
+        """
+
+        samples = len(data_table)
+        if (threshold >= samples) or (threshold < 4):
+            return list(data_table)
+
+        time_array, magnitude_array = UnitConversion.get_arrays(data_table)
+
+        buckets = (threshold - 2) // 2
+        edges = UnitConversion.get_bucket_edges(samples, buckets)
+
+        # Find the minimum and maximum value of each bucket, then the first point in each bucket with that value.
+        # Matching points are in time order, so the first match at or after the start of a bucket is in that bucket.
+        # The last point is not in a bucket, so it is left out of the reduction for the last bucket.
+        bucket_sizes = np.diff(edges)
+        bucket_magnitudes = magnitude_array[:edges[-1]]
+        minimum_values = np.repeat(np.minimum.reduceat(bucket_magnitudes, edges[:-1]), bucket_sizes)
+        maximum_values = np.repeat(np.maximum.reduceat(bucket_magnitudes, edges[:-1]), bucket_sizes)
+        inner_magnitudes = magnitude_array[1:-1]
+        minimum_matches = np.flatnonzero(inner_magnitudes == minimum_values) + 1
+        maximum_matches = np.flatnonzero(inner_magnitudes == maximum_values) + 1
+        minimums = minimum_matches[np.searchsorted(minimum_matches, edges[:-1])]
+        maximums = maximum_matches[np.searchsorted(maximum_matches, edges[:-1])]
+
+        selected = np.unique(np.concatenate(([0], minimums, maximums, [samples - 1])))
+
+        return UnitConversion.get_pairs(time_array, magnitude_array, selected)
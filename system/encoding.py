@@ -0,0 +1,163 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.core.serializers.json import DjangoJSONEncoder
+import json
+import numpy as np
+import struct
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class TrendEncoding:
+    """
+    Encodings for data that contains trend series.
+    Trend series are lists of (timestamp, value) pairs. As well as plain JSON they can be encoded as:
+        columns: JSON where each series is {"t0": first timestamp, "dt": [time deltas], "v": [values]}.
+        binary: A 4 byte little endian header length, a JSON header, padding to a multiple of 4 bytes,
+        then for each series an Int32 array of time deltas and a Float32 array of values.
+        In the header each series is {"t0": first timestamp, "n": number of points, "offset": byte offset},
+        where the offset is from the end of the padded header.
+    """
+
+    # The content type of each format.
+    formats = {
+        'json': 'application/json',
+        'columns': 'application/json',
+        'binary': 'application/octet-stream',
+    }
+
+    @staticmethod
+    def get_format(request) -> str:
+        """
+        Get the format the client has asked for.
+        The format can be given in the format parameter, or binary can be asked for in the Accept header.
+
+        :param request:
+        :return: The format. i.e. 'json', 'columns', 'binary'.
+        """
+
+        data_format = str(request.GET.get('format', default=''))
+        if data_format in TrendEncoding.formats:
+            return data_format
+
+        if 'application/octet-stream' in request.headers.get('Accept', ''):
+            return 'binary'
+
+        return 'json'
+
+    @staticmethod
+    def is_trend(value) -> bool:
+        """
+        Check if a value is a trend series, a non empty list of (timestamp, value) pairs.
+
+        :param value: The value to check.
+        :return: True if the value is a trend series.
+        """
+
+        return isinstance(value, (list, tuple)) and (len(value) > 0) \
+            and all(isinstance(pair, (list, tuple)) and (len(pair) == 2) for pair in value)
+
+    @staticmethod
+    def get_columns(trend_list: list) -> tuple:
+        """
+        Split a trend series into the first timestamp, the time deltas and the values.
+
+        :param trend_list: The trend series.
+        :return: The first timestamp, the array of time deltas (the first is always 0) and the array of values.
+        """
+
+        time_array = np.fromiter((pair[0] for pair in trend_list), dtype=np.int64, count=len(trend_list))
+        value_array = np.fromiter((pair[1] for pair in trend_list), dtype=np.float64, count=len(trend_list))
+
+        return int(time_array[0]), np.diff(time_array, prepend=time_array[0]), value_array
+
+    @staticmethod
+    def to_columns(data):
+        """
+        Replace every trend series in the data with its columns.
+
+        :param data: The data to encode.
+        :return: The encoded data.
+        """
+
+        if TrendEncoding.is_trend(data):
+            first_time, time_deltas, values = TrendEncoding.get_columns(data)
+            return {'t0': first_time, 'dt': time_deltas[1:].tolist(), 'v': values.tolist()}
+        elif isinstance(data, dict):
+            return {key: TrendEncoding.to_columns(value) for key, value in data.items()}
+
+        return data
+
+    @staticmethod
+    def to_binary(data) -> bytes:
+        """
+        Encode the data with the trend series as typed arrays.
+
+        :param data: The data to encode.
+        :return: The encoded data.
+        """
+
+        blocks = []
+        body_size = 0
+
+        def replace_trends(value):
+            nonlocal body_size
+
+            if TrendEncoding.is_trend(value):
+                first_time, time_deltas, values = TrendEncoding.get_columns(value)
+                block = time_deltas.astype('<i4').tobytes() + values.astype('<f4').tobytes()
+                blocks.append(block)
+                series = {'t0': first_time, 'n': len(value), 'offset': body_size}
+                body_size += len(block)
+                return series
+            elif isinstance(value, dict):
+                return {key: replace_trends(item) for key, item in value.items()}
+
+            return value
+
+        header = json.dumps(replace_trends(data), cls=DjangoJSONEncoder).encode('utf-8')
+        padding = b' ' * (-(len(header) + 4) % 4)
+
+        return struct.pack('<I', len(header) + len(padding)) + header + padding + b''.join(blocks)
+
+    @staticmethod
+    def encode(data, data_format: str) -> bytes:
+        """
+        Encode data in a format.
+
+        :param data: The data to encode.
+        :param data_format: The format. i.e. 'json', 'columns', 'binary'.
+        :return: The encoded data.
+        """
+
+        if data_format == 'binary':
+            return TrendEncoding.to_binary(data)
+        elif data_format == 'columns':
+            data = TrendEncoding.to_columns(data)
+
+        return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
@@ -0,0 +1,195 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from system.models import HistoryPayload as HistoryPayloadModel
+from system.period import TimePeriod
+from datetime import date, datetime, timedelta
+import hashlib
+import json
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class HistoryCache:
+    """
+    The rendered JSON payloads for the history dashboards.
+    The history for a day includes the week and month totals for that day, so once the week
+    and month a day is in have both ended the payload can never change. These payloads are stored
+    in the database with no expiry, and must be invalidated if data for the day is backfilled or restored.
+    Only the solar dashboard has history payloads.
+    """
+
+    @staticmethod
+    def get_data(dashboard: str, timestamp: int) -> dict:
+        """
+        Get the history data for a dashboard.
+
+        :param dashboard: The dashboard to get the data for. i.e. 'solar'.
+        :param timestamp: The timestamp to get the history for.
+        :return: The history data.
+        """
+
+        # Imported here as the solar data class imports this module to invalidate the payloads.
+        from solar.solardata import SolarData
+
+        if dashboard != 'solar':
+            raise ValueError("The '%s' dashboard has no history." % dashboard)
+
+        return SolarData.get_history(timestamp)
+
+    @staticmethod
+    def is_final(timestamp: int, today: date = None) -> bool:
+        """
+        Check if the history for a day can no longer change.
+        This is the case when the week and month the day is in have both ended.
+
+        :param timestamp: The timestamp to check.
+        :param today: The current date, defaults to today.
+        :return: True if the history is final.
+        """
+
+        if today is None:
+            today = TimePeriod.get_date(datetime.now().timestamp())
+
+        date_object = TimePeriod.get_date(timestamp)
+
+        period_start, period_end = HistoryCache.get_period_range(date_object)
+
+        return period_end < today
+
+    @staticmethod
+    def get_period_range(date_object: date) -> tuple:
+        """
+        Get the first and last days of the week and month a day is in.
+        The history for any day in this range includes data from the given day.
+
+        :param date_object: The day to get the range for.
+        :return: The first and last days.
+        """
+
+        week_start = TimePeriod.get_week_start(date_object)
+        week_end = week_start + timedelta(days=6)
+        month_start = date_object.replace(day=1)
+        month_end = (date_object.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+        return min(week_start, month_start), max(week_end, month_end)
+
+    @staticmethod
+    def get(dashboard: str, timestamp: int) -> dict:
+        """
+        Get the history payload for a dashboard and day.
+        Final payloads are got from the database, or built and stored if they don't exist yet.
+        Payloads that are not final are built for each request and not stored.
+
+        :param dashboard: The dashboard to get the payload for. i.e. 'solar'.
+        :param timestamp: The timestamp to get the history for.
+        :return: The payload, and if it is final.
+        """
+
+        date_object = TimePeriod.get_date(timestamp)
+        day_filter = {
+            'dashboard': dashboard,
+            'time_year': date_object.year,
+            'time_month': date_object.month,
+            'time_day': date_object.day
+        }
+        final = HistoryCache.is_final(timestamp)
+
+        if final:
+            payload_record = HistoryPayloadModel.objects.filter(**day_filter).values('version', 'content').first()
+            if payload_record is not None:
+                return {
+                    'version': payload_record['version'],
+                    'content': bytes(payload_record['content']),
+                    'final': True
+                }
+
+        content = json.dumps(HistoryCache.get_data(dashboard, timestamp), cls=DjangoJSONEncoder).encode('utf-8')
+        payload = {
+            'version': hashlib.sha1(content).hexdigest(),
+            'content': content,
+            'final': final
+        }
+
+        if final:
+            try:
+                with transaction.atomic():
+                    HistoryPayloadModel.objects.create(version=payload['version'], content=content, **day_filter)
+            except IntegrityError:
+                # Another request stored the payload first, it will be the same as this one.
+                pass
+
+        return payload
+
+    @staticmethod
+    def invalidate(dashboard: str = None, start: date = None, end: date = None) -> int:
+        """
+        Remove stored history payloads, so they are rebuilt on the next request.
+        This must be called after data for past days is backfilled or restored.
+
+        :param dashboard: Only remove payloads for this dashboard. i.e. 'solar'.
+        :param start: Only remove payloads for this day and later.
+        :param end: Only remove payloads for this day and earlier.
+        :return: The number of payloads removed.
+        """
+
+        payload_objects = HistoryPayloadModel.objects.all()
+        if dashboard is not None:
+            payload_objects = payload_objects.filter(dashboard=dashboard)
+        if start is not None:
+            payload_objects = payload_objects.filter(
+                Q(time_year__gt=start.year)
+                | Q(time_year=start.year, time_month__gt=start.month)
+                | Q(time_year=start.year, time_month=start.month, time_day__gte=start.day))
+        if end is not None:
+            payload_objects = payload_objects.filter(
+                Q(time_year__lt=end.year)
+                | Q(time_year=end.year, time_month__lt=end.month)
+                | Q(time_year=end.year, time_month=end.month, time_day__lte=end.day))
+
+        removed, removed_types = payload_objects.delete()
+
+        return removed
+
+    @staticmethod
+    def invalidate_day(dashboard: str, time_obj: dict) -> int:
+        """
+        Remove the stored history payloads that include data from a day.
+        This is every day in the same week or month, as their totals include the day.
+
+        :param dashboard: The dashboard to remove payloads for. i.e. 'solar'.
+        :param time_obj: The object that contains the time data.
+        :return: The number of payloads removed.
+        """
+
+        period_start, period_end = HistoryCache.get_period_range(
+            date(time_obj['year'], time_obj['month'], time_obj['day']))
+
+        return HistoryCache.invalidate(dashboard, period_start, period_end)
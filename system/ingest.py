@@ -0,0 +1,414 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connection, transaction
+import atexit
+import fcntl
+import glob
+import itertools
+import json
+import os
+import threading
+import time
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class IngestBuffer:
+    """
+    Buffer newly stored samples and insert them into the database in batches.
+    Each sample is appended to a write ahead log file before it is buffered, and the log is
+    emptied once the buffer has been flushed, so samples are not lost if the process stops.
+    The buffer is flushed when it holds INGEST_BUFFER_SIZE samples, or INGEST_BUFFER_SECONDS
+    after the first sample was buffered. If INGEST_BUFFER_SIZE is 0, the default, samples are
+    inserted straight away.
+
+    Each process has its own log file for each model, locked while the process is running.
+    Log files that are not locked were left by a process that has stopped, and are recovered
+    into the database by the next process to buffer samples for the model.
+    """
+
+    # The buffers for each model in this process.
+    buffers = {}
+
+    lock = threading.Lock()
+
+    @staticmethod
+    def get_size() -> int:
+        """
+        Get the number of samples that are buffered before they are inserted.
+
+        :return: The INGEST_BUFFER_SIZE setting, defaults to 0 which disables buffering.
+        """
+
+        return getattr(settings, 'INGEST_BUFFER_SIZE', 0)
+
+    @staticmethod
+    def get_seconds() -> float:
+        """
+        Get the longest time a sample is buffered for.
+
+        :return: The INGEST_BUFFER_SECONDS setting, defaults to 60 seconds.
+        """
+
+        return getattr(settings, 'INGEST_BUFFER_SECONDS', 60)
+
+    @staticmethod
+    def get_path() -> str:
+        """
+        Get the directory the write ahead log files are kept in.
+        This needs to survive a reboot, so it shouldn't be in /tmp.
+
+        :return: The INGEST_BUFFER_PATH setting, defaults to /var/tmp/solarweather_ingest.
+        """
+
+        return getattr(settings, 'INGEST_BUFFER_PATH', '/var/tmp/solarweather_ingest')
+
+    @staticmethod
+    def get_log_pattern(data_model) -> str:
+        """
+        Get the pattern matching every log file for a model.
+
+        :param data_model: The model the samples are for.
+        :return: The file name pattern.
+        """
+
+        return os.path.join(IngestBuffer.get_path(), '{0}.*.wal'.format(data_model._meta.label_lower))
+
+    @staticmethod
+    def add(data_model, store_data: dict):
+        """
+        Store a new sample, either straight away or through the buffer.
+
+        :param data_model: The model to store the sample in.
+        :param store_data: The data for the sample.
+        :return: The ID of the inserted row, or None if the sample was buffered.
+        """
+
+        if IngestBuffer.get_size() <= 0:
+            data_record = data_model(**store_data)
+            data_record.save()
+            return data_record.id
+
+        with IngestBuffer.lock:
+            buffer = IngestBuffer.get_buffer(data_model)
+
+            # The sample is only buffered once it is safely in the log.
+            buffer['log'].write(json.dumps(store_data, cls=DjangoJSONEncoder) + '\n')
+            buffer['log'].flush()
+            os.fsync(buffer['log'].fileno())
+            buffer['samples'].append(store_data)
+
+            if len(buffer['samples']) >= IngestBuffer.get_size():
+                IngestBuffer.flush_buffer(data_model, buffer)
+            elif buffer['timer'] is None:
+                buffer['timer'] = threading.Timer(IngestBuffer.get_seconds(), IngestBuffer.thread_flush, args=(data_model,))
+                buffer['timer'].daemon = True
+                buffer['timer'].start()
+
+        return None
+
+    @staticmethod
+    def get_buffer(data_model) -> dict:
+        """
+        Get the buffer for a model in this process, creating it and its log file if needed.
+        Logs left by stopped processes are recovered before a new buffer is created.
+        Must be called with the lock held.
+
+        :param data_model: The model the samples are for.
+        :return: The buffer.
+        """
+
+        label = data_model._meta.label_lower
+        buffer = IngestBuffer.buffers.get(label)
+
+        # A forked process can't share its parent's log.
+        if (buffer is not None) and (buffer['pid'] == os.getpid()):
+            return buffer
+
+        os.makedirs(IngestBuffer.get_path(), exist_ok=True)
+        IngestBuffer.recover(data_model)
+
+        log_name = os.path.join(IngestBuffer.get_path(), '{0}.{1}.wal'.format(label, os.getpid()))
+        log_file = open(log_name, 'a+', encoding='utf-8')
+        fcntl.flock(log_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        if not IngestBuffer.buffers:
+            atexit.register(IngestBuffer.flush_all)
+
+        buffer = {'pid': os.getpid(), 'name': log_name, 'log': log_file, 'samples': [], 'timer': None}
+        IngestBuffer.buffers[label] = buffer
+
+        return buffer
+
+    @staticmethod
+    def flush_buffer(data_model, buffer: dict) -> int:
+        """
+        Insert the buffered samples into the database and empty the log.
+        If the insert fails the samples are kept, and are inserted with the next flush.
+        Must be called with the lock held.
+
+        :param data_model: The model the samples are for.
+        :param buffer: The buffer to flush.
+        :return: The number of samples inserted.
+        """
+
+        if buffer['timer'] is not None:
+            buffer['timer'].cancel()
+            buffer['timer'] = None
+
+        samples = buffer['samples']
+        if len(samples) == 0:
+            return 0
+
+        try:
+            data_model.objects.bulk_create([data_model(**sample) for sample in samples])
+        except DatabaseError as error:
+            logger.error('Ingest buffer: failed to insert {0} {1} samples: {2}'.format(
+                len(samples), data_model._meta.label_lower, error))
+            return 0
+
+        buffer['log'].seek(0)
+        buffer['log'].truncate()
+        buffer['log'].flush()
+        os.fsync(buffer['log'].fileno())
+        buffer['samples'] = []
+
+        return len(samples)
+
+    @staticmethod
+    def flush(data_model) -> int:
+        """
+        Insert any samples buffered for a model by this process.
+        This is done before anything is rebuilt from the stored samples.
+
+        :param data_model: The model the samples are for.
+        :return: The number of samples inserted.
+        """
+
+        with IngestBuffer.lock:
+            buffer = IngestBuffer.buffers.get(data_model._meta.label_lower)
+            if (buffer is None) or (buffer['pid'] != os.getpid()):
+                return 0
+
+            return IngestBuffer.flush_buffer(data_model, buffer)
+
+    @staticmethod
+    def thread_flush(data_model):
+        """
+        Method called in a timer thread to flush a buffer that hasn't filled up in time.
+
+        :param data_model: The model the samples are for.
+        :return:
+        """
+
+        IngestBuffer.flush(data_model)
+        connection.close()
+
+    @staticmethod
+    def flush_all():
+        """
+        Flush the buffers for every model, called when the process exits.
+
+        :return:
+        """
+
+        from django.apps import apps
+
+        for label in list(IngestBuffer.buffers):
+            IngestBuffer.flush(apps.get_model(label))
+
+    @staticmethod
+    def read_log(log_file) -> list:
+        """
+        Read the samples from a log file.
+        A line that was only partly written when the process stopped is skipped.
+
+        :param log_file: The open log file.
+        :return: The samples.
+        """
+
+        log_file.seek(0)
+        samples = []
+        for line in log_file:
+            try:
+                samples.append(json.loads(line))
+            except ValueError:
+                logger.warning('Ingest buffer: skipped incomplete sample in {0}'.format(log_file.name))
+
+        return samples
+
+    @staticmethod
+    def recover(data_model) -> int:
+        """
+        Insert the samples from log files left by stopped processes, then remove the files.
+        Samples that were already inserted before the process stopped are skipped,
+        matched by their time stamp.
+
+        :param data_model: The model the samples are for.
+        :return: The number of samples recovered.
+        """
+
+        recovered = 0
+        for log_name in sorted(glob.glob(IngestBuffer.get_log_pattern(data_model))):
+            with open(log_name, 'r', encoding='utf-8') as log_file:
+                try:
+                    fcntl.flock(log_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # The log belongs to a running process.
+                    continue
+
+                samples = IngestBuffer.read_log(log_file)
+                if len(samples) > 0:
+                    time_stamps = [int(sample['time_stamp']) for sample in samples]
+                    with transaction.atomic():
+                        stored = set(data_model.objects
+                                     .filter(time_stamp__gte=min(time_stamps), time_stamp__lte=max(time_stamps))
+                                     .values_list('time_stamp', flat=True))
+                        data_records = [
+                            data_model(**sample) for sample, time_stamp in zip(samples, time_stamps)
+                            if time_stamp not in stored
+                        ]
+                        data_model.objects.bulk_create(data_records)
+                    recovered += len(data_records)
+
+                os.remove(log_name)
+
+        if recovered > 0:
+            logger.info('Ingest buffer: recovered {0} {1} samples'.format(recovered, data_model._meta.label_lower))
+
+        return recovered
+
+
+class IngestQueue:
+    """
+    A durable queue of raw samples waiting to be stored, so a sender can be answered before the sample
+    is processed. Each sample is written to its own file in a spool directory: it is written to a
+    temporary file, synced and then renamed into the queue, so a sample is either fully queued or not at all.
+    File names start with the time they were queued, so the files are processed in order.
+    """
+
+    # Used to keep file names unique within a process.
+    counter = itertools.count()
+
+    @staticmethod
+    def get_path(name: str) -> str:
+        """
+        Get the directory a queue is kept in.
+
+        :param name: The name of the queue, e.g. weather
+        :return: The directory in the INGEST_QUEUE_PATH setting, defaults to /var/tmp/solarweather_queue.
+        """
+
+        return os.path.join(getattr(settings, 'INGEST_QUEUE_PATH', '/var/tmp/solarweather_queue'), name)
+
+    @staticmethod
+    def put(name: str, payload: dict) -> str:
+        """
+        Add a sample to a queue.
+
+        :param name: The name of the queue, e.g. weather
+        :param payload: The raw sample.
+        :return: The file name of the queued sample.
+        """
+
+        queue_path = IngestQueue.get_path(name)
+        os.makedirs(os.path.join(queue_path, 'tmp'), exist_ok=True)
+
+        file_name = '{0:020d}-{1}-{2}.json'.format(time.time_ns(), os.getpid(), next(IngestQueue.counter))
+        temp_name = os.path.join(queue_path, 'tmp', file_name)
+        with open(temp_name, 'w', encoding='utf-8') as queue_file:
+            json.dump(payload, queue_file)
+            queue_file.flush()
+            os.fsync(queue_file.fileno())
+
+        os.rename(temp_name, os.path.join(queue_path, file_name))
+
+        # Sync the directory so the rename itself survives a crash.
+        directory = os.open(queue_path, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+        return file_name
+
+    @staticmethod
+    def get_pending(name: str) -> list:
+        """
+        Get the samples waiting in a queue, oldest first.
+
+        :param name: The name of the queue, e.g. weather
+        :return: The file names of the queued samples.
+        """
+
+        queue_path = IngestQueue.get_path(name)
+        if not os.path.isdir(queue_path):
+            return []
+
+        return sorted(entry.name for entry in os.scandir(queue_path) if entry.is_file() and entry.name.endswith('.json'))
+
+    @staticmethod
+    def read(name: str, file_name: str) -> dict:
+        """
+        Read a queued sample.
+
+        :param name: The name of the queue, e.g. weather
+        :param file_name: The file name of the queued sample.
+        :return: The raw sample.
+        """
+
+        with open(os.path.join(IngestQueue.get_path(name), file_name), 'r', encoding='utf-8') as queue_file:
+            return json.load(queue_file)
+
+    @staticmethod
+    def remove(name: str, file_name: str):
+        """
+        Remove a sample from a queue once it has been stored.
+
+        :param name: The name of the queue, e.g. weather
+        :param file_name: The file name of the queued sample.
+        :return:
+        """
+
+        os.remove(os.path.join(IngestQueue.get_path(name), file_name))
+
+    @staticmethod
+    def fail(name: str, file_name: str):
+        """
+        Move a sample that can't be stored out of a queue, so it can be looked at later.
+
+        :param name: The name of the queue, e.g. weather
+        :param file_name: The file name of the queued sample.
+        :return:
+        """
+
+        queue_path = IngestQueue.get_path(name)
+        os.makedirs(os.path.join(queue_path, 'failed'), exist_ok=True)
+        os.rename(os.path.join(queue_path, file_name), os.path.join(queue_path, 'failed', file_name))
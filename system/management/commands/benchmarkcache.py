@@ -0,0 +1,381 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from django.utils.module_loading import import_string
+from solar.models import SolarData as SolarDataModel
+from solar.solardata import SolarData
+from system.cache import DataCache
+from system.history import HistoryCache
+from system.management.commands.benchmarkingest import Command as IngestCommand
+from system.payload import DashboardPayload
+from system.workers import WorkerPool
+from weather.weatherdata import WeatherData
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fakeredis
+    import redis
+except ImportError:
+    fakeredis = None
+
+
+class RecordingCache(LocMemCache):
+    """
+    Local memory cache that records every operation, so the operations can be replayed on other backends.
+    The compare-and-set operations of DataCache are recorded as one operation, as Redis runs them as Lua scripts,
+    and the cache operations they make are not recorded.
+    """
+
+    operations = []
+    lock = threading.Lock()
+
+    # Set for the thread while a compare-and-set operation runs.
+    paused = threading.local()
+
+    @staticmethod
+    def record(method: str, *args):
+        if getattr(RecordingCache.paused, 'value', False):
+            return
+
+        with RecordingCache.lock:
+            RecordingCache.operations.append((method, args))
+
+    @staticmethod
+    def recording(method: str):
+        """
+        Wrap a DataCache compare-and-set operation, so it is recorded as one operation.
+
+        :param method: The name of the DataCache method.
+        :return: The wrapped method.
+        """
+
+        function = getattr(DataCache, method)
+
+        def wrapper(*args):
+            RecordingCache.record(method, *args)
+            RecordingCache.paused.value = True
+            try:
+                return function(*args)
+            finally:
+                RecordingCache.paused.value = False
+
+        return wrapper
+
+    def get(self, key, default=None, version=None):
+        self.record('get', key)
+        return super().get(key, default, version)
+
+    def get_many(self, keys, version=None):
+        self.record('get_many', list(keys))
+        return super().get_many(keys, version)
+
+    def set(self, key, value, timeout=None, version=None):
+        self.record('set', key, value, timeout)
+        return super().set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=None, version=None):
+        self.record('set_many', dict(data), timeout)
+        return super().set_many(data, timeout, version)
+
+    def add(self, key, value, timeout=None, version=None):
+        self.record('add', key, value, timeout)
+        return super().add(key, value, timeout, version)
+
+    def delete(self, key, version=None):
+        self.record('delete', key)
+        return super().delete(key, version)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the cache profiles. The cache operations made by the weather and solar data classes ' \
+           'while storing samples and serving the dashboards are recorded, then replayed on each profile.'
+
+    # The DataCache compare-and-set operations, recorded and replayed as one operation.
+    data_cache_methods = ('update_extremes', 'set_many_versioned')
+
+    class Rollback(Exception):
+        """
+        Raised to roll back the synthetic data once the operations have been recorded.
+        """
+        pass
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profile",
+            "-p",
+            type=str,
+            action="append",
+            help="The cache profile to benchmark, can be given more than once. Defaults to every profile.",
+            required=False,
+            default=None,
+        )
+        parser.add_argument(
+            "--samples",
+            "-n",
+            type=int,
+            help="The number of weather and solar samples to store while recording.",
+            required=False,
+            default=50,
+        )
+        parser.add_argument(
+            "--repeat",
+            "-r",
+            type=int,
+            help="The number of times to replay the recorded operations on each profile.",
+            required=False,
+            default=5,
+        )
+
+    @staticmethod
+    def record(samples: int) -> list:
+        """
+        Record the cache operations for storing samples and polling the dashboards.
+        For each sample a weather and solar sample is stored and each dashboard is polled,
+        then the full dashboard and history data is got once.
+
+        :param samples: The number of samples to store.
+        :return: The recorded operations.
+        """
+
+        RecordingCache.operations = []
+        solar_sample = SolarDataModel.objects.order_by('-time_stamp').values().first()
+        del solar_sample['id']
+
+        sample_time = datetime.utcnow() - timedelta(seconds=samples * 16)
+        methods = {method: getattr(DataCache, method) for method in Command.data_cache_methods}
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'system.management.commands.benchmarkcache.RecordingCache',
+                'LOCATION': 'benchmarkcache'}}):
+            for method in Command.data_cache_methods:
+                setattr(DataCache, method, staticmethod(RecordingCache.recording(method)))
+            try:
+                with transaction.atomic():
+                    for _ in range(samples):
+                        sample_time += timedelta(seconds=16)
+                        weather_result = WeatherData.store(
+                            dict(IngestCommand.sample, dateutc=sample_time.strftime('%Y-%m-%d %H:%M:%S')))
+
+                        time_stamp = int(sample_time.replace(tzinfo=timezone.utc).timestamp())
+                        store_data = dict(solar_sample, time_stamp=time_stamp)
+                        solar_task = WorkerPool.submit('cache_solar', SolarData.thread_set, store_data)
+                        solar_result = DashboardPayload.rebuild('solar', solar_task)
+
+                        for task in (weather_result['thread'], weather_result['derive_thread'],
+                                     weather_result['payload_thread'], solar_result):
+                            task.join()
+
+                        for dashboard in ('weather', 'solar'):
+                            DashboardPayload.get(dashboard)
+                            DashboardPayload.get(dashboard)
+
+                    timestamp = datetime.now().timestamp()
+                    WeatherData.get_data(timestamp)
+                    SolarData.get_data(timestamp)
+                    HistoryCache.get('solar', timestamp)
+
+                    raise Command.Rollback()
+            except Command.Rollback:
+                pass
+            finally:
+                for method, function in methods.items():
+                    setattr(DataCache, method, staticmethod(function))
+
+        return RecordingCache.operations
+
+    @staticmethod
+    def get_backend(name: str, location: str, redis_location: str = None):
+        """
+        Create a cache backend for a profile. The backend uses its own location,
+        so the benchmark doesn't replace the values in the real cache.
+
+        :param name: The name of the profile.
+        :param location: A temporary directory for the file based profiles.
+        :param redis_location: The location of a Redis server to use instead of the profile's, e.g. a stand-in.
+        :return: The cache backend.
+        """
+
+        params = dict(settings.CACHE_PROFILES[name])
+        params['KEY_PREFIX'] = 'benchmarkcache'
+        if redis_location is not None:
+            params['LOCATION'] = redis_location
+        if params['BACKEND'].endswith('FileBasedCache'):
+            params['LOCATION'] = os.path.join(location, name)
+        elif params['BACKEND'].endswith('SharedMemoryCache'):
+            params['LOCATION'] = '/dev/shm/solarweather_benchmark_{0}'.format(os.getpid())
+        elif params['BACKEND'].endswith('LocMemCache'):
+            params['LOCATION'] = 'benchmarkcache'
+
+        return import_string(params['BACKEND'])(params.get('LOCATION', ''), params)
+
+    @staticmethod
+    def start_stand_in():
+        """
+        Start a stand-in Redis server in this process, for hosts without a Redis server.
+        The stand-in speaks the Redis protocol and runs the Lua scripts, but the commands are run in Python,
+        so its times are only an upper bound for a real server. Needs the fakeredis and lupa packages.
+
+        :return: The stand-in server, or None if fakeredis is not installed.
+        """
+
+        if fakeredis is None:
+            return None
+
+        server = fakeredis.TcpFakeServer(('127.0.0.1', 0), server_type='redis')
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        # The stand-in drops the connection on an error reply, so the scripts are loaded before they are run by hash.
+        client = redis.Redis(host='127.0.0.1', port=server.server_address[1])
+        for name in ('extremes', 'versioned'):
+            client.script_load(getattr(DataCache, '{0}_script'.format(name)))
+        client.close()
+
+        return server
+
+    @staticmethod
+    def replay(backend, operations: list, repeat: int) -> dict:
+        """
+        Replay the recorded operations on a backend.
+        The DataCache operations are replayed with the backend as the default cache.
+
+        :param backend: The cache backend.
+        :param operations: The recorded operations.
+        :param repeat: The number of times to replay the operations.
+        :return: The times of each operation in seconds, keyed by method, and the time of each replay.
+        """
+
+        times = {'replay': []}
+        caches['default'] = backend
+        try:
+            for _ in range(repeat):
+                replay_start = time.perf_counter()
+                for method, args in operations:
+                    start = time.perf_counter()
+                    if method in Command.data_cache_methods:
+                        getattr(DataCache, method)(*args)
+                    else:
+                        getattr(backend, method)(*args)
+                    times.setdefault(method, []).append(time.perf_counter() - start)
+                times['replay'].append(time.perf_counter() - replay_start)
+        finally:
+            del caches['default']
+            DataCache.scripts = {}
+
+        return times
+
+    @staticmethod
+    def clean_up(backend, operations: list):
+        """
+        Remove the keys the benchmark set from a backend.
+
+        :param backend: The cache backend.
+        :param operations: The recorded operations.
+        :return:
+        """
+
+        keys = set()
+        for method, args in operations:
+            if method == 'set_many':
+                keys.update(args[0].keys())
+            elif method in ('set', 'add'):
+                keys.add(args[0])
+            elif method == 'update_extremes':
+                keys.update(args[0].keys())
+                keys.update('{0}_value'.format(key) for key in args[0].keys())
+            elif method == 'set_many_versioned':
+                keys.update(args[0].keys())
+                keys.update([args[1], '{0}_value'.format(args[1])])
+
+        backend.delete_many(list(keys))
+
+    def handle(self, profile: list, samples: int, repeat: int, *args, **kwargs):
+        profiles = profile if profile else list(settings.CACHE_PROFILES.keys())
+
+        self.stdout.write('Recording the cache operations for {0} samples...'.format(samples))
+        operations = Command.record(samples)
+        counts = {}
+        for method, args in operations:
+            counts[method] = counts.get(method, 0) + 1
+        self.stdout.write('{0} operations: {1}'.format(
+            len(operations), ', '.join('{0} {1}'.format(count, method) for method, count in sorted(counts.items()))))
+
+        stand_in = None
+        with tempfile.TemporaryDirectory() as location:
+            for name in profiles:
+                label = name
+                try:
+                    backend = Command.get_backend(name, location)
+                    backend.set('benchmarkcache_check', 1, 60)
+                except Exception as error:
+                    self.stdout.write(self.style.WARNING('{0}: not available ({1})'.format(name, error)))
+
+                    # Without a Redis server the profile is run against a stand-in, so its scripts are still run.
+                    if not settings.CACHE_PROFILES[name]['BACKEND'].startswith('django_redis'):
+                        continue
+                    if stand_in is None:
+                        stand_in = Command.start_stand_in()
+                        if stand_in is None:
+                            continue
+
+                    backend = Command.get_backend(
+                        name, location, 'redis://127.0.0.1:{0}/1'.format(stand_in.server_address[1]))
+                    label = '{0} (stand-in server)'.format(name)
+
+                times = Command.replay(backend, operations, repeat)
+
+                # Redis is not cleared, as clear removes every key in the database.
+                clear_time = None
+                if 'redis' not in type(backend).__module__:
+                    clear_start = time.perf_counter()
+                    backend.clear()
+                    clear_time = time.perf_counter() - clear_start
+                else:
+                    Command.clean_up(backend, operations)
+
+                if hasattr(backend, 'segment'):
+                    os.remove(backend.segment.path)
+
+                self.stdout.write(self.style.SUCCESS('{0}: replay {1:.1f} ms{2}'.format(
+                    label, min(times['replay']) * 1000,
+                    ', clear {0:.1f} ms'.format(clear_time * 1000) if clear_time is not None else '')))
+                for method in sorted(times.keys()):
+                    if method == 'replay':
+                        continue
+                    p50, p99 = np.percentile(np.array(times[method]) * 1000000, [50, 99])
+                    self.stdout.write('  {0}: p50 {1:.0f} us, p99 {2:.0f} us'.format(method, p50, p99))
+
+        if stand_in is not None:
+            stand_in.shutdown()
+            stand_in.server_close()
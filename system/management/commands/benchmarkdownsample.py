@@ -0,0 +1,110 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.core.management.base import BaseCommand
+from system.conversion import UnitConversion
+import numpy as np
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the trend down sampling methods against day, month and year sized data sets.'
+
+    # Number of samples in each period, based on a sample every 16 seconds from the weather station.
+    period_samples = {
+        'day': 5400,
+        'month': 5400 * 31,
+        'year': 5400 * 366,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--points",
+            "-p",
+            type=int,
+            help="The number of points to down sample to.",
+            required=False,
+            default=250,
+        )
+        parser.add_argument(
+            "--repeat",
+            "-r",
+            type=int,
+            help="The number of times to run each method. The fastest run is reported.",
+            required=False,
+            default=3,
+        )
+
+    @staticmethod
+    def time_function(function, repeat: int) -> tuple:
+        """
+        Run a function a number of times and return the fastest time and the result.
+
+        :param function: The function to time.
+        :param repeat: The number of times to run the function.
+        :return: The fastest run time and the function result.
+        """
+
+        fastest = None
+        result = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            run_time = time.perf_counter() - start
+            if (fastest is None) or (run_time < fastest):
+                fastest = run_time
+
+        return fastest, result
+
+    def handle(self, points: int, repeat: int, *args, **kwargs):
+        random_generator = np.random.default_rng(42)
+
+        for period, samples in Command.period_samples.items():
+            # Build a synthetic temperature like data set, a daily cycle with noise and some spikes.
+            time_array = 1631858701 + np.cumsum(random_generator.integers(15, 18, samples))
+            magnitude_array = 15 + 8 * np.sin(time_array / 86400 * 2 * np.pi) \
+                + random_generator.normal(0, 0.5, samples)
+            spikes = random_generator.integers(0, samples, 10)
+            magnitude_array[spikes] += random_generator.choice([-20, 20], 10)
+            data_table = list(zip(time_array.tolist(), np.round(magnitude_array, 3).tolist()))
+            peak = max(data_table, key=lambda data_tuple: data_tuple[1])
+
+            # The current method uses a bucket size, so pick the one that gives the requested number of points.
+            sample_size = int(np.ceil(samples / points))
+            methods = {
+                'average': lambda: UnitConversion.downsample_data(data_table, sample_size),
+                'lttb': lambda: UnitConversion.downsample_lttb(data_table, points),
+                'minmax': lambda: UnitConversion.downsample_minmax(data_table, points),
+            }
+
+            # Most of the time for the vectorised methods is spent converting the list of pairs into arrays.
+            conversion_time, arrays = Command.time_function(lambda: UnitConversion.get_arrays(data_table), repeat)
+
+            self.stdout.write('{0}: {1} samples to {2} points'.format(period, samples, points))
+            for method, function in methods.items():
+                run_time, result = Command.time_function(function, repeat)
+                self.stdout.write(self.style.SUCCESS(
+                    '  {0}: {1:.4f} seconds, {2} points, peak kept: {3}'
+                    .format(method, run_time, len(result), peak in result)))
+            self.stdout.write('  converting to arrays: {0:.4f} seconds'.format(conversion_time))
@@ -0,0 +1,239 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from weather.models import WeatherData as WeatherDataModel
+from solar.models import SolarData as SolarDataModel
+from datetime import datetime, timedelta
+import numpy as np
+import re
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the insert throughput and query latency of the weather and solar data tables ' \
+           'with their current indexes. Synthetic data is used and everything is rolled back at the end.'
+
+    models = {
+        'weather': (WeatherDataModel, 'outdoor_temp'),
+        'solar': (SolarDataModel, 'inverter_ac_power'),
+    }
+
+    # Seconds between synthetic samples, the weather station sends a sample about every 16 seconds.
+    sample_interval = 16
+
+    class Rollback(Exception):
+        """
+        Raised to roll back the synthetic data once the benchmark has finished.
+        """
+        pass
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dashboard",
+            "-d",
+            type=str,
+            choices=['weather', 'solar'],
+            help="The data to benchmark.",
+            required=False,
+            default='weather',
+        )
+        parser.add_argument(
+            "--rows",
+            type=int,
+            help="The number of synthetic rows to add before running the queries.",
+            required=False,
+            default=50000,
+        )
+        parser.add_argument(
+            "--inserts",
+            type=int,
+            help="The number of rows to insert one at a time, the way new samples are stored.",
+            required=False,
+            default=2000,
+        )
+        parser.add_argument(
+            "--repeat",
+            "-r",
+            type=int,
+            help="The number of times to run each query. The fastest run is reported.",
+            required=False,
+            default=5,
+        )
+
+    @staticmethod
+    def get_partition_range(data_model) -> tuple:
+        """
+        Get the range of the first partition of a table, so the synthetic data goes into a real partition.
+
+        :param data_model: The model that stores the data.
+        :return: The start and end (exclusive) timestamps of the partition.
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits '
+                'JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid '
+                'WHERE pg_inherits.inhparent = %s::regclass', [data_model._meta.db_table])
+            bounds = []
+            for (bound,) in cursor.fetchall():
+                match = re.search(r"FROM \('?(\d+)'?\) TO \('?(\d+)'?\)", bound)
+                if match:
+                    bounds.append((int(match.group(1)), int(match.group(2))))
+
+        return min(bounds)
+
+    @staticmethod
+    def get_index_count(data_model) -> int:
+        """
+        Get the number of indexes on a table. Each index is also created on every partition.
+
+        :param data_model: The model that stores the data.
+        :return: The number of indexes.
+        """
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM pg_index WHERE indrelid = %s::regclass', [data_model._meta.db_table])
+
+            return int(cursor.fetchone()[0])
+
+    @staticmethod
+    def get_rows(data_model, start: int, count: int) -> list:
+        """
+        Build synthetic rows for a table.
+
+        :param data_model: The model that stores the data.
+        :param start: The timestamp of the first row.
+        :param count: The number of rows.
+        :return: The unsaved model instances.
+        """
+
+        random_generator = np.random.default_rng(42)
+        rows = []
+        for time_stamp in range(start, start + (count * Command.sample_interval), Command.sample_interval):
+            datetime_object = datetime.fromtimestamp(time_stamp)
+            row_data = {
+                'time_stamp': time_stamp,
+                'time_year': datetime_object.year,
+                'time_month': datetime_object.month,
+                'time_day': datetime_object.day,
+            }
+            for field in data_model._meta.concrete_fields:
+                if field.name in row_data or field.primary_key:
+                    continue
+                elif field.get_internal_type() == 'FloatField':
+                    row_data[field.name] = round(float(random_generator.normal(20, 5)), 3)
+                elif field.get_internal_type() == 'IntegerField':
+                    row_data[field.name] = int(random_generator.integers(0, 10))
+                elif field.get_internal_type() == 'DateTimeField':
+                    row_data[field.name] = datetime.fromtimestamp(time_stamp, tz=timezone.utc)
+                else:
+                    row_data[field.name] = 'benchmark'
+            rows.append(data_model(**row_data))
+
+        return rows
+
+    @staticmethod
+    def time_query(query, repeat: int) -> float:
+        """
+        Run a query a number of times and return the fastest time.
+
+        :param query: A function that runs the query.
+        :param repeat: The number of times to run the query.
+        :return: The fastest run time.
+        """
+
+        fastest = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            query()
+            run_time = time.perf_counter() - start
+            if (fastest is None) or (run_time < fastest):
+                fastest = run_time
+
+        return fastest
+
+    def handle(self, dashboard: str, rows: int, inserts: int, repeat: int, *args, **kwargs):
+        data_model, metric = Command.models[dashboard]
+        start, end = Command.get_partition_range(data_model)
+        rows = min(rows, (end - start) // Command.sample_interval)
+        inserts = min(inserts, rows)
+        synthetic_rows = Command.get_rows(data_model, start, rows)
+
+        # Pick a day in the middle of the synthetic data to query.
+        middle = datetime.fromtimestamp(start + (rows // 2) * Command.sample_interval)
+        day_filter = {'time_year': middle.year, 'time_month': middle.month, 'time_day': middle.day}
+        day_start = int(datetime(middle.year, middle.month, middle.day).timestamp())
+        range_filter = {'time_stamp__gte': day_start, 'time_stamp__lt': day_start + 86400}
+        month_start = int(datetime(middle.year, middle.month, 1).timestamp())
+        month_end = int((datetime(middle.year, middle.month, 1) + timedelta(days=32)).replace(day=1).timestamp())
+        month_range_filter = {'time_stamp__gte': month_start, 'time_stamp__lt': month_end}
+
+        queries = {
+            'day trend (calendar filter)': lambda: list(
+                data_model.objects.filter(**day_filter).order_by('time_stamp').values_list('time_stamp', metric)),
+            'day trend (time stamp range)': lambda: list(
+                data_model.objects.filter(**range_filter).order_by('time_stamp').values_list('time_stamp', metric)),
+            'day maximum': lambda: data_model.objects.filter(**day_filter).aggregate(Max(metric)),
+            'month maximum (calendar filter)': lambda: data_model.objects.filter(
+                time_year=middle.year, time_month=middle.month).aggregate(Max(metric)),
+            'month maximum (time stamp range)': lambda: data_model.objects.filter(
+                **month_range_filter).aggregate(Max(metric)),
+            'last sample of day': lambda: data_model.objects.filter(**day_filter)
+                .order_by('-time_stamp').values('time_stamp', metric).first(),
+            'first sample': lambda: data_model.objects.order_by('time_stamp').values_list('time_stamp').first(),
+        }
+
+        try:
+            with transaction.atomic():
+                insert_start = time.perf_counter()
+                for synthetic_row in synthetic_rows[:inserts]:
+                    synthetic_row.save()
+                insert_time = time.perf_counter() - insert_start
+
+                bulk_start = time.perf_counter()
+                data_model.objects.bulk_create(synthetic_rows[inserts:], batch_size=5000)
+                bulk_time = time.perf_counter() - bulk_start
+
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE {0}'.format(connection.ops.quote_name(data_model._meta.db_table)))
+
+                self.stdout.write('{0}: {1} synthetic rows, {2} indexes'.format(
+                    dashboard, rows, Command.get_index_count(data_model)))
+                self.stdout.write(self.style.SUCCESS('  single row inserts: {0:.0f} rows per second'.format(
+                    inserts / insert_time)))
+                if rows > inserts:
+                    self.stdout.write(self.style.SUCCESS('  bulk inserts: {0:.0f} rows per second'.format(
+                        (rows - inserts) / bulk_time)))
+
+                for name, query in queries.items():
+                    run_time = Command.time_query(query, repeat)
+                    self.stdout.write(self.style.SUCCESS('  {0}: {1:.2f} ms'.format(name, run_time * 1000)))
+
+                raise Command.Rollback()
+        except Command.Rollback:
+            pass
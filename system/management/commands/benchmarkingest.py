@@ -0,0 +1,143 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+from system.ingest import IngestQueue
+from weather.views import index
+from datetime import datetime, timedelta
+import numpy as np
+import tempfile
+import threading
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the latency of the weather station ingest view, storing each sample straight away ' \
+           'and queueing it for the ingest worker. Synthetic samples are used and everything is rolled back at the end.'
+
+    # A sample as sent by the weather station, the date is set for each request.
+    sample = {
+        'ID': 'benchmark',
+        'PASSWORD': 'benchmark',
+        'indoortempf': '68.0',
+        'tempf': '52.5',
+        'dewptf': '45.5',
+        'windchillf': '52.5',
+        'indoorhumidity': '52',
+        'humidity': '77',
+        'windspeedmph': '0.7',
+        'windgustmph': '1.1',
+        'winddir': '338',
+        'absbaromin': '29.318',
+        'baromin': '29.714',
+        'rainin': '0.000',
+        'dailyrainin': '0.000',
+        'weeklyrainin': '0.181',
+        'monthlyrainin': '3.098',
+        'solarradiation': '71.56',
+        'UV': '0',
+        'softwaretype': 'EasyWeatherV1.5.9',
+        'action': 'updateraw',
+        'realtime': '1',
+        'rtfreq': '5',
+    }
+
+    class Rollback(Exception):
+        """
+        Raised to roll back the synthetic data once the benchmark has finished.
+        """
+        pass
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            "-n",
+            type=int,
+            help="The number of samples to send in each mode.",
+            required=False,
+            default=200,
+        )
+
+    @staticmethod
+    def time_requests(count: int) -> list:
+        """
+        Send samples to the ingest view and time each response.
+        The threads started for a sample are finished before the next sample is sent,
+        as they would be with the weather station sending a sample every 16 seconds.
+
+        :param count: The number of samples to send.
+        :return: The response times in seconds.
+        """
+
+        request_factory = RequestFactory()
+        sample_time = datetime.utcnow() - timedelta(seconds=count * 16)
+        running_threads = set(threading.enumerate())
+        response_times = []
+        for _ in range(count):
+            sample_time += timedelta(seconds=16)
+            request = request_factory.get(
+                '/weatherstation/updateweatherstation.php',
+                dict(Command.sample, dateutc=sample_time.strftime('%Y-%m-%d %H:%M:%S')))
+
+            start = time.perf_counter()
+            index(request)
+            response_times.append(time.perf_counter() - start)
+
+            for thread in set(threading.enumerate()) - running_threads:
+                thread.join()
+
+        return response_times
+
+    def report(self, name: str, response_times: list):
+        """
+        Report the percentiles of the response times.
+
+        :param name: The name of the mode.
+        :param response_times: The response times in seconds.
+        """
+
+        p50, p95, p99 = np.percentile(np.array(response_times) * 1000, [50, 95, 99])
+        self.stdout.write(self.style.SUCCESS('  {0}: p50 {1:.2f} ms, p95 {2:.2f} ms, p99 {3:.2f} ms, max {4:.2f} ms'.format(
+            name, p50, p95, p99, max(response_times) * 1000)))
+
+    def handle(self, requests: int, *args, **kwargs):
+        self.stdout.write('Sending {0} samples in each mode...'.format(requests))
+
+        # A local memory cache is used, so the synthetic samples don't replace the cached dashboard values.
+        with tempfile.TemporaryDirectory() as queue_path, override_settings(
+                INGEST_QUEUE_PATH=queue_path,
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            try:
+                with transaction.atomic():
+                    with override_settings(WEATHER_INGEST_MODE='sync'):
+                        self.report('sync', Command.time_requests(requests))
+                    with override_settings(WEATHER_INGEST_MODE='queue'):
+                        self.report('queue', Command.time_requests(requests))
+                    self.stdout.write('  {0} samples queued'.format(len(IngestQueue.get_pending('weather'))))
+
+                    raise Command.Rollback()
+            except Command.Rollback:
+                pass
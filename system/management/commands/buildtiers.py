@@ -0,0 +1,100 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from weather.models import WeatherData as WeatherDataModel
+from weather.weatherdata import WeatherData
+from solar.models import SolarData as SolarDataModel
+from solar.solardata import SolarData
+from datetime import date, datetime
+import time
+import tqdm
+
+
+class Command(BaseCommand):
+    help = 'Build the trend tiers from the stored weather and solar data.'
+
+    # Number of seconds of data to build in each step.
+    step = 86400 * 7
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dashboard",
+            "-d",
+            type=str,
+            choices=['weather', 'solar'],
+            help="Only build the tiers for this dashboard.",
+            required=False,
+            default=None,
+        )
+        parser.add_argument(
+            "--start",
+            "-s",
+            type=date.fromisoformat,
+            help="Only build the tiers from this day (YYYY-MM-DD).",
+            required=False,
+            default=None,
+        )
+        parser.add_argument(
+            "--end",
+            "-e",
+            type=date.fromisoformat,
+            help="Only build the tiers up to and including this day (YYYY-MM-DD).",
+            required=False,
+            default=None,
+        )
+
+    def handle(self, dashboard: str, start: date, end: date, *args, **kwargs):
+        begin = time.time()
+
+        dashboards = {
+            'weather': (WeatherDataModel, WeatherData),
+            'solar': (SolarDataModel, SolarData),
+        }
+        if dashboard is not None:
+            dashboards = {dashboard: dashboards[dashboard]}
+
+        for dashboard_name, (data_model, data_class) in dashboards.items():
+            data_range = data_model.objects.aggregate(Min('time_stamp'), Max('time_stamp'))
+            if data_range['time_stamp__min'] is None:
+                self.stdout.write('No {0} data to build tiers for.'.format(dashboard_name))
+                continue
+
+            range_start = data_range['time_stamp__min']
+            range_end = data_range['time_stamp__max'] + 1
+            if start is not None:
+                range_start = max(range_start, int(datetime(start.year, start.month, start.day).timestamp()))
+            if end is not None:
+                range_end = min(range_end, int(datetime(end.year, end.month, end.day).timestamp()) + 86400)
+
+            steps = range(range_start, range_end, Command.step)
+            self.stdout.write(self.style.SUCCESS('Building {0} tiers...'.format(dashboard_name)))
+            with tqdm.tqdm(total=len(steps)) as pbar:
+                for step_start in steps:
+                    data_class.refresh_tiers(step_start, min(step_start + Command.step, range_end))
+                    pbar.update(1)
+
+        total_time = (time.time() - begin)
+        self.stdout.write(self.style.SUCCESS('Tiers built in {0:.1f} seconds.'.format(total_time)))
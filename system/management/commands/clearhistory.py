@@ -0,0 +1,62 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.core.management.base import BaseCommand
+from system.history import HistoryCache
+from datetime import date
+
+
+class Command(BaseCommand):
+    help = 'Clear the stored history dashboard payloads, e.g. after backfilling or restoring data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dashboard",
+            "-d",
+            type=str,
+            choices=['solar'],
+            help="Only clear the payloads for this dashboard.",
+            required=False,
+            default=None,
+        )
+        parser.add_argument(
+            "--start",
+            "-s",
+            type=date.fromisoformat,
+            help="Only clear the payloads for this day (YYYY-MM-DD) and later.",
+            required=False,
+            default=None,
+        )
+        parser.add_argument(
+            "--end",
+            "-e",
+            type=date.fromisoformat,
+            help="Only clear the payloads for this day (YYYY-MM-DD) and earlier.",
+            required=False,
+            default=None,
+        )
+
+    def handle(self, dashboard: str, start: date, end: date, *args, **kwargs):
+        removed = HistoryCache.invalidate(dashboard, start, end)
+        self.stdout.write(self.style.SUCCESS('Cleared {0} history payloads.'.format(removed)))
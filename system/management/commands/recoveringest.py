@@ -0,0 +1,38 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.core.management.base import BaseCommand
+from system.ingest import IngestBuffer
+from weather.models import WeatherData as WeatherDataModel
+from solar.models import SolarData as SolarDataModel
+
+
+class Command(BaseCommand):
+    help = 'Insert the samples left in the ingest buffer logs by processes that have stopped.'
+
+    def handle(self, *args, **kwargs):
+        for data_model in (WeatherDataModel, SolarDataModel):
+            recovered = IngestBuffer.recover(data_model)
+            self.stdout.write(self.style.SUCCESS('Recovered {0} {1} samples.'.format(
+                recovered, data_model._meta.verbose_name)))
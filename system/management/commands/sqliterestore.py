@@ -22,8 +22,11 @@
 # @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
 # ==============================================================================
 
+from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import connection
+from system.history import HistoryCache
 import sqlite3
 import time
 import os
@@ -84,5 +87,13 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS('Table {}, Rows {}'.format(row[0], db_cur.fetchone()[0])))
         db_con.close()
 
+        # The stored history payloads, rollups, extremes, tiers and cached values were built from the data
+        # that was replaced, so rebuild them from the restored database.
+        connection.close()
+        removed = HistoryCache.invalidate()
+        self.stdout.write(self.style.SUCCESS('Cleared {0} history payloads.'.format(removed)))
+        for command in ('buildrollup', 'buildextremes', 'buildtiers', 'rebuildcache'):
+            call_command(command, stdout=self.stdout, stderr=self.stderr)
+
         total_time = (time.time() - start)
         self.stdout.write(self.style.SUCCESS('Restore complete in {0:.1f} seconds.'.format(total_time)))
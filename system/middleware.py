@@ -0,0 +1,129 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from system.cache import DataCache
+from system.workers import WorkerPool
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class CacheOperationsMiddleware:
+    """
+    Report the number of data cache operations made by each request.
+    The counts are logged and added to the response in the X-Cache-Operations header,
+    and the L1 cache hits and misses in the X-Local-Cache header.
+    The middleware is async capable, so async views such as the dashboard long poll
+    are not run on the single thread shared by sync code under ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        DataCache.reset_operations()
+
+        response = self.get_response(request)
+
+        return self.add_headers(request, response)
+
+    async def __acall__(self, request):
+        # The counts are kept in an asgiref Local, so counts made by sync views
+        # run in another thread are seen here once they have been awaited.
+        DataCache.reset_operations()
+
+        response = await self.get_response(request)
+
+        return self.add_headers(request, response)
+
+    @staticmethod
+    def add_headers(request, response):
+        """
+        Add the cache operation counts for a request to its response.
+
+        :param request: The request.
+        :param response: The response.
+        :return: The response.
+        """
+
+        operations = DataCache.get_operations()
+        response.headers['X-Cache-Operations'] = '{0}; keys={1}'.format(operations['operations'], operations['keys'])
+        local_operations = DataCache.get_local_operations()
+        response.headers['X-Local-Cache'] = 'hits={0}; misses={1}'.format(
+            local_operations['hits'], local_operations['misses'])
+        logger.debug('{0} cache operations, {1} keys: {2}'.format(
+            operations['operations'], operations['keys'], request.get_full_path()))
+
+        return response
+
+
+class WorkerPoolMiddleware:
+    """
+    Report the state of the worker pool with each response.
+    The queue depth and the number of dropped tasks are added to the response in the X-Worker-Pool header.
+    The middleware is async capable, see CacheOperationsMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        return self.add_headers(self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(await self.get_response(request))
+
+    @staticmethod
+    def add_headers(response):
+        """
+        Add the state of the worker pool to a response.
+
+        :param response: The response.
+        :return: The response.
+        """
+
+        stats = WorkerPool.get_stats()
+        response.headers['X-Worker-Pool'] = 'depth={0}; max={1}; coalesced={2}; dropped={3}'.format(
+            stats['queue_depth'], stats['max_queue_depth'], stats['coalesced'], stats['dropped'])
+
+        return response
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.4 on 2026-10-17 23:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryPayload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dashboard', models.CharField(max_length=50)),
+                ('version', models.CharField(max_length=40)),
+                ('content', models.BinaryField()),
+                ('time_year', models.IntegerField()),
+                ('time_month', models.IntegerField()),
+                ('time_day', models.IntegerField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='historypayload',
+            constraint=models.UniqueConstraint(fields=('dashboard', 'time_year', 'time_month', 'time_day'), name='history_payload_day'),
+        ),
+    ]
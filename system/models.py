@@ -24,4 +24,22 @@
 
 from django.db import models
 
-# Create your models here.
+
+class HistoryPayload(models.Model):
+    """
+    This model stores the rendered JSON payloads for the history dashboards.
+    Data for days in the past never changes, so payloads are kept until they are explicitly invalidated.
+    """
+
+    dashboard = models.CharField(max_length=50)
+    version = models.CharField(max_length=40)
+    content = models.BinaryField()
+    time_year = models.IntegerField()
+    time_month = models.IntegerField()
+    time_day = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dashboard', 'time_year', 'time_month', 'time_day'],
+                                    name='history_payload_day'),
+        ]
@@ -0,0 +1,251 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from system.cache import DataCache
+from system.encoding import TrendEncoding
+from system.workers import WorkerPool, WorkerTask
+from datetime import datetime
+import asyncio
+import hashlib
+import json
+import threading
+import time
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class DashboardPayload:
+    """
+    The rendered JSON payloads for the live dashboards.
+    Payloads are built once each time a new sample is stored and then served as is,
+    so polling the dashboards does not rebuild and serialise the dashboard data for each request.
+    """
+
+    # Number of seconds a payload is cached for. If no new samples are stored in this time
+    # the payload is rebuilt on the next request, so the dashboards still roll over to a new day.
+    timeout = 300
+
+    # Number of seconds between checks for a new payload version while clients are waiting.
+    # The version is read once per interval for each dashboard and shared by all the waiting clients.
+    wait_interval = 0.5
+
+    # Number of seconds a client waits for a new payload, before it is told the payload hasn't changed.
+    # This is kept below the read timeout of proxies such as nginx.
+    wait_duration = 25
+
+    # The number of clients waiting in this process.
+    wait_lock = threading.Lock()
+    waiting = 0
+
+    # The last payload version read for each dashboard, and the time it was read.
+    version_lock = threading.Lock()
+    versions = {}
+
+    @staticmethod
+    def get_data(dashboard: str) -> dict:
+        """
+        Get the current data for a dashboard.
+
+        :param dashboard: The dashboard to get the data for. i.e. 'weather', 'solar'.
+        :return: The dashboard data.
+        """
+
+        # Imported here as the data classes import this module to rebuild the payloads.
+        from weather.weatherdata import WeatherData
+        from solar.solardata import SolarData
+
+        timestamp = datetime.now().timestamp()
+        if dashboard == 'solar':
+            return SolarData.get_data(timestamp)
+
+        return WeatherData.get_data(timestamp)
+
+    @staticmethod
+    def build(dashboard: str) -> dict:
+        """
+        Build the payload for a dashboard and store it in the cache.
+        The payload is encoded in every format, see TrendEncoding.
+        The version of the payload is a hash of its content, and is used as the ETag.
+
+        :param dashboard: The dashboard to build the payload for. i.e. 'weather', 'solar'.
+        :return: The payload.
+        """
+
+        data = DashboardPayload.get_data(dashboard)
+        content = TrendEncoding.encode(data, 'json')
+        payload = {
+            'version': hashlib.sha1(content).hexdigest(),
+            'content': content,
+            'columns': TrendEncoding.encode(data, 'columns'),
+            'binary': TrendEncoding.encode(data, 'binary'),
+        }
+        DataCache.set_many({
+            'payload_{0}'.format(dashboard): payload,
+            'payload_version_{0}'.format(dashboard): payload['version'],
+        }, DashboardPayload.timeout)
+
+        return payload
+
+    @staticmethod
+    def get(dashboard: str) -> dict:
+        """
+        Get the payload for a dashboard, building it if it isn't cached.
+
+        :param dashboard: The dashboard to get the payload for. i.e. 'weather', 'solar'.
+        :return: The payload.
+        """
+
+        payload = DataCache.get('payload_{0}'.format(dashboard))
+        if payload is None:
+            payload = DashboardPayload.build(dashboard)
+
+        return payload
+
+    @staticmethod
+    def thread_build(items: list):
+        """
+        Method called in a worker to rebuild a payload after new samples are stored.
+        The task is only queued once the tasks updating the latest values have finished,
+        so the payload includes the new samples. Rebuilds queued while the worker was busy are
+        coalesced, so the payload is only built once for them.
+
+        :param items: The dashboard to build the payload for, for each new sample.
+        :return:
+        """
+
+        DashboardPayload.build(items[0])
+
+        # The caches and payload now include the new samples, so other processes drop their L1 values.
+        DataCache.bump_generation()
+
+    @staticmethod
+    def rebuild(dashboard: str, cache_task: WorkerTask) -> WorkerTask:
+        """
+        Rebuild the payload for a dashboard in the worker pool, so we don't have to wait for it.
+        The rebuild is queued once the cache values have been updated. Workers never wait for
+        other tasks, as with one worker that task could be queued behind the rebuild.
+
+        :param dashboard: The dashboard to build the payload for. i.e. 'weather', 'solar'.
+        :param cache_task: The task updating the cache values for the new sample.
+        :return: The task building the payload.
+        """
+
+        return WorkerPool.submit(
+            'payload_{0}'.format(dashboard), DashboardPayload.thread_build, dashboard, after=cache_task)
+
+    @staticmethod
+    def get_content(payload: dict, data_format: str) -> bytes:
+        """
+        Get the content of a payload in a format.
+        Payloads that were not built in the format are encoded from the JSON content.
+
+        :param payload: The payload.
+        :param data_format: The format. i.e. 'json', 'columns', 'binary'.
+        :return: The content.
+        """
+
+        if data_format == 'json':
+            return payload['content']
+        elif data_format in payload:
+            return payload[data_format]
+
+        return TrendEncoding.encode(json.loads(payload['content']), data_format)
+
+    @staticmethod
+    def get_wait_limit() -> int:
+        """
+        Get the maximum number of clients that can wait for a new payload in each process.
+        Waiting clients hold a thread under WSGI, so they are limited to leave threads for other requests.
+        Under ASGI the limit also bounds the version checks made on the thread shared by sync code.
+
+        :return: The DASHBOARD_WAIT_LIMIT setting, defaults to 10.
+        """
+
+        return max(0, int(getattr(settings, 'DASHBOARD_WAIT_LIMIT', 10)))
+
+    @staticmethod
+    def get_version(dashboard: str) -> str:
+        """
+        Get the version of the current payload for a dashboard.
+        The version is read from the cache at most once per wait interval in each process,
+        however many clients are waiting.
+
+        :param dashboard: The dashboard to get the payload version for. i.e. 'weather', 'solar'.
+        :return: The payload version.
+        """
+
+        with DashboardPayload.version_lock:
+            read_time, version = DashboardPayload.versions.get(dashboard, (0.0, None))
+            if (time.monotonic() - read_time) < DashboardPayload.wait_interval:
+                return version
+
+            version = DataCache.get('payload_version_{0}'.format(dashboard))
+            if version is None:
+                # No new samples have been stored for a while, build the payload again.
+                version = DashboardPayload.get(dashboard)['version']
+
+            DashboardPayload.versions[dashboard] = (time.monotonic(), version)
+
+        return version
+
+    @staticmethod
+    async def wait(dashboard: str, versions: list) -> dict:
+        """
+        Wait for the payload of a dashboard to change from the versions a client already has.
+        The wait sleeps on the event loop between version checks. Under ASGI the version checks run on
+        the one thread Django 3.2 shares between all sync code, so a waiting client only holds that thread
+        for each check. This relies on every middleware being async capable: a sync only middleware runs
+        the whole wait on that thread, and holds up every other request until the wait is over.
+        The wait gives up after the wait duration and returns the current payload.
+
+        :param dashboard: The dashboard to wait for. i.e. 'weather', 'solar'.
+        :param versions: The payload versions the client has.
+        :return: The payload, or None if too many clients are already waiting.
+        """
+
+        with DashboardPayload.wait_lock:
+            if DashboardPayload.waiting >= DashboardPayload.get_wait_limit():
+                return None
+            DashboardPayload.waiting += 1
+
+        try:
+            deadline = time.monotonic() + DashboardPayload.wait_duration
+            while time.monotonic() < deadline:
+                if await sync_to_async(DashboardPayload.get_version)(dashboard) not in versions:
+                    break
+                await asyncio.sleep(DashboardPayload.wait_interval)
+
+            return await sync_to_async(DashboardPayload.get)(dashboard)
+        finally:
+            with DashboardPayload.wait_lock:
+                DashboardPayload.waiting -= 1
+
+            # Don't keep a database connection open for each waiting client.
+            await sync_to_async(connections.close_all)()
@@ -0,0 +1,214 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.conf import settings
+from datetime import date, datetime, time, timedelta
+import functools
+import pytz
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class TimePeriod:
+    """
+    Resolve the calendar periods used by the dashboards to time stamp ranges.
+    The data tables are partitioned on the time stamp, so filtering on a time stamp range lets
+    PostgreSQL skip the partitions outside the period. Filtering on the calendar columns
+    has to check every partition.
+
+    Periods are calendar days, weeks, months and years in the TIME_ZONE setting, so a day is
+    23 or 25 hours long when daylight saving starts or ends. Weeks start on Sunday.
+    The boundaries are memoized by date, as the same few periods are resolved for every metric.
+    """
+
+    # The number of memoized dates. Each date has an entry for each period.
+    cache_size = 512
+
+    # Periods to get maximum and minimum values for.
+    extreme_periods = {
+        'daily': 'day',
+        'monthly': 'month',
+        'yearly': 'year',
+    }
+
+    @staticmethod
+    def get_timezone():
+        """
+        Get the timezone periods are calculated in.
+
+        :return: The timezone from the TIME_ZONE setting.
+        """
+
+        return pytz.timezone(getattr(settings, 'TIME_ZONE'))
+
+    @staticmethod
+    def get_date(timestamp) -> date:
+        """
+        Get the local date of a timestamp.
+
+        :param timestamp: The unix timestamp.
+        :return: The date in the TIME_ZONE setting.
+        """
+
+        return datetime.fromtimestamp(timestamp, TimePeriod.get_timezone()).date()
+
+    @staticmethod
+    def get_week_start(day: date) -> date:
+        """
+        Get the Sunday a week starts on.
+
+        :param day: A day in the week.
+        :return: The first day of the week.
+        """
+
+        return day - timedelta(days=(day.weekday() + 1) % 7)
+
+    @staticmethod
+    def get_time_obj(timestamp) -> dict:
+        """
+        Get the time object for a timestamp, with the components used to identify its periods.
+        The week is the week of the year the Sunday starting the week is in, and week_year is that year.
+
+        :param timestamp: The unix timestamp.
+        :return: The time object.
+        """
+
+        return dict(TimePeriod.get_day_obj(TimePeriod.get_date(timestamp)))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=cache_size)
+    def get_day_obj(day: date) -> dict:
+        """
+        Get the time object for a day. Use get_time_obj(), as the returned dict is shared.
+
+        :param day: The day.
+        :return: The time object.
+        """
+
+        week_start = TimePeriod.get_week_start(day)
+        week_end = week_start + timedelta(days=6)
+
+        return {
+            'year': day.year,
+            'month': day.month,
+            'week': int(week_start.strftime('%U')),
+            'week_year': week_start.year,
+            'day': day.day,
+            'week_start_day': week_start.day,
+            'week_end_day': week_end.day,
+        }
+
+    @staticmethod
+    def get_range(period: str, time_obj: dict) -> tuple:
+        """
+        Get the start and end timestamps of a day, week, month or year.
+
+        :param period: The period to get the range for. i.e. 'year', 'month', 'week', 'day'.
+        :param time_obj: The object that contains the time data.
+        :return: The start and end (exclusive) timestamps.
+        """
+
+        day = date(time_obj['year'], time_obj['month'], time_obj['day'])
+
+        return TimePeriod.get_date_range(period, day, getattr(settings, 'TIME_ZONE'))
+
+    @staticmethod
+    def get_extreme_cache_key(extreme: str, metric: str, period: str, time_obj: dict) -> str:
+        """
+        Get the cache key for a maximum or minimum value.
+
+        :param extreme: The type of extreme. i.e. 'max', 'min'.
+        :param metric: The metric the extreme is for, e.g. uv_index
+        :param period: The period the extreme relates to. i.e. 'year', 'month', 'day'.
+        :param time_obj: The object that contains the time data.
+        :return: The cache key.
+        """
+
+        key_parts = [extreme, metric, str(time_obj['year'])]
+        if period in ('month', 'day'):
+            key_parts.append(str(time_obj['month']))
+        if period == 'day':
+            key_parts.append(str(time_obj['day']))
+
+        return '_'.join(key_parts)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=cache_size * 4)
+    def get_date_range(period: str, day: date, time_zone: str) -> tuple:
+        """
+        Get the start and end timestamps of the period a day is in.
+        The time zone is part of the key, so changing the setting doesn't return stale ranges.
+
+        :param period: The period to get the range for. i.e. 'year', 'month', 'week', 'day'.
+        :param day: The day.
+        :param time_zone: The name of the time zone.
+        :return: The start and end (exclusive) timestamps.
+        """
+
+        if period == 'year':
+            start = date(day.year, 1, 1)
+            end = date(day.year + 1, 1, 1)
+        elif period == 'month':
+            start = day.replace(day=1)
+            end = (start + timedelta(days=32)).replace(day=1)
+        elif period == 'week':
+            start = TimePeriod.get_week_start(day)
+            end = start + timedelta(days=7)
+        else:
+            start = day
+            end = start + timedelta(days=1)
+
+        tz = pytz.timezone(time_zone)
+
+        return TimePeriod.get_timestamp(start, tz), TimePeriod.get_timestamp(end, tz)
+
+    @staticmethod
+    def get_timestamp(day: date, tz) -> int:
+        """
+        Get the timestamp of the start of a day.
+
+        :param day: The day.
+        :param tz: The timezone the day is in.
+        :return: The timestamp of midnight, or the first time after it if midnight is skipped by daylight saving.
+        """
+
+        return int(tz.normalize(tz.localize(datetime.combine(day, time.min))).timestamp())
+
+    @staticmethod
+    def get_filter(period: str, time_obj: dict, field: str = 'time_stamp') -> dict:
+        """
+        Get the database filter for a day, week, month or year.
+
+        :param period: The period to get the filter for. i.e. 'year', 'month', 'week', 'day'.
+        :param time_obj: The object that contains the time data.
+        :param field: The time stamp field to filter on.
+        :return: The filter for the period.
+        """
+
+        start, end = TimePeriod.get_range(period, time_obj)
+
+        return {'{0}__gte'.format(field): start, '{0}__lt'.format(field): end}
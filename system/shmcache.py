@@ -0,0 +1,521 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class SharedMemorySegment:
+    """
+    A cache segment: a fixed size file, normally on a shared memory file system, mapped into memory.
+    Every process that opens the same file shares the cached values.
+
+    The segment starts with a header, followed by a hash table index and then the data area.
+    Each index slot holds the hash of a key, the offset and length of its record in the data area,
+    a state (empty, used or deleted) and the expiry time. Records are the key followed by the pickled value,
+    and are appended to the data area. When the data area or index is full, the live records are compacted,
+    and if there is still no room some records are culled.
+
+    Access is locked with a thread lock within a process, and a file lock between processes.
+    A process forked after the segment was opened opens the file again, as a file lock
+    is shared by every process using the same open file.
+    """
+
+    magic = b'SWSHMC01'
+
+    # Magic, file size, number of index slots, end of the used data area, used slots, deleted slots.
+    header = struct.Struct('<8sQQQQQ')
+    header_size = 64
+
+    # Key hash, record offset, record length, state, expiry (0 never expires).
+    slot = struct.Struct('<QQIId')
+
+    empty = 0
+    used = 1
+    deleted = 2
+
+    # Maximum share of the index slots that can be used before it is compacted.
+    load_factor = 0.75
+
+    def __init__(self, path: str, size: int, slots: int):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self.pid = os.getpid()
+
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            current = os.read(self.fd, SharedMemorySegment.header.size)
+            if (len(current) == SharedMemorySegment.header.size) and current.startswith(SharedMemorySegment.magic):
+                # Use the size of the existing segment, so every process agrees on the layout.
+                _, size, slots, _, _, _ = SharedMemorySegment.header.unpack(current)
+                self.map = mmap.mmap(self.fd, size)
+            else:
+                os.ftruncate(self.fd, size)
+                self.map = mmap.mmap(self.fd, size)
+                self.size = size
+                self.slots = slots
+                self.reset()
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+        self.size = size
+        self.slots = slots
+        self.data_start = SharedMemorySegment.header_size + (slots * SharedMemorySegment.slot.size)
+
+    @contextlib.contextmanager
+    def locked(self, shared: bool = False):
+        """
+        Lock the segment.
+
+        :param shared: True to only read the segment, so other processes can read it at the same time.
+        :return:
+        """
+
+        with self.lock:
+            if self.pid != os.getpid():
+                self.fd = os.open(self.path, os.O_RDWR)
+                self.pid = os.getpid()
+
+            fcntl.flock(self.fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def compare_and_set(self, keys: list, compare, expiry: float, cull_frequency: int) -> list:
+        """
+        Read the pickled values of several keys and write the values a function returns,
+        with the segment locked between processes for the whole update, so no other process
+        can change the values in between.
+
+        :param keys: The keys to read.
+        :param compare: Function called with the pickled values, keyed by key (keys that are not cached
+        are left out), returning the pickled values to write, keyed by key.
+        :param expiry: The time the written values expire, or 0 if they never expire.
+        :param cull_frequency: The fraction (1 / cull_frequency) of records to remove when full, 0 removes all.
+        :return: The keys that were written.
+        """
+
+        with self.locked():
+            now = time.time()
+            current = {}
+            for key in keys:
+                value = self.get(key, now)
+                if value is not None:
+                    current[key] = value
+
+            updates = compare(current)
+
+            return [key for key, value in updates.items() if self.set(key, value, expiry, cull_frequency)]
+
+    def reset(self):
+        """
+        Remove every record. Must be called with the segment locked.
+
+        :return:
+        """
+
+        data_start = SharedMemorySegment.header_size + (self.slots * SharedMemorySegment.slot.size)
+        self.map[SharedMemorySegment.header_size:data_start] = bytes(data_start - SharedMemorySegment.header_size)
+        self.write_header(data_start, 0, 0)
+
+    def read_header(self) -> tuple:
+        """
+        Get the end of the used data area and the number of used and deleted slots.
+
+        :return: The data end, used slots and deleted slots.
+        """
+
+        return SharedMemorySegment.header.unpack_from(self.map, 0)[3:]
+
+    def write_header(self, data_end: int, used: int, deleted: int):
+        """
+        Set the end of the used data area and the number of used and deleted slots.
+
+        :return:
+        """
+
+        SharedMemorySegment.header.pack_into(
+            self.map, 0, SharedMemorySegment.magic, self.size, self.slots, data_end, used, deleted)
+
+    def read_slot(self, index: int) -> tuple:
+        """
+        Get an index slot.
+
+        :param index: The slot number.
+        :return: The key hash, offset, length, state and expiry.
+        """
+
+        return SharedMemorySegment.slot.unpack_from(
+            self.map, SharedMemorySegment.header_size + (index * SharedMemorySegment.slot.size))
+
+    def write_slot(self, index: int, key_hash: int, offset: int, length: int, state: int, expiry: float):
+        """
+        Set an index slot.
+
+        :return:
+        """
+
+        SharedMemorySegment.slot.pack_into(
+            self.map, SharedMemorySegment.header_size + (index * SharedMemorySegment.slot.size),
+            key_hash, offset, length, state, expiry)
+
+    @staticmethod
+    def get_hash(key: bytes) -> int:
+        """
+        Get the hash of a key.
+
+        :param key: The key.
+        :return: The 64 bit hash.
+        """
+
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+    def read_record(self, offset: int, length: int) -> tuple:
+        """
+        Get a record from the data area.
+
+        :param offset: The offset of the record.
+        :param length: The length of the record.
+        :return: The key and pickled value.
+        """
+
+        key_length = struct.unpack_from('<H', self.map, offset)[0]
+        key = self.map[offset + 2:offset + 2 + key_length]
+
+        return key, self.map[offset + 2 + key_length:offset + length]
+
+    def find(self, key: bytes, key_hash: int) -> tuple:
+        """
+        Find the slot of a key. Must be called with the segment locked.
+
+        :param key: The key.
+        :param key_hash: The hash of the key.
+        :return: The slot number of the key, or None, and the first free slot.
+        """
+
+        free_index = None
+        index = key_hash % self.slots
+        for _ in range(self.slots):
+            slot_hash, offset, length, state, expiry = self.read_slot(index)
+            if state == SharedMemorySegment.empty:
+                return None, free_index if free_index is not None else index
+            elif state == SharedMemorySegment.deleted:
+                if free_index is None:
+                    free_index = index
+            elif (slot_hash == key_hash) and (self.read_record(offset, length)[0] == key):
+                return index, free_index
+            index = (index + 1) % self.slots
+
+        return None, free_index
+
+    def get(self, key: bytes, now: float):
+        """
+        Get the pickled value of a key. Must be called with the segment locked.
+
+        :param key: The key.
+        :param now: The current time.
+        :return: The pickled value, or None if the key is not cached or has expired.
+        """
+
+        index, _ = self.find(key, SharedMemorySegment.get_hash(key))
+        if index is None:
+            return None
+
+        _, offset, length, _, expiry = self.read_slot(index)
+        if expiry and (expiry <= now):
+            return None
+
+        return self.read_record(offset, length)[1]
+
+    def set(self, key: bytes, value: bytes, expiry: float, cull_frequency: int) -> bool:
+        """
+        Set the pickled value of a key. Must be called with the segment locked.
+
+        :param key: The key.
+        :param value: The pickled value.
+        :param expiry: The time the value expires, or 0 if it never expires.
+        :param cull_frequency: The fraction (1 / cull_frequency) of records to remove when full, 0 removes all.
+        :return: False if the value is too large for the segment.
+        """
+
+        record = struct.pack('<H', len(key)) + key + value
+        if len(record) > (self.size - self.data_start):
+            return False
+
+        key_hash = SharedMemorySegment.get_hash(key)
+        self.delete(key)
+
+        data_end, used, deleted = self.read_header()
+        if ((data_end + len(record)) > self.size) or ((used + deleted + 1) > (self.slots * self.load_factor)):
+            self.compact(time.time())
+            data_end, used, deleted = self.read_header()
+            if ((data_end + len(record)) > self.size) or ((used + 1) > (self.slots * self.load_factor)):
+                self.cull(cull_frequency, len(record))
+                data_end, used, deleted = self.read_header()
+
+        _, free_index = self.find(key, key_hash)
+        self.map[data_end:data_end + len(record)] = record
+        self.write_slot(free_index, key_hash, data_end, len(record), SharedMemorySegment.used, expiry)
+        self.write_header(data_end + len(record), used + 1, deleted)
+
+        return True
+
+    def delete(self, key: bytes) -> bool:
+        """
+        Delete a key. Must be called with the segment locked.
+
+        :param key: The key.
+        :return: True if the key was deleted.
+        """
+
+        index, _ = self.find(key, SharedMemorySegment.get_hash(key))
+        if index is None:
+            return False
+
+        self.write_slot(index, 0, 0, 0, SharedMemorySegment.deleted, 0)
+        data_end, used, deleted = self.read_header()
+        self.write_header(data_end, used - 1, deleted + 1)
+
+        return True
+
+    def get_records(self, now: float) -> list:
+        """
+        Get the records that haven't expired. Must be called with the segment locked.
+
+        :param now: The current time.
+        :return: The key, value and expiry of each record.
+        """
+
+        records = []
+        for index in range(self.slots):
+            _, offset, length, state, expiry = self.read_slot(index)
+            if (state == SharedMemorySegment.used) and not (expiry and (expiry <= now)):
+                key, value = self.read_record(offset, length)
+                records.append((key, value, expiry))
+
+        return records
+
+    def write_records(self, records: list):
+        """
+        Replace every record. Must be called with the segment locked.
+
+        :param records: The key, value and expiry of each record.
+        :return:
+        """
+
+        self.reset()
+        data_end = self.data_start
+        for key, value, expiry in records:
+            record = struct.pack('<H', len(key)) + key + value
+            key_hash = SharedMemorySegment.get_hash(key)
+            _, free_index = self.find(key, key_hash)
+            self.map[data_end:data_end + len(record)] = record
+            self.write_slot(free_index, key_hash, data_end, len(record), SharedMemorySegment.used, expiry)
+            data_end += len(record)
+
+        self.write_header(data_end, len(records), 0)
+
+    def compact(self, now: float):
+        """
+        Remove deleted and expired records, so their space can be used again.
+        Must be called with the segment locked.
+
+        :param now: The current time.
+        :return:
+        """
+
+        self.write_records(self.get_records(now))
+
+    def cull(self, cull_frequency: int, space: int):
+        """
+        Remove some records to make room for a new one. Must be called with the segment locked.
+
+        :param cull_frequency: The fraction (1 / cull_frequency) of records to remove, 0 removes all.
+        :param space: The space needed for the new record.
+        :return:
+        """
+
+        records = self.get_records(time.time())
+        if cull_frequency > 0:
+            records = [record for index, record in enumerate(records) if (index % cull_frequency) != 0]
+
+        # Keep removing records until the new record fits.
+        while records and ((self.data_start + space + sum(len(key) + len(value) + 2 for key, value, _ in records))
+                           > self.size or (len(records) + 1) > (self.slots * self.load_factor)):
+            records = records[len(records) // 2:] if len(records) > 1 else []
+
+        self.write_records(records)
+
+
+class SharedMemoryCache(BaseCache):
+    """
+    Cache backend that keeps the cache in a memory mapped file, shared by every process on the host.
+    Put the file on a shared memory file system such as /dev/shm, so it is never written to disk.
+
+    Options:
+        SIZE: The size of the cache file in bytes, defaults to 64 MB.
+        SLOTS: The maximum number of keys in the index, defaults to 16384.
+    The size and number of slots are fixed when the file is created, clear the cache file to change them.
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    # Segments opened by this process, keyed by path. Cache backends are created for each thread,
+    # so the segment is shared between them.
+    segments = {}
+    segments_lock = threading.Lock()
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        path = os.path.abspath(location)
+        with SharedMemoryCache.segments_lock:
+            if path not in SharedMemoryCache.segments:
+                SharedMemoryCache.segments[path] = SharedMemorySegment(
+                    path, int(options.get('SIZE', 64 * 1024 * 1024)), int(options.get('SLOTS', 16384)))
+            self.segment = SharedMemoryCache.segments[path]
+
+    def get_key(self, key, version=None) -> bytes:
+        """
+        Make and validate the cache key.
+
+        :return: The key as bytes.
+        """
+
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        return key.encode('utf-8')
+
+    def get_expiry(self, timeout) -> float:
+        """
+        Get the time a value expires.
+
+        :return: The expiry time, or 0 if the value never expires.
+        """
+
+        expiry = self.get_backend_timeout(timeout)
+
+        return 0.0 if expiry is None else float(expiry)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.get_key(key, version)
+        value = pickle.dumps(value, self.pickle_protocol)
+        with self.segment.locked():
+            if self.segment.get(key, time.time()) is not None:
+                return False
+
+            return self.segment.set(key, value, self.get_expiry(timeout), self._cull_frequency)
+
+    def get(self, key, default=None, version=None):
+        key = self.get_key(key, version)
+        with self.segment.locked(shared=True):
+            value = self.segment.get(key, time.time())
+
+        return default if value is None else pickle.loads(value)
+
+    def get_many(self, keys, version=None):
+        cache_keys = {self.get_key(key, version): key for key in keys}
+        now = time.time()
+        with self.segment.locked(shared=True):
+            values = {key: self.segment.get(cache_key, now) for cache_key, key in cache_keys.items()}
+
+        return {key: pickle.loads(value) for key, value in values.items() if value is not None}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.get_key(key, version)
+        value = pickle.dumps(value, self.pickle_protocol)
+        with self.segment.locked():
+            self.segment.set(key, value, self.get_expiry(timeout), self._cull_frequency)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        values = {key: (self.get_key(key, version), pickle.dumps(value, self.pickle_protocol))
+                  for key, value in data.items()}
+        expiry = self.get_expiry(timeout)
+        with self.segment.locked():
+            return [key for key, (cache_key, value) in values.items()
+                    if not self.segment.set(cache_key, value, expiry, self._cull_frequency)]
+
+    def compare_and_set_many(self, keys, compare, timeout=DEFAULT_TIMEOUT, version=None) -> dict:
+        """
+        Read several values and set the values a function returns, in one operation that is
+        atomic between processes, see SharedMemorySegment.compare_and_set.
+
+        :param keys: The keys to read.
+        :param compare: Function called with the cached values, keyed by key (keys that are not cached
+        are left out), returning the values to set, keyed by key.
+        :return: The values that were set, keyed by key.
+        """
+
+        cache_keys = {self.get_key(key, version): key for key in keys}
+        updates = {}
+
+        def compare_values(current: dict) -> dict:
+            updates.update(compare({cache_keys[cache_key]: pickle.loads(value) for cache_key, value in current.items()}))
+            return {self.get_key(key, version): pickle.dumps(value, self.pickle_protocol)
+                    for key, value in updates.items()}
+
+        written = self.segment.compare_and_set(
+            list(cache_keys.keys()), compare_values, self.get_expiry(timeout), self._cull_frequency)
+
+        return {key: value for key, value in updates.items() if self.get_key(key, version) in written}
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.get_key(key, version)
+        with self.segment.locked():
+            value = self.segment.get(key, time.time())
+            if value is None:
+                return False
+
+            return self.segment.set(key, value, self.get_expiry(timeout), self._cull_frequency)
+
+    def delete(self, key, version=None):
+        key = self.get_key(key, version)
+        with self.segment.locked():
+            return self.segment.delete(key)
+
+    def has_key(self, key, version=None):
+        key = self.get_key(key, version)
+        with self.segment.locked(shared=True):
+            return self.segment.get(key, time.time()) is not None
+
+    def clear(self):
+        with self.segment.locked():
+            self.segment.reset()
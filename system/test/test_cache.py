@@ -0,0 +1,507 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.test import SimpleTestCase, TestCase, AsyncClient, Client, override_settings
+from django.core.cache import cache
+from system.cache import DataCache
+from system.management.commands.benchmarkcache import Command as BenchmarkCacheCommand
+from system.shmcache import SharedMemoryCache
+from unittest import skipIf
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+
+try:
+    import django_redis  # noqa: F401
+    import fakeredis
+    import lupa  # noqa: F401
+except ImportError:
+    fakeredis = None
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class DataCacheUnitTestCase(TestCase):
+    # Load the fixtures used in this test.
+    fixtures = ['weatherdata.json']
+
+    def test_count_operations(self):
+        """
+        Test the cache operations and keys are counted.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+        DataCache.reset_operations()
+
+        DataCache.set('foo', 1, 60)
+        DataCache.set_many({'bar': 2, 'baz': 3}, 60)
+        DataCache.set_many({}, 60)  # Nothing to set, should not be counted.
+        self.assertEqual(DataCache.get('foo'), 1)
+        self.assertEqual(DataCache.get_many(['foo', 'bar', 'baz', 'qux']), {'foo': 1, 'bar': 2, 'baz': 3})
+
+        self.assertEqual(DataCache.get_operations(), {'operations': 4, 'keys': 8})
+
+        DataCache.reset_operations()
+        self.assertEqual(DataCache.get_operations(), {'operations': 0, 'keys': 0})
+
+    def test_update_extremes(self):
+        """
+        Test extremes are only updated when the new value exceeds the cached value.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+
+        # Extremes that are not cached are only set by fill.
+        updated = DataCache.update_extremes({'max_foo': ('max', 5), 'min_foo': ('fill', 5)}, 60)
+        self.assertEqual(updated, {'min_foo': 5})
+        self.assertIsNone(cache.get('max_foo'))
+
+        DataCache.update_extremes({'max_foo': ('fill', 5)}, 60)
+        updated = DataCache.update_extremes({'max_foo': ('max', 4), 'min_foo': ('min', 4)}, 60)
+        self.assertEqual(updated, {'min_foo': 4})
+        updated = DataCache.update_extremes({'max_foo': ('max', 6), 'min_foo': ('fill', 1)}, 60)
+        self.assertEqual(updated, {'max_foo': 6})
+        self.assertEqual(cache.get_many(['max_foo', 'min_foo']), {'max_foo': 6, 'min_foo': 4})
+
+    def test_set_many_versioned(self):
+        """
+        Test values are only set when they are newer than the cached values.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+
+        self.assertTrue(DataCache.set_many_versioned({'foo_latest': 2}, 'foo_version', 200, 60))
+        self.assertFalse(DataCache.set_many_versioned({'foo_latest': 1}, 'foo_version', 100, 60))
+        self.assertFalse(DataCache.set_many_versioned({'foo_latest': 1}, 'foo_version', 200, 60))
+        self.assertEqual(cache.get('foo_latest'), 2)
+        self.assertTrue(DataCache.set_many_versioned({'foo_latest': 3}, 'foo_version', 300, 60))
+        self.assertEqual(cache.get('foo_latest'), 3)
+
+    def test_update_extremes_concurrent(self):
+        """
+        Stress test concurrent updates, no update should be lost.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+
+        keys = ['stress_{0}'.format(index) for index in range(4)]
+        DataCache.update_extremes({key: ('fill', 0) for key in keys}, 60)
+        DataCache.update_extremes({'{0}_min'.format(key): ('fill', 0) for key in keys}, 60)
+
+        thread_values = [[random.uniform(-1000, 1000) for _ in range(200)] for _ in range(8)]
+        thread_versions = [list(range(index, 1600, 8)) for index in range(8)]
+        start = threading.Barrier(len(thread_values))
+
+        def update(values, versions):
+            start.wait()
+            for value, version in zip(values, versions):
+                updates = {key: ('max', value) for key in keys}
+                updates.update({'{0}_min'.format(key): ('min', value) for key in keys})
+                DataCache.update_extremes(updates, 60)
+                DataCache.set_many_versioned({'stress_latest': version}, 'stress_version', version, 60)
+
+        threads = [threading.Thread(target=update, args=args) for args in zip(thread_values, thread_versions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        all_values = [value for values in thread_values for value in values]
+        for key in keys:
+            self.assertEqual(cache.get(key), max(all_values + [0]))
+            self.assertEqual(cache.get('{0}_min'.format(key)), min(all_values + [0]))
+        self.assertEqual(cache.get('stress_latest'), 1599)
+
+    @override_settings(DATA_CACHE_LOCAL_SIZE=3, DATA_CACHE_GENERATION_INTERVAL=60)
+    def test_local_cache(self):
+        """
+        Test repeated reads are served from the L1 cache, and the least recently used values are removed.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+        DataCache.clear_local()
+        DataCache.reset_operations()
+
+        DataCache.set_many({'foo': 1, 'bar': 2}, 60)
+        self.assertEqual(DataCache.get('foo'), 1)
+        self.assertEqual(DataCache.get_many(['foo', 'bar']), {'foo': 1, 'bar': 2})
+
+        # Only the generation check and the write went to the shared cache.
+        self.assertEqual(DataCache.get_operations(), {'operations': 2, 'keys': 3})
+        self.assertEqual(DataCache.get_local_operations(), {'hits': 3, 'misses': 0})
+
+        # Values cached by other processes are read from the shared cache once.
+        cache.set('baz', 3)
+        self.assertEqual(DataCache.get_many(['foo', 'baz', 'qux']), {'foo': 1, 'baz': 3})
+        self.assertEqual(DataCache.get('baz'), 3)
+
+        # The cache holds 3 values, so bar is removed as the least recently used.
+        self.assertEqual(DataCache.get('foo'), 1)
+        cache.set_many({'bar': 20, 'qux': 4})
+        self.assertEqual(DataCache.get('qux'), 4)
+        self.assertEqual(DataCache.get('bar'), 20)
+
+        stats = DataCache.get_local_stats()
+        self.assertEqual(stats['hits'], 6)
+        self.assertEqual(stats['misses'], 4)
+        self.assertEqual(stats['hit_rate'], 0.6)
+        self.assertEqual(stats['size'], 3)
+        DataCache.clear_local()
+
+    @override_settings(DATA_CACHE_LOCAL_SIZE=10, DATA_CACHE_GENERATION_INTERVAL=0)
+    def test_local_cache_invalidation(self):
+        """
+        Test L1 values are dropped when a new sample is processed, or they expire.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+        DataCache.clear_local()
+
+        DataCache.set('foo', 1, 60)
+        cache.set('foo', 2)
+        self.assertEqual(DataCache.get('foo'), 1)
+
+        # Another process stored a sample.
+        DataCache.bump_generation()
+        self.assertEqual(DataCache.get('foo'), 2)
+        self.assertEqual(DataCache.get_local_stats()['invalidations'], 1)
+
+        # Compare-and-set updates always go to the shared cache.
+        cache.set('max_foo', 10)
+        self.assertEqual(DataCache.get('max_foo'), 10)
+        cache.set('max_foo', 20)
+        self.assertEqual(DataCache.update_extremes({'max_foo': ('max', 15)}, 60), {})
+        self.assertEqual(DataCache.get('max_foo'), 20)
+
+        with override_settings(DATA_CACHE_LOCAL_TTL=0):
+            DataCache.set('bar', 1, 60)
+            cache.set('bar', 2)
+            self.assertEqual(DataCache.get('bar'), 2)
+        DataCache.clear_local()
+
+    @override_settings(DATA_CACHE_EARLY_EXPIRY_BETA=0)
+    def test_get_or_compute(self):
+        """
+        Test computed values are cached, and expired values are served stale while they are recomputed.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+
+        computed = []
+
+        def compute():
+            computed.append(len(computed) + 1)
+            return computed[-1]
+
+        self.assertEqual(DataCache.get_or_compute('foo', compute, 60), 1)
+        self.assertEqual(DataCache.get_or_compute('foo', compute, 60), 1)
+        self.assertEqual(computed, [1])
+
+        # Expired, but another caller is recomputing the value, so the stale value is served.
+        cache.set('foo_refresh', {'expires': 0, 'delta': 0})
+        cache.add('foo_rebuild', 1)
+        self.assertEqual(DataCache.get_or_compute('foo', compute, 60), 1)
+        self.assertEqual(computed, [1])
+
+        cache.delete('foo_rebuild')
+        self.assertEqual(DataCache.get_or_compute('foo', compute, 60), 2)
+        self.assertIsNone(cache.get('foo_rebuild'))
+
+        # A recomputed extreme replaces the cached one, even if that is further out, e.g. from a removed sample.
+        # Samples stored afterwards move it on from the recomputed value.
+        cache.set_many({'max_foo': 10, 'max_foo_refresh': {'expires': 0, 'delta': 0}})
+        self.assertEqual(DataCache.get_or_compute('max_foo', compute, 60, 'max'), 3)
+        self.assertEqual(cache.get('max_foo'), 3)
+        DataCache.update_extremes({'max_foo': ('max', 2)}, 60)
+        self.assertEqual(cache.get('max_foo'), 3)
+        DataCache.update_extremes({'max_foo': ('max', 4)}, 60)
+        self.assertEqual(cache.get('max_foo'), 4)
+
+        # An unchanged extreme is kept for as long as its new expiry time.
+        cache.set_many({'min_foo': 1, 'min_foo_refresh': {'expires': 0, 'delta': 0}}, 1)
+        self.assertEqual(DataCache.get_or_compute('min_foo', lambda: 1, 60, 'min'), 1)
+        time.sleep(1.1)
+        self.assertEqual(cache.get('min_foo'), 1)
+        self.assertGreater(cache.get('min_foo_refresh')['expires'], time.time())
+
+        # Refreshing computes the value, but leaves the lock of the caller already computing it.
+        cache.add('foo_rebuild', 1)
+        self.assertEqual(DataCache.get_or_compute('foo', compute, 60, refresh=True), 4)
+        self.assertEqual(cache.get('foo_rebuild'), 1)
+        cache.delete('foo_rebuild')
+        self.assertEqual(DataCache.get_or_compute('foo', compute, 60, refresh=True), 5)
+        self.assertIsNone(cache.get('foo_rebuild'))
+
+        # Values that can't be computed are not cached.
+        self.assertIsNone(DataCache.get_or_compute('bar', lambda: None, 60))
+        self.assertIsNone(cache.get('bar'))
+
+    def test_get_or_compute_concurrent(self):
+        """
+        Test only one caller computes a value when it is missing or expired.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+
+        computed = []
+        start = threading.Barrier(8)
+
+        def compute():
+            time.sleep(0.2)
+            computed.append(len(computed) + 1)
+            return computed[-1]
+
+        def get_values(results):
+            start.wait()
+            results.append(DataCache.get_or_compute('foo', compute, 60))
+
+        for expected in ([1], [1, 2]):
+            results = []
+            threads = [threading.Thread(target=get_values, args=(results,)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(computed, expected)
+            self.assertEqual(len(results), 8)
+
+            # Expire the value, the next callers get the stale value while it is recomputed.
+            cache.set('foo_refresh', {'expires': 0, 'delta': 0})
+
+        self.assertEqual(sorted(set(results)), [1, 2])
+        self.assertEqual(cache.get('foo'), 2)
+
+    def test_operations_header(self):
+        """
+        Test the cache operations for a request are reported in the response.
+        """
+
+        cache.clear()
+        client = Client()
+
+        # The weather dashboard gets the latest values and the extremes in two operations,
+        # then caches the missing extremes in one more.
+        response = client.get('/dataajax/?dashboard=weather', {'timestamp': '1623906568'})
+        self.assertEqual(response.headers['X-Cache-Operations'], '3; keys=273')
+
+        response = client.get('/dataajax/?dashboard=weather', {'timestamp': '1623906568'})
+        self.assertEqual(response.headers['X-Cache-Operations'], '2; keys=147')
+
+    async def test_operations_header_async(self):
+        """
+        Test the cache operations made by a sync view are reported when the request is handled as ASGI.
+        """
+
+        cache.clear()
+        client = AsyncClient()
+
+        response = await client.get('/dataajax/?dashboard=weather&timestamp=1623906568')
+        self.assertEqual(response.headers['X-Cache-Operations'], '3; keys=273')
+
+        response = await client.get('/dataajax/?dashboard=weather&timestamp=1623906568')
+        self.assertEqual(response.headers['X-Cache-Operations'], '2; keys=147')
+
+
+@skipIf(fakeredis is None, 'The redis profile needs the django-redis, fakeredis and lupa packages')
+class DataCacheRedisTestCase(SimpleTestCase):
+    """
+    The compare-and-set operations with the redis profile, which runs them as Lua scripts.
+    A fakeredis server stands in for Redis.
+    """
+
+    def setUp(self):
+        DataCache.scripts = {}
+        self.override = override_settings(CACHES={'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': 'redis://127.0.0.1:6379/1',
+            'OPTIONS': {'CONNECTION_POOL_KWARGS': {
+                'connection_class': fakeredis.FakeConnection,
+                'server': fakeredis.FakeServer()}}}})
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        DataCache.scripts = {}
+
+    def test_update_extremes(self):
+        """
+        Test extremes are only updated when the new value exceeds the cached value.
+        """
+
+        self.assertIsNotNone(DataCache.get_redis())
+        DataCacheUnitTestCase.test_update_extremes(self)
+        self.assertEqual(list(DataCache.scripts.keys()), ['extremes'])
+
+        # The value key holds the plain number the script compares with.
+        client, encode = DataCache.get_redis()
+        self.assertEqual(client.get(cache.make_key('max_foo_value')), b'6.0')
+
+    def test_set_many_versioned(self):
+        """
+        Test values are only set when they are newer than the cached values.
+        """
+
+        DataCacheUnitTestCase.test_set_many_versioned(self)
+        self.assertEqual(list(DataCache.scripts.keys()), ['versioned'])
+        self.assertEqual(cache.get('foo_version'), 300)
+
+    def test_update_extremes_concurrent(self):
+        """
+        Stress test concurrent updates, no update should be lost.
+        """
+
+        DataCacheUnitTestCase.test_update_extremes_concurrent(self)
+
+    def test_get_or_compute(self):
+        """
+        Test computed extremes are stored with the script, and replace the cached extreme when recomputed.
+        """
+
+        cache.clear()
+        self.assertEqual(DataCache.get_or_compute('max_bar', lambda: 5, 60, 'max'), 5)
+        self.assertEqual(cache.get('max_bar'), 5)
+        DataCache.update_extremes({'max_bar': ('max', 7)}, 60)
+        self.assertEqual(DataCache.get_or_compute('max_bar', lambda: 5, 60, 'max'), 7)
+
+        # A recomputed extreme replaces the cached one, along with the number the script compares with.
+        self.assertEqual(DataCache.get_or_compute('max_bar', lambda: 5, 60, 'max', refresh=True), 5)
+        self.assertEqual(cache.get('max_bar'), 5)
+        self.assertEqual(DataCache.update_extremes({'max_bar': ('max', 6)}, 60), {'max_bar': 6})
+
+
+class DataCacheProcessTestCase(SimpleTestCase):
+    """
+    Compare-and-set operations made by several processes at the same time, as the web server
+    workers and ingest commands do.
+    """
+
+    processes = 4
+    iterations = 100
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        SharedMemoryCache.segments.pop(os.path.join(self.cache_dir.name, 'shm'), None)
+        self.cache_dir.cleanup()
+
+    def update_values(self, process: int):
+        """
+        Increment a counter and update an extreme and a versioned value from one process.
+        """
+
+        for iteration in range(self.iterations):
+            DataCache.compare_and_set(['count'], lambda current: {'count': current.get('count', 0) + 1}, 60)
+
+            value = (iteration * self.processes) + process
+            DataCache.update_extremes({'max': ('max', value)}, 60)
+            DataCache.set_many_versioned({'latest': value}, 'latest_version', value, 60)
+
+    def run_processes(self):
+        """
+        Run update_values in several processes at the same time, and check no update was lost.
+        """
+
+        cache.clear()
+        DataCache.update_extremes({'max': ('fill', -1)}, 60)
+
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=self.update_values, args=(process,)) for process in range(self.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+            self.assertEqual(process.exitcode, 0)
+
+        last_value = (self.iterations * self.processes) - 1
+        self.assertEqual(cache.get('count'), self.iterations * self.processes)
+        self.assertEqual(cache.get('max'), last_value)
+        self.assertEqual(cache.get_many(['latest', 'latest_version']), {'latest': last_value, 'latest_version': last_value})
+
+    def test_file_processes(self):
+        """
+        Test the file based cache, which compares and sets under the lock file.
+        """
+
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': os.path.join(self.cache_dir.name, 'file')}}):
+            self.run_processes()
+            self.assertTrue(os.path.exists(os.path.join(self.cache_dir.name, 'file', 'solarweather_cache.lock')))
+
+    def test_shm_processes(self):
+        """
+        Test the shared memory cache, which compares and sets with its segment locked.
+        """
+
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'system.shmcache.SharedMemoryCache',
+                'LOCATION': os.path.join(self.cache_dir.name, 'shm'),
+                'OPTIONS': {'SIZE': 1000000, 'SLOTS': 256}}}):
+            self.run_processes()
+
+    @skipIf(fakeredis is None, 'The redis profile needs the django-redis, fakeredis and lupa packages')
+    def test_redis_processes(self):
+        """
+        Test the redis profile, which runs the extremes and versioned updates as Lua scripts.
+        The stand-in server of the benchmarkcache command is used in place of Redis.
+        """
+
+        # The stand-in runs each command in Python, so fewer iterations are made.
+        self.iterations = 25
+        server = BenchmarkCacheCommand.start_stand_in()
+        try:
+            with override_settings(
+                    CACHES={'default': {
+                        'BACKEND': 'django_redis.cache.RedisCache',
+                        'LOCATION': 'redis://127.0.0.1:{0}/1'.format(server.server_address[1])}},
+                    DATA_CACHE_LOCK_FILE=os.path.join(self.cache_dir.name, 'redis.lock')):
+                self.run_processes()
+        finally:
+            server.shutdown()
+            server.server_close()
+            DataCache.scripts = {}
@@ -25,6 +25,7 @@
 from django.test import TestCase
 from system.conversion import UnitConversion
 import system.test.test_data as test_data
+import random
 
 import logging
 
@@ -106,3 +107,71 @@ class ConversionUnitTestCase(TestCase):
 
         self.assertEqual(result_list[0][0], 1631855251)
         self.assertEqual(result_list[0][1], -3677.407)
+
+    def test_downsample(self):
+        """
+        Test down sampling to a maximum number of points.
+        """
+        # Data with no more than the maximum number of points is unchanged.
+        result_list = UnitConversion.downsample(test_data.test_trend_list, 250)
+        self.assertEqual(result_list, test_data.test_trend_list)
+
+        result_list = UnitConversion.downsample(test_data.test_trend_list, 50)
+        self.assertEqual(len(result_list), 50)
+
+        result_list = UnitConversion.downsample(test_data.test_trend_list, 50, 'minmax')
+        self.assertLessEqual(len(result_list), 50)
+
+    def test_downsample_lttb(self):
+        """
+        Test down sampling with Largest-Triangle-Three-Buckets.
+        """
+        result_list = UnitConversion.downsample_lttb(test_data.test_trend_list, 20)
+
+        self.assertEqual(len(result_list), 20)
+        self.assertEqual(result_list[0], test_data.test_trend_list[0])
+        self.assertEqual(result_list[-1], test_data.test_trend_list[-1])
+
+        # A single spike is kept, where averaging would flatten it.
+        spike_list = [(1631855161 + (index * 20), 0.0) for index in range(1000)]
+        spike_list[500] = (spike_list[500][0], 100.0)
+        result_list = UnitConversion.downsample_lttb(spike_list, 20)
+        self.assertIn(spike_list[500], result_list)
+
+    def test_downsample_minmax(self):
+        """
+        Test down sampling by keeping the minimum and maximum of each bucket.
+        """
+        result_list = UnitConversion.downsample_minmax(test_data.test_trend_list, 20)
+
+        self.assertEqual(len(result_list), 20)
+        self.assertEqual(result_list[0], test_data.test_trend_list[0])
+        self.assertEqual(result_list[-1], test_data.test_trend_list[-1])
+        self.assertEqual(result_list, sorted(result_list))
+
+        # The peak and the trough are kept.
+        self.assertIn((1631858882, -603.62), result_list)
+        self.assertIn((1631856322, -3906.15), result_list)
+
+        # The last point is the maximum, and is not part of the last bucket.
+        rising_list = [(1631855161 + (index * 20), float(index)) for index in range(100)]
+        result_list = UnitConversion.downsample_minmax(rising_list, 10)
+        self.assertEqual(result_list[-1], rising_list[-1])
+        self.assertEqual(len(result_list), len(set(result_list)))
+
+    def test_downsample_minmax_random(self):
+        """
+        Test down sampling random series of any length to any number of points.
+        """
+        generator = random.Random(1631855161)
+        for _ in range(500):
+            samples = generator.randint(5, 400)
+            threshold = generator.randint(4, samples)
+            data_list = [(1631855161 + (index * 20), float(generator.randint(-10, 10))) for index in range(samples)]
+
+            result_list = UnitConversion.downsample_minmax(data_list, threshold)
+
+            self.assertLessEqual(len(result_list), threshold)
+            self.assertEqual(result_list[0], data_list[0])
+            self.assertEqual(result_list[-1], data_list[-1])
+            self.assertEqual(result_list, sorted(set(result_list)))
@@ -0,0 +1,91 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+
+from django.test import TestCase, RequestFactory
+from system.encoding import TrendEncoding
+import system.test.test_data as test_data
+import json
+import numpy as np
+import struct
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class TrendEncodingUnitTestCase(TestCase):
+
+    def test_get_format(self):
+        """
+        Test getting the format the client asked for.
+        """
+
+        request_factory = RequestFactory()
+
+        self.assertEqual(TrendEncoding.get_format(request_factory.get('/dataajax/')), 'json')
+        self.assertEqual(TrendEncoding.get_format(request_factory.get('/dataajax/', {'format': 'columns'})), 'columns')
+        self.assertEqual(TrendEncoding.get_format(request_factory.get('/dataajax/', {'format': 'foo'})), 'json')
+        self.assertEqual(TrendEncoding.get_format(
+            request_factory.get('/dataajax/', HTTP_ACCEPT='application/octet-stream')), 'binary')
+
+    def test_to_columns(self):
+        """
+        Test encoding trend series as columns.
+        """
+
+        data = {
+            'outdoor_temp': {'latest': 10.5, 'daily_trend': [(1631855161, 1.5), (1631855181, 2.5), (1631855211, -1.0)]},
+            'indoor_temp': {'daily_trend': []},
+        }
+
+        result = TrendEncoding.to_columns(data)
+        self.assertEqual(result['outdoor_temp']['latest'], 10.5)
+        self.assertEqual(result['outdoor_temp']['daily_trend'], {'t0': 1631855161, 'dt': [20, 30], 'v': [1.5, 2.5, -1.0]})
+        self.assertEqual(result['indoor_temp']['daily_trend'], [])
+
+    def test_to_binary(self):
+        """
+        Test encoding trend series as typed arrays.
+        """
+
+        data = {'outdoor_temp': {'latest': 10.5, 'daily_trend': test_data.test_trend_list}}
+        result = TrendEncoding.to_binary(data)
+
+        header_length = struct.unpack('<I', result[:4])[0]
+        self.assertEqual((4 + header_length) % 4, 0)
+        header = json.loads(result[4:4 + header_length])
+        body = result[4 + header_length:]
+
+        series = header['outdoor_temp']['daily_trend']
+        self.assertEqual(header['outdoor_temp']['latest'], 10.5)
+        self.assertEqual(series['n'], len(test_data.test_trend_list))
+
+        time_deltas = np.frombuffer(body, dtype='<i4', count=series['n'], offset=series['offset'])
+        values = np.frombuffer(body, dtype='<f4', count=series['n'], offset=series['offset'] + (series['n'] * 4))
+        times = series['t0'] + np.cumsum(time_deltas)
+
+        self.assertEqual(times.tolist(), [pair[0] for pair in test_data.test_trend_list])
+        np.testing.assert_allclose(values, [pair[1] for pair in test_data.test_trend_list], rtol=1e-6)
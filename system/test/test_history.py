@@ -0,0 +1,115 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+
+from django.test import TestCase, Client
+from system.history import HistoryCache
+from system.models import HistoryPayload as HistoryPayloadModel
+from solar.solardata import SolarData
+from datetime import date
+import json
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class HistoryCacheUnitTestCase(TestCase):
+    # Load the fixtures used in this test.
+    fixtures = ['solardata.json']
+
+    def test_is_final(self):
+        """
+        Test checking if the history for a day can no longer change.
+        """
+
+        # Friday 17 September 2021, the week ends on Saturday 18th and the month on the 30th.
+        timestamp = 1631859241
+        self.assertFalse(HistoryCache.is_final(timestamp, date(2021, 9, 18)))
+        self.assertFalse(HistoryCache.is_final(timestamp, date(2021, 9, 30)))
+        self.assertTrue(HistoryCache.is_final(timestamp, date(2021, 10, 1)))
+
+        # Tuesday 28 September 2021, the week doesn't end until Saturday 2 October.
+        timestamp = 1632787200
+        self.assertFalse(HistoryCache.is_final(timestamp, date(2021, 10, 1)))
+        self.assertTrue(HistoryCache.is_final(timestamp, date(2021, 10, 3)))
+
+    def test_get(self):
+        """
+        Test getting history payloads, final payloads are stored.
+        """
+
+        timestamp = 1631859241
+        payload = HistoryCache.get('solar', timestamp)
+        content = json.loads(payload['content'])
+
+        self.assertTrue(payload['final'])
+        self.assertEqual(content['inverter_ac_power']['daily_trend'][0][0], 1631855161)
+        self.assertEqual(HistoryPayloadModel.objects.filter(dashboard='solar').count(), 1)
+
+        # The stored payload is returned without building it again.
+        HistoryPayloadModel.objects.filter(dashboard='solar').update(content=b'{}')
+        self.assertEqual(HistoryCache.get('solar', timestamp)['content'], b'{}')
+
+        # Only the solar dashboard has history.
+        with self.assertRaises(ValueError):
+            HistoryCache.get('weather', timestamp)
+
+    def test_invalidate(self):
+        """
+        Test removing stored history payloads.
+        """
+
+        for day in (1, 16, 17, 30):
+            HistoryPayloadModel.objects.create(
+                dashboard='solar', version='foo', content=b'{}', time_year=2021, time_month=9, time_day=day)
+        HistoryPayloadModel.objects.create(
+            dashboard='weather', version='foo', content=b'{}', time_year=2021, time_month=9, time_day=17)
+
+        self.assertEqual(HistoryCache.invalidate('solar', date(2021, 9, 16), date(2021, 9, 17)), 2)
+        self.assertEqual(HistoryCache.invalidate('solar', end=date(2021, 9, 1)), 1)
+
+        # Rebuilding a day removes the payloads for the month it is in.
+        SolarData.rollup_day({'year': 2021, 'month': 9, 'day': 17})
+        self.assertEqual(HistoryPayloadModel.objects.filter(dashboard='solar').count(), 0)
+        self.assertEqual(HistoryPayloadModel.objects.filter(dashboard='weather').count(), 1)
+
+
+class HistoryFunctionalTestCase(TestCase):
+    # Load the fixtures used in this test.
+    fixtures = ['solardata.json']
+
+    def test_dataajax_history_view(self):
+        client = Client()
+        response = client.get('/dataajax/', {'dashboard': 'solar', 'history': '1', 'timestamp': '1631859241'})
+        content = json.loads(response.content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(content['inverter_ac_power']['daily_trend'][-1][0], 1631859301)
+
+        response = client.get('/dataajax/', {'dashboard': 'solar', 'history': '1', 'timestamp': '1631859241'},
+                              HTTP_IF_NONE_MATCH=response.headers['ETag'])
+        self.assertEqual(response.status_code, 304)
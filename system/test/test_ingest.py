@@ -0,0 +1,174 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.test import TestCase, override_settings
+from system.ingest import IngestBuffer, IngestQueue
+from weather.models import WeatherData as WeatherDataModel
+import json
+import os
+import tempfile
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class IngestBufferUnitTestCase(TestCase):
+    # Load the fixtures used in this test.
+    fixtures = ['weatherdata.json']
+
+    def setUp(self):
+        self.log_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        for buffer in IngestBuffer.buffers.values():
+            if buffer['timer'] is not None:
+                buffer['timer'].cancel()
+            buffer['log'].close()
+        IngestBuffer.buffers.clear()
+        self.log_dir.cleanup()
+
+    def get_samples(self, count: int) -> list:
+        """
+        Get new samples, based on the last stored sample.
+        """
+
+        sample = WeatherDataModel.objects.order_by('-time_stamp').values().first()
+        del sample['id']
+
+        return [dict(sample, time_stamp=sample['time_stamp'] + (16 * index)) for index in range(1, count + 1)]
+
+    def test_add_unbuffered(self):
+        """
+        Test samples are inserted straight away when the buffer is disabled.
+        """
+
+        record_count = WeatherDataModel.objects.count()
+        record_id = IngestBuffer.add(WeatherDataModel, self.get_samples(1)[0])
+
+        self.assertTrue(WeatherDataModel.objects.filter(id=record_id).exists())
+        self.assertEqual(WeatherDataModel.objects.count(), record_count + 1)
+        self.assertEqual(IngestBuffer.buffers, {})
+
+    def test_add_buffered(self):
+        """
+        Test samples are logged and buffered, then inserted together when the buffer is full.
+        """
+
+        record_count = WeatherDataModel.objects.count()
+        samples = self.get_samples(3)
+
+        with self.settings(INGEST_BUFFER_SIZE=3, INGEST_BUFFER_PATH=self.log_dir.name):
+            self.assertIsNone(IngestBuffer.add(WeatherDataModel, samples[0]))
+            self.assertIsNone(IngestBuffer.add(WeatherDataModel, samples[1]))
+
+            buffer = IngestBuffer.buffers['weather.weatherdata']
+            self.assertEqual(WeatherDataModel.objects.count(), record_count)
+            self.assertEqual(len(buffer['samples']), 2)
+            self.assertIsNotNone(buffer['timer'])
+            with open(buffer['name']) as log_file:
+                self.assertEqual(len(log_file.readlines()), 2)
+
+            IngestBuffer.add(WeatherDataModel, samples[2])
+
+            self.assertEqual(WeatherDataModel.objects.count(), record_count + 3)
+            self.assertEqual(buffer['samples'], [])
+            self.assertIsNone(buffer['timer'])
+            self.assertEqual(os.path.getsize(buffer['name']), 0)
+
+            # A partly full buffer can be flushed.
+            IngestBuffer.add(WeatherDataModel, self.get_samples(1)[0])
+            self.assertEqual(IngestBuffer.flush(WeatherDataModel), 1)
+            self.assertEqual(WeatherDataModel.objects.count(), record_count + 4)
+
+    def test_recover(self):
+        """
+        Test recovering the samples left in the log of a stopped process.
+        """
+
+        record_count = WeatherDataModel.objects.count()
+        samples = self.get_samples(3)
+
+        # The first sample was inserted before the process stopped, and the last line was only partly written.
+        IngestBuffer.add(WeatherDataModel, samples[0])
+        log_name = os.path.join(self.log_dir.name, 'weather.weatherdata.999999.wal')
+        with open(log_name, 'w') as log_file:
+            for sample in samples[:2]:
+                log_file.write(json.dumps(sample, default=str) + '\n')
+            log_file.write(json.dumps(samples[2], default=str)[:50])
+
+        with self.settings(INGEST_BUFFER_PATH=self.log_dir.name):
+            self.assertEqual(IngestBuffer.recover(WeatherDataModel), 1)
+
+        self.assertEqual(WeatherDataModel.objects.count(), record_count + 2)
+        self.assertTrue(WeatherDataModel.objects.filter(time_stamp=samples[1]['time_stamp']).exists())
+        self.assertFalse(os.path.exists(log_name))
+
+    def test_recover_running(self):
+        """
+        Test the log of a running process is not recovered.
+        """
+
+        with self.settings(INGEST_BUFFER_SIZE=3, INGEST_BUFFER_PATH=self.log_dir.name):
+            IngestBuffer.add(WeatherDataModel, self.get_samples(1)[0])
+            buffer = IngestBuffer.buffers['weather.weatherdata']
+
+            # The log is locked by this process, so it looks like a running process to recover().
+            self.assertEqual(IngestBuffer.recover(WeatherDataModel), 0)
+            self.assertTrue(os.path.exists(buffer['name']))
+            self.assertEqual(len(buffer['samples']), 1)
+
+
+class IngestQueueUnitTestCase(TestCase):
+
+    def setUp(self):
+        self.queue_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(INGEST_QUEUE_PATH=self.queue_dir.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.queue_dir.cleanup()
+
+    def test_queue(self):
+        """
+        Test samples are queued durably and read back in order.
+        """
+
+        self.assertEqual(IngestQueue.get_pending('weather'), [])
+
+        first_name = IngestQueue.put('weather', {'sample': 1})
+        second_name = IngestQueue.put('weather', {'sample': 2})
+        queue_path = IngestQueue.get_path('weather')
+
+        self.assertEqual(IngestQueue.get_pending('weather'), [first_name, second_name])
+        self.assertEqual(IngestQueue.read('weather', first_name), {'sample': 1})
+        self.assertEqual(os.listdir(os.path.join(queue_path, 'tmp')), [])
+
+        IngestQueue.remove('weather', first_name)
+        IngestQueue.fail('weather', second_name)
+
+        self.assertEqual(IngestQueue.get_pending('weather'), [])
+        self.assertTrue(os.path.isfile(os.path.join(queue_path, 'failed', second_name)))
@@ -0,0 +1,219 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
+from system.payload import DashboardPayload
+from system.workers import WorkerPool
+from unittest import mock
+import asyncio
+import json
+import threading
+import time
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class DashboardPayloadUnitTestCase(TestCase):
+    # Load the fixtures used in this test.
+    fixtures = ['weatherdata.json']
+
+    def test_build(self):
+        """
+        Test building a dashboard payload.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+
+        payload = DashboardPayload.build('weather')
+        content = json.loads(payload['content'])
+
+        self.assertIn('outdoor_temp', content)
+        self.assertEqual(cache.get('payload_weather'), payload)
+
+        # The version only changes when the content changes.
+        self.assertEqual(DashboardPayload.build('weather')['version'], payload['version'])
+        cache.set('outdoor_temp_latest', 100.5)
+        self.assertNotEqual(DashboardPayload.build('weather')['version'], payload['version'])
+
+    def test_get(self):
+        """
+        Test getting a dashboard payload.
+        """
+
+        cache.clear()
+
+        # The payload is built when it isn't cached.
+        payload = DashboardPayload.get('solar')
+        self.assertIn('inverter_ac_power', json.loads(payload['content']))
+
+        cache.set('payload_solar', {'version': 'foo', 'content': b'{}'})
+        self.assertEqual(DashboardPayload.get('solar')['version'], 'foo')
+
+    def test_get_version(self):
+        """
+        Test getting the payload version shared by the waiting clients.
+        """
+
+        cache.clear()
+        DashboardPayload.versions.clear()
+
+        cache.set('payload_version_weather', 'foo')
+        self.assertEqual(DashboardPayload.get_version('weather'), 'foo')
+
+        # The version is only read from the cache once per interval.
+        cache.set('payload_version_weather', 'bar')
+        self.assertEqual(DashboardPayload.get_version('weather'), 'foo')
+        time.sleep(DashboardPayload.wait_interval)
+        self.assertEqual(DashboardPayload.get_version('weather'), 'bar')
+
+        # The payload is built when the version isn't cached.
+        DashboardPayload.versions.clear()
+        cache.clear()
+        self.assertEqual(DashboardPayload.get_version('weather'), cache.get('payload_weather')['version'])
+
+
+# Waiting closes the database connection, so the waits are tested outside of a test transaction.
+class DashboardPayloadRebuildTestCase(TestCase):
+
+    def setUp(self):
+        self.events = []
+
+    def tearDown(self):
+        for event in self.events:
+            event.set()
+        WorkerPool.wait()
+
+    def block_workers(self, count: int) -> list:
+        """
+        Keep workers busy until the test releases them, one event for each worker.
+        """
+
+        started = threading.Semaphore(0)
+        events = [threading.Event() for _ in range(count)]
+        self.events.extend(events)
+
+        def block(items):
+            started.release()
+            items[0].wait(10)
+
+        for event in events:
+            WorkerPool.submit(None, block, event)
+        for _ in events:
+            started.acquire(timeout=10)
+
+        return events
+
+    @override_settings(WORKER_POOL_SIZE=1)
+    def test_rebuild_single_worker(self):
+        """
+        Test a payload rebuild that absorbs a later rebuild doesn't wait for a cache task behind it.
+        With one worker this used to block the worker for good.
+        """
+
+        # Leave only one worker free, in case the pool was started with more.
+        WorkerPool.submit(None, len, '').join(10)
+        workers = WorkerPool.get_stats()['workers']
+        events = self.block_workers(workers)
+
+        built = []
+        updated = []
+        with mock.patch.object(DashboardPayload, 'build', side_effect=built.append):
+            first_cache_task = WorkerPool.submit(None, updated.extend, 1)
+            first_payload_task = DashboardPayload.rebuild('test', first_cache_task)
+            second_cache_task = WorkerPool.submit(None, updated.extend, 2)
+            second_payload_task = DashboardPayload.rebuild('test', second_cache_task)
+
+            # The second rebuild is coalesced, but the rebuild is only queued once both caches are updated.
+            self.assertIs(second_payload_task, first_payload_task)
+            self.assertFalse(first_payload_task.queued)
+
+            events[0].set()
+            first_payload_task.join(10)
+
+        self.assertFalse(first_payload_task.is_alive())
+        self.assertEqual(updated, [1, 2])
+        self.assertEqual(built, ['test'])
+        self.assertEqual(WorkerPool.get_stats()['queue_depth'], 0)
+
+
+class DashboardPayloadWaitTestCase(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        DashboardPayload.versions.clear()
+        cache.set('payload_weather', {'version': 'foo', 'content': b'{}'})
+        cache.set('payload_version_weather', 'foo')
+
+    def tearDown(self):
+        DashboardPayload.wait_duration = 25
+
+    def test_wait(self):
+        """
+        Test waiting for a new payload.
+        """
+
+        # The payload is returned straight away if the client doesn't have it.
+        self.assertEqual(async_to_sync(DashboardPayload.wait)('weather', ['bar'])['version'], 'foo')
+
+        # Otherwise the wait returns the new payload once it is built.
+        def build():
+            time.sleep(0.2)
+            cache.set('payload_weather', {'version': 'bar', 'content': b'{}'})
+            cache.set('payload_version_weather', 'bar')
+
+        build_thread = threading.Thread(target=build)
+        build_thread.start()
+        self.assertEqual(async_to_sync(DashboardPayload.wait)('weather', ['foo'])['version'], 'bar')
+        build_thread.join()
+        self.assertEqual(DashboardPayload.waiting, 0)
+
+        # If the payload doesn't change the wait gives up and returns the current payload.
+        DashboardPayload.wait_duration = 1
+        start = time.monotonic()
+        self.assertEqual(async_to_sync(DashboardPayload.wait)('weather', ['bar'])['version'], 'bar')
+        self.assertGreaterEqual(time.monotonic() - start, 1)
+
+    @override_settings(DASHBOARD_WAIT_LIMIT=1)
+    def test_wait_limit(self):
+        """
+        Test the number of waiting clients is limited.
+        """
+
+        DashboardPayload.wait_duration = 1
+
+        async def wait_twice():
+            return await asyncio.gather(
+                DashboardPayload.wait('weather', ['foo']), DashboardPayload.wait('weather', ['foo']))
+
+        payloads = async_to_sync(wait_twice)()
+        self.assertEqual(payloads[0]['version'], 'foo')
+        self.assertIsNone(payloads[1])
+        self.assertEqual(DashboardPayload.waiting, 0)
@@ -0,0 +1,152 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.test import TestCase, override_settings
+from system.period import TimePeriod
+from weather.models import WeatherData as WeatherDataModel
+from solar.models import SolarData as SolarDataModel
+from datetime import date, datetime
+import pytz
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class TimePeriodUnitTestCase(TestCase):
+
+    def test_get_range_week(self):
+        """
+        Test getting the time range of a week.
+        """
+
+        time_obj = {'year': 2021, 'month': 12, 'day': 31}
+
+        # Weeks start on Sunday and can cross the end of a month or year.
+        start, end = TimePeriod.get_range('week', time_obj)
+        self.assertEqual(start, datetime(2021, 12, 26).timestamp())
+        self.assertEqual(end, datetime(2022, 1, 2).timestamp())
+
+    @override_settings(TIME_ZONE='Australia/Melbourne')
+    def test_get_range_timezone(self):
+        """
+        Test periods are calendar periods in the TIME_ZONE setting.
+        """
+
+        tz = pytz.timezone('Australia/Melbourne')
+
+        # Daylight saving starts on 3 October 2021, so the day is 23 hours long.
+        start, end = TimePeriod.get_range('day', {'year': 2021, 'month': 10, 'day': 3})
+        self.assertEqual(start, tz.localize(datetime(2021, 10, 3)).timestamp())
+        self.assertEqual(end - start, 23 * 3600)
+
+        # A week that starts in September and ends in October.
+        start, end = TimePeriod.get_range('week', {'year': 2021, 'month': 10, 'day': 1})
+        self.assertEqual(start, tz.localize(datetime(2021, 9, 26)).timestamp())
+        self.assertEqual(end, tz.localize(datetime(2021, 10, 3)).timestamp())
+
+        # The same range is returned from the cache.
+        hits = TimePeriod.get_date_range.cache_info().hits
+        self.assertEqual(TimePeriod.get_range('week', {'year': 2021, 'month': 10, 'day': 1}), (start, end))
+        self.assertEqual(TimePeriod.get_date_range.cache_info().hits, hits + 1)
+
+        # Changing the time zone doesn't return the cached range.
+        with self.settings(TIME_ZONE='UTC'):
+            start, end = TimePeriod.get_range('day', {'year': 2021, 'month': 10, 'day': 3})
+            self.assertEqual(start, datetime(2021, 10, 3, tzinfo=pytz.utc).timestamp())
+            self.assertEqual(end - start, 24 * 3600)
+
+    @override_settings(TIME_ZONE='Australia/Melbourne')
+    def test_get_time_obj(self):
+        """
+        Test getting the time object for a timestamp.
+        """
+
+        # 23:30 UTC on 31 December 2021 is New Year's Day in Melbourne.
+        timestamp = datetime(2021, 12, 31, 23, 30, tzinfo=pytz.utc).timestamp()
+        self.assertEqual(TimePeriod.get_date(timestamp), date(2022, 1, 1))
+
+        time_obj = TimePeriod.get_time_obj(timestamp)
+        self.assertEqual(time_obj['year'], 2022)
+        self.assertEqual(time_obj['month'], 1)
+        self.assertEqual(time_obj['day'], 1)
+
+        # The week started on Sunday 26 December, so it belongs to 2021.
+        self.assertEqual(time_obj['week_year'], 2021)
+        self.assertEqual(time_obj['week'], 52)
+        self.assertEqual(time_obj['week_start_day'], 26)
+        self.assertEqual(time_obj['week_end_day'], 1)
+
+        # The returned object can be changed without changing the cached one.
+        time_obj['year'] = 2000
+        self.assertEqual(TimePeriod.get_time_obj(timestamp)['year'], 2022)
+
+    def test_get_extreme_cache_key(self):
+        """
+        Test the cache key for an extreme only has the parts of the date its period needs.
+        """
+
+        time_obj = {'year': 2021, 'month': 9, 'day': 17}
+
+        self.assertEqual(TimePeriod.get_extreme_cache_key('max', 'uv_index', 'year', time_obj), 'max_uv_index_2021')
+        self.assertEqual(TimePeriod.get_extreme_cache_key('max', 'uv_index', 'month', time_obj), 'max_uv_index_2021_9')
+        self.assertEqual(TimePeriod.get_extreme_cache_key('min', 'uv_index', 'day', time_obj), 'min_uv_index_2021_9_17')
+
+    def test_get_filter(self):
+        """
+        Test getting the database filter for a period.
+        """
+
+        time_obj = {'year': 2021, 'month': 9, 'day': 17}
+
+        period_filter = TimePeriod.get_filter('day', time_obj)
+        self.assertEqual(period_filter, {
+            'time_stamp__gte': datetime(2021, 9, 17).timestamp(),
+            'time_stamp__lt': datetime(2021, 9, 18).timestamp(),
+        })
+
+        period_filter = TimePeriod.get_filter('day', time_obj, 'first_time_stamp')
+        self.assertEqual(list(period_filter.keys()), ['first_time_stamp__gte', 'first_time_stamp__lt'])
+
+    def test_partition_pruning(self):
+        """
+        Test queries for a period only read the partitions for that period.
+        """
+
+        time_obj = {'year': 2021, 'month': 9, 'day': 17}
+
+        for data_model in (WeatherDataModel, SolarDataModel):
+            table = data_model._meta.db_table
+            # The partitions don't line up exactly with months, so only days and weeks are checked.
+            for period in ('day', 'week'):
+                plan = data_model.objects.filter(**TimePeriod.get_filter(period, time_obj)).explain()
+
+                self.assertIn('{0}_2021_09 '.format(table), plan)
+                self.assertNotIn('{0}_2021_10 '.format(table), plan)
+                self.assertNotIn('{0}_default '.format(table), plan)
+
+            # Filtering on the calendar columns can't be pruned.
+            plan = data_model.objects.filter(time_year=2021, time_month=9, time_day=17).explain()
+            self.assertIn('{0}_2021_10 '.format(table), plan)
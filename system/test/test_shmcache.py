@@ -0,0 +1,139 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.test import SimpleTestCase
+from system.shmcache import SharedMemoryCache, SharedMemorySegment
+import os
+import tempfile
+import time
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class SharedMemoryCacheUnitTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.cache_dir.name, 'cache')
+        self.cache = SharedMemoryCache(self.location, {'OPTIONS': {'SIZE': 100000, 'SLOTS': 64}})
+
+    def tearDown(self):
+        SharedMemoryCache.segments.pop(self.location, None)
+        self.cache_dir.cleanup()
+
+    def test_get_set(self):
+        """
+        Test setting, getting, adding and deleting values.
+        """
+
+        self.cache.set('foo', {'bar': [1, 2.5]}, 60)
+        self.assertEqual(self.cache.get('foo'), {'bar': [1, 2.5]})
+        self.assertEqual(self.cache.get('missing', 'default'), 'default')
+
+        self.assertFalse(self.cache.add('foo', 1, 60))
+        self.assertTrue(self.cache.add('baz', 1, 60))
+        self.cache.set_many({'baz': 2, 'qux': 3}, 60)
+        self.assertEqual(self.cache.get_many(['foo', 'baz', 'qux', 'missing']),
+                         {'foo': {'bar': [1, 2.5]}, 'baz': 2, 'qux': 3})
+
+        self.assertTrue(self.cache.delete('foo'))
+        self.assertFalse(self.cache.delete('foo'))
+        self.assertIsNone(self.cache.get('foo'))
+
+        self.cache.clear()
+        self.assertEqual(self.cache.get_many(['baz', 'qux']), {})
+
+    def test_expiry(self):
+        """
+        Test values expire, and can be touched to keep them.
+        """
+
+        self.cache.set('foo', 1, 0.05)
+        self.cache.set('bar', 2, 0.05)
+        self.cache.set('baz', 3, None)
+        self.assertTrue(self.cache.touch('bar', 60))
+        time.sleep(0.1)
+
+        self.assertIsNone(self.cache.get('foo'))
+        self.assertFalse(self.cache.touch('foo', 60))
+        self.assertEqual(self.cache.get('bar'), 2)
+        self.assertEqual(self.cache.get('baz'), 3)
+
+    def test_full(self):
+        """
+        Test space is reused when values are replaced, and values are culled when the cache is full.
+        """
+
+        # Replacing values many times over the size of the cache compacts the data area.
+        for index in range(500):
+            self.cache.set('foo_{0}'.format(index % 5), index, 60)
+            self.cache.set('big', b'x' * 10000, 60)
+        self.assertEqual(self.cache.get_many(['foo_0', 'foo_4']), {'foo_0': 495, 'foo_4': 499})
+
+        # More keys than the index can hold.
+        self.cache.set_many({'key_{0}'.format(index): index for index in range(100)}, 60)
+        self.assertEqual(self.cache.get('key_99'), 99)
+        self.assertLessEqual(self.cache.segment.read_header()[1], 64 * SharedMemorySegment.load_factor)
+
+        # A value too large for the cache is not cached.
+        self.assertEqual(self.cache.set_many({'huge': b'x' * 100000}, 60), ['huge'])
+        self.assertIsNone(self.cache.get('huge'))
+
+    def test_shared(self):
+        """
+        Test a cache opened separately, as another process would, shares the values.
+        """
+
+        self.cache.set('foo', 'bar', 60)
+
+        # The size and slots of the existing cache are used.
+        other_location = self.location + '.other'
+        os.link(self.location, other_location)
+        other_cache = SharedMemoryCache(other_location, {'OPTIONS': {'SIZE': 200000, 'SLOTS': 128}})
+        self.assertEqual(other_cache.segment.size, 100000)
+        self.assertEqual(other_cache.get('foo'), 'bar')
+
+        other_cache.set('baz', 'qux', 60)
+        self.assertEqual(self.cache.get('baz'), 'qux')
+        SharedMemoryCache.segments.pop(other_location, None)
+
+    def test_compare_and_set(self):
+        """
+        Test values are read and set in one locked operation.
+        """
+
+        self.cache.set('foo', 1, 60)
+
+        def increment(current):
+            return {'foo': current.get('foo', 0) + 1, 'bar': current.get('bar', 0) + 1}
+
+        self.assertEqual(self.cache.compare_and_set_many(['foo', 'bar'], increment, 60), {'foo': 2, 'bar': 1})
+        self.assertEqual(self.cache.get_many(['foo', 'bar']), {'foo': 2, 'bar': 1})
+
+        # Nothing is set if the function returns nothing.
+        self.assertEqual(self.cache.compare_and_set_many(['foo'], lambda current: {}, 60), {})
+        self.assertEqual(self.cache.get('foo'), 2)
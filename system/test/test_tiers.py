@@ -0,0 +1,138 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+
+from django.test import TestCase, override_settings
+from system.period import TimePeriod
+from system.tiers import TrendTiers
+from weather.models import WeatherData, WeatherTrendTier
+from datetime import datetime
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class TrendTiersUnitTestCase(TestCase):
+
+    def test_get_resolution(self):
+        """
+        Test picking the tier to use for a time range and number of points.
+        """
+
+        # The coarsest tier with at least the number of points is used.
+        self.assertEqual(TrendTiers.get_resolution(0, 86400 * 366, 250), 86400)
+        self.assertEqual(TrendTiers.get_resolution(0, 86400 * 31, 250), 3600)
+        self.assertEqual(TrendTiers.get_resolution(0, 86400 * 7, 250), 900)
+        self.assertEqual(TrendTiers.get_resolution(0, 86400, 250), 60)
+
+        # The raw data is used when no tier has enough points.
+        self.assertEqual(TrendTiers.get_resolution(0, 86400, 2000), 0)
+
+    def test_get_period_range(self):
+        """
+        Test getting the time range of a period.
+        """
+
+        time_obj = {'year': 2021, 'month': 12, 'day': 31}
+
+        start, end = TimePeriod.get_range('day', time_obj)
+        self.assertEqual(start, datetime(2021, 12, 31).timestamp())
+        self.assertEqual(end, datetime(2022, 1, 1).timestamp())
+
+        start, end = TimePeriod.get_range('month', time_obj)
+        self.assertEqual(start, datetime(2021, 12, 1).timestamp())
+        self.assertEqual(end, datetime(2022, 1, 1).timestamp())
+
+        start, end = TimePeriod.get_range('year', time_obj)
+        self.assertEqual(start, datetime(2021, 1, 1).timestamp())
+        self.assertEqual(end, datetime(2022, 1, 1).timestamp())
+
+
+class TrendTiersFunctionalTestCase(TestCase):
+    # Load the fixtures used in this test.
+    fixtures = ['weatherdata.json']
+
+    @override_settings(TREND_RAW_MAX_RANGE=600)
+    def test_get_range_empty_tiers(self):
+        """
+        Test getting a range when the tiers have not been built yet.
+        """
+
+        start = 1623906300
+        end = 1623907860
+        raw_rows = list(WeatherData.objects
+                        .filter(time_stamp__gte=start, time_stamp__lt=end)
+                        .order_by('time_stamp')
+                        .values_list('time_stamp', 'indoor_temp'))
+
+        # Short ranges read the raw rows.
+        trend_range = TrendTiers.get_range(WeatherData, WeatherTrendTier, ['indoor_temp'], start, start + 600, 5)
+        self.assertEqual(trend_range['resolution'], 0)
+        self.assertEqual(
+            sorted(trend_range['trends']['indoor_temp']), sorted(row for row in raw_rows if row[0] < start + 600))
+
+        # Longer ranges are averaged into the tier buckets by the database.
+        buckets = {}
+        for time_stamp, indoor_temp in raw_rows:
+            buckets.setdefault(time_stamp // 60 * 60, []).append(indoor_temp)
+
+        with self.assertNumQueries(2):
+            trend_range = TrendTiers.get_range(WeatherData, WeatherTrendTier, ['indoor_temp'], start, end, 5)
+        self.assertEqual(trend_range['resolution'], 60)
+        self.assertEqual([row[0] for row in trend_range['trends']['indoor_temp']], sorted(buckets))
+        for bucket_start, average in trend_range['trends']['indoor_temp']:
+            self.assertAlmostEqual(average, sum(buckets[bucket_start]) / len(buckets[bucket_start]))
+
+    @override_settings(TREND_RAW_MAX_RANGE=600)
+    def test_get_range_minmax(self):
+        """
+        Test getting the minimum and maximum of each bucket for min/max down sampling.
+        """
+
+        start = 1623906300
+        end = 1623907860
+        buckets = {}
+        for time_stamp, indoor_temp in WeatherData.objects \
+                .filter(time_stamp__gte=start, time_stamp__lt=end) \
+                .values_list('time_stamp', 'indoor_temp'):
+            buckets.setdefault(time_stamp // 60 * 60, []).append(float(indoor_temp))
+
+        expected = []
+        for bucket_start in sorted(buckets):
+            expected.append((bucket_start, min(buckets[bucket_start])))
+            expected.append((bucket_start + 30, max(buckets[bucket_start])))
+
+        # Before the tiers are built the raw data is grouped into buckets by the database.
+        trend_range = TrendTiers.get_range(WeatherData, WeatherTrendTier, ['indoor_temp'], start, end, 5, 'minmax')
+        self.assertEqual(trend_range['resolution'], 60)
+        self.assertEqual([(row[0], float(row[1])) for row in trend_range['trends']['indoor_temp']], expected)
+
+        # The tiers keep the minimum and maximum of each bucket.
+        TrendTiers.refresh(WeatherData, WeatherTrendTier, ['indoor_temp'], start, end)
+        with self.assertNumQueries(2):
+            trend_range = TrendTiers.get_range(WeatherData, WeatherTrendTier, ['indoor_temp'], start, end, 5, 'minmax')
+        self.assertEqual(trend_range['resolution'], 60)
+        self.assertEqual(trend_range['trends']['indoor_temp'], expected)
@@ -22,9 +22,12 @@
 # @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
 # ==============================================================================
 
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, AsyncClient, Client, override_settings
 from django.core.cache import cache
+from system.payload import DashboardPayload
+import asyncio
 import json
+import time
 
 import logging
 
@@ -50,3 +53,138 @@ class SystemFunctionalTestCase(TestCase):
         self.assertEqual(content['indoor_temp']['daily_max'], 20.0)
         self.assertEqual(content['indoor_temp']['daily_trend'][0][0], 1623906326)
         self.assertEqual(content['indoor_temp']['daily_trend'][-1][0], 1623907827)
+
+    def test_dataajax_payload_view(self):
+        cache.clear()
+        response = self.client.get('/dataajax/?dashboard=weather')
+        content = json.loads(response.content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        self.assertIn('indoor_temp', content)
+
+        # The same payload is served until it is rebuilt.
+        etag = response.headers['ETag']
+        response = self.client.get('/dataajax/?dashboard=weather')
+        self.assertEqual(response.headers['ETag'], etag)
+
+        # Clients that already have the payload get a not modified response.
+        response = self.client.get('/dataajax/?dashboard=weather', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get('/dataajax/?dashboard=weather', HTTP_IF_NONE_MATCH='"foo"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_trendajax_view(self):
+        response = self.client.get('/trendajax/', {
+            'dashboard': 'weather',
+            'metric[]': ['indoor_temp', 'outdoor_temp', 'foo'],
+            'start': '1623906326',
+            'end': '1623907828',
+            'max_points': '20',
+        })
+        content = json.loads(response.content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content['resolution'], 0)
+        self.assertEqual(list(content['trends'].keys()), ['indoor_temp', 'outdoor_temp'])
+        self.assertEqual(len(content['trends']['indoor_temp']), 20)
+        self.assertEqual(content['trends']['indoor_temp'][0][0], 1623906326)
+        self.assertEqual(content['trends']['indoor_temp'][-1][0], 1623907827)
+
+        # The end of the range is exclusive.
+        response = self.client.get('/trendajax/', {
+            'metric[]': 'indoor_temp', 'start': '1623906326', 'end': '1623907827'})
+        content = json.loads(response.content)
+        self.assertLess(content['trends']['indoor_temp'][-1][0], 1623907827)
+
+        response = self.client.get('/trendajax/', {'metric[]': 'indoor_temp', 'start': 'foo'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/trendajax/', {'start': '1623906326'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/trendajax/', {'metric[]': 'foo', 'start': '1623906326'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_dataajax_format_view(self):
+        cache.clear()
+        response = self.client.get('/dataajax/', {'dashboard': 'weather', 'timestamp': '1623906568', 'format': 'columns'})
+        content = json.loads(response.content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content['indoor_temp']['daily_min'], 19.722)
+        self.assertEqual(content['indoor_temp']['daily_trend']['t0'], 1623906326)
+        self.assertEqual(
+            content['indoor_temp']['daily_trend']['t0'] + sum(content['indoor_temp']['daily_trend']['dt']), 1623907827)
+
+        # Each format of a payload has its own ETag.
+        response = self.client.get('/dataajax/', {'dashboard': 'weather'}, HTTP_ACCEPT='application/octet-stream')
+        self.assertEqual(response.headers['Content-Type'], 'application/octet-stream')
+        self.assertTrue(response.headers['ETag'].endswith('-binary"'))
+
+
+# Waiting closes the database connection, so the waits are tested outside of a test transaction.
+class SystemWaitFunctionalTestCase(TransactionTestCase):
+    # Load the fixtures used in this test.
+    fixtures = ['weatherdata.json']
+
+    def setUp(self):
+        self.client = Client()
+        DashboardPayload.versions.clear()
+
+    def tearDown(self):
+        DashboardPayload.wait_duration = 25
+
+    def test_datawait_view(self):
+        cache.clear()
+
+        # Clients without the payload get it straight away.
+        response = self.client.get('/datawait/', {'dashboard': 'weather', 'format': 'columns'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('indoor_temp', json.loads(response.content))
+        etag = response.headers['ETag']
+        self.assertTrue(etag.endswith('-columns"'))
+
+        # Clients with the current payload are told it hasn't changed once the wait is over.
+        DashboardPayload.wait_duration = 1
+        response = self.client.get(
+            '/datawait/', {'dashboard': 'weather', 'format': 'columns'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+
+    async def test_datawait_concurrent_view(self):
+        """
+        Test a client waiting for a new payload under ASGI doesn't hold up other requests.
+        """
+
+        cache.clear()
+        client = AsyncClient()
+
+        # The query string is part of the path, as the async client in Django 3.2 ignores the data argument.
+        response = await client.get('/datawait/?dashboard=weather&format=columns')
+        etag = response.headers['ETag']
+        response = await client.get('/dataajax/?dashboard=weather&timestamp=1623906568')
+        self.assertEqual(response.status_code, 200)
+
+        DashboardPayload.wait_duration = 3
+        wait = asyncio.ensure_future(
+            client.get('/datawait/?dashboard=weather&format=columns', **{'if-none-match': etag}))
+        await asyncio.sleep(0.5)
+
+        start = time.monotonic()
+        response = await client.get('/dataajax/?dashboard=weather&timestamp=1623906568')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertFalse(wait.done())
+
+        response = await wait
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(DASHBOARD_WAIT_LIMIT=0)
+    def test_datawait_limit_view(self):
+        response = self.client.get('/datawait/', {'dashboard': 'weather'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '25')
+
+        response = self.client.post('/datawait/', {'dashboard': 'weather'})
+        self.assertEqual(response.status_code, 405)
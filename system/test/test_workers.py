@@ -0,0 +1,235 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from asgiref.sync import iscoroutinefunction
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, RequestFactory
+from system.middleware import WorkerPoolMiddleware
+from system.workers import WorkerPool
+import threading
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class WorkerPoolUnitTestCase(TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        WorkerPool.wait()
+
+    def block_workers(self) -> list:
+        """
+        Keep every worker busy until the test releases them.
+        """
+
+        started = threading.Semaphore(0)
+
+        def block(items):
+            started.release()
+            self.release.wait(10)
+
+        tasks = [WorkerPool.submit(None, block, None) for _ in range(WorkerPool.get_size())]
+        for _ in tasks:
+            started.acquire(timeout=10)
+
+        return tasks
+
+    def test_coalesce(self):
+        """
+        Test items for the same key are added to the waiting task and processed in order.
+        """
+
+        self.block_workers()
+        processed = []
+        stats = WorkerPool.get_stats()
+
+        first_task = WorkerPool.submit('test', processed.append, 1)
+        second_task = WorkerPool.submit('test', processed.append, 2)
+        other_task = WorkerPool.submit('other', processed.append, 3)
+
+        self.assertIs(first_task, second_task)
+        self.assertIsNot(first_task, other_task)
+        self.assertTrue(first_task.is_alive())
+        self.assertEqual(WorkerPool.get_stats()['queue_depth'], 2)
+        self.assertEqual(WorkerPool.get_stats()['coalesced'], stats['coalesced'] + 1)
+
+        self.release.set()
+        first_task.join(10)
+        other_task.join(10)
+
+        self.assertFalse(first_task.is_alive())
+        self.assertIn([1, 2], processed)
+        self.assertIn([3], processed)
+
+        # A new task is queued once the waiting task has started.
+        self.assertIsNot(WorkerPool.submit('test', processed.append, 4), first_task)
+
+    def test_after(self):
+        """
+        Test items submitted after another task are only queued once it has finished.
+        """
+
+        self.block_workers()
+        processed = []
+
+        before_task = WorkerPool.submit(None, processed.append, 1)
+        after_task = WorkerPool.submit('test', processed.append, 2, after=before_task)
+        self.assertFalse(after_task.queued)
+        self.assertEqual(WorkerPool.get_stats()['queue_depth'], 1)
+
+        # Items are added to a task that isn't queued yet, or that doesn't have to wait.
+        self.assertIs(WorkerPool.submit('test', processed.append, 3), after_task)
+
+        self.release.set()
+        after_task.join(10)
+        self.assertEqual(processed, [[1], [2, 3]])
+
+        # An item waiting for an unfinished task isn't added to a queued task.
+        self.release.clear()
+        self.block_workers()
+        queued_task = WorkerPool.submit('test', processed.append, 4)
+        before_task = WorkerPool.submit(None, processed.append, 5)
+        self.assertIsNot(WorkerPool.submit('test', processed.append, 6, after=before_task), queued_task)
+
+        self.release.set()
+        WorkerPool.wait()
+        self.assertCountEqual(processed[2:4], [[4], [5]])
+        self.assertEqual(processed[4:], [[6]])
+
+    def test_order(self):
+        """
+        Test tasks for the same key run one at a time, in the order they were queued.
+        """
+
+        running = threading.Lock()
+        overlapped = []
+        processed = []
+
+        def process(items):
+            if not running.acquire(blocking=False):
+                overlapped.append(items)
+                return
+            self.release.wait(0.01)
+            processed.extend(items)
+            running.release()
+
+        tasks = []
+        for item in range(20):
+            tasks.append(WorkerPool.submit('test', process, item))
+            self.release.wait(0.005)
+        for task in tasks:
+            task.join(10)
+
+        self.assertEqual(overlapped, [])
+        self.assertEqual(processed, list(range(20)))
+
+    def test_drop(self):
+        """
+        Test tasks are dropped and counted when the queue is full.
+        """
+
+        self.block_workers()
+        stats = WorkerPool.get_stats()
+
+        tasks = [WorkerPool.submit(None, len, item) for item in range(WorkerPool.get_queue_size() + 1)]
+
+        self.assertFalse(any(task.dropped for task in tasks[:-1]))
+        self.assertTrue(tasks[-1].dropped)
+        self.assertFalse(tasks[-1].is_alive())
+        self.assertEqual(WorkerPool.get_stats()['dropped'], stats['dropped'] + 1)
+        self.assertEqual(WorkerPool.get_stats()['max_queue_depth'], WorkerPool.get_queue_size())
+
+    def test_submit_write_transaction(self):
+        """
+        Test writes submitted in a transaction are made straight away, so they are part of it.
+        """
+
+        processed = []
+        self.block_workers()
+
+        task = WorkerPool.submit_write('test', processed.extend, 1)
+        self.assertFalse(task.queued)
+        self.assertFalse(task.is_alive())
+        self.assertEqual(processed, [1])
+
+    async def test_middleware_async(self):
+        """
+        Test the middleware stays async when it wraps an async view, so the view isn't run in a thread.
+        """
+
+        async def view(request):
+            return HttpResponse()
+
+        middleware = WorkerPoolMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+
+        response = await middleware(RequestFactory().get('/'))
+        self.assertTrue(response.headers['X-Worker-Pool'].startswith('depth='))
+
+        # Sync views are still wrapped synchronously.
+        middleware = WorkerPoolMiddleware(lambda request: HttpResponse())
+        self.assertFalse(iscoroutinefunction(middleware))
+        self.assertTrue(middleware(RequestFactory().get('/')).headers['X-Worker-Pool'].startswith('depth='))
+
+
+class WorkerPoolWriteTestCase(TransactionTestCase):
+    """
+    Writes submitted outside a transaction, as the ingest view and commands do.
+    """
+
+    def setUp(self):
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        WorkerPool.wait()
+
+    def test_submit_write(self):
+        """
+        Test writes are queued, and made straight away instead of being dropped when the queue is full.
+        """
+
+        processed = []
+        WorkerPoolUnitTestCase.block_workers(self)
+
+        task = WorkerPool.submit_write('test', processed.extend, 1)
+        self.assertTrue(task.queued)
+        self.assertEqual(processed, [])
+
+        for item in range(WorkerPool.get_queue_size() - 1):
+            WorkerPool.submit(None, len, item)
+        dropped_task = WorkerPool.submit_write('other', processed.extend, 2)
+        self.assertTrue(dropped_task.dropped)
+        self.assertEqual(processed, [2])
+
+        self.release.set()
+        task.join(10)
+        self.assertEqual(processed, [2, 1])
+
@@ -0,0 +1,273 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, F, Max, Min
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class TrendTiers:
+    """
+    Pre-aggregated trend data at several resolutions.
+    Each tier holds the sum, minimum, maximum and count of the samples of each metric in fixed size
+    time buckets, so long trends can be read from a few hundred buckets instead of millions of raw rows.
+    Buckets are aligned to the unix epoch, so daily buckets start at midnight UTC.
+
+    The tiers are updated as each sample is stored, and can be rebuilt from the raw data with refresh().
+    Each bucket keeps the time stamp of the newest sample in it, and a sample is only added to a bucket
+    if it is newer, so a sample that is stored again is not counted twice. Samples that arrive out of
+    order are left out until the tiers are rebuilt.
+    """
+
+    # Bucket sizes in seconds: 1 minute, 15 minutes, 1 hour and 1 day.
+    resolutions = [
+        60,
+        900,
+        3600,
+        86400,
+    ]
+
+    @staticmethod
+    def update(tier_model, metrics: list, store_data: dict):
+        """
+        Add a newly stored sample to the buckets it falls in for every tier, in one query.
+        Buckets that already have the sample, or a newer one, are not changed.
+
+        :param tier_model: The model that stores the tiers.
+        :param metrics: The metrics to add to the tiers.
+        :param store_data: The data for the sample that was stored.
+        :return:
+        """
+
+        time_stamp = int(store_data['time_stamp'])
+        tier_table = connection.ops.quote_name(tier_model._meta.db_table)
+
+        value_rows = []
+        params = []
+        for resolution in TrendTiers.resolutions:
+            bucket_start = (time_stamp // resolution) * resolution
+            for metric in metrics:
+                value = float(store_data[metric])
+                value_rows.append('(%s, %s, %s, %s, %s, %s, 1, %s)')
+                params.extend([resolution, metric, bucket_start, value, value, value, time_stamp])
+
+        sql = 'INSERT INTO {0} ' \
+              '(resolution, metric, bucket_start, sum_value, min_value, max_value, sample_count, last_time_stamp) ' \
+              'VALUES {1} ' \
+              'ON CONFLICT (resolution, metric, bucket_start) DO UPDATE SET ' \
+              'sum_value = {0}.sum_value + EXCLUDED.sum_value, ' \
+              'min_value = LEAST({0}.min_value, EXCLUDED.min_value), ' \
+              'max_value = GREATEST({0}.max_value, EXCLUDED.max_value), ' \
+              'sample_count = {0}.sample_count + EXCLUDED.sample_count, ' \
+              'last_time_stamp = EXCLUDED.last_time_stamp ' \
+              'WHERE {0}.last_time_stamp < EXCLUDED.last_time_stamp'.format(tier_table, ', '.join(value_rows))
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    @staticmethod
+    def refresh(data_model, tier_model, metrics: list, start: int, end: int):
+        """
+        Rebuild the tiers from the raw data for a time range, with one query for each tier.
+        The range is widened to whole days, so every bucket that is rebuilt is complete.
+
+        :param data_model: The model that stores the raw data.
+        :param tier_model: The model that stores the tiers.
+        :param metrics: The metrics to build the tiers for.
+        :param start: The start of the time range.
+        :param end: The end of the time range (exclusive).
+        :return:
+        """
+
+        largest = TrendTiers.resolutions[-1]
+        start = (int(start) // largest) * largest
+        end = -(-int(end) // largest) * largest
+
+        data_table = connection.ops.quote_name(data_model._meta.db_table)
+        tier_table = connection.ops.quote_name(tier_model._meta.db_table)
+
+        # Turn each raw row into a row for each metric, so all metrics are aggregated in one pass.
+        metric_values = ', '.join(
+            "('{0}', raw_data.{1}::double precision)".format(metric, connection.ops.quote_name(metric))
+            for metric in metrics)
+
+        sql = 'INSERT INTO {0} ' \
+              '(resolution, metric, bucket_start, sum_value, min_value, max_value, sample_count, last_time_stamp) ' \
+              'SELECT %s, tier_data.metric, (raw_data.time_stamp / %s) * %s, ' \
+              'SUM(tier_data.value), MIN(tier_data.value), MAX(tier_data.value), COUNT(*), MAX(raw_data.time_stamp) ' \
+              'FROM {1} AS raw_data ' \
+              'CROSS JOIN LATERAL (VALUES {2}) AS tier_data (metric, value) ' \
+              'WHERE raw_data.time_stamp >= %s AND raw_data.time_stamp < %s ' \
+              'GROUP BY 2, 3 ' \
+              'ON CONFLICT (resolution, metric, bucket_start) DO UPDATE SET ' \
+              'sum_value = EXCLUDED.sum_value, ' \
+              'min_value = EXCLUDED.min_value, ' \
+              'max_value = EXCLUDED.max_value, ' \
+              'sample_count = EXCLUDED.sample_count, ' \
+              'last_time_stamp = EXCLUDED.last_time_stamp'.format(tier_table, data_table, metric_values)
+
+        with transaction.atomic():
+            tier_model.objects.filter(metric__in=metrics, bucket_start__gte=start, bucket_start__lt=end).delete()
+            with connection.cursor() as cursor:
+                for resolution in TrendTiers.resolutions:
+                    cursor.execute(sql, [resolution, resolution, resolution, start, end])
+
+    @staticmethod
+    def get_resolution(start: int, end: int, max_points: int) -> int:
+        """
+        Pick the tier to use for a trend.
+        This is the coarsest tier that still has at least the maximum number of points for the time range,
+        so the trend can be down sampled to the maximum number of points without losing detail.
+        If even the finest tier has fewer points, the raw data is used.
+
+        :param start: The start of the time range.
+        :param end: The end of the time range (exclusive).
+        :param max_points: The maximum number of points in the trend.
+        :return: The resolution of the tier, or 0 to use the raw data.
+        """
+
+        for resolution in reversed(TrendTiers.resolutions):
+            if ((end - start) / resolution) >= max_points:
+                return resolution
+
+        return 0
+
+    @staticmethod
+    def covers(data_model, resolution: int, start: int, end: int, first_bucket: int, last_bucket: int) -> bool:
+        """
+        Check a tier has buckets for all the raw data in a time range.
+        The tiers only start when samples are first stored after they were added, until they are rebuilt
+        with refresh(), so a tier can be missing the start of the raw data. Only the ends of the range are
+        checked, as the tiers are updated with every sample and rebuilt for whole days.
+
+        :param data_model: The model that stores the raw data.
+        :param resolution: The resolution of the tier.
+        :param start: The start of the time range.
+        :param end: The end of the time range (exclusive).
+        :param first_bucket: The start of the first bucket of the tier in the time range.
+        :param last_bucket: The start of the last bucket of the tier in the time range.
+        :return: True if the tier has a bucket for the first and last samples in the time range.
+        """
+
+        raw_range = data_model.objects \
+            .filter(time_stamp__gte=start, time_stamp__lt=end) \
+            .aggregate(first=Min('time_stamp'), last=Max('time_stamp'))
+
+        if raw_range['first'] is None:
+            return True
+
+        return (first_bucket <= (raw_range['first'] // resolution) * resolution) \
+            and (last_bucket >= (raw_range['last'] // resolution) * resolution)
+
+    @staticmethod
+    def get_range(data_model, tier_model, metrics: list, start: int, end: int, max_points: int, mode: str = None) -> dict:
+        """
+        Get the trend data for several metrics for a time range.
+        Ranges up to TREND_RAW_MAX_RANGE seconds, defaults to 2 days, are read from the raw data,
+        so short trends such as a day keep their peaks when they are down sampled.
+        Longer ranges are read from the tier that best matches the time range and maximum number of points,
+        with all the metrics in one query. If the tier doesn't cover the whole range, e.g. before the tiers
+        are rebuilt, the raw data is averaged into buckets the size of the tier in the database instead,
+        so the rows of the whole range are not read.
+        The raw data is filtered on the time stamp, so only the partitions for the time range are read.
+
+        In 'minmax' mode each bucket gives two points instead of its average, the minimum at the start of
+        the bucket and the maximum half way through it, so the peaks are kept when the trend is down sampled
+        with UnitConversion.downsample_minmax().
+
+        :param data_model: The model that stores the raw data.
+        :param tier_model: The model that stores the tiers.
+        :param metrics: The metrics to get the trend for.
+        :param start: The start of the time range.
+        :param end: The end of the time range (exclusive).
+        :param max_points: The maximum number of points the trend will be down sampled to.
+        :param mode: The down sampling mode, 'lttb' or 'minmax', defaults to the TREND_DOWNSAMPLE_MODE setting.
+        :return: The resolution used (0 for raw data) and the trend data for each metric.
+        """
+
+        if mode is None:
+            mode = getattr(settings, 'TREND_DOWNSAMPLE_MODE', 'lttb')
+
+        trend_data = {metric: [] for metric in metrics}
+
+        resolution = TrendTiers.get_resolution(start, end, max_points)
+        if (resolution == 0) or ((end - start) <= getattr(settings, 'TREND_RAW_MAX_RANGE', 172800)):
+            raw_rows = data_model.objects \
+                .filter(time_stamp__gte=start, time_stamp__lt=end) \
+                .order_by('time_stamp') \
+                .values_list('time_stamp', *metrics)
+
+            for raw_row in raw_rows.iterator(chunk_size=10000):
+                for index, metric in enumerate(metrics, 1):
+                    trend_data[metric].append((raw_row[0], raw_row[index]))
+
+            return {'resolution': 0, 'trends': trend_data}
+
+        tier_rows = tier_model.objects \
+            .filter(resolution=resolution, metric__in=metrics, bucket_start__gte=start, bucket_start__lt=end) \
+            .order_by('bucket_start') \
+            .values_list('metric', 'bucket_start', 'sum_value', 'min_value', 'max_value', 'sample_count')
+
+        for metric, bucket_start, sum_value, min_value, max_value, sample_count in tier_rows.iterator(chunk_size=10000):
+            if mode == 'minmax':
+                trend_data[metric].append((bucket_start, min_value))
+                trend_data[metric].append((bucket_start + resolution // 2, max_value))
+            else:
+                trend_data[metric].append((bucket_start, sum_value / sample_count))
+
+        # Every metric is added to the same buckets, so the first metric has the range of the tier.
+        tier_data = next(iter(trend_data.values()), [])
+        if (len(tier_data) > 0) \
+                and TrendTiers.covers(data_model, resolution, start, end, tier_data[0][0], tier_data[-1][0]):
+            return {'resolution': resolution, 'trends': trend_data}
+
+        if mode == 'minmax':
+            aggregates = [('min', Min, 0), ('max', Max, resolution // 2)]
+        else:
+            aggregates = [('avg', Avg, 0)]
+
+        trend_data = {metric: [] for metric in metrics}
+        bucket_rows = data_model.objects \
+            .filter(time_stamp__gte=start, time_stamp__lt=end) \
+            .annotate(bucket_start=(F('time_stamp') / resolution) * resolution) \
+            .values('bucket_start') \
+            .annotate(**{'{0}__{1}'.format(metric, name): aggregate(metric)
+                         for metric in metrics for name, aggregate, offset in aggregates}) \
+            .order_by('bucket_start') \
+            .values_list('bucket_start', *['{0}__{1}'.format(metric, name)
+                                           for metric in metrics for name, aggregate, offset in aggregates])
+
+        for bucket_row in bucket_rows.iterator(chunk_size=10000):
+            index = 1
+            for metric in metrics:
+                for name, aggregate, offset in aggregates:
+                    trend_data[metric].append((bucket_row[0] + offset, bucket_row[index]))
+                    index += 1
+
+        return {'resolution': resolution, 'trends': trend_data}
@@ -36,4 +36,6 @@ urlpatterns = [
     re_path(r'^solar\/history[\/]?', views.solar_history, name='solar_history'),
     re_path(r'^solar[\/]?', views.solar_dashboard, name='solar_dashboard'),
     re_path(r'^dataajax\/.*', views.data_ajax, name='data_ajax'),
+    re_path(r'^datawait\/.*', views.data_wait, name='data_wait'),
+    re_path(r'^trendajax\/.*', views.trend_ajax, name='trend_ajax'),
 ]
\ No newline at end of file
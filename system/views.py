@@ -23,9 +23,13 @@
 # ==============================================================================
 
 from django.shortcuts import render
-from django.http import HttpResponseNotAllowed, JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, HttpResponseNotModified
 from weather.weatherdata import WeatherData
 from solar.solardata import SolarData
+from system.encoding import TrendEncoding
+from system.history import HistoryCache
+from system.payload import DashboardPayload
 from datetime import datetime
 import logging
 
@@ -87,9 +91,69 @@ def solar_history(request):
     return render(request, 'system/solar_history.html', context)
 
 
+def get_request_etags(request) -> list:
+    """
+    Get the ETags of the versions the client already has.
+
+    :param request:
+    :return: The ETags in the If-None-Match header.
+    """
+
+    return [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',') if tag.strip()]
+
+
+def payload_response(request, payload: dict) -> HttpResponse:
+    """
+    Get the response for a prebuilt dashboard payload.
+    If the client already has this version of the payload a 304 Not Modified response is returned.
+
+    :param request:
+    :param payload: The payload to return.
+    :return:
+    """
+
+    # Each format of the payload has its own ETag.
+    data_format = TrendEncoding.get_format(request)
+    if data_format == 'json':
+        etag = '"{0}"'.format(payload['version'])
+    else:
+        etag = '"{0}-{1}"'.format(payload['version'], data_format)
+
+    if etag in get_request_etags(request):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(DashboardPayload.get_content(payload, data_format),
+                                content_type=TrendEncoding.formats[data_format])
+
+    # Browsers should always check the payload is current before using their copy.
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept'
+
+    return response
+
+
+def history_response(request, payload: dict) -> HttpResponse:
+    """
+    Get the response for a history dashboard payload.
+    Final payloads never change, so browsers can keep them for as long as they like.
+
+    :param request:
+    :param payload: The payload to return.
+    :return:
+    """
+
+    response = payload_response(request, payload)
+    if payload['final']:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+
+    return response
+
+
 def data_ajax(request):
     """
     This view handles ajax requests for the main dashboard.
+    Trend data can be requested in a compact format with the format parameter, see TrendEncoding.
 
     :param request:
     :return:
@@ -100,8 +164,6 @@ def data_ajax(request):
     elif request.method == 'GET':
         # If timestamp is not provided default to now.
         timestamp = int(request.GET.get('timestamp', default=0))
-        if timestamp == 0:
-            timestamp = datetime.now().timestamp()
 
         # Decide which dataset we are getting.
         dashboard = str(request.GET.get('dashboard', default='weather'))
@@ -109,6 +171,17 @@ def data_ajax(request):
         # Decide if we are getting historic data.
         history = int(request.GET.get('history', default=0))
 
+        # The live dashboards are served from the prebuilt payloads.
+        if (timestamp == 0) and (history == 0) and (dashboard in ('weather', 'solar')):
+            return payload_response(request, DashboardPayload.get(dashboard))
+
+        if timestamp == 0:
+            timestamp = datetime.now().timestamp()
+
+        # History is served from the history payloads, which are stored once the day can no longer change.
+        if (history == 1) and (dashboard == 'solar'):
+            return history_response(request, HistoryCache.get(dashboard, timestamp))
+
         if dashboard == 'weather':
             weather_data = WeatherData()
             if history == 1:
@@ -117,10 +190,93 @@ def data_ajax(request):
                 result_data = weather_data.get_data(timestamp)
         elif dashboard == 'solar':
             solar_data = SolarData()
-            if history == 1:
-                result_data = solar_data.get_history(timestamp)
-            else:
-                result_data = solar_data.get_data(timestamp)
+            result_data = solar_data.get_data(timestamp)
 
-        response = JsonResponse(result_data)
+        data_format = TrendEncoding.get_format(request)
+        response = HttpResponse(TrendEncoding.encode(result_data, data_format),
+                                content_type=TrendEncoding.formats[data_format])
         return response
+
+
+async def data_wait(request):
+    """
+    This view handles long polling requests for the live dashboards.
+    The client sends the ETag of the payload it has in the If-None-Match header, and the response
+    is held until a new payload is built, or for up to DashboardPayload.wait_duration seconds.
+    If the payload hasn't changed a 304 Not Modified response is returned. If too many clients
+    are already waiting a 503 response is returned, and the client should poll /dataajax/ instead.
+
+    :param request:
+    :return:
+    """
+
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    # Decide which dashboard we are waiting for.
+    dashboard = str(request.GET.get('dashboard', default='weather'))
+    if dashboard not in ('weather', 'solar'):
+        dashboard = 'weather'
+
+    # The version is the start of the ETag for every format of the payload.
+    versions = [tag.strip('"').split('-')[0] for tag in get_request_etags(request)]
+
+    payload = await DashboardPayload.wait(dashboard, versions)
+    if payload is None:
+        response = HttpResponse(status=503)
+        response.headers['Retry-After'] = str(DashboardPayload.wait_duration)
+        return response
+
+    return payload_response(request, payload)
+
+
+def trend_ajax(request):
+    """
+    This view handles ajax requests for trend data for any time range.
+    Parameters:
+        dashboard: 'weather' or 'solar'.
+        metric[]: The metrics to get, can be repeated.
+        start: The start timestamp of the range.
+        end: The end timestamp of the range, defaults to now.
+        max_points: The maximum number of points for each metric.
+        format: 'json' (default), 'columns' or 'binary', see TrendEncoding.
+
+    :param request:
+    :return:
+    """
+
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    try:
+        start = int(request.GET.get('start', default=0))
+        end = int(request.GET.get('end', default=datetime.now().timestamp()))
+        max_points = int(request.GET.get('max_points', default=getattr(settings, 'TREND_MAX_POINTS', 250)))
+    except ValueError:
+        return HttpResponseBadRequest('start, end and max_points must be integers')
+
+    metrics = request.GET.getlist('metric[]') or request.GET.getlist('metric')
+    dashboard = str(request.GET.get('dashboard', default='weather'))
+
+    if (start <= 0) or (end <= start) or (len(metrics) == 0):
+        return HttpResponseBadRequest('metric[], start and end are required and end must be after start')
+
+    # Unknown metrics are skipped, but there must be at least one metric to get.
+    allowed_metrics = SolarData.solar_metrics if dashboard == 'solar' else WeatherData.weather_metrics
+    metrics = [metric for metric in metrics if metric in allowed_metrics]
+    if len(metrics) == 0:
+        return HttpResponseBadRequest('metric[] must include at least one known metric')
+
+    # Keep the number of points to something a chart can use.
+    max_points = min(max(max_points, 3), 5000)
+
+    if dashboard == 'solar':
+        trend_range = SolarData.get_trend_range(metrics, start, end, max_points)
+    else:
+        trend_range = WeatherData.get_trend_range(metrics, start, end, max_points)
+
+    # The trends are down sampled, so the response is small enough to encode in one go.
+    data_format = TrendEncoding.get_format(request)
+    trend_data = {'start': start, 'end': end, 'resolution': trend_range['resolution'], 'trends': trend_range['trends']}
+
+    return HttpResponse(TrendEncoding.encode(trend_data, data_format), content_type=TrendEncoding.formats[data_format])
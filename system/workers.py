@@ -0,0 +1,359 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+import collections
+import queue
+import threading
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class WorkerTask:
+    """
+    A task queued in the worker pool. Tasks can be joined like a thread.
+    """
+
+    def __init__(self, key, function):
+        self.key = key
+        self.function = function
+        self.items = []
+        self.turn = 0
+        self.queued = False
+        self.started = False
+        self.dropped = False
+        self.done = threading.Event()
+
+        # The number of tasks this task is waiting for before it is queued, and the tasks waiting for this one.
+        self.waiting = 0
+        self.followers = []
+
+    def join(self, timeout: float = None):
+        """
+        Wait for the task to finish.
+
+        :param timeout: The maximum number of seconds to wait.
+        :return:
+        """
+
+        self.done.wait(timeout)
+
+    def is_alive(self) -> bool:
+        """
+        Check if the task is still queued or running.
+
+        :return: True if the task hasn't finished.
+        """
+
+        return not self.done.is_set()
+
+
+class WorkerPool:
+    """
+    A process wide pool of worker threads for the work done after a sample is stored,
+    such as updating the cached values, writing the daily rollups, extremes and trend tiers,
+    and rebuilding the dashboard payloads.
+    The number of workers and the length of the queue are fixed, so a burst of samples
+    doesn't start a thread and open a database connection for each sample.
+
+    Tasks with a key are coalesced: while a task is waiting in the queue, new items for the same key
+    are added to it, and the task function is called once with all the items. Tasks with the same key
+    are run in the order they were queued. If the queue is full new tasks are dropped and counted.
+
+    An item can be submitted to run after another task has finished. Its task is only queued once all the
+    tasks its items are waiting for have finished, so workers never wait for tasks that are behind them
+    in the queue. Items that wait for an unfinished task aren't added to a task that is already queued.
+
+    Each worker keeps its database connection open while there is more work in the queue.
+    Once the queue is empty the connection is closed, unless it is still within the CONN_MAX_AGE
+    database setting, so with persistent connections the workers reuse them between samples.
+    """
+
+    lock = threading.Lock()
+    turn_changed = threading.Condition(lock)
+    tasks = None
+    workers = []
+
+    # Tasks that are waiting in the queue, keyed by task key.
+    pending = {}
+
+    # The turn given to the next task queued for each key, and the turn of the next task to run.
+    next_turn = collections.defaultdict(int)
+    current_turn = collections.defaultdict(int)
+
+    stats = {
+        'submitted': 0,
+        'coalesced': 0,
+        'dropped': 0,
+        'completed': 0,
+        'failed': 0,
+        'max_queue_depth': 0,
+    }
+
+    @staticmethod
+    def get_size() -> int:
+        """
+        Get the number of worker threads.
+
+        :return: The WORKER_POOL_SIZE setting, defaults to 2.
+        """
+
+        return max(1, int(getattr(settings, 'WORKER_POOL_SIZE', 2)))
+
+    @staticmethod
+    def get_queue_size() -> int:
+        """
+        Get the maximum number of tasks waiting in the queue.
+
+        :return: The WORKER_QUEUE_SIZE setting, defaults to 100.
+        """
+
+        return max(1, int(getattr(settings, 'WORKER_QUEUE_SIZE', 100)))
+
+    @staticmethod
+    def start():
+        """
+        Start the worker threads, if they aren't already running.
+        Must be called with the pool lock held.
+
+        :return:
+        """
+
+        if WorkerPool.tasks is None:
+            WorkerPool.tasks = queue.Queue(WorkerPool.get_queue_size())
+
+        WorkerPool.workers = [worker for worker in WorkerPool.workers if worker.is_alive()]
+        for _ in range(len(WorkerPool.workers), WorkerPool.get_size()):
+            worker = threading.Thread(target=WorkerPool.thread_work, name='worker_pool', daemon=True)
+            worker.start()
+            WorkerPool.workers.append(worker)
+
+    @staticmethod
+    def submit(key, function, item, after: WorkerTask = None) -> WorkerTask:
+        """
+        Queue an item to be processed by a worker.
+
+        :param key: The key used to coalesce tasks, or None to always queue a new task.
+        :param function: The function to call with the list of items.
+        :param item: The item to add to the task.
+        :param after: A task that must finish before the item is processed.
+        :return: The task the item was added to.
+        """
+
+        with WorkerPool.lock:
+            WorkerPool.stats['submitted'] += 1
+            if (after is not None) and not after.is_alive():
+                after = None
+
+            task = WorkerPool.pending.get(key) if key is not None else None
+            if (task is not None) and ((after is None) or not task.queued):
+                task.items.append(item)
+                WorkerPool.follow(task, after)
+                WorkerPool.stats['coalesced'] += 1
+                return task
+
+            WorkerPool.start()
+            task = WorkerTask(key, function)
+            task.items.append(item)
+            if key is not None:
+                WorkerPool.pending[key] = task
+
+            WorkerPool.follow(task, after)
+            if task.waiting == 0:
+                WorkerPool.enqueue(task)
+
+        return task
+
+    @staticmethod
+    def submit_write(key, function, item) -> WorkerTask:
+        """
+        Queue an item that is written to the database, such as the data derived from a stored sample.
+        Unlike the cache updates these writes must not be lost, so if the task is dropped because the queue
+        is full the function is called straight away. It is also called straight away if the caller is in a
+        transaction, as a worker's connection can't see the uncommitted sample and its writes wouldn't be
+        rolled back with it.
+
+        :param key: The key used to coalesce tasks.
+        :param function: The function to call with the list of items.
+        :param item: The item to add to the task.
+        :return: The task the item was added to, already finished if the function was called straight away.
+        """
+
+        if connection.in_atomic_block:
+            task = WorkerTask(key, function)
+            task.items.append(item)
+            function(task.items)
+            task.done.set()
+            return task
+
+        task = WorkerPool.submit(key, function, item)
+        if task.dropped:
+            function(task.items)
+
+        return task
+
+    @staticmethod
+    def follow(task: WorkerTask, after: WorkerTask):
+        """
+        Hold a task back from the queue until another task has finished.
+        Must be called with the pool lock held.
+
+        :param task: The task to hold back.
+        :param after: The unfinished task to wait for, or None.
+        :return:
+        """
+
+        if after is not None:
+            task.waiting += 1
+            after.followers.append(task)
+
+    @staticmethod
+    def enqueue(task: WorkerTask):
+        """
+        Put a task in the queue, or drop it if the queue is full.
+        Must be called with the pool lock held.
+
+        :param task: The task to queue.
+        :return:
+        """
+
+        try:
+            WorkerPool.tasks.put_nowait(task)
+        except queue.Full:
+            task.dropped = True
+            if WorkerPool.pending.get(task.key) is task:
+                del WorkerPool.pending[task.key]
+            WorkerPool.stats['dropped'] += 1
+            logger.warning('Worker pool: queue is full, dropped task for {0}'.format(task.key))
+            WorkerPool.finish(task)
+            return
+
+        task.queued = True
+        if task.key is not None:
+            task.turn = WorkerPool.next_turn[task.key]
+            WorkerPool.next_turn[task.key] += 1
+        WorkerPool.stats['max_queue_depth'] = max(WorkerPool.stats['max_queue_depth'], WorkerPool.tasks.qsize())
+
+    @staticmethod
+    def finish(task: WorkerTask):
+        """
+        Mark a task as done, and queue the tasks that were only waiting for it.
+        Must be called with the pool lock held.
+
+        :param task: The finished or dropped task.
+        :return:
+        """
+
+        task.done.set()
+        followers = task.followers
+        task.followers = []
+        for follower in followers:
+            follower.waiting -= 1
+            if follower.waiting == 0:
+                WorkerPool.enqueue(follower)
+
+    @staticmethod
+    def run(task: WorkerTask):
+        """
+        Run a task, with the other tasks that have the same key run before it.
+
+        :param task: The task to run.
+        :return:
+        """
+
+        with WorkerPool.turn_changed:
+            # No more items can be added once the task has started.
+            if WorkerPool.pending.get(task.key) is task:
+                del WorkerPool.pending[task.key]
+            task.started = True
+            if task.key is not None:
+                WorkerPool.turn_changed.wait_for(lambda: WorkerPool.current_turn[task.key] == task.turn)
+
+        # The database connection is kept open between tasks, unless it has gone away.
+        if (connection.connection is not None) and not connection.is_usable():
+            connection.close()
+
+        try:
+            task.function(task.items)
+            result = 'completed'
+        except Exception:
+            logger.exception('Worker pool: task for {0} failed'.format(task.key))
+            result = 'failed'
+
+        with WorkerPool.turn_changed:
+            WorkerPool.stats[result] += 1
+            if task.key is not None:
+                WorkerPool.current_turn[task.key] += 1
+                WorkerPool.turn_changed.notify_all()
+
+    @staticmethod
+    def thread_work():
+        """
+        Method called in each worker thread to run the queued tasks.
+
+        :return:
+        """
+
+        while True:
+            task = WorkerPool.tasks.get()
+            WorkerPool.run(task)
+
+            if WorkerPool.tasks.empty():
+                close_old_connections()
+
+            # The tasks waiting for this one are queued before it is marked as done in the queue,
+            # so waiting for the queue also waits for them.
+            with WorkerPool.lock:
+                WorkerPool.finish(task)
+            WorkerPool.tasks.task_done()
+
+    @staticmethod
+    def get_stats() -> dict:
+        """
+        Get the current queue depth and the task counts since the process started.
+
+        :return: The worker pool statistics.
+        """
+
+        with WorkerPool.lock:
+            stats = dict(WorkerPool.stats)
+            stats['queue_depth'] = WorkerPool.tasks.qsize() if WorkerPool.tasks is not None else 0
+            stats['workers'] = len([worker for worker in WorkerPool.workers if worker.is_alive()])
+
+        return stats
+
+    @staticmethod
+    def wait():
+        """
+        Wait until all the queued tasks have finished.
+
+        :return:
+        """
+
+        if WorkerPool.tasks is not None:
+            WorkerPool.tasks.join()
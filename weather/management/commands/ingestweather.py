@@ -0,0 +1,143 @@
+# ==============================================================================
+#
+# This file is part of SolarWeather.
+#
+# SolarWeather is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# SolarWeather is distributed  WITHOUT ANY WARRANTY:
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software.  If not, see <http://www.gnu.org/licenses/>.
+# ==============================================================================
+
+# ==============================================================================
+#
+# @author Matthew Porritt
+# @copyright  2021 onwards Matthew Porritt (mattp@catalyst-au.net)
+# @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
+# ==============================================================================
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from system.ingest import IngestBuffer, IngestQueue
+from weather.models import WeatherData as WeatherDataModel
+from weather.weatherdata import WeatherData
+import fcntl
+import os
+import signal
+import threading
+
+import logging
+
+# Get an instance of a logger
+logger = logging.getLogger('django')
+
+
+class Command(BaseCommand):
+    help = 'Store the weather station data queued by the ingest view, until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            "-i",
+            type=float,
+            help="The number of seconds to wait between checks when the queue is empty.",
+            required=False,
+            default=0.5,
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Store the data that is queued and then stop.",
+        )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stop_event = threading.Event()
+
+    def stop(self, signum, frame):
+        """
+        Signal handler to stop storing data after the current sample.
+        """
+
+        self.stop_event.set()
+
+    def drain(self) -> tuple:
+        """
+        Store the samples in the queue, oldest first.
+        Samples that can't be stored because they are invalid are moved out of the queue.
+        If the database can't be reached the sample is left in the queue and tried again later.
+
+        :return: The number of samples stored and failed.
+        """
+
+        stored = 0
+        failed = 0
+        for file_name in IngestQueue.get_pending('weather'):
+            if self.stop_event.is_set():
+                break
+
+            # The database connection is kept open between samples, unless it has gone away.
+            if (connection.connection is not None) and not connection.is_usable():
+                connection.close()
+
+            try:
+                store_result = WeatherData.store(IngestQueue.read('weather', file_name))
+            except (KeyError, ValueError, TypeError, AttributeError) as error:
+                logger.error('Weather ingest: failed to store {0}: {1}'.format(file_name, error))
+                IngestQueue.fail('weather', file_name)
+                failed += 1
+                continue
+            except DatabaseError as error:
+                logger.error('Weather ingest: database error storing {0}: {1}'.format(file_name, error))
+                connection.close()
+                break
+
+            # The sample stays in the queue until the data derived from it has been written, so it isn't lost.
+            store_result['thread'].join()
+            store_result['derive_thread'].join()
+            store_result['payload_thread'].join()
+            IngestQueue.remove('weather', file_name)
+            stored += 1
+
+        return stored, failed
+
+    def handle(self, interval: float, once: bool, *args, **kwargs):
+        # Only one worker can drain a queue, so the samples are stored in order.
+        queue_path = IngestQueue.get_path('weather')
+        os.makedirs(queue_path, exist_ok=True)
+        lock_file = open(os.path.join(queue_path, 'worker.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise CommandError('Another worker is already storing the weather queue.')
+
+        previous_handlers = {
+            signum: signal.signal(signum, self.stop) for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+
+        total_stored = 0
+        total_failed = 0
+        try:
+            while not self.stop_event.is_set():
+                stored, failed = self.drain()
+                total_stored += stored
+                total_failed += failed
+                if once:
+                    break
+                if (stored + failed) == 0:
+                    self.stop_event.wait(interval)
+        finally:
+            IngestBuffer.flush(WeatherDataModel)
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+        self.stdout.write(self.style.SUCCESS('Stored {0} queued samples, {1} failed.'.format(total_stored, total_failed)))
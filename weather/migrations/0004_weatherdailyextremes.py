@@ -0,0 +1,31 @@
+# Generated by Django 3.2.4 on 2026-10-17 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0003_auto_20220916_1632'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherDailyExtremes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=50)),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('avg_value', models.FloatField()),
+                ('count', models.IntegerField()),
+                ('time_year', models.IntegerField()),
+                ('time_month', models.IntegerField()),
+                ('time_day', models.IntegerField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='weatherdailyextremes',
+            constraint=models.UniqueConstraint(fields=('time_year', 'time_month', 'time_day', 'metric'), name='weather_daily_extremes_day'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.4 on 2026-10-17 23:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0004_weatherdailyextremes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherTrendTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.IntegerField()),
+                ('metric', models.CharField(max_length=50)),
+                ('bucket_start', models.IntegerField()),
+                ('sum_value', models.FloatField()),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('sample_count', models.IntegerField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='weathertrendtier',
+            constraint=models.UniqueConstraint(fields=('resolution', 'metric', 'bucket_start'), name='weather_trend_tier_bucket'),
+        ),
+    ]
@@ -0,0 +1,126 @@
+# Generated by Django 3.2.4 on 2026-10-17 23:30
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0005_weathertrendtier'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_indoor__d5513a_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_outdoor_6b76aa_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_indoor__858815_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_outdoor_b1f3e6_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_indoor__b9bbf1_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_outdoor_f40154_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_dew_poi_1a2d4e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_wind_ch_5a23dc_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_indoor__2e0fb6_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_outdoor_c57950_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_wind_sp_7a40b5_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_wind_gu_1e980e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_wind_di_0fedf3_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_absolut_ac86c1_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_pressur_cc2e87_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_rain_932af8_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_daily_r_f95d69_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_weekly__bbfe9f_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_monthly_38f3d7_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_solar_r_269259_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_wea_uv_inde_0bc6be_idx',
+        ),
+        migrations.AlterField(
+            model_name='weatherdata',
+            name='time_day',
+            field=models.IntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='weatherdata',
+            name='time_month',
+            field=models.IntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='weatherdata',
+            name='time_stamp',
+            field=models.IntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='weatherdata',
+            name='time_year',
+            field=models.IntegerField(),
+        ),
+        migrations.AddIndex(
+            model_name='weatherdata',
+            index=django.contrib.postgres.indexes.BrinIndex(autosummarize=True, fields=['time_stamp'], name='weather_data_time_stamp_brin', pages_per_range=32),
+        ),
+        migrations.AddIndex(
+            model_name='weatherdata',
+            index=models.Index(fields=['time_year', 'time_month', 'time_day', 'time_stamp'], name='weather_data_calendar_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.4 on 2026-10-18 00:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0007_weathertrendtier_last_time_stamp'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='weatherdata',
+            name='weather_data_time_stamp_brin',
+        ),
+        migrations.AddIndex(
+            model_name='weatherdata',
+            index=models.Index(fields=['time_stamp'], name='weather_data_time_stamp_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.4 on 2026-10-18 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0008_time_stamp_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weatherdailyextremes',
+            name='last_time_stamp',
+            field=models.IntegerField(default=0),
+        ),
+        # Existing days get the time stamp of their newest sample, so samples already in them aren't added again.
+        migrations.RunSQL(
+            'UPDATE weather_weatherdailyextremes SET last_time_stamp = day_data.last_time_stamp '
+            'FROM (SELECT time_year, time_month, time_day, MAX(time_stamp) AS last_time_stamp '
+            'FROM weather_weatherdata GROUP BY time_year, time_month, time_day) AS day_data '
+            'WHERE weather_weatherdailyextremes.time_year = day_data.time_year '
+            'AND weather_weatherdailyextremes.time_month = day_data.time_month '
+            'AND weather_weatherdailyextremes.time_day = day_data.time_day',
+            migrations.RunSQL.noop,
+        ),
+    ]
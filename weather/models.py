@@ -56,10 +56,10 @@ class WeatherData(PostgresPartitionedModel):
     solar_radiation = models.FloatField()
     uv_index = models.IntegerField()
     date_utc = models.DateTimeField()
-    time_stamp = models.IntegerField(db_index=True)
-    time_year = models.IntegerField(db_index=True)
-    time_month = models.IntegerField(db_index=True)
-    time_day = models.IntegerField(db_index=True)
+    time_stamp = models.IntegerField()
+    time_year = models.IntegerField()
+    time_month = models.IntegerField()
+    time_day = models.IntegerField()
     software_type = models.CharField(max_length=100)
     action = models.CharField(max_length=100)
     real_time = models.IntegerField()
@@ -67,25 +67,53 @@ class WeatherData(PostgresPartitionedModel):
 
     class Meta:
         indexes = [
-            models.Index(fields=['indoor_temp', 'time_year']),
-            models.Index(fields=['outdoor_temp', 'time_year']),
-            models.Index(fields=['indoor_feels_temp', 'time_year']),
-            models.Index(fields=['outdoor_feels_temp', 'time_year']),
-            models.Index(fields=['indoor_dew_temp', 'time_year']),
-            models.Index(fields=['outdoor_dew_temp', 'time_year']),
-            models.Index(fields=['dew_point', 'time_year']),
-            models.Index(fields=['wind_chill', 'time_year']),
-            models.Index(fields=['indoor_humidity', 'time_year']),
-            models.Index(fields=['outdoor_humidity', 'time_year']),
-            models.Index(fields=['wind_speed', 'time_year']),
-            models.Index(fields=['wind_gust', 'time_year']),
-            models.Index(fields=['wind_direction', 'time_year']),
-            models.Index(fields=['absolute_pressure', 'time_year']),
-            models.Index(fields=['pressure', 'time_year']),
-            models.Index(fields=['rain', 'time_year']),
-            models.Index(fields=['daily_rain', 'time_year']),
-            models.Index(fields=['weekly_rain', 'time_year']),
-            models.Index(fields=['monthly_rain', 'time_year']),
-            models.Index(fields=['solar_radiation', 'time_year']),
-            models.Index(fields=['uv_index', 'time_year']),
+            # Time stamp ranges, and the first and last samples. Samples are appended in time order,
+            # so inserts only ever touch the right hand edge of the index.
+            models.Index(fields=['time_stamp'], name='weather_data_time_stamp_idx'),
+            # Day, month and year lookups, ordered by time stamp within the period.
+            models.Index(fields=['time_year', 'time_month', 'time_day', 'time_stamp'], name='weather_data_calendar_idx'),
+        ]
+
+
+class WeatherDailyExtremes(models.Model):
+    """
+    This model stores the minimum, maximum, average and count
+    of each weather metric for each day.
+    Monthly and yearly values are derived from the daily values.
+    """
+
+    metric = models.CharField(max_length=50)
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    avg_value = models.FloatField()
+    count = models.IntegerField()
+    last_time_stamp = models.IntegerField(default=0)  # Time stamp of the newest sample in the day.
+    time_year = models.IntegerField()
+    time_month = models.IntegerField()
+    time_day = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['time_year', 'time_month', 'time_day', 'metric'], name='weather_daily_extremes_day'),
+        ]
+
+class WeatherTrendTier(models.Model):
+    """
+    This model stores the weather station data aggregated into time buckets at several resolutions.
+    See system.tiers.TrendTiers.
+    """
+
+    resolution = models.IntegerField()  # Bucket size in seconds.
+    metric = models.CharField(max_length=50)
+    bucket_start = models.IntegerField()
+    sum_value = models.FloatField()
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    sample_count = models.IntegerField()
+    last_time_stamp = models.IntegerField(default=0)  # Time stamp of the newest sample in the bucket.
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['resolution', 'metric', 'bucket_start'], name='weather_trend_tier_bucket'),
         ]
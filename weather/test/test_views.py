@@ -22,9 +22,14 @@
 # @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
 # ==============================================================================
 
-from django.test import TestCase, Client
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+from system.ingest import IngestQueue
+from weather.models import WeatherData as WeatherDataModel
 import weather.test.test_data as test_data
 from django.core.cache import cache
+from io import StringIO
+import tempfile
 
 
 # Basic functional testing
@@ -40,3 +45,33 @@ class WeatherDataFunctionalTestCase(TestCase):
         # and content should be empty
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.content, b'success')
+
+    def test_index_view_queue(self):
+        """
+        Test data is only queued in queue mode, and is stored by the ingest worker.
+        """
+        cache.clear()
+        record_count = WeatherDataModel.objects.count()
+
+        with tempfile.TemporaryDirectory() as queue_path, \
+                override_settings(WEATHER_INGEST_MODE='queue', INGEST_QUEUE_PATH=queue_path):
+            response = self.client.get('/weatherstation/updateweatherstation.php', test_data.test_query_vars)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, b'success')
+            self.assertEqual(WeatherDataModel.objects.count(), record_count)
+
+            pending = IngestQueue.get_pending('weather')
+            self.assertEqual(len(pending), 1)
+            self.assertEqual(IngestQueue.read('weather', pending[0]), test_data.test_query_vars)
+
+            # Invalid data is rejected and not queued.
+            invalid_vars = dict(test_data.test_query_vars, tempf='warm')
+            response = self.client.get('/weatherstation/updateweatherstation.php', invalid_vars)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(len(IngestQueue.get_pending('weather')), 1)
+
+            out = StringIO()
+            call_command('ingestweather', once=True, stdout=out)
+            self.assertIn('Stored 1 queued samples, 0 failed.', out.getvalue())
+            self.assertEqual(IngestQueue.get_pending('weather'), [])
+            self.assertEqual(WeatherDataModel.objects.count(), record_count + 1)
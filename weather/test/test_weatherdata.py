@@ -22,10 +22,13 @@
 # @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
 # ==============================================================================
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from weather.weatherdata import WeatherData
 from weather.models import WeatherData as WeatherDataModel
+from weather.models import WeatherDailyExtremes as WeatherDailyExtremesModel
+from weather.models import WeatherTrendTier as WeatherTrendTierModel
 import weather.test.test_data as test_data
+from system.period import TimePeriod
 from django.core.cache import cache
 from datetime import datetime
 
@@ -48,6 +51,7 @@ class WeatherDataUnitTestCase(TestCase):
         weather_data = WeatherData()
         store_result = weather_data.store(test_data.test_query_vars)
         store_result['thread'].join()
+        store_result['payload_thread'].join()
         data_record = WeatherDataModel.objects.get(id=store_result['datarecord'])
 
         self.assertEqual(data_record.software_type, 'EasyWeatherV1.5.9')
@@ -444,6 +448,90 @@ class WeatherDataUnitTestCase(TestCase):
         set_result = weather_data.get_latest('outdoor_temp')
         self.assertEqual(set_result.get('outdoor_temp_latest'), 10.277)
 
+    def test_set_latest_many(self):
+        """
+        Test setting and getting the latest values for several metrics.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+
+        weather_data = WeatherData()
+
+        # Metrics that are not in the allowed list are not set.
+        set_result = weather_data.set_latest_many({'outdoor_temp': 10.277, 'indoor_temp': 20.0, 'foo': 1})
+        self.assertEqual(set_result, {'outdoor_temp_latest': 10.277, 'indoor_temp_latest': 20.0})
+
+        get_result = weather_data.get_latest_many(['outdoor_temp', 'indoor_temp', 'uv_index'])
+        self.assertEqual(get_result.get('outdoor_temp_latest'), 10.277)
+        self.assertEqual(get_result.get('indoor_temp_latest'), 20.0)
+        self.assertIsNone(get_result.get('uv_index_latest'))
+
+    def test_set_extremes(self):
+        """
+        Test setting the maximum and minimum values for several metrics at once.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches
+        cache.clear()
+
+        date_object = datetime.fromtimestamp(1623906568)
+        time_obj = {
+            'year': date_object.year,
+            'month': date_object.month,
+            'day': date_object.day
+        }
+        weather_data = WeatherData()
+
+        # A new maximum for every period and a value inside the existing range.
+        updated = weather_data.set_extremes({'outdoor_temp': 100, 'indoor_temp': 19.9}, time_obj)
+        self.assertEqual(updated, {
+            'max_outdoor_temp_{0}_{1}_{2}'.format(time_obj['year'], time_obj['month'], time_obj['day']): 100,
+            'max_outdoor_temp_{0}_{1}'.format(time_obj['year'], time_obj['month']): 100,
+            'max_outdoor_temp_{0}'.format(time_obj['year']): 100,
+        })
+
+        extremes = weather_data.get_extremes(time_obj)
+        self.assertEqual(extremes['outdoor_temp']['daily_max'], 100)
+        self.assertEqual(extremes['outdoor_temp']['yearly_max'], 100)
+        self.assertEqual(extremes['indoor_temp']['daily_max'], 20.0)
+        self.assertEqual(extremes['indoor_temp']['daily_min'], 19.722)
+
+    def test_thread_set_coalesced(self):
+        """
+        Test the cache values are updated once for several coalesced samples.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches.
+        cache.clear()
+
+        time_obj = TimePeriod.get_time_obj(1623906568)
+        weather_data = WeatherData()
+
+        weather_data.thread_set([
+            {'outdoor_temp': 100.0, 'indoor_temp': 19.8, 'time_stamp': 1623906584},
+            {'outdoor_temp': -10.0, 'indoor_temp': 19.9, 'time_stamp': 1623906600},
+            {'outdoor_temp': 12.0, 'indoor_temp': 19.85, 'time_stamp': 1623906616},
+        ])
+
+        # The extremes come from every sample, the latest values from the last one.
+        extremes = weather_data.get_extremes(time_obj)
+        self.assertEqual(extremes['outdoor_temp']['daily_max'], 100.0)
+        self.assertEqual(extremes['outdoor_temp']['daily_min'], -10.0)
+        self.assertEqual(extremes['indoor_temp']['daily_max'], 20.0)
+        self.assertEqual(extremes['indoor_temp']['daily_min'], 19.722)
+
+        latest = weather_data.get_latest_many(['outdoor_temp', 'indoor_temp'])
+        self.assertEqual(latest, {'outdoor_temp_latest': 12.0, 'indoor_temp_latest': 19.85})
+
+        # A delayed update for an older sample doesn't replace the latest values.
+        weather_data.thread_set([{'outdoor_temp': 11.0, 'indoor_temp': 19.8, 'time_stamp': 1623906600}])
+        latest = weather_data.get_latest_many(['outdoor_temp', 'indoor_temp'])
+        self.assertEqual(latest, {'outdoor_temp_latest': 12.0, 'indoor_temp_latest': 19.85})
+
     def test_get_data(self):
         """
         Test getting the weather data.
@@ -462,6 +550,159 @@ class WeatherDataUnitTestCase(TestCase):
         self.assertEqual(result_data['indoor_temp']['daily_trend'][0][0], 1623906326)
         self.assertEqual(result_data['indoor_temp']['daily_trend'][-1][0], 1623907827)
 
+    def test_rollup_extremes_day(self):
+        """
+        Test building the daily extremes from the raw data.
+        """
+
+        time_obj = {'year': 2021, 'month': 6, 'day': 17}
+
+        weather_data = WeatherData()
+        sample_count = weather_data.rollup_extremes_day(time_obj)
+
+        self.assertEqual(sample_count, 112)
+        self.assertEqual(WeatherDailyExtremesModel.objects.count(), len(WeatherData.weather_metrics))
+
+        extremes_record = WeatherDailyExtremesModel.objects.get(metric='indoor_temp')
+        self.assertEqual(extremes_record.min_value, 19.722)
+        self.assertEqual(extremes_record.max_value, 20.0)
+        self.assertEqual(extremes_record.count, 112)
+
+        # Building again should replace the existing extremes.
+        weather_data.rollup_extremes_day(time_obj)
+        self.assertEqual(WeatherDailyExtremesModel.objects.count(), len(WeatherData.weather_metrics))
+
+    def test_update_extremes(self):
+        """
+        Test adding a new sample to the daily extremes.
+        """
+
+        weather_data = WeatherData()
+        weather_data.rollup_extremes_day({'year': 2021, 'month': 6, 'day': 17})
+        day_objects = WeatherDataModel.objects.filter(time_year=2021, time_month=6, time_day=17)
+        last_time_stamp = int(day_objects.order_by('-time_stamp').values_list('time_stamp', flat=True).first())
+        self.assertEqual(WeatherDailyExtremesModel.objects.get(metric='indoor_temp').last_time_stamp, last_time_stamp)
+
+        store_data = day_objects.values().first()
+        store_data['indoor_temp'] = 30.5
+        store_data['time_stamp'] = last_time_stamp + 16
+        weather_data.update_extremes(store_data)
+
+        extremes_record = WeatherDailyExtremesModel.objects.get(metric='indoor_temp')
+        self.assertEqual(extremes_record.min_value, 19.722)
+        self.assertEqual(extremes_record.max_value, 30.5)
+        self.assertEqual(extremes_record.count, 113)
+        self.assertEqual(extremes_record.last_time_stamp, last_time_stamp + 16)
+
+        # Every metric is updated in one query.
+        store_data['indoor_temp'] = 10.5
+        store_data['time_stamp'] = last_time_stamp + 32
+        with self.assertNumQueries(1):
+            weather_data.update_extremes(store_data)
+
+        extremes_record = WeatherDailyExtremesModel.objects.get(metric='indoor_temp')
+        self.assertEqual(extremes_record.min_value, 10.5)
+        self.assertEqual(extremes_record.count, 114)
+        self.assertEqual(WeatherDailyExtremesModel.objects.filter(count=114).count(), len(WeatherData.weather_metrics))
+
+        # A sample that is stored again is not counted twice.
+        weather_data.update_extremes(store_data)
+        self.assertEqual(WeatherDailyExtremesModel.objects.filter(count=114).count(), len(WeatherData.weather_metrics))
+
+        # A sample older than the newest one in the day rebuilds the day from the raw data,
+        # which doesn't have the samples above.
+        store_data['time_stamp'] = last_time_stamp - 1
+        weather_data.update_extremes(store_data)
+        extremes_record = WeatherDailyExtremesModel.objects.get(metric='indoor_temp')
+        self.assertEqual(extremes_record.count, 112)
+        self.assertEqual(extremes_record.max_value, 20.0)
+        self.assertEqual(extremes_record.last_time_stamp, last_time_stamp)
+
+    def test_get_extremes_raw(self):
+        """
+        Test getting the extremes for all metrics from the raw data.
+        """
+
+        date_object = datetime.fromtimestamp(1623906568)
+        time_obj = {
+            'year': date_object.year,
+            'month': date_object.month,
+            'day': date_object.day
+        }
+
+        weather_data = WeatherData()
+
+        with self.assertNumQueries(1):
+            extremes = weather_data.get_extremes_raw('month', time_obj)
+
+        self.assertEqual(extremes['solar_radiation__max'], 90.90)
+        self.assertEqual(extremes['outdoor_temp__min'], 9.278)
+
+        # Periods without data should be zero.
+        extremes = weather_data.get_extremes_raw('year', {'year': 2000, 'month': 1, 'day': 1})
+        self.assertEqual(extremes['solar_radiation__max'], 0)
+
+    def test_get_extremes(self):
+        """
+        Test getting the extremes for all metrics, from the daily extremes and the raw data.
+        """
+
+        # Start by clearing the cache.
+        # If this test was ever run in a production environment it would clear all caches.
+        cache.clear()
+
+        date_object = datetime.fromtimestamp(1623906568)
+        time_obj = {
+            'year': date_object.year,
+            'month': date_object.month,
+            'day': date_object.day
+        }
+
+        weather_data = WeatherData()
+
+        # No daily extremes, values come from the raw data.
+        # One query for the daily extremes, then one for each period.
+        with self.assertNumQueries(4):
+            extremes = weather_data.get_extremes(time_obj)
+        self.assertEqual(extremes['indoor_temp']['daily_min'], 19.722)
+        self.assertEqual(extremes['solar_radiation']['yearly_max'], 90.90)
+        self.assertEqual(cache.get('max_solar_radiation_2021'), 90.90)
+
+        # Values from the daily extremes should match.
+        cache.clear()
+        weather_data.rollup_extremes_day(time_obj)
+        extremes_rollup = weather_data.get_extremes(time_obj)
+        self.assertEqual(extremes_rollup, extremes)
+
+    def test_get_extremes_partial_rollup(self):
+        """
+        Test days without daily extremes are got from the raw data.
+        """
+
+        time_obj = {'year': 2021, 'month': 6, 'day': 17}
+
+        weather_data = WeatherData()
+        weather_data.rollup_extremes_day(time_obj)
+
+        # A sample on a day earlier in the month, that has no daily extremes.
+        sample = WeatherDataModel.objects.filter(time_year=2021, time_month=6, time_day=17).values().first()
+        sample.pop('id')
+        sample.update({'time_stamp': 1623283200, 'time_day': 10, 'solar_radiation': 99.5, 'outdoor_temp': 1.5})
+        WeatherDataModel.objects.create(**sample)
+
+        with self.assertNumQueries(3):
+            extremes = weather_data.get_extremes_rollup(time_obj)
+        self.assertEqual(extremes['solar_radiation']['daily_max'], 90.90)
+        self.assertEqual(extremes['solar_radiation']['monthly_max'], 99.5)
+        self.assertEqual(extremes['solar_radiation']['yearly_max'], 99.5)
+        self.assertEqual(extremes['outdoor_temp']['monthly_min'], 1.5)
+
+        # Once every day with data has daily extremes, they match the raw data.
+        weather_data.rollup_extremes_day({'year': 2021, 'month': 6, 'day': 10})
+        extremes = weather_data.get_extremes_rollup(time_obj)
+        self.assertEqual(extremes['solar_radiation']['yearly_max'], 99.5)
+        self.assertEqual(extremes['outdoor_temp']['daily_min'], 9.278)
+
     def test_get_trend(self):
         """
         Test getting the trend data.
@@ -485,6 +726,97 @@ class WeatherDataUnitTestCase(TestCase):
         self.assertEqual(result_data[0][0], 1623906326)
         self.assertEqual(result_data[-1][0], 1623907827)
 
+    def test_refresh_tiers(self):
+        """
+        Test building the trend tiers from the raw data.
+        """
+
+        weather_data = WeatherData()
+        weather_data.refresh_tiers(1623906326, 1623907828)
+
+        day_bucket = WeatherTrendTierModel.objects.get(resolution=86400, metric='outdoor_temp')
+        day_objects = WeatherDataModel.objects.filter(time_year=2021, time_month=6, time_day=17)
+        self.assertEqual(day_bucket.sample_count, day_objects.count())
+        self.assertEqual(day_bucket.max_value, max(day_objects.values_list('outdoor_temp', flat=True)))
+        self.assertEqual(day_bucket.min_value, min(day_objects.values_list('outdoor_temp', flat=True)))
+        self.assertEqual(day_bucket.last_time_stamp, max(day_objects.values_list('time_stamp', flat=True)))
+
+        # Every tier has all the samples.
+        for resolution in (60, 900, 3600, 86400):
+            tier_objects = WeatherTrendTierModel.objects.filter(resolution=resolution, metric='outdoor_temp')
+            self.assertEqual(sum(tier_objects.values_list('sample_count', flat=True)), day_objects.count())
+
+    def test_update_tiers(self):
+        """
+        Test adding a stored sample to the trend tiers.
+        """
+
+        weather_data = WeatherData()
+        weather_data.refresh_tiers(1623906326, 1623907828)
+        day_bucket = WeatherTrendTierModel.objects.get(resolution=86400, metric='outdoor_temp')
+
+        store_data = WeatherDataModel.objects.filter(time_stamp=1623907827).values().first()
+        store_data['outdoor_temp'] = 50
+        store_data['time_stamp'] = 1623907830
+        weather_data.update_tiers(store_data)
+
+        updated_bucket = WeatherTrendTierModel.objects.get(resolution=86400, metric='outdoor_temp')
+        self.assertEqual(updated_bucket.sample_count, day_bucket.sample_count + 1)
+        self.assertEqual(updated_bucket.max_value, 50)
+        self.assertEqual(updated_bucket.min_value, day_bucket.min_value)
+        self.assertAlmostEqual(updated_bucket.sum_value, day_bucket.sum_value + 50)
+        self.assertEqual(updated_bucket.last_time_stamp, 1623907830)
+
+        # A sample that is stored again, or one older than the bucket already has, is not added twice.
+        weather_data.update_tiers(store_data)
+        store_data['time_stamp'] = 1623907827
+        weather_data.update_tiers(store_data)
+        for resolution in (60, 900, 3600, 86400):
+            retried_bucket = WeatherTrendTierModel.objects.get(
+                resolution=resolution, metric='outdoor_temp', bucket_start=(1623907830 // resolution) * resolution)
+            self.assertEqual(retried_bucket.last_time_stamp, 1623907830)
+        self.assertEqual(WeatherTrendTierModel.objects.get(resolution=86400, metric='outdoor_temp').sample_count,
+                         day_bucket.sample_count + 1)
+
+    def test_get_trend_tier(self):
+        """
+        Test getting the trend data from the trend tiers.
+        """
+
+        date_object = datetime.fromtimestamp(1623906568)
+        time_obj = {
+            'year': date_object.year,
+            'month': date_object.month,
+            'day': date_object.day
+        }
+
+        weather_data = WeatherData()
+        weather_data.refresh_tiers(1623906326, 1623907828)
+
+        # A day is got from the raw data, so the peaks are kept.
+        result_data = weather_data.get_trend('indoor_temp', 'day', time_obj)
+        self.assertEqual(result_data[0][0], 1623906326)
+        self.assertEqual(result_data[-1][0], 1623907827)
+
+        # A year uses the daily tier.
+        result_data = weather_data.get_trend('indoor_temp', 'year', time_obj)
+        self.assertEqual(len(result_data), 1)
+        self.assertEqual(result_data[0][0], 1623888000)
+
+        # A sample on a day the tier doesn't have means the daily averages are got from the raw data.
+        sample = WeatherDataModel.objects.filter(time_stamp=1623907827).values().first()
+        sample.pop('id')
+        sample.update({'time_stamp': 1623283200, 'time_day': 10, 'indoor_temp': 10.0})
+        WeatherDataModel.objects.create(**sample)
+
+        day_objects = WeatherDataModel.objects.filter(time_year=2021, time_month=6, time_day=17)
+        result_data = weather_data.get_trend('indoor_temp', 'year', time_obj)
+        self.assertEqual(len(result_data), 2)
+        self.assertEqual(result_data[0], (1623283200, 10.0))
+        self.assertEqual(result_data[1][0], 1623888000)
+        self.assertAlmostEqual(
+            result_data[1][1], sum(day_objects.values_list('indoor_temp', flat=True)) / day_objects.count())
+
     def test_get_apparent_temperature(self):
         """
         Test getting apparent temperature with no solar radiation
@@ -545,3 +877,28 @@ class WeatherDataUnitTestCase(TestCase):
         self.assertEqual(result_data['value'], today)
         self.assertEqual(result_data['maximum'], '2021-06-17')
         self.assertEqual(result_data['minimum'], '2021-06-17')
+
+
+class WeatherDataStoreTestCase(TransactionTestCase):
+    """
+    Storing samples outside a transaction, as the ingest view and command do.
+    """
+
+    def test_store_derive(self):
+        """
+        Test the daily extremes and trend tiers are written in the worker pool once the sample is stored.
+        """
+
+        store_result = WeatherData.store(test_data.test_query_vars)
+        self.assertTrue(store_result['derive_thread'].queued)
+        for task in (store_result['thread'], store_result['derive_thread'], store_result['payload_thread']):
+            task.join(10)
+
+        data_record = WeatherDataModel.objects.get(id=store_result['datarecord'])
+        extremes_record = WeatherDailyExtremesModel.objects.get(
+            metric='outdoor_temp', time_year=data_record.time_year, time_month=data_record.time_month,
+            time_day=data_record.time_day)
+        self.assertEqual(extremes_record.count, 1)
+        self.assertEqual(extremes_record.max_value, data_record.outdoor_temp)
+        self.assertEqual(WeatherTrendTierModel.objects.filter(metric='outdoor_temp', sample_count=1).count(), 4)
+
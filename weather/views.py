@@ -22,21 +22,30 @@
 # @license    http://www.gnu.org/copyleft/gpl.html GNU GPL v3 or later
 # ==============================================================================
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest
+from system.ingest import IngestQueue
 from weather.weatherdata import WeatherData
 
 
 def index(request):
     """
-    This view processes the data sent by the weather station
+    This view processes the data sent by the weather station.
+    If the WEATHER_INGEST_MODE setting is 'queue' the data is only checked and queued,
+    so the station gets its response straight away. The ingestweather command stores the queued data.
 
     :param request:
     :return:
     """
     request_data = request.GET
 
-    weather_data = WeatherData()
-    weather_data.store(request_data)
+    if getattr(settings, 'WEATHER_INGEST_MODE', 'sync') == 'queue':
+        if not WeatherData.is_valid(request_data):
+            return HttpResponseBadRequest('Invalid weather station data.')
+        IngestQueue.put('weather', request_data.dict())
+    else:
+        weather_data = WeatherData()
+        weather_data.store(request_data)
 
     response = HttpResponse()
     response.headers['Content-Type'] = 'text/plain; charset=utf-8'
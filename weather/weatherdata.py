@@ -23,15 +23,21 @@
 # ==============================================================================
 
 from weather.models import WeatherData as WeatherDataModel
-from django.db.models import Max, Min
+from weather.models import WeatherTrendTier as WeatherTrendTierModel
+from weather.models import WeatherDailyExtremes as WeatherDailyExtremesModel
+from django.db.models import Avg, Count, Max, Min, Q
 from system.conversion import UnitConversion
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from django.conf import settings
-from django.core.cache import cache
+from system.cache import DataCache
+from system.payload import DashboardPayload
+from system.ingest import IngestBuffer
+from system.period import TimePeriod
+from system.tiers import TrendTiers
+from system.workers import WorkerPool
 import math
 import pytz
-import threading
-from django.db import connection
+from django.db import connection, transaction
 
 import logging
 
@@ -75,13 +81,54 @@ class WeatherData:
         'outdoor_temp',
     ]
 
+    # Numeric fields sent by the weather station, and their types.
+    station_fields = {
+        'indoortempf': float,
+        'tempf': float,
+        'dewptf': float,
+        'windchillf': float,
+        'indoorhumidity': float,
+        'humidity': float,
+        'windspeedmph': float,
+        'windgustmph': float,
+        'winddir': float,
+        'absbaromin': float,
+        'baromin': float,
+        'rainin': float,
+        'dailyrainin': float,
+        'weeklyrainin': float,
+        'monthlyrainin': float,
+        'solarradiation': float,
+        'UV': int,
+        'realtime': int,
+        'rtfreq': int,
+    }
+
+    @staticmethod
+    def is_valid(data: dict) -> bool:
+        """
+        Check data received from the weather station can be stored, without doing the conversions.
+
+        :param data: Data received from the weather station
+        :return: True if the data is valid.
+        """
+
+        try:
+            for field, field_type in WeatherData.station_fields.items():
+                field_type(data.get(field))
+            datetime.strptime(data.get('dateutc').replace('%20', ' '), '%Y-%m-%d %X')
+        except (AttributeError, TypeError, ValueError):
+            return False
+
+        return (data.get('softwaretype') is not None) and (data.get('action') is not None)
+
     @staticmethod
     def store(data: dict) -> dict:
         """
         Store received weather station data into database.
 
         :param data: Data received from the weather station
-        :return: ID of inserted row.
+        :return: ID of inserted row, or None if the sample was buffered.
         """
 
         # First do some date mangling.
@@ -132,49 +179,390 @@ class WeatherData:
             'radio_freq': int(data.get('rtfreq')),
         }
 
-        # Update latest, max and min values.
-        timestamp = datetime.now().timestamp()
-        date_object = datetime.fromtimestamp(timestamp)
-        time_obj = {
-            'year': date_object.year,
-            'month': date_object.month,
-            'day': date_object.day
-        }
+        # Update latest, max and min values in the worker pool so we don't have to wait for a response.
+        cache_task = WorkerPool.submit('cache_weather', WeatherData.thread_set, store_data)
+
+        # Store data in the database, or the ingest buffer if it is enabled.
+        data_record_id = IngestBuffer.add(WeatherDataModel, store_data)
 
-        # Update caches in a thread so we don't have to wait for a response.
-        x = threading.Thread(target=WeatherData.thread_set, args=(store_data, time_obj))
-        x.start()
+        # Add the new data to the daily extremes and trend tiers in the worker pool.
+        derive_task = WorkerPool.submit_write('derive_weather', WeatherData.thread_derive, store_data)
 
-        # Store data in the database.
-        data_record = WeatherDataModel(**store_data)
-        data_record.save()
+        # Rebuild the dashboard payload once the caches have been updated.
+        payload_task = DashboardPayload.rebuild('weather', cache_task)
 
         # Return ID of inserted row.
         return {
-            'datarecord': data_record.id,
-            'thread': x
+            'datarecord': data_record_id,
+            'thread': cache_task,
+            'derive_thread': derive_task,
+            'payload_thread': payload_task
         }
 
     @staticmethod
-    def thread_set(store_data: dict, time_obj: dict):
+    def thread_set(samples: list):
         """
-        Method called in a thread to update cache values.
+        Method called in a worker to update cache values.
+        Samples queued while the worker was busy are coalesced: the extremes are updated
+        once with the largest and smallest value of each metric, and the latest values
+        are set from the last sample.
 
-        :param store_data:
-        :param time_obj:
+        :param samples: The stored data for each new sample, oldest first.
         :return:
         """
-        for metric, value in store_data.items():
-            if (type(value) is int) or (type(value) is float):
-                WeatherData.set_max(metric, 'day', value, time_obj)
-                WeatherData.set_min(metric, 'day', value, time_obj)
-                WeatherData.set_latest(metric, value)
-        connection.close()
+        max_values = {}
+        min_values = {}
+        values = {}
+        time_objs = [TimePeriod.get_time_obj(store_data['time_stamp']) for store_data in samples]
+        for index, store_data in enumerate(samples):
+            values = {}
+            for metric, value in store_data.items():
+                if (metric in WeatherData.weather_metrics) and ((type(value) is int) or (type(value) is float)):
+                    values[metric] = value
+                    max_values[metric] = max(value, max_values.get(metric, value))
+                    min_values[metric] = min(value, min_values.get(metric, value))
+
+            # The extremes are cached for the day of the sample, so samples are only
+            # coalesced while it doesn't change.
+            if (index == len(samples) - 1) or (time_objs[index + 1] != time_objs[index]):
+                WeatherData.set_extremes(max_values, time_objs[index], min_values)
+                max_values = {}
+                min_values = {}
+
+        WeatherData.set_latest_many(values, samples[-1]['time_stamp'])
+
+    @staticmethod
+    def thread_derive(samples: list):
+        """
+        Method called in a worker to add newly stored samples to the daily extremes and trend tiers.
+
+        :param samples: The stored data for each new sample, oldest first.
+        :return:
+        """
+
+        for store_data in samples:
+            WeatherData.update_extremes(store_data)
+            WeatherData.update_tiers(store_data)
+
+    @staticmethod
+    def rollup_extremes_day(time_obj: dict) -> int:
+        """
+        Create or replace the daily extremes for a day from the raw data.
+        All metrics are aggregated in a single query.
+        The day's rows are locked while they are rebuilt, so a sample can't be added to them, see update_extremes().
+
+        :param time_obj: The object that contains the time data.
+        :return: The number of samples for the day.
+        """
+
+        day_filter = {'time_year': time_obj['year'], 'time_month': time_obj['month'], 'time_day': time_obj['day']}
+
+        # Samples still in the ingest buffer would be missed.
+        IngestBuffer.flush(WeatherDataModel)
+
+        aggregates = {'sample_count': Count('id'), 'last_time_stamp': Max('time_stamp')}
+        for metric in WeatherData.weather_metrics:
+            aggregates['{0}__min'.format(metric)] = Min(metric)
+            aggregates['{0}__max'.format(metric)] = Max(metric)
+            aggregates['{0}__avg'.format(metric)] = Avg(metric)
+
+        with transaction.atomic():
+            list(WeatherDailyExtremesModel.objects.select_for_update().filter(**day_filter).values_list('id', flat=True))
+            day_values = WeatherDataModel.objects.filter(**TimePeriod.get_filter('day', time_obj)).aggregate(**aggregates)
+
+            extremes_records = []
+            if day_values['sample_count'] > 0:
+                for metric in WeatherData.weather_metrics:
+                    extremes_records.append(WeatherDailyExtremesModel(
+                        metric=metric,
+                        min_value=day_values['{0}__min'.format(metric)],
+                        max_value=day_values['{0}__max'.format(metric)],
+                        avg_value=day_values['{0}__avg'.format(metric)],
+                        count=day_values['sample_count'],
+                        last_time_stamp=int(day_values['last_time_stamp']),
+                        **day_filter
+                    ))
+
+            WeatherDailyExtremesModel.objects.filter(**day_filter).delete()
+            WeatherDailyExtremesModel.objects.bulk_create(extremes_records)
+
+        return day_values['sample_count']
+
+    @staticmethod
+    def update_extremes(store_data: dict):
+        """
+        Update the daily extremes with a newly stored sample.
+        The extremes of every metric are updated in a single query, which locks the day's rows as
+        rollup_extremes_day() does, so it waits for a rebuild of the day to finish.
+        Each day keeps the time stamp of its newest sample, and a sample is only added if it is newer,
+        so a sample that is stored again is not counted twice.
+        If the day has no extremes yet, or the sample is older than the newest one, the day is built
+        from the raw data instead.
+
+        :param store_data: The data for the sample that was stored.
+        :return:
+        """
+
+        day_filter = {
+            'time_year': store_data['time_year'],
+            'time_month': store_data['time_month'],
+            'time_day': store_data['time_day']
+        }
+        time_stamp = int(store_data['time_stamp'])
+
+        extremes_table = connection.ops.quote_name(WeatherDailyExtremesModel._meta.db_table)
+        value_rows = ', '.join(['(%s, CAST(%s AS double precision))'] * len(WeatherData.weather_metrics))
+        params = [store_data['time_year'], store_data['time_month'], store_data['time_day'], time_stamp]
+        for metric in WeatherData.weather_metrics:
+            params.extend([metric, float(store_data[metric])])
+        params.append(time_stamp)
+
+        sql = 'WITH day_rows AS (' \
+              'SELECT id FROM {0} WHERE time_year = %s AND time_month = %s AND time_day = %s FOR UPDATE) ' \
+              'UPDATE {0} SET ' \
+              'min_value = LEAST({0}.min_value, sample_data.value), ' \
+              'max_value = GREATEST({0}.max_value, sample_data.value), ' \
+              'avg_value = (({0}.avg_value * {0}.count) + sample_data.value) / ({0}.count + 1), ' \
+              'count = {0}.count + 1, ' \
+              'last_time_stamp = %s ' \
+              'FROM day_rows, (VALUES {1}) AS sample_data (metric, value) ' \
+              'WHERE {0}.id = day_rows.id AND {0}.metric = sample_data.metric ' \
+              'AND {0}.last_time_stamp < %s'.format(extremes_table, value_rows)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            updated = cursor.rowcount
+
+        if updated == len(WeatherData.weather_metrics):
+            return
+
+        # The sample is the newest one in the extremes of every metric, so it was stored again.
+        day_objects = WeatherDailyExtremesModel.objects.filter(**day_filter)
+        if day_objects.filter(last_time_stamp=time_stamp).count() == len(WeatherData.weather_metrics):
+            return
+
+        # Otherwise the day is rebuilt, which replaces any rows that were updated.
+        WeatherData.rollup_extremes_day({
+            'year': store_data['time_year'],
+            'month': store_data['time_month'],
+            'day': store_data['time_day']
+        })
+
+    @staticmethod
+    def get_extremes_gaps(time_obj: dict, rollup_days: set) -> Q:
+        """
+        Get the filter for the days of a year that don't have daily extremes.
+        Consecutive days are joined into one time range.
+
+        :param time_obj: The object that contains the time data.
+        :param rollup_days: The (month, day) of each day that has daily extremes.
+        :return: The filter for the raw data of the days without daily extremes,
+        or None if every day has daily extremes.
+        """
+
+        time_zone = getattr(settings, 'TIME_ZONE')
+        gap_ranges = []
+        day = date(time_obj['year'], 1, 1)
+        while day.year == time_obj['year']:
+            if (day.month, day.day) not in rollup_days:
+                day_start, day_end = TimePeriod.get_date_range('day', day, time_zone)
+                if (len(gap_ranges) > 0) and (gap_ranges[-1][1] == day_start):
+                    gap_ranges[-1][1] = day_end
+                else:
+                    gap_ranges.append([day_start, day_end])
+            day += timedelta(days=1)
+
+        gap_filter = None
+        for gap_start, gap_end in gap_ranges:
+            gap = Q(time_stamp__gte=gap_start, time_stamp__lt=gap_end)
+            gap_filter = gap if gap_filter is None else gap_filter | gap
+
+        return gap_filter
+
+    @staticmethod
+    def get_extremes_rollup(time_obj: dict) -> dict:
+        """
+        Get the daily, monthly and yearly maximum and minimum values for all metrics,
+        from the daily extremes. This is done in a single query.
+        Days of the year without daily extremes, e.g. before the daily extremes were built
+        or when updating them failed, are aggregated from the raw data in one more query.
+
+        :param time_obj: The object that contains the time data.
+        :return: The extremes for each metric, or an empty dict if there are no daily extremes for the year.
+        """
+
+        month_filter = Q(time_month=time_obj['month'])
+        day_filter = Q(time_month=time_obj['month'], time_day=time_obj['day'])
+
+        extremes_rows = WeatherDailyExtremesModel.objects \
+            .filter(time_year=time_obj['year']) \
+            .values('metric') \
+            .annotate(
+                daily_max=Max('max_value', filter=day_filter),
+                daily_min=Min('min_value', filter=day_filter),
+                monthly_max=Max('max_value', filter=month_filter),
+                monthly_min=Min('min_value', filter=month_filter),
+                yearly_max=Max('max_value'),
+                yearly_min=Min('min_value')
+            ) \
+            .order_by()
+
+        extremes = {}
+        for extremes_row in extremes_rows:
+            metric = extremes_row.pop('metric')
+            extremes[metric] = extremes_row
+
+        if len(extremes) == 0:
+            return extremes
+
+        rollup_days = set(WeatherDailyExtremesModel.objects
+                          .filter(time_year=time_obj['year'])
+                          .values_list('time_month', 'time_day')
+                          .distinct())
+        gap_filter = WeatherData.get_extremes_gaps(time_obj, rollup_days)
+
+        if gap_filter is not None:
+            period_filters = {
+                'daily': Q(**TimePeriod.get_filter('day', time_obj)),
+                'monthly': Q(**TimePeriod.get_filter('month', time_obj)),
+                'yearly': Q(),
+            }
+            aggregates = {}
+            for metric in extremes:
+                for period_name, period_filter in period_filters.items():
+                    aggregates['{0}__{1}_max'.format(metric, period_name)] = Max(metric, filter=period_filter)
+                    aggregates['{0}__{1}_min'.format(metric, period_name)] = Min(metric, filter=period_filter)
+
+            gap_values = WeatherDataModel.objects.filter(gap_filter).aggregate(**aggregates)
+
+            for metric, metric_extremes in extremes.items():
+                for period, value in metric_extremes.items():
+                    gap_value = gap_values['{0}__{1}'.format(metric, period)]
+                    if value is None:
+                        metric_extremes[period] = gap_value
+                    elif gap_value is not None:
+                        metric_extremes[period] = max(value, gap_value) if period.endswith('max') else min(value, gap_value)
+
+        # No data for a period is treated as zero, the same as get_max and get_min.
+        return {
+            metric: {period: value if value is not None else 0 for period, value in metric_extremes.items()}
+            for metric, metric_extremes in extremes.items()
+        }
+
+    @staticmethod
+    def get_extremes_raw(period: str, time_obj: dict) -> dict:
+        """
+        Get the maximum and minimum values of all metrics for a given time period,
+        from the raw data. All metrics are aggregated in a single query.
+
+        :param period: The period the extremes relate to. i.e. 'year', 'month', 'day'.
+        :param time_obj: The object that contains the time data.
+        :return: The extremes, keyed by metric__max and metric__min.
+        """
+
+        aggregates = {}
+        for metric in WeatherData.weather_metrics:
+            aggregates['{0}__max'.format(metric)] = Max(metric)
+            aggregates['{0}__min'.format(metric)] = Min(metric)
+
+        extremes = WeatherDataModel.objects \
+            .filter(**TimePeriod.get_filter(period, time_obj)) \
+            .aggregate(**aggregates)
+
+        # No data for a period is treated as zero, the same as get_max and get_min.
+        return {extreme: value if value is not None else 0 for extreme, value in extremes.items()}
+
+    @staticmethod
+    def get_extremes(time_obj: dict) -> dict:
+        """
+        Get the daily, monthly and yearly maximum and minimum values for all metrics.
+        Values are got from the cache in one operation. Any values that are not cached are got from the
+        daily extremes with one query, or if there are no daily extremes from the raw data
+        with one query per period. All the missing values are then stored in the cache at once.
+
+        :param time_obj: The object that contains the time data.
+        :return: The extremes for each metric.
+        """
+
+        extreme_keys = {}
+        for metric in WeatherData.weather_metrics:
+            for period_name, period in TimePeriod.extreme_periods.items():
+                for extreme in ('max', 'min'):
+                    cache_key = TimePeriod.get_extreme_cache_key(extreme, metric, period, time_obj)
+                    extreme_keys[cache_key] = (metric, period_name, period, extreme)
+
+        cache_values = DataCache.get_many(list(extreme_keys.keys()))
+
+        extremes = {metric: {} for metric in WeatherData.weather_metrics}
+        missing_values = {}
+        extremes_rollup = None
+        extremes_raw = {}
+
+        for cache_key, (metric, period_name, period, extreme) in extreme_keys.items():
+            result_key = '_'.join((period_name, extreme))
+            cache_val = cache_values.get(cache_key)
+
+            if cache_val is None:
+                if extremes_rollup is None:
+                    extremes_rollup = WeatherData.get_extremes_rollup(time_obj)
+
+                if metric in extremes_rollup:
+                    cache_val = extremes_rollup[metric][result_key]
+                else:
+                    if period not in extremes_raw:
+                        extremes_raw[period] = WeatherData.get_extremes_raw(period, time_obj)
+                    cache_val = extremes_raw[period]['{0}__{1}'.format(metric, extreme)]
+                missing_values[cache_key] = cache_val
+
+            extremes[metric][result_key] = cache_val
+
+        # Another process may have cached newer extremes in the meantime, so only missing values are set.
+        DataCache.update_extremes({cache_key: ('fill', value) for cache_key, value in missing_values.items()}, 3600)
+
+        return extremes
+
+    @staticmethod
+    def set_extremes(values: dict, time_obj: dict, min_values: dict = None) -> dict:
+        """
+        Set the daily, monthly and yearly maximum and minimum values for several metrics at once.
+        The current extremes are got with get_extremes, and any extremes
+        that the new values exceed are updated in the cache in one atomic operation,
+        so a concurrent update can't replace a higher maximum or lower minimum.
+        The values are only "set" in the cache and not updated in the database.
+
+        :param values: The new values, keyed by metric.
+        :param time_obj: The object that contains the time data.
+        :param min_values: The new values to check the minimums against, if they differ from values.
+        :return: The updated extremes, keyed by cache key.
+        """
+
+        if min_values is None:
+            min_values = values
+
+        extremes = WeatherData.get_extremes(time_obj)
+        updates = {}
+
+        for metric, value in values.items():
+            # Skip metrics that are not in the allowed list.
+            if metric not in WeatherData.weather_metrics:
+                continue
+
+            # Extremes the new values don't exceed are skipped, the cache still compares the rest.
+            for period_name, period in TimePeriod.extreme_periods.items():
+                if extremes[metric]['{0}_max'.format(period_name)] < value:
+                    updates[TimePeriod.get_extreme_cache_key('max', metric, period, time_obj)] = ('max', value)
+                if extremes[metric]['{0}_min'.format(period_name)] > min_values[metric]:
+                    updates[TimePeriod.get_extreme_cache_key('min', metric, period, time_obj)] = \
+                        ('min', min_values[metric])
+
+        return DataCache.update_extremes(updates, 3600)
 
     @staticmethod
     def get_max(metric: str, period: str, time_obj: dict, usecache: bool = True):
         """
         Get the maximum value for a given time period.
+        If the value is not cached, or has expired, it is got from the database and then set in the cache.
+        Only one caller gets an expired value from the database, the others get the expired value meanwhile.
 
         :param metric: The metric to get the maximum for, e.g. uv_index
         :param period: The period the maximum relates to. i.e. 'year', 'month', 'day'.
@@ -183,53 +571,27 @@ class WeatherData:
         :return: The found maximum value.
         """
 
-        max_year = time_obj['year']
-        max_month = time_obj['month']
-        max_day = time_obj['day']
-        tz = pytz.timezone(getattr(settings, 'TIME_ZONE'))
+        if period not in TimePeriod.extreme_periods.values():
+            return {}
 
-        max_value = {}
         metric_max = '{0}__max'.format(metric)
 
-        # Get value from cache.
-        # If cache is empty or invalid get value from the database. Then store in cache.
-        if period == 'year':
-            cache_key = '_'.join(('max', metric, str(max_year)))
-            cache_val = cache.get(cache_key)
-            if (cache_val is None) or (usecache is False):
-                year_stamp = datetime(max_year,1,1,0,0,0, tzinfo=tz).timestamp()
-                max_value = WeatherDataModel.objects\
-                    .filter(time_year=max_year, time_stamp__gte=year_stamp)\
-                    .aggregate(Max(metric))
-                if max_value[metric_max] is None:
-                    max_value = {metric_max: 0}
-            else:
-                max_value = {metric_max: cache_val}
-        elif period == 'month':
-            cache_key = '_'.join(('max', metric, str(max_year), str(max_month)))
-            cache_val = cache.get(cache_key)
-            if (cache_val is None) or (usecache is False):
-                month_stamp = datetime(max_year, max_month, 1, 0, 0, 0, tzinfo=tz).timestamp()
-                max_value = WeatherDataModel.objects \
-                    .filter(time_year=max_year, time_month=max_month, time_stamp__gte=month_stamp) \
-                    .aggregate(Max(metric))
-                if max_value[metric_max] is None:
-                    max_value = {metric_max: 0}
-            else:
-                max_value = {metric_max: cache_val}
-        elif period == 'day':
-            cache_key = '_'.join(('max', metric, str(max_year), str(max_month), str(max_day)))
-            cache_val = cache.get(cache_key)
-            if (cache_val is None) or (usecache is False):
-                day_stamp = datetime(max_year, max_month, max_day, 0, 0, 0, tzinfo=tz).timestamp()
-                max_value = WeatherDataModel.objects \
-                    .filter(time_year=max_year, time_month=max_month, time_day=max_day, time_stamp__gte=day_stamp) \
-                    .aggregate(Max(metric))
-                if max_value[metric_max] is None:
-                    max_value = {metric_max: 0}
-            else:
-                max_value = {metric_max: cache_val}
-        return max_value
+        def get_db_value():
+            return WeatherDataModel.objects \
+                .filter(**TimePeriod.get_filter(period, time_obj)) \
+                .aggregate(Max(metric))[metric_max]
+
+        if usecache is False:
+            max_value = get_db_value()
+        else:
+            cache_key = TimePeriod.get_extreme_cache_key('max', metric, period, time_obj)
+            max_value = DataCache.get_or_compute(cache_key, get_db_value, 3600, 'max')
+
+        # No data for the period is treated as zero, and is not cached.
+        if max_value is None:
+            max_value = 0
+
+        return {metric_max: max_value}
 
     @staticmethod
     def set_max(metric: str, period: str, value, time_obj: dict):
@@ -264,17 +626,16 @@ class WeatherData:
         elif period == 'day':
             cache_key = '_'.join(('max', metric, str(max_year), str(max_month), str(max_day)))
 
-        cache_val = cache.get(cache_key)  # Raw check of cache.
+        cache_val = DataCache.get(cache_key)  # Raw check of cache.
         if cache_val is None:
             # Cache is empty, get value from database.
             db_val = WeatherData.get_max(metric, period, time_obj, False)
             max_metric = ''.join((metric, '__max'))
-            cache_val = db_val.get(max_metric)
-            cache.set(cache_key, cache_val, 3600)
+            DataCache.update_extremes({cache_key: ('fill', db_val.get(max_metric))}, 3600)
             max_set = True
 
-        if cache_val < value:
-            cache.set(cache_key, value, 3600)
+        # Compare and set in one atomic operation, so a concurrent update can't replace a higher value.
+        if cache_key in DataCache.update_extremes({cache_key: ('max', value)}, 3600):
             max_set = True
 
         # Do recursive checks if needed.
@@ -293,6 +654,8 @@ class WeatherData:
     def get_min(metric: str, period: str, time_obj: dict, usecache: bool = True):
         """
         Get the minimum value for a given time period.
+        If the value is not cached, or has expired, it is got from the database and then set in the cache.
+        Only one caller gets an expired value from the database, the others get the expired value meanwhile.
 
         :param metric: The metric to get the minimum for, e.g. uv_index
         :param period: The period the minimum relates to. i.e. 'year', 'month', 'day'.
@@ -301,53 +664,27 @@ class WeatherData:
         :return: The found minimum value.
         """
 
-        min_year = time_obj['year']
-        min_month = time_obj['month']
-        min_day = time_obj['day']
-        tz = pytz.timezone(getattr(settings, 'TIME_ZONE'))
+        if period not in TimePeriod.extreme_periods.values():
+            return {}
 
-        min_value = {}
         metric_min = '{0}__min'.format(metric)
 
-        # Get value from cache.
-        # If cache is empty or invalid get value from the database. Then store in cache.
-        if period == 'year':
-            cache_key = '_'.join(('min', metric, str(min_year)))
-            cache_val = cache.get(cache_key)
-            if (cache_val is None) or (usecache is False):
-                year_stamp = datetime(min_year, 1, 1, 0, 0, 0, tzinfo=tz).timestamp()
-                min_value = WeatherDataModel.objects\
-                    .filter(time_year=min_year, time_stamp__gte=year_stamp)\
-                    .aggregate(Min(metric))
-                if min_value[metric_min] is None:
-                    min_value = {metric_min: 0}
-            else:
-                min_value = {metric_min: cache_val}
-        elif period == 'month':
-            cache_key = '_'.join(('min', metric, str(min_year), str(min_month)))
-            cache_val = cache.get(cache_key)
-            if (cache_val is None) or (usecache is False):
-                month_stamp = datetime(min_year, min_month, 1, 0, 0, 0, tzinfo=tz).timestamp()
-                min_value = WeatherDataModel.objects \
-                    .filter(time_year=min_year, time_month=min_month, time_stamp__gte=month_stamp) \
-                    .aggregate(Min(metric))
-                if min_value[metric_min] is None:
-                    min_value = {metric_min: 0}
-            else:
-                min_value = {metric_min: cache_val}
-        elif period == 'day':
-            cache_key = '_'.join(('min', metric, str(min_year), str(min_month), str(min_day)))
-            cache_val = cache.get(cache_key)
-            if (cache_val is None) or (usecache is False):
-                day_stamp = datetime(min_year, min_month, min_day, 0, 0, 0, tzinfo=tz).timestamp()
-                min_value = WeatherDataModel.objects \
-                    .filter(time_year=min_year, time_month=min_month, time_day=min_day, time_stamp__gte=day_stamp) \
-                    .aggregate(Min(metric))
-                if min_value[metric_min] is None:
-                    min_value = {metric_min: 0}
-            else:
-                min_value = {metric_min: cache_val}
-        return min_value
+        def get_db_value():
+            return WeatherDataModel.objects \
+                .filter(**TimePeriod.get_filter(period, time_obj)) \
+                .aggregate(Min(metric))[metric_min]
+
+        if usecache is False:
+            min_value = get_db_value()
+        else:
+            cache_key = TimePeriod.get_extreme_cache_key('min', metric, period, time_obj)
+            min_value = DataCache.get_or_compute(cache_key, get_db_value, 3600, 'min')
+
+        # No data for the period is treated as zero, and is not cached.
+        if min_value is None:
+            min_value = 0
+
+        return {metric_min: min_value}
 
     @staticmethod
     def set_min(metric: str, period: str, value, time_obj: dict) -> bool:
@@ -382,17 +719,16 @@ class WeatherData:
         elif period == 'day':
             cache_key = '_'.join(('min', metric, str(min_year), str(min_month), str(min_day)))
 
-        cache_val = cache.get(cache_key)  # Raw check of cache.
+        cache_val = DataCache.get(cache_key)  # Raw check of cache.
         if cache_val is None:
             # Cache is empty, get value from database.
             db_val = WeatherData.get_min(metric, period, time_obj, False)
             min_metric = ''.join((metric, '__min'))
-            cache_val = db_val.get(min_metric)
-            cache.set(cache_key, cache_val, 3600)
+            DataCache.update_extremes({cache_key: ('fill', db_val.get(min_metric))}, 3600)
             min_set = True
 
-        if cache_val > value:
-            cache.set(cache_key, value, 3600)
+        # Compare and set in one atomic operation, so a concurrent update can't replace a lower value.
+        if cache_key in DataCache.update_extremes({cache_key: ('min', value)}, 3600):
             min_set = True
 
         # Do recursive checks if needed.
@@ -417,7 +753,7 @@ class WeatherData:
         """
 
         cache_key = '{0}_latest'.format(metric)
-        cache_val = cache.get(cache_key)
+        cache_val = DataCache.get(cache_key)
 
         return {cache_key: cache_val}
 
@@ -437,10 +773,50 @@ class WeatherData:
             return
 
         cache_key = '{0}_latest'.format(metric)
-        cache.set(cache_key, value, 3600)
+        DataCache.set(cache_key, value, 3600)
 
         return {cache_key: value}
 
+    @staticmethod
+    def get_latest_many(metrics: list) -> dict:
+        """
+        Get the latest received values for several metrics in one cache operation.
+
+        :param metrics: The metrics to get the latest for, e.g. ['uv_index', 'solar_radiation']
+        :return: The latest values, keyed by cache key.
+        """
+
+        cache_keys = ['{0}_latest'.format(metric) for metric in metrics]
+        cache_values = DataCache.get_many(cache_keys)
+
+        return {cache_key: cache_values.get(cache_key) for cache_key in cache_keys}
+
+    @staticmethod
+    def set_latest_many(values: dict, time_stamp: int = None) -> dict:
+        """
+        Set the latest values for several metrics in one cache operation.
+        If the time stamp of the sample is given, the values are only set if they are newer
+        than the cached values, so a delayed update can't replace newer values.
+        The values are only "set" in the cache and not updated in the database.
+
+        :param values: The latest values, keyed by metric.
+        :param time_stamp: The time stamp of the sample the values come from.
+        :return: The latest values, keyed by cache key, or an empty dict if newer values are cached.
+        """
+
+        latest_values = {}
+        for metric, value in values.items():
+            # Skip metrics that are not in the allowed list.
+            if metric in WeatherData.weather_metrics:
+                latest_values['{0}_latest'.format(metric)] = value
+
+        if time_stamp is None:
+            DataCache.set_many(latest_values, 3600)
+        elif not DataCache.set_many_versioned(latest_values, 'latest_weather_time_stamp', time_stamp, 3600):
+            return {}
+
+        return latest_values
+
     @staticmethod
     def get_apparent_temperature(temp: float, humidity: float, wind: float, solar: float) -> float:
         """
@@ -511,77 +887,96 @@ class WeatherData:
             timestamp = datetime.now().timestamp()
 
         # Split out timestamp to date components.
-        date_object = datetime.fromtimestamp(timestamp)
-        time_obj = {
-            'year': date_object.year,
-            'month': date_object.month,
-            'day': date_object.day
-
-        }
+        time_obj = TimePeriod.get_time_obj(timestamp)
 
         result_data = {}
+        latest = WeatherData.get_latest_many(WeatherData.weather_metrics)
+        extremes = WeatherData.get_extremes(time_obj)
 
         for metric in WeatherData.weather_metrics:
             result_data[metric] = {}
-            result_data[metric]['latest'] = WeatherData.get_latest(metric).get('{0}_latest'.format(metric))
-            result_data[metric]['daily_max'] = WeatherData.get_max(metric, 'day', time_obj).get('{0}__max'.format(metric))
-            result_data[metric]['daily_min'] = WeatherData.get_min(metric, 'day', time_obj).get('{0}__min'.format(metric))
-            result_data[metric]['monthly_max'] = WeatherData.get_max(metric, 'month', time_obj).get('{0}__max'.format(metric))
-            result_data[metric]['monthly_min'] = WeatherData.get_min(metric, 'month', time_obj).get('{0}__min'.format(metric))
-            result_data[metric]['yearly_max'] = WeatherData.get_max(metric, 'year', time_obj).get('{0}__max'.format(metric))
-            result_data[metric]['yearly_min'] = WeatherData.get_min(metric, 'year', time_obj).get('{0}__min'.format(metric))
+            result_data[metric]['latest'] = latest.get('{0}_latest'.format(metric))
+            result_data[metric]['daily_max'] = extremes[metric]['daily_max']
+            result_data[metric]['daily_min'] = extremes[metric]['daily_min']
+            result_data[metric]['monthly_max'] = extremes[metric]['monthly_max']
+            result_data[metric]['monthly_min'] = extremes[metric]['monthly_min']
+            result_data[metric]['yearly_max'] = extremes[metric]['yearly_max']
+            result_data[metric]['yearly_min'] = extremes[metric]['yearly_min']
 
             # Get the trend data.
             if metric in WeatherData.weather_trends:
-                # We use slicing here to do some quick and dirty down sampling.
-                # Down sampling is based on number of elements (told you it was dirty).
+                # Down sample the trend to a fixed maximum number of points, keeping the peaks and troughs.
                 trend_list = WeatherData.get_trend(metric, 'day', time_obj)
-                list_size = len(trend_list)
-
-                if list_size <= 250:
-                    result_data[metric]['daily_trend'] = trend_list
-                elif (list_size > 250) or (list_size < 100):
-                    result_data[metric]['daily_trend'] = UnitConversion.downsample_data(trend_list, 20)
-                else:
-                    result_data[metric]['daily_trend'] = UnitConversion.downsample_data(trend_list, 60)
+                result_data[metric]['daily_trend'] = UnitConversion.downsample(trend_list)
 
         return result_data
 
     @staticmethod
-    def get_trend(metric: str, period: str, time_obj: dict) -> list:
+    def get_trend_range(metrics: list, start: int, end: int, max_points: int) -> dict:
+        """
+        Get the trend data for several metrics for a time range, down sampled to a maximum number of points.
+
+        :param metrics: The metrics to get the trend for, metrics that are not in the allowed list are skipped.
+        :param start: The start of the time range.
+        :param end: The end of the time range (exclusive).
+        :param max_points: The maximum number of points for each metric.
+        :return: The resolution used (0 for raw data) and the trend data for each metric.
+        """
+
+        metrics = [metric for metric in metrics if metric in WeatherData.weather_metrics]
+        trend_range = TrendTiers.get_range(WeatherDataModel, WeatherTrendTierModel, metrics, start, end, max_points)
+
+        for metric, trend_list in trend_range['trends'].items():
+            trend_range['trends'][metric] = UnitConversion.downsample(trend_list, max_points)
+
+        return trend_range
+
+    @staticmethod
+    def update_tiers(store_data: dict):
+        """
+        Add a newly stored sample to the trend tiers.
+
+        :param store_data: The data for the sample that was stored.
+        :return:
+        """
+
+        TrendTiers.update(WeatherTrendTierModel, WeatherData.weather_metrics, store_data)
+
+    @staticmethod
+    def refresh_tiers(start: int, end: int):
+        """
+        Rebuild the trend tiers from the raw data for a time range.
+
+        :param start: The start of the time range.
+        :param end: The end of the time range (exclusive).
+        :return:
+        """
+
+        TrendTiers.refresh(WeatherDataModel, WeatherTrendTierModel, WeatherData.weather_metrics, start, end)
+
+    @staticmethod
+    def get_trend(metric: str, period: str, time_obj: dict, max_points: int = None) -> list:
         """
         Get the metric trend data for a given time period.
+        Short periods such as a day are got from the raw data, so the peaks are kept when the trend is
+        down sampled. Longer periods are got from the trend tier that best matches the period and maximum
+        number of points, see TrendTiers.get_range().
 
         :param metric: The metric to get the trend for, e.g. indoor_temp
         :param period: The period the trend relates to. i.e. 'year', 'month', 'day'.
         :param time_obj: The object that contains the time data.
+        :param max_points: The maximum number of points the trend will be down sampled to,
+        defaults to the TREND_MAX_POINTS setting.
         :return: The trend data.
         """
 
-        trend_year = time_obj['year']
-        trend_month = time_obj['month']
-        trend_day = time_obj['day']
-
-        trend_data = {}
+        if max_points is None:
+            max_points = getattr(settings, 'TREND_MAX_POINTS', 250)
 
-        # TODO: decide if this needs to be cached.
-        if period == 'year':
-            trend_data = WeatherDataModel.objects.values_list('time_stamp', metric) \
-                .filter(time_year=trend_year) \
-                .order_by('time_stamp') \
-                .all()
-        elif period == 'month':
-            trend_data = WeatherDataModel.objects.values_list('time_stamp', metric) \
-                .filter(time_year=trend_year, time_month=trend_month) \
-                .order_by('time_stamp') \
-                .all()
-        elif period == 'day':
-            trend_data = WeatherDataModel.objects.values_list('time_stamp', metric) \
-                .filter(time_year=trend_year, time_month=trend_month, time_day=trend_day) \
-                .order_by('time_stamp') \
-                .all()
+        start, end = TimePeriod.get_range(period, time_obj)
+        trend_range = TrendTiers.get_range(WeatherDataModel, WeatherTrendTierModel, [metric], start, end, max_points)
 
-        return list(trend_data)
+        return trend_range['trends'][metric]
 
     @staticmethod
     def get_date_range() -> dict:
@@ -595,26 +990,28 @@ class WeatherData:
 
         # Cache max and min values. Min can be cached for ages.
         max_cache_key = 'select_date_max'
-        max_cache_val = cache.get(max_cache_key)
+        max_cache_val = DataCache.get(max_cache_key)
 
         min_cache_key = 'select_date_min'
-        min_cache_val = cache.get(min_cache_key)
+        min_cache_val = DataCache.get(min_cache_key)
 
         if max_cache_val is None:
-            max_value = WeatherDataModel.objects.aggregate(Max('time_stamp'))
-            maximum = datetime.fromtimestamp(max_value['time_stamp__max']).strftime("%Y-%m-%d")
-            cache.set(max_cache_key, maximum, 600)
+            max_value = WeatherDataModel.objects.order_by('-time_stamp') \
+                .values_list('time_stamp', flat=True).first()
+            maximum = TimePeriod.get_date(max_value).strftime("%Y-%m-%d")
+            DataCache.set(max_cache_key, maximum, 600)
         else:
             maximum = max_cache_val
 
         if min_cache_val is None:
-            min_value = WeatherDataModel.objects.aggregate(Min('time_stamp'))
-            minimum = datetime.fromtimestamp(min_value['time_stamp__min']).strftime("%Y-%m-%d")
-            cache.set(min_cache_key, minimum, 86400)
+            min_value = WeatherDataModel.objects.order_by('time_stamp') \
+                .values_list('time_stamp', flat=True).first()
+            minimum = TimePeriod.get_date(min_value).strftime("%Y-%m-%d")
+            DataCache.set(min_cache_key, minimum, 86400)
         else:
             minimum = min_cache_val
 
-        today = datetime.now().strftime("%Y-%m-%d")
+        today = TimePeriod.get_date(datetime.now().timestamp()).strftime("%Y-%m-%d")
 
         context = {
             'minimum': minimum,